@@ -2,8 +2,12 @@ from django.contrib import admin
 
 # Register your models here.
 
-from api.models import Document, AIFeedback, User
+from api.models import Document, DocumentChunk, DocumentRevision, AnalysisJob, AIFeedback, User, WritingStatsRollup
 
 admin.site.register(User)
 admin.site.register(Document)
-admin.site.register(AIFeedback)
\ No newline at end of file
+admin.site.register(DocumentChunk)
+admin.site.register(DocumentRevision)
+admin.site.register(AIFeedback)
+admin.site.register(AnalysisJob)
+admin.site.register(WritingStatsRollup)
\ No newline at end of file
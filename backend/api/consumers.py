@@ -0,0 +1,226 @@
+import asyncio
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from api.models import AnalysisJob, Document
+from api.utils.collaboration import edit_group, send_to_room
+from api.utils.jobs import job_group, serialize_job
+from api.utils.streaming import stream_suggestions
+from api.views.ai_views import AISuggestionsStreamView
+
+
+class SuggestionsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Websocket counterpart of AISuggestionsStreamView.
+
+    Each message ``{"text": ..., "request_id": ...}`` starts a new analysis
+    (cancelling the previous one) and every event is sent back as
+    ``{"event": ..., "data": ..., "request_id": ...}``.
+    """
+
+    async def connect(self):
+        self.task = None
+        await self.accept()
+
+    async def disconnect(self, code):
+        if self.task:
+            self.task.cancel()
+
+    async def receive_json(self, content, **kwargs):
+        text = content.get('text') if isinstance(content, dict) else None
+        request_id = content.get('request_id') if isinstance(content, dict) else None
+        if not text:
+            await self.send_json({'event': 'error', 'data': {'error': 'Text is required'}, 'request_id': request_id})
+            return
+
+        if self.task:
+            self.task.cancel()
+        self.task = asyncio.ensure_future(self.stream(text, request_id))
+
+    async def stream(self, text, request_id):
+        view = AISuggestionsStreamView()
+        async for event, data in stream_suggestions(text, view.get_messages(text), view.mock_suggestions):
+            await self.send_json({'event': event, 'data': data, 'request_id': request_id})
+
+
+class AnalysisJobConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Follow a background analysis job.
+
+    Sends the job as ``{"event": "job", "data": ...}`` on connect and whenever
+    a worker pushes a change, and closes once the job is done or has failed.
+    The job is also re-read every ``ANALYSIS_JOBS['WATCH_INTERVAL']`` seconds,
+    in case the worker runs where its pushes cannot reach this process.
+    """
+    finished = ('done', 'failed')
+
+    async def connect(self):
+        self.job_id = self.scope['url_route']['kwargs']['job_id']
+        job = await self.get_job()
+        if job is None:
+            await self.close(code=4404)
+            return
+        self.group = job_group(self.job_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        self.watcher = None
+        if not await self.send_job(job):
+            self.watcher = asyncio.ensure_future(self.watch())
+
+    async def disconnect(self, code):
+        if getattr(self, 'group', None):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+        if getattr(self, 'watcher', None):
+            self.watcher.cancel()
+
+    @database_sync_to_async
+    def get_job(self):
+        """
+        Return the job serialized if the connected user may read its document, else None
+        """
+        user = self.scope.get('user')
+        jobs = AnalysisJob.objects.select_related('feedback').filter(pk=self.job_id)
+        if user is not None and user.is_authenticated:
+            jobs = jobs.filter(document__author=user)
+        else:
+            jobs = jobs.filter(document__author__isnull=True)
+        job = jobs.first()
+        return serialize_job(job) if job is not None else None
+
+    async def send_job(self, job):
+        """
+        Send the job's state, closing the socket when it is final. Returns whether it was.
+        """
+        await self.send_json({'event': 'job', 'data': job})
+        if job['status'] in self.finished:
+            await self.close()
+            return True
+        return False
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(settings.ANALYSIS_JOBS['WATCH_INTERVAL'])
+            job = await self.get_job()
+            if job is None or await self.send_job(job):
+                return
+
+    async def analysis_job(self, event):
+        await self.send_job(event['job'])
+
+
+class DocumentEditConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Edit a document together with everyone else connected to it.
+
+    On connect the socket gets ``{"event": "init", "data": {"version", "content", ...}}``.
+    The client sends each local change as ``{"delta": ..., "version": ..., "request_id": ...}``,
+    ``version`` being the last version it has seen, and may only send the next
+    one once it got the ``ack`` for the previous. Everyone else's changes
+    arrive as ``delta`` events, already transformed to apply to the client's
+    last seen version; the client transforms them past its own unacknowledged
+    change. ``saved`` events report when the edits reached the database.
+
+    If the socket misses a version, or the room lost track of it, it is sent
+    a fresh ``init`` and the client has to start over from that content. A
+    ``conflict`` event before it names the document the room's unsaved edits
+    were kept in, when they could not be merged with a change saved elsewhere.
+    """
+
+    async def connect(self):
+        self.document_id = self.scope['url_route']['kwargs']['document_id']
+        self.client = uuid.uuid4().hex
+        self.version = None
+        self.heartbeat = None
+        if not await self.can_edit():
+            await self.close(code=4404)
+            return
+        self.group = edit_group(self.document_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        await self.send_room('collab.join')
+        self.heartbeat = asyncio.ensure_future(self.keep_alive())
+
+    async def disconnect(self, code):
+        if getattr(self, 'group', None):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+            await self.send_room('collab.leave')
+        if getattr(self, 'heartbeat', None):
+            self.heartbeat.cancel()
+
+    @database_sync_to_async
+    def can_edit(self):
+        user = self.scope.get('user')
+        documents = Document.objects.filter(pk=self.document_id)
+        if user is not None and user.is_authenticated:
+            return documents.filter(author=user).exists()
+        return documents.filter(author__isnull=True).exists()
+
+    async def send_room(self, message_type, **message):
+        await send_to_room(self.channel_layer, {
+            'type': message_type,
+            'document': self.document_id,
+            'client': self.client,
+            'channel': self.channel_name,
+            **message,
+        })
+
+    async def keep_alive(self):
+        while True:
+            await asyncio.sleep(settings.COLLABORATION['CLIENT_TIMEOUT'] / 3)
+            await self.send_room('collab.ping')
+
+    async def receive_json(self, content, **kwargs):
+        request_id = content.get('request_id') if isinstance(content, dict) else None
+        version = content.get('version') if isinstance(content, dict) else None
+        if (
+            not isinstance(content, dict) or content.get('delta') is None
+            or not isinstance(version, int) or isinstance(version, bool)
+        ):
+            await self.send_json({
+                'event': 'error', 'data': {'error': 'delta and an integer version are required'}, 'request_id': request_id
+            })
+            return
+        await self.send_room('collab.edit', delta=content['delta'], version=version, request_id=request_id)
+
+    async def resync(self):
+        self.version = None
+        await self.send_room('collab.join')
+
+    async def collab_init(self, event):
+        self.version = event['version']
+        await self.send_json({'event': 'init', 'data': {
+            'version': event['version'],
+            'content': event['content'],
+            'revision': event['revision'],
+            'editors': event['editors'],
+        }})
+
+    async def collab_delta(self, event):
+        if self.version is None or event['version'] <= self.version:
+            # Sequenced before this socket's init, which already includes it
+            return
+        if event['version'] != self.version + 1:
+            await self.resync()
+            return
+        self.version = event['version']
+        if event['client'] == self.client:
+            await self.send_json({'event': 'ack', 'data': {'version': event['version']}, 'request_id': event['request_id']})
+        else:
+            await self.send_json({'event': 'delta', 'data': {'version': event['version'], 'delta': event['delta']}})
+
+    async def collab_saved(self, event):
+        await self.send_json({'event': 'saved', 'data': {'version': event['version'], 'revision': event['revision']}})
+
+    async def collab_error(self, event):
+        await self.send_json({'event': 'error', 'data': {'error': event['error']}, 'request_id': event['request_id']})
+
+    async def collab_resync(self, event):
+        if event.get('conflict') is not None:
+            await self.send_json({'event': 'conflict', 'data': {'document': event['conflict']}})
+        await self.resync()
+
+    async def collab_closed(self, event):
+        await self.close(code=4404)
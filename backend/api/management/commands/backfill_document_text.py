@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Document, WritingStatsRollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored word/char counts and content hash of existing documents from their chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = updated = 0
+        batch = []
+
+        queryset = Document.objects.only('id', *Document.TEXT_FIELDS).order_by('pk')
+        for document in queryset.iterator(chunk_size=batch_size):
+            checked += 1
+            if document.update_text_fields():
+                batch.append(document)
+            if len(batch) >= batch_size:
+                Document.objects.bulk_update(batch, Document.TEXT_FIELDS)
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Document.objects.bulk_update(batch, Document.TEXT_FIELDS)
+            updated += len(batch)
+
+        if updated:
+            # bulk_update does not send save signals, so recount the writing stats rollups
+            WritingStatsRollup.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} documents, updated {updated}'))
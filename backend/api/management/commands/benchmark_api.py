@@ -0,0 +1,422 @@
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.management.commands.fake_llm_server import FakeLLMHandler
+from api.models import Document, User
+from api.utils import llm
+
+WORDS = (
+    'the writer editor chapter story draft page book line word sentence paragraph idea reader voice scene '
+    'character plot theme note letter morning evening city river house garden window door road light '
+    'write read revise edit publish describe explain imagine remember finish begin carry follow open '
+    'close walk run turn change keep find give make take see hear feel think know want need try '
+    'quick slow bright dark quiet loud long short clear simple careful honest strange familiar '
+    'quickly slowly carefully often never always again almost perhaps really and but with from into '
+    'over under after before while because'
+).split()
+
+ENDPOINTS = (
+    'document-create',
+    'document-retrieve',
+    'document-update',
+    'document-delta',
+    'document-list',
+    'grammar',
+    'word-analysis',
+    'word-analysis-batch',
+    'stats',
+    'ai-suggestions',
+    'document-ai-suggestions',
+    'document-delete',
+)
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted values
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def max_rss_mb():
+    """
+    The process's peak resident set size so far, in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Command(BaseCommand):
+    help = 'Measure latency, throughput, query counts and memory of the main API endpoints on a generated corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1000, help='Documents in the generated corpus (up to 100k)')
+        parser.add_argument('--words', type=int, default=1000, help='Words per document (1k to 1M)')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per endpoint first')
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads sending requests at once')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+        parser.add_argument('--isolate', action='store_true',
+                            help='Run each endpoint in a fresh process, so peak RSS is per endpoint')
+        parser.add_argument('--llm-latency', type=float, default=0.2, help='Seconds the fake LLM takes to answer')
+        parser.add_argument('--real-llm', action='store_true', help='Use the configured LLM instead of the fake one')
+        parser.add_argument('--corpus-user', type=int, help='Reuse the corpus of this user instead of generating one')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated corpus (its user id is printed)')
+        parser.add_argument('--baseline', help='Fail if p95 latency regressed against this earlier --output file')
+        parser.add_argument('--max-regression', type=float, default=0.25,
+                            help='Allowed p95 slowdown against the baseline, as a fraction')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.paragraphs = [self.make_paragraph(self.rng) for _ in range(200)]
+        self.lock = threading.Lock()
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'config': {
+                name: options[name]
+                for name in ('documents', 'words', 'requests', 'warmup', 'concurrency', 'isolate', 'llm_latency', 'real_llm', 'seed')
+            },
+            'endpoints': {},
+        }
+
+        if options['corpus_user']:
+            self.user = User.objects.get(pk=options['corpus_user'])
+            generated = False
+        else:
+            start = time.perf_counter()
+            self.user = self.generate_corpus(options['documents'], options['words'])
+            report['corpus'] = {'seconds': round(time.perf_counter() - start, 2)}
+            generated = True
+            self.stdout.write(
+                f"Generated {options['documents']} documents of {options['words']} words "
+                f"in {report['corpus']['seconds']}s (user {self.user.pk})"
+            )
+
+        try:
+            if options['isolate'] and not options['corpus_user']:
+                for name in options['endpoints']:
+                    report['endpoints'][name] = self.run_isolated(name)
+            else:
+                self.load_corpus_state()
+                with self.llm_settings():
+                    for name in options['endpoints']:
+                        report['endpoints'][name] = self.run_endpoint(name)
+        finally:
+            if generated and not options['keep']:
+                with transaction.atomic():
+                    self.user.delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if options['baseline']:
+            self.check_baseline(report, options['baseline'], options['max_regression'])
+
+    # Corpus
+
+    def make_paragraph(self, rng):
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = rng.choices(WORDS, k=rng.randint(6, 24))
+            sentence = ' '.join(words)
+            # Leave some sentences for the grammar rules to flag
+            if rng.random() < 0.8:
+                sentence = sentence.capitalize()
+            sentences.append(sentence + ('.' if rng.random() < 0.9 else ''))
+        return ' '.join(sentences)
+
+    def make_text(self, rng, words):
+        paragraphs = []
+        count = 0
+        while count < words:
+            paragraph = rng.choice(self.paragraphs)
+            paragraphs.append(paragraph)
+            count += paragraph.count(' ') + 1
+        return '\n'.join(paragraphs) + '\n'
+
+    def make_content(self, rng, words):
+        return {'ops': [{'insert': self.make_text(rng, words)}]}
+
+    def generate_corpus(self, documents, words):
+        user = User.objects.create(username=f'api-benchmark-{uuid.uuid4().hex[:12]}')
+        for offset in range(0, documents, 100):
+            with transaction.atomic():
+                for index in range(offset, min(offset + 100, documents)):
+                    Document.objects.create(
+                        title=f'Benchmark document {index}', author=user, content=self.make_content(self.rng, words)
+                    )
+        return user
+
+    def load_corpus_state(self):
+        documents = Document.objects.filter(author=self.user).values_list('id', 'revision', 'char_count')
+        self.document_ids = []
+        self.revisions = {}
+        self.lengths = {}
+        for document_id, revision, char_count in documents:
+            self.document_ids.append(document_id)
+            self.revisions[document_id] = revision
+            self.lengths[document_id] = char_count
+        if not self.document_ids:
+            raise CommandError('The corpus has no documents')
+        self.created_ids = []
+
+    @contextmanager
+    def llm_settings(self):
+        """
+        Point the LLM gateway at a local fake server (unless --real-llm) for the duration of the run
+        """
+        if self.options['real_llm']:
+            yield
+            return
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeLLMHandler)
+        server.daemon_threads = True
+        server.latency = self.options['llm_latency']
+        server.jitter = 0
+        server.token_delay = 0
+        server.verbose = False
+        server.lock = threading.Lock()
+        server.requests = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        base_url = f'http://127.0.0.1:{server.server_address[1]}/v1'
+        try:
+            with override_settings(OPENAI_API_KEY='fake', OPENAI_BASE_URL=base_url):
+                # The gateway is built from settings on first use
+                llm._gateway = None
+                yield
+        finally:
+            llm._gateway = None
+            server.shutdown()
+            server.server_close()
+
+    # Endpoints: each returns a callable that sends one request, so only the request is timed
+
+    def pick_document(self, rng):
+        return rng.choice(self.document_ids)
+
+    def call_document_create(self, client, rng):
+        data = {'title': 'Created by the benchmark', 'content': self.make_content(rng, self.options['words'])}
+
+        def send():
+            response = client.post('/api/documents/', data, format='json')
+            if response.status_code == 201:
+                with self.lock:
+                    self.created_ids.append(response.data['id'])
+            return response
+        return send
+
+    def call_document_retrieve(self, client, rng):
+        document_id = self.pick_document(rng)
+        return lambda: client.get(f'/api/documents/{document_id}/')
+
+    def call_document_update(self, client, rng):
+        document_id = self.pick_document(rng)
+        data = {'content': self.make_content(rng, self.options['words'])}
+
+        def send():
+            response = client.patch(f'/api/documents/{document_id}/', data, format='json')
+            if response.status_code == 200:
+                # Keep the deltas sent afterwards against the new revision and text
+                with self.lock:
+                    self.revisions[document_id] = max(self.revisions[document_id], response.data['revision'])
+                    self.lengths[document_id] = response.data['char_count']
+            return response
+        return send
+
+    def call_document_delta(self, client, rng):
+        """
+        A typical autosave: a few words typed somewhere in the document
+        """
+        document_id = self.pick_document(rng)
+        with self.lock:
+            revision = self.revisions[document_id]
+        # Only inserts are sent, so positions within the original length stay valid
+        position = rng.randrange(max(1, self.lengths[document_id]))
+        words = ' '.join(rng.choices(WORDS, k=rng.randint(1, 5))) + ' '
+        delta = [{'retain': position}, {'insert': words}] if position else [{'insert': words}]
+
+        def send():
+            response = client.patch(
+                f'/api/documents/{document_id}/delta/', {'delta': delta, 'revision': revision}, format='json'
+            )
+            if response.status_code in (200, 409) and response.data.get('revision') is not None:
+                with self.lock:
+                    self.revisions[document_id] = max(self.revisions[document_id], response.data['revision'])
+            return response
+        return send
+
+    def call_document_list(self, client, rng):
+        return lambda: client.get('/api/documents/')
+
+    def call_grammar(self, client, rng):
+        # Fresh text every time, so the result cache does not answer
+        text = f'{rng.choice(self.paragraphs)} Note {uuid.uuid4().hex[:8]}.'
+        return lambda: client.post('/api/ai/grammar/', {'text': text}, format='json')
+
+    def call_word_analysis(self, client, rng):
+        word = rng.choice(WORDS)
+        return lambda: client.get(f'/api/ai/word-analysis/{word}/')
+
+    def call_word_analysis_batch(self, client, rng):
+        text = rng.choice(self.paragraphs)
+        return lambda: client.post('/api/ai/word-analysis/batch/', {'text': text}, format='json')
+
+    def call_stats(self, client, rng):
+        return lambda: client.get('/api/users/stats/')
+
+    def call_ai_suggestions(self, client, rng):
+        text = f'{rng.choice(self.paragraphs)} Note {uuid.uuid4().hex[:8]}.'
+        return lambda: client.post('/api/ai/suggestions/', {'text': text}, format='json')
+
+    def call_document_ai_suggestions(self, client, rng):
+        document_id = self.pick_document(rng)
+        return lambda: client.post(f'/api/documents/{document_id}/get_ai_suggestions/', {}, format='json')
+
+    def call_document_delete(self, client, rng):
+        with self.lock:
+            document_id = self.created_ids.pop() if self.created_ids else None
+        if document_id is None:
+            document_id = Document.objects.create(
+                title='Deleted by the benchmark', author=self.user, content=self.make_content(rng, self.options['words'])
+            ).pk
+        return lambda: client.delete(f'/api/documents/{document_id}/')
+
+    # Running
+
+    def make_client(self):
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user=self.user)
+        return client
+
+    def run_endpoint(self, name):
+        call = getattr(self, 'call_' + name.replace('-', '_'))
+        concurrency = self.options['concurrency']
+        requests = self.options['requests']
+        rss_before = max_rss_mb()
+        timings = []
+        query_counts = []
+        statuses = Counter()
+
+        def work(index):
+            client = self.make_client()
+            rng = random.Random(f"{self.options['seed']}-{name}-{index}")
+            share = requests // concurrency + (1 if index < requests % concurrency else 0)
+            try:
+                for _ in range(self.options['warmup'] if index == 0 else 0):
+                    self.send(call(client, rng))
+                for _ in range(share):
+                    send = call(client, rng)
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        response = self.send(send)
+                        elapsed = time.perf_counter() - start
+                    with self.lock:
+                        timings.append(elapsed)
+                        query_counts.append(len(queries.captured_queries))
+                        statuses[response.status_code] += 1
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(work, range(concurrency)))
+        wall = time.perf_counter() - start
+
+        timings.sort()
+        query_counts.sort()
+        result = {
+            'requests': len(timings),
+            'errors': sum(count for status, count in statuses.items() if status >= 400),
+            'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+            'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+            'max_ms': round(timings[-1] * 1000, 2),
+            'throughput_rps': round(len(timings) / wall, 1),
+            'queries_mean': round(sum(query_counts) / len(query_counts), 1),
+            'queries_p95': percentile(query_counts, 0.95),
+            'queries_max': query_counts[-1],
+            'peak_rss_mb': max_rss_mb(),
+            'rss_growth_mb': round(max_rss_mb() - rss_before, 1),
+        }
+        self.stdout.write(
+            f"{name:<24} p50 {result['p50_ms']:>9} ms  p95 {result['p95_ms']:>9} ms  p99 {result['p99_ms']:>9} ms  "
+            f"{result['throughput_rps']:>8} req/s  {result['queries_mean']:>6} queries  "
+            f"peak RSS {result['peak_rss_mb']} MB  errors {result['errors']}"
+        )
+        return result
+
+    def send(self, send):
+        response = send()
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        return response
+
+    def run_isolated(self, name):
+        """
+        Run one endpoint in a fresh interpreter against the corpus generated here
+        """
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            arguments = [
+                sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_api',
+                '--corpus-user', str(self.user.pk), '--endpoints', name, '--output', output.name,
+            ]
+            for option in ('words', 'requests', 'warmup', 'concurrency', 'llm_latency', 'seed'):
+                arguments += [f"--{option.replace('_', '-')}", str(self.options[option])]
+            if self.options['real_llm']:
+                arguments.append('--real-llm')
+            completed = subprocess.run(arguments, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if completed.returncode:
+                raise CommandError(f'{name}: {completed.stderr.strip()}')
+            self.stdout.write(completed.stdout.rstrip())
+            with open(output.name) as f:
+                return json.load(f)['endpoints'][name]
+
+    def check_baseline(self, report, path, max_regression):
+        with open(path) as f:
+            baseline = json.load(f)['endpoints']
+        regressions = []
+        for name, result in report['endpoints'].items():
+            before = baseline.get(name)
+            if before and before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+                regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {result['p95_ms']} ms")
+        if regressions:
+            raise CommandError('Latency regressed against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No p95 regressions against the baseline'))
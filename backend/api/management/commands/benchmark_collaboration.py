@@ -0,0 +1,259 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api.management.commands.benchmark_api import percentile
+from api.models import Document, DocumentRevision
+from api.utils.collaboration import serve_rooms
+from api.utils.delta import apply_to_text, compose_changes, delta_to_text, transform
+
+WORDS = (
+    'the writer revised each chapter slowly while the editor marked passive sentences '
+    'and suggested clearer words for every paragraph of the long manuscript'
+).split()
+
+
+class Editor:
+    """
+    A simulated editor: types random changes over a websocket and keeps its
+    copy of the text in sync the way a Quill client would, with at most one
+    change waiting for its ack and the ones typed meanwhile buffered.
+    """
+
+    def __init__(self, communicator, rng):
+        self.communicator = communicator
+        self.rng = rng
+        self.text = None
+        self.version = None
+        self.outstanding = None
+        self.buffer = None
+        self.sent_at = None
+        self.ack_latencies = []
+        # version -> when this editor saw it, to measure broadcast latency
+        self.received = {}
+        self.typed = 0
+        self.resyncs = 0
+        self.errors = 0
+        self.initialized = asyncio.Event()
+
+    async def listen(self, sent):
+        while True:
+            message = await self.communicator.receive_json_from(timeout=60)
+            event, data = message['event'], message.get('data', {})
+            if event == 'init':
+                if self.text is not None:
+                    self.resyncs += 1
+                self.text = delta_to_text(data['content'])
+                self.version = data['version']
+                self.outstanding = self.buffer = None
+                self.initialized.set()
+            elif event == 'ack':
+                self.ack_latencies.append(time.perf_counter() - self.sent_at)
+                sent[data['version']] = self.sent_at
+                self.version = data['version']
+                self.outstanding = None
+                if self.buffer is not None:
+                    self.outstanding, self.buffer = self.buffer, None
+                    await self.send()
+            elif event == 'delta':
+                self.received[data['version']] = time.perf_counter()
+                self.receive(data['delta'])
+                self.version = data['version']
+            elif event == 'error':
+                self.errors += 1
+
+    def receive(self, change):
+        # The server sequenced the change before anything of ours it has not acknowledged
+        if self.outstanding is not None:
+            change, self.outstanding = transform(self.outstanding, change, False), transform(change, self.outstanding, True)
+        if self.buffer is not None:
+            change, self.buffer = transform(self.buffer, change, False), transform(change, self.buffer, True)
+        self.text, _ = apply_to_text(self.text, change)
+
+    async def send(self):
+        self.sent_at = time.perf_counter()
+        await self.communicator.send_json_to({
+            'delta': self.outstanding, 'version': self.version, 'request_id': uuid.uuid4().hex,
+        })
+
+    async def edit(self):
+        change = self.random_change()
+        self.typed += 1
+        self.text, _ = apply_to_text(self.text, change)
+        if self.outstanding is None:
+            self.outstanding = change
+            await self.send()
+        else:
+            self.buffer = change if self.buffer is None else compose_changes(self.buffer, change)
+
+    def random_change(self):
+        # Keep the closing newline
+        position = self.rng.randrange(len(self.text))
+        if self.rng.random() < 0.7 or len(self.text) - position < 2:
+            ops = [{'insert': self.rng.choice(WORDS) + ' '}]
+        else:
+            ops = [{'delete': self.rng.randint(1, min(10, len(self.text) - position - 1))}]
+        return {'ops': ([{'retain': position}] if position else []) + ops}
+
+    @property
+    def idle(self):
+        return self.outstanding is None and self.buffer is None
+
+
+class Command(BaseCommand):
+    help = 'Load test real-time collaborative editing: latency, throughput, saves and convergence'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=5)
+        parser.add_argument('--editors', type=int, default=10, help='Editors per document')
+        parser.add_argument('--ops', type=int, default=100, help='Changes each editor types')
+        parser.add_argument('--rate', type=float, default=5, help='Changes per second per editor')
+        parser.add_argument('--room-host', choices=['local', 'worker'], default='local',
+                            help='Host the rooms in the socket consumers, or in a room worker over the channel layer')
+        parser.add_argument('--save-delay', type=float, default=settings.COLLABORATION['SAVE_DELAY'])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        documents = [
+            Document.objects.create(
+                title=f'Collaboration benchmark {index}',
+                content={'ops': [{'insert': ' '.join(rng.choice(WORDS) for _ in range(200)) + '\n'}]},
+            )
+            for index in range(options['documents'])
+        ]
+        config = dict(settings.COLLABORATION, ROOM_HOST=options['room_host'], SAVE_DELAY=options['save_delay'])
+        try:
+            with override_settings(COLLABORATION=config):
+                result = asyncio.run(self.run([document.pk for document in documents], rng, options))
+        finally:
+            Document.objects.filter(pk__in=[document.pk for document in documents]).delete()
+
+        self.stdout.write(
+            f"{result['editors']} editors on {result['documents']} documents ({result['room_host']} rooms): "
+            f"{result['ops']} changes in {result['seconds']} s ({result['ops_per_second']} ops/s, "
+            f"{result['messages']} messages)\n"
+            f"ack p50 {result['ack_ms_p50']} ms p95 {result['ack_ms_p95']} ms p99 {result['ack_ms_p99']} ms, "
+            f"broadcast p50 {result['broadcast_ms_p50']} ms p95 {result['broadcast_ms_p95']} ms "
+            f"p99 {result['broadcast_ms_p99']} ms\n"
+            f"{result['saves']} saves for {result['ops']} changes, {result['resyncs']} resyncs, {result['errors']} errors"
+        )
+        if result['diverged']:
+            self.stdout.write(self.style.ERROR(f"{result['diverged']} documents diverged"))
+        else:
+            self.stdout.write(self.style.SUCCESS('Every editor and the saved documents converged'))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+
+    async def run(self, document_ids, rng, options):
+        stopping = asyncio.Event()
+        worker = None
+        if options['room_host'] == 'worker':
+            worker = asyncio.ensure_future(serve_rooms(range(settings.COLLABORATION['SHARDS']), stopping))
+
+        from core.asgi import application
+        origin = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS[0] != '*' else 'localhost'
+        rooms = {}
+        for document_id in document_ids:
+            rooms[document_id] = []
+            for _ in range(options['editors']):
+                communicator = WebsocketCommunicator(
+                    application, f'/ws/documents/{document_id}/edit/', headers=[(b'origin', f'http://{origin}'.encode())]
+                )
+                connected, _ = await communicator.connect()
+                if not connected:
+                    raise RuntimeError(f'Could not connect to document {document_id}')
+                rooms[document_id].append(Editor(communicator, random.Random(rng.random())))
+
+        editors = [editor for room in rooms.values() for editor in room]
+        revisions = await database_sync_to_async(self.revision_count)(document_ids)
+        sent = {document_id: {} for document_id in document_ids}
+        listeners = [
+            asyncio.ensure_future(editor.listen(sent[document_id]))
+            for document_id, room in rooms.items() for editor in room
+        ]
+        await asyncio.gather(*(editor.initialized.wait() for editor in editors))
+
+        async def type_changes(editor):
+            for _ in range(options['ops']):
+                await asyncio.sleep(editor.rng.expovariate(options['rate']))
+                await editor.edit()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(type_changes(editor) for editor in editors))
+        # Until every change is acknowledged and every editor has seen every version
+        while not all(
+            editor.idle and editor.version == max(other.version for other in room)
+            for room in rooms.values() for editor in room
+        ):
+            await asyncio.sleep(0.05)
+        seconds = time.perf_counter() - start
+
+        diverged = sum(1 for room in rooms.values() if len({editor.text for editor in room}) > 1)
+        for listener in listeners:
+            listener.cancel()
+        for editor in editors:
+            await editor.communicator.disconnect(timeout=10)
+
+        # The last editor leaving saves the room
+        deadline = time.monotonic() + 30
+        while True:
+            saved = await database_sync_to_async(self.saved_texts)(document_ids)
+            if all(saved[document_id] == room[0].text for document_id, room in rooms.items()):
+                break
+            if time.monotonic() > deadline:
+                diverged += sum(1 for document_id, room in rooms.items() if saved[document_id] != room[0].text)
+                break
+            await asyncio.sleep(0.1)
+        saves = await database_sync_to_async(self.revision_count)(document_ids) - revisions
+
+        if worker is not None:
+            stopping.set()
+            await worker
+
+        acks = sorted(latency for editor in editors for latency in editor.ack_latencies)
+        ops = sum(editor.typed for editor in editors)
+        broadcasts = sorted(
+            received - sent[document_id][version]
+            for document_id, room in rooms.items() for editor in room
+            for version, received in editor.received.items() if version in sent[document_id]
+        )
+        return {
+            'room_host': options['room_host'],
+            'documents': len(document_ids),
+            'editors': len(editors),
+            'ops': ops,
+            'seconds': round(seconds, 2),
+            'ops_per_second': round(ops / seconds, 1),
+            # Changes typed while waiting for an ack go out together
+            'messages': len(acks),
+            **{
+                f'{name}_ms_p{int(fraction * 100)}': round(percentile(values, fraction) * 1000, 2) if values else None
+                for name, values in (('ack', acks), ('broadcast', broadcasts))
+                for fraction in (0.5, 0.95, 0.99)
+            },
+            'saves': saves,
+            'resyncs': sum(editor.resyncs for editor in editors),
+            'errors': sum(editor.errors for editor in editors),
+            'diverged': diverged,
+        }
+
+    def revision_count(self, document_ids):
+        return DocumentRevision.objects.filter(document_id__in=document_ids).count()
+
+    def saved_texts(self, document_ids):
+        return {
+            document.pk: delta_to_text(document.content)
+            for document in Document.objects.filter(pk__in=document_ids)
+        }
@@ -0,0 +1,98 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api.management.commands.benchmark_api import max_rss_mb
+from api.management.commands.benchmark_grammar import SAMPLE_SENTENCES
+from api.utils.chunking import find_issues_in_chunks, get_parse_cache, get_pool, parse_in_worker, reset_pool
+from api.utils.incremental import split_paragraphs
+from api.utils.nlp import get_nlp
+
+
+class Command(BaseCommand):
+    help = 'Measure chunked, parallel grammar analysis of a book-sized document'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megabytes', type=float, default=2, help='Size of the generated manuscript')
+        parser.add_argument('--sentences', type=int, default=6, help='Sentences per paragraph')
+        parser.add_argument('--long-paragraphs', type=int, default=2,
+                            help='Paragraphs longer than CHUNK_CHARS to include, to exercise splitting')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--start-method', default=settings.DOCUMENT_ANALYSIS['START_METHOD'])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        nlp = get_nlp('grammar')
+        results = []
+        for workers in options['workers']:
+            # A different manuscript per run, so nothing is in the parse cache yet
+            bodies = self.make_bodies(random.Random(options['seed'] + workers), options)
+            results.append(self.run(nlp, bodies, workers, options, 'parse'))
+        # The last manuscript again: every chunk comes from the parse cache, as after a rules change
+        results.append(self.run(nlp, bodies, options['workers'][-1], options, 'cached'))
+        # One sentence added to a paragraph in the middle: only the chunks around it are parsed again
+        middle = len(bodies) // 2
+        bodies = bodies[:middle] + [bodies[middle] + ' ' + SAMPLE_SENTENCES[0]] + bodies[middle + 1:]
+        results.append(self.run(nlp, bodies, options['workers'][-1], options, 'edited'))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'runs': results}, f, indent=2)
+
+    def make_bodies(self, rng, options):
+        paragraphs = []
+        size = 0
+        while size < options['megabytes'] * 1e6:
+            paragraph = ' '.join(rng.choice(SAMPLE_SENTENCES) for _ in range(options['sentences'])) + '\n'
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        chunk_chars = settings.DOCUMENT_ANALYSIS['CHUNK_CHARS']
+        for _ in range(options['long_paragraphs']):
+            words = []
+            while sum(len(word) + 1 for word in words) < chunk_chars * 2.5:
+                words.extend(rng.choice(SAMPLE_SENTENCES).split())
+            paragraphs.insert(rng.randrange(len(paragraphs)), ' '.join(words) + '\n')
+        return [body for body in (paragraph.rstrip('\n') for paragraph in split_paragraphs(''.join(paragraphs))) if body]
+
+    def run(self, nlp, bodies, workers, options, mode):
+        config = dict(
+            settings.DOCUMENT_ANALYSIS, WORKERS=workers, PARALLEL_MIN_CHARS=0, START_METHOD=options['start_method']
+        )
+        cache = get_parse_cache(nlp)
+        with override_settings(DOCUMENT_ANALYSIS=config):
+            reset_pool()
+            if workers > 1 and mode == 'parse':
+                # Start the pool processes and load the model in them before timing
+                list(get_pool().map(parse_in_worker, [nlp.analyzer] * workers * 2, [['Warm up.']] * workers * 2))
+            cache.reset_stats()
+            start = time.perf_counter()
+            findings = sum(len(issues) for issues in find_issues_in_chunks(nlp, bodies))
+            elapsed = time.perf_counter() - start
+            reset_pool()
+
+        # A chunk is parsed when it misses every tier of the cache
+        parsed = cache.stats()['tiers'][cache.tiers[-1].name]['misses']
+        characters = sum(len(body) for body in bodies)
+        result = {
+            'mode': mode,
+            'workers': workers,
+            'paragraphs': len(bodies),
+            'megabytes': round(characters / 1e6, 2),
+            'findings': findings,
+            'seconds': round(elapsed, 3),
+            'megabytes_per_second': round(characters / 1e6 / elapsed, 3),
+            'chunks_parsed': parsed,
+            'peak_rss_mb': max_rss_mb(),
+        }
+        self.stdout.write(
+            f"{mode:<7} workers={workers:<3} {result['megabytes']} MB in {result['paragraphs']} paragraphs: "
+            f"{result['seconds']:>8} s, {result['megabytes_per_second']} MB/s, {findings} findings, "
+            f"{parsed} chunks parsed, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+        return result
@@ -0,0 +1,111 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api.utils import metrics
+from api.utils.grammar import RULES, RuleEngine, check_grammar, check_texts
+from api.utils.nlp import get_nlp
+
+SAMPLE_SENTENCES = [
+    'The quick brown fox jumps over the lazy dog.',
+    'The report was written by the committee last week.',
+    'it are a good idea to test the code',
+    'We use js for most of the frontend work.',
+    'Writers often revise a paragraph many times before they are happy with it.',
+    'Short one.',
+    'The new editor highlights grammar issues as you type and suggests improvements for style and clarity.',
+    'She said that the chapter is finished.',
+    'He were late again',
+    "It's been a long week, but the draft got done.",
+    'Readers remember a strong opening line!',
+    'Why would anyone write like that?',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare per-text grammar checks against batched nlp.pipe throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--texts', type=int, default=1000, help='Number of paragraphs to check')
+        parser.add_argument('--sentences', type=int, default=5, help='Sentences per paragraph')
+        parser.add_argument('--batch-size', type=int, nargs='+', default=[16, 64, 256])
+        parser.add_argument('--n-process', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--rule-timings', action='store_true', help='Also report the time spent in each rule')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        nlp = get_nlp('grammar')
+
+        rng = random.Random(options['seed'])
+        texts = [
+            ' '.join(rng.choice(SAMPLE_SENTENCES) for _ in range(options['sentences']))
+            for _ in range(options['texts'])
+        ]
+
+        results = []
+
+        start = time.perf_counter()
+        for text in texts:
+            check_grammar(nlp(text))
+        results.append(self.record('sequential', None, None, len(texts), time.perf_counter() - start))
+
+        for n_process in options['n_process']:
+            for batch_size in options['batch_size']:
+                start = time.perf_counter()
+                for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+                    check_grammar(doc)
+                results.append(self.record('pipe', batch_size, n_process, len(texts), time.perf_counter() - start))
+
+        # The tiered pipeline against parsing every sentence, on the same texts
+        outputs = {}
+        for tiered in (False, True):
+            with override_settings(GRAMMAR_TIERED=tiered):
+                parsed = metrics.GRAMMAR_SENTENCES.value(stage='parser')
+                surface = metrics.GRAMMAR_SENTENCES.value(stage='surface')
+                start = time.perf_counter()
+                outputs[tiered] = list(check_texts(nlp, texts, batch_size=options['batch_size'][0]))
+                result = self.record('tiered' if tiered else 'full', options['batch_size'][0], 1, len(texts),
+                                     time.perf_counter() - start)
+                parsed = metrics.GRAMMAR_SENTENCES.value(stage='parser') - parsed
+                surface = metrics.GRAMMAR_SENTENCES.value(stage='surface') - surface
+                result['parsed_share'] = round(parsed / (parsed + surface), 3) if parsed + surface else None
+                results.append(result)
+        mismatches = sum(1 for full, tiered in zip(outputs[False], outputs[True]) if full != tiered)
+        results[-1]['mismatches'] = mismatches
+        self.stdout.write(
+            f"tiered: {1 - results[-1]['parsed_share']:.1%} of sentences skipped the parser, "
+            f"{mismatches} of {len(texts)} texts got different suggestions than with a full parse"
+        )
+
+        report = {'runs': results}
+        if options['rule_timings']:
+            engine = RuleEngine(RULES, timed=True)
+            for doc in nlp.pipe(texts):
+                for sent in doc.sents:
+                    engine.check_sentence(sent)
+            report['rule_timings'] = engine.timings()
+            for name, timing in report['rule_timings'].items():
+                self.stdout.write(f"{name:<24} {timing['seconds'] * 1000:>10.2f} ms over {timing['calls']} sentences")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def record(self, mode, batch_size, n_process, count, elapsed):
+        result = {
+            'mode': mode,
+            'batch_size': batch_size,
+            'n_process': n_process,
+            'texts': count,
+            'seconds': round(elapsed, 4),
+            'texts_per_second': round(count / elapsed, 1) if elapsed else None,
+        }
+        self.stdout.write(
+            f"{mode:<10} batch_size={batch_size or '-':<5} n_process={n_process or '-':<3} "
+            f"{result['seconds']:>8}s {result['texts_per_second']:>10} texts/s"
+        )
+        return result
@@ -0,0 +1,76 @@
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Each measurement runs in a fresh interpreter so earlier loads do not skew it
+STARTUP_SCRIPT = """
+import json, os, resource, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+import django
+django.setup()
+import api.urls
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+LOAD_SCRIPT = """
+import json, resource, sys, time
+import spacy
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+nlp = spacy.load(sys.argv[1], exclude=json.loads(sys.argv[2]))
+seconds = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'seconds': seconds,
+    'max_rss_kb': after,
+    'model_rss_kb': after - before,
+    'pipe_names': nlp.pipe_names,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure app startup time and the load time and RSS of each configured spaCy pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = {'startup': self.run(STARTUP_SCRIPT), 'pipelines': []}
+        self.stdout.write(
+            f"startup: {results['startup']['seconds']:.3f}s, max RSS {results['startup']['max_rss_kb'] // 1024} MB"
+        )
+
+        configs = [('full', {})] + list(settings.SPACY_PIPELINES.items())
+        for analyzer, config in configs:
+            model = config.get('model', settings.SPACY_MODEL)
+            exclude = config.get('exclude', [])
+            result = self.run(LOAD_SCRIPT, model, json.dumps(exclude))
+            result.update({'analyzer': analyzer, 'model': model, 'exclude': exclude})
+            results['pipelines'].append(result)
+            self.stdout.write(
+                f"{analyzer}: {result['seconds']:.3f}s, +{result['model_rss_kb'] // 1024} MB RSS, "
+                f"components {', '.join(result['pipe_names'])}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def run(self, script, *args):
+        output = subprocess.run(
+            [sys.executable, '-c', script, *args],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if output.returncode:
+            raise CommandError(output.stderr.strip().splitlines()[-1])
+        return json.loads(output.stdout.strip().splitlines()[-1])
@@ -0,0 +1,118 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.management.commands.benchmark_api import max_rss_mb, percentile
+from api.utils.phrases import (
+    add_counts, count_paragraphs, count_phrases, dump_table, locate_phrases, new_sketch, top_entries
+)
+
+# Habits a writer might fall into, sprinkled through the generated manuscripts
+PET_PHRASES = [
+    'She took a deep breath.',
+    'At the end of the day, nothing else mattered.',
+    'His heart skipped a beat.',
+    'A shiver ran down her spine.',
+    'They exchanged a knowing glance.',
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure how long indexing and locating the repeated phrases of a book-sized document take'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, nargs='+', default=[10000, 100000, 300000],
+                            help='Sizes of the generated manuscripts, in words')
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Distinct words to draw from')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per manuscript')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = self.make_vocabulary(rng, options['vocabulary'])
+        results = [self.run(rng, self.make_paragraphs(rng, vocabulary, words), options) for words in options['words']]
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'runs': results}, f, indent=2)
+
+    def make_vocabulary(self, rng, size):
+        letters = 'abcdefghijklmnoprstuvwy'
+        words = ['the', 'and', 'of', 'to', 'a', 'in', 'was', 'he', 'she', 'it', 'that', 'with', 'for', 'on', 'her']
+        while len(words) < size:
+            words.append(''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+        # Zipf-like weights, so a few words are common and most are rare
+        return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+    def make_paragraphs(self, rng, vocabulary, words):
+        paragraphs = []
+        count = 0
+        while count < words:
+            sentences = []
+            for _ in range(rng.randint(3, 8)):
+                if rng.random() < 0.05:
+                    sentences.append(rng.choice(PET_PHRASES))
+                else:
+                    sentence = rng.choices(*vocabulary, k=rng.randint(6, 22))
+                    sentences.append(' '.join(sentence).capitalize() + '.')
+            paragraph = ' '.join(sentences)
+            paragraphs.append(paragraph + '\n')
+            count += len(paragraph.split())
+        return paragraphs
+
+    def run(self, rng, paragraphs, options):
+        config = settings.PHRASE_INDEX
+        build, change, locate = [], [], []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            sketch, table = new_sketch(), {}
+            count_paragraphs(paragraphs, (sketch, table))
+            build.append(time.perf_counter() - start)
+
+            # Rewrite one paragraph, as a save does
+            position = rng.randrange(len(paragraphs))
+            edited = paragraphs[position].replace('.', ', then she took a deep breath.', 1)
+            start = time.perf_counter()
+            changes = count_phrases([edited])
+            changes.subtract(count_phrases([paragraphs[position]]))
+            add_counts(sketch, table, changes)
+            change.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            candidates = {
+                phrase for group in top_entries(table, config['CANDIDATES'], nested=True) for phrase, _ in group
+            }
+            found = locate_phrases(paragraphs, candidates, config['MAX_LOCATIONS'])
+            locate.append(time.perf_counter() - start)
+        build.sort()
+        change.sort()
+        locate.sort()
+
+        phrases, _ = top_entries({phrase: count for phrase, (count, _) in found.items()}, 5)
+        words = sum(len(paragraph.split()) for paragraph in paragraphs)
+        result = {
+            'words': words,
+            'paragraphs': len(paragraphs),
+            'build_seconds_p50': round(percentile(build, 0.5), 3),
+            'change_ms_p50': round(percentile(change, 0.5) * 1000, 2),
+            'locate_seconds_p50': round(percentile(locate, 0.5), 3),
+            'words_per_second': round(words / percentile(build, 0.5)),
+            'sketch_kb': round(len(sketch.to_bytes()) / 1024, 1),
+            'table_kb': round(len(dump_table(table)) / 1024, 1),
+            'table_phrases': len(table),
+            'top_phrases': [f'{phrase} ({count})' for phrase, count in phrases],
+            'peak_rss_mb': max_rss_mb(),
+        }
+        self.stdout.write(
+            f"{result['words']:>8} words in {result['paragraphs']} paragraphs: "
+            f"build p50 {result['build_seconds_p50']} s ({result['words_per_second']} words/s), "
+            f"one-paragraph change p50 {result['change_ms_p50']} ms, locate p50 {result['locate_seconds_p50']} s, "
+            f"sketch {result['sketch_kb']} KB, table {result['table_kb']} KB ({result['table_phrases']} phrases), "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+        self.stdout.write(f"  top phrases: {', '.join(result['top_phrases'])}")
+        return result
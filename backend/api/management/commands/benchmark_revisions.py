@@ -0,0 +1,119 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.conf import settings
+
+from api.models import Document, DocumentRevision
+from api.utils.delta import compose, delta_to_text
+
+WORDS = (
+    'the writer revised each chapter slowly while the editor marked passive sentences '
+    'and suggested clearer words for every paragraph of the long manuscript'
+).split()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure revision history size and reconstruction latency on a large synthetic document'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paragraphs', type=int, default=3000)
+        parser.add_argument('--edits', type=int, default=500, help='Saved revisions to generate')
+        parser.add_argument('--snapshot-interval', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--samples', type=int, default=50, help='Revisions to rebuild per interval')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = []
+        for interval in options['snapshot_interval']:
+            config = dict(settings.REVISION_HISTORY, SNAPSHOT_INTERVAL=interval)
+            with override_settings(REVISION_HISTORY=config):
+                try:
+                    with transaction.atomic():
+                        results.append(self.run(interval, options))
+                        # Leave nothing behind
+                        raise Rollback
+                except Rollback:
+                    pass
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'runs': results}, f, indent=2)
+
+    def run(self, interval, options):
+        rng = random.Random(options['seed'])
+        paragraphs = [
+            ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))).capitalize() + '.\n'
+            for _ in range(options['paragraphs'])
+        ]
+        content = {'ops': [{'insert': ''.join(paragraphs)}]}
+        document = Document.objects.create(title='Revision benchmark', content=content)
+        content = document.content
+
+        # What storing a full copy of the content per revision would take
+        full_copies = len(json.dumps(content, separators=(',', ':')).encode('utf-8'))
+        expected = {document.revision: content}
+        for _ in range(options['edits']):
+            change = self.random_change(rng, delta_to_text(content))
+            document.apply_delta(change, document.revision)
+            content = compose(content, change)
+            full_copies += len(json.dumps(content, separators=(',', ':')).encode('utf-8'))
+            expected[document.revision] = content
+
+        rows = DocumentRevision.objects.filter(document=document)
+        stored = sum(len(bytes(row.delta or b'')) + len(bytes(row.snapshot or b'')) for row in rows)
+        snapshots = rows.filter(snapshot__isnull=False).count()
+
+        timings = []
+        mismatches = 0
+        for number in rng.sample(sorted(expected), min(options['samples'], len(expected))):
+            start = time.perf_counter()
+            rebuilt = DocumentRevision.content_at(document.pk, number)
+            timings.append(time.perf_counter() - start)
+            if delta_to_text(rebuilt) != delta_to_text(expected[number]):
+                mismatches += 1
+
+        timings.sort()
+        result = {
+            'snapshot_interval': interval,
+            'paragraphs': options['paragraphs'],
+            'revisions': len(expected),
+            'snapshots': snapshots,
+            'full_copy_bytes': full_copies,
+            'stored_bytes': stored,
+            'ratio': round(full_copies / stored, 1) if stored else None,
+            'rebuild_ms_p50': round(statistics.median(timings) * 1000, 2),
+            'rebuild_ms_p95': round(timings[int(len(timings) * 0.95) - 1] * 1000, 2) if len(timings) > 1 else None,
+            'rebuild_ms_max': round(timings[-1] * 1000, 2),
+            'mismatches': mismatches,
+        }
+        self.stdout.write(
+            f"interval={interval:<5} revisions={result['revisions']:<5} snapshots={snapshots:<4} "
+            f"full copies {full_copies / 1e6:.1f} MB, stored {stored / 1e6:.2f} MB (x{result['ratio']}), "
+            f"rebuild p50 {result['rebuild_ms_p50']} ms p95 {result['rebuild_ms_p95']} ms, mismatches {mismatches}"
+        )
+        return result
+
+    def random_change(self, rng, text):
+        """
+        A typical autosave: a few words typed, deleted or reformatted somewhere in the text
+        """
+        position = rng.randrange(len(text))
+        kind = rng.random()
+        if kind < 0.6:
+            words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+            return [{'retain': position}, {'insert': words + ' '}] if position else [{'insert': words + ' '}]
+        length = min(rng.randint(1, 30), len(text) - position - 1)
+        if length < 1:
+            return [{'insert': ' '}]
+        op = {'delete': length} if kind < 0.85 else {'retain': length, 'attributes': {'bold': True}}
+        return [{'retain': position}, op] if position else [op]
@@ -0,0 +1,117 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import Document, User
+from api.utils.search import get_search_backend, owner_token, search_documents
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ran', 'tes', 'vo', 'dri', 'sel', 'nu', 'pha', 'gor', 'eth', 'wyn', 'bel', 'qua', 'zor')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time full-text search queries over a large synthetic library'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=100000)
+        parser.add_argument('--authors', type=int, default=1, help='Spread the documents over this many users')
+        parser.add_argument('--words', type=int, default=300, help='Words per document')
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Distinct words, drawn with a Zipf distribution')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None:
+            raise CommandError(f'Search is not available on {connection.vendor}')
+
+        try:
+            with transaction.atomic():
+                report = self.run(backend, options)
+                # Leave nothing behind
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def run(self, backend, options):
+        rng = random.Random(options['seed'])
+        vocabulary = self.make_vocabulary(rng, options['vocabulary'])
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        authors = User.objects.bulk_create([
+            User(username=f'search-benchmark-{index}') for index in range(options['authors'])
+        ])
+
+        # Documents and index rows are written directly; building chunks is not what is measured
+        start = time.perf_counter()
+        for offset in range(0, options['documents'], options['batch_size']):
+            count = min(options['batch_size'], options['documents'] - offset)
+            documents = Document.objects.bulk_create([
+                Document(title=' '.join(rng.choices(vocabulary, weights, k=3)).capitalize(), author=rng.choice(authors),
+                         search_stale=False)
+                for _ in range(count)
+            ])
+            rows = [
+                (document.pk, document.title, ' '.join(rng.choices(vocabulary, weights, k=options['words'])), '',
+                 owner_token(document.author_id))
+                for document in documents
+            ]
+            with connection.cursor() as cursor:
+                backend.index(cursor, rows)
+        build_seconds = time.perf_counter() - start
+        self.stdout.write(f"Indexed {options['documents']} documents in {build_seconds:.1f}s")
+
+        # Common words match most of the library, which is the worst case for ranking
+        common = vocabulary[:20]
+        typical = vocabulary[200:5000]
+        queries = {
+            'common word': lambda: rng.choice(common),
+            'typical word': lambda: rng.choice(typical),
+            'two words': lambda: f'{rng.choice(typical)} {rng.choice(vocabulary[20:500])}',
+            'prefix': lambda: rng.choice(typical)[:4],
+        }
+        report = {
+            'vendor': connection.vendor,
+            'documents': options['documents'],
+            'authors': options['authors'],
+            'words_per_document': options['words'],
+            'build_seconds': round(build_seconds, 2),
+            'queries': {},
+        }
+        for name, make_query in queries.items():
+            timings = []
+            for _ in range(options['queries']):
+                query = make_query()
+                start = time.perf_counter()
+                search_documents(query, rng.choice(authors).pk, options['limit'])
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            result = {
+                'p50_ms': round(statistics.median(timings) * 1000, 2),
+                'p95_ms': round(timings[int(len(timings) * 0.95) - 1] * 1000, 2),
+                'p99_ms': round(timings[int(len(timings) * 0.99) - 1] * 1000, 2),
+            }
+            report['queries'][name] = result
+            self.stdout.write(f"{name:<13} p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms")
+        return report
+
+    def make_vocabulary(self, rng, size):
+        words = set()
+        while len(words) < size:
+            words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+        words = sorted(words)
+        rng.shuffle(words)
+        return words
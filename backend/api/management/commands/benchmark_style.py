@@ -0,0 +1,62 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.management.commands.benchmark_api import max_rss_mb, percentile
+from api.management.commands.benchmark_grammar import SAMPLE_SENTENCES
+from api.utils.style import score_text
+
+
+class Command(BaseCommand):
+    help = 'Measure how long the style metrics of a book-sized document take'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, nargs='+', default=[10000, 100000, 250000],
+                            help='Sizes of the generated manuscripts, in words')
+        parser.add_argument('--sentences', type=int, default=6, help='Sentences per paragraph')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per manuscript')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        results = [self.run(self.make_text(rng, words, options), options) for words in options['words']]
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'runs': results}, f, indent=2)
+
+    def make_text(self, rng, words, options):
+        paragraphs = []
+        count = 0
+        while count < words:
+            paragraph = ' '.join(rng.choice(SAMPLE_SENTENCES) for _ in range(options['sentences']))
+            paragraphs.append(paragraph)
+            count += len(paragraph.split())
+        return '\n'.join(paragraphs) + '\n'
+
+    def run(self, text, options):
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            metrics = score_text(text)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+
+        result = {
+            'words': metrics['document']['words'],
+            'paragraphs': metrics['document']['paragraphs'],
+            'megabytes': round(len(text) / 1e6, 2),
+            'seconds_p50': round(percentile(timings, 0.5), 3),
+            'seconds_max': round(timings[-1], 3),
+            'words_per_second': round(metrics['document']['words'] / percentile(timings, 0.5)),
+            'peak_rss_mb': max_rss_mb(),
+        }
+        self.stdout.write(
+            f"{result['words']:>8} words in {result['paragraphs']} paragraphs ({result['megabytes']} MB): "
+            f"p50 {result['seconds_p50']} s, max {result['seconds_max']} s, "
+            f"{result['words_per_second']} words/s, peak RSS {result['peak_rss_mb']} MB"
+        )
+        return result
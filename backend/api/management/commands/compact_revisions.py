@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.db.models.functions import Coalesce, Length
+from django.utils import timezone
+
+from api.models import DocumentRevision
+
+
+class Command(BaseCommand):
+    help = 'Drop the intermediate revisions of old document history, keeping its snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=30, help='Keep every revision newer than this')
+        parser.add_argument('--keep-latest', type=int, default=50, help='Always keep this many latest revisions per document')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['keep_days'])
+        before = self.stored_bytes()
+        documents = dropped = 0
+
+        document_ids = (
+            DocumentRevision.objects.filter(created_at__lt=cutoff, snapshot__isnull=True)
+            .values_list('document_id', flat=True).distinct().order_by()
+        )
+        for document_id in list(document_ids):
+            with transaction.atomic():
+                count = self.compact(document_id, cutoff, options['keep_latest'], options['dry_run'])
+            if count:
+                documents += 1
+                dropped += count
+
+        verb = 'Would drop' if options['dry_run'] else 'Dropped'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {dropped} revisions from {documents} documents; '
+            f'history is {self.stored_bytes()} bytes (was {before})'
+        ))
+
+    def compact(self, document_id, cutoff, keep_latest, dry_run):
+        """
+        Drop the document's revisions older than cutoff (apart from the latest
+        keep_latest) that have no snapshot. The oldest revision kept gets a
+        snapshot first, since the changes leading to it are going away.
+        """
+        revisions = DocumentRevision.objects.filter(document_id=document_id)
+        latest = revisions.aggregate(latest=Max('revision'))['latest']
+        recent = revisions.filter(created_at__gte=cutoff).order_by('revision').values_list('revision', flat=True).first()
+        boundary = min(latest + 1 if recent is None else recent, latest - keep_latest + 1)
+
+        dropped = revisions.filter(revision__lt=boundary, snapshot__isnull=True)
+        count = dropped.count()
+        if not count or dry_run:
+            return count
+
+        first_kept = revisions.filter(revision__gte=boundary).order_by('revision').first()
+        if first_kept is not None and first_kept.snapshot is None:
+            first_kept.snapshot = DocumentRevision.compress(DocumentRevision.content_at(document_id, first_kept.revision))
+            first_kept.save(update_fields=['snapshot'])
+        dropped.delete()
+        return count
+
+    def stored_bytes(self):
+        return DocumentRevision.objects.aggregate(
+            total=Coalesce(Sum(Length('delta')), 0) + Coalesce(Sum(Length('snapshot')), 0)
+        )['total']
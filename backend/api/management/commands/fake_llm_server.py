@@ -0,0 +1,142 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+REPLY_WORDS = (
+    'Consider tightening this paragraph by removing filler words and leading with the main point. '
+    'A concrete example would make the argument easier to follow, and varying sentence length '
+    'will improve the rhythm of the passage.'
+).split()
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """
+    Answers OpenAI-style chat completion requests with canned text after a configurable delay.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self.send_error(400, 'Invalid JSON')
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+
+        words = REPLY_WORDS[:max(1, min(len(REPLY_WORDS), body.get('max_tokens') or len(REPLY_WORDS)))]
+        model = body.get('model', 'fake-model')
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+
+        time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+
+        if body.get('stream'):
+            self.send_stream(completion_id, model, words)
+        else:
+            self.send_completion(completion_id, model, words, body)
+
+    def send_completion(self, completion_id, model, words, body):
+        payload = json.dumps({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ' '.join(words)},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': sum(len(str(m.get('content', '')).split()) for m in body.get('messages', [])),
+                'completion_tokens': len(words),
+                'total_tokens': len(words),
+            },
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, completion_id, model, words):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        for index, word in enumerate(words):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if index == 0 else f' {word}'},
+                    'finish_reason': None,
+                }],
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+
+        final = {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        }
+        self.wfile.write(f'data: {json.dumps(final)}\n\ndata: [DONE]\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+
+class Command(BaseCommand):
+    help = 'Run a local OpenAI-compatible server with canned completions for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds before the first byte')
+        parser.add_argument('--jitter', type=float, default=0.1, help='Extra random delay, in seconds')
+        parser.add_argument('--token-delay', type=float, default=0.02, help='Seconds between streamed chunks')
+        parser.add_argument('--verbose', action='store_true')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer((options['host'], options['port']), FakeLLMHandler)
+        server.daemon_threads = True
+        server.latency = options['latency']
+        server.jitter = options['jitter']
+        server.token_delay = options['token_delay']
+        server.verbose = options['verbose']
+        server.lock = threading.Lock()
+        server.requests = 0
+
+        self.stdout.write(
+            f"Fake LLM listening on http://{options['host']}:{options['port']}/v1 "
+            f"(set OPENAI_BASE_URL to this and OPENAI_API_KEY to any value)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Served {server.requests} completion requests')
@@ -0,0 +1,118 @@
+import io
+import pstats
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.profiling import get_store
+
+
+class Command(BaseCommand):
+    help = 'List, summarize and render the request profiles kept by PROFILING'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action', choices=['list', 'top', 'render', 'stats', 'clear'],
+            help='list traces, show the top offenders, render collapsed stacks for a flamegraph, '
+                 'print the cProfile stats of a trace, or delete every trace'
+        )
+        parser.add_argument('ids', nargs='*', help='Trace ids (render and stats)')
+        parser.add_argument('--view', help='Only traces of this view name, e.g. document-detail')
+        parser.add_argument('--limit', type=int, default=20, help='Traces or rows to show')
+        parser.add_argument('--slowest', action='store_true', help='List the slowest traces instead of the newest')
+        parser.add_argument('--sort', default='cumulative', help='pstats sort key for stats')
+        parser.add_argument('--output', help='Write render output to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        self.store = get_store()
+        getattr(self, options['action'])(options)
+
+    def records(self, options):
+        records = []
+        for profile_id in reversed(self.store.ids()):
+            try:
+                record = self.store.load(profile_id)
+            except (OSError, ValueError):
+                # Pruned by a server process while we were reading
+                continue
+            if options['view'] and record['view'] != options['view']:
+                continue
+            records.append(record)
+        return records
+
+    def selected(self, options):
+        if options['ids']:
+            try:
+                return [self.store.load(profile_id) for profile_id in options['ids']]
+            except FileNotFoundError as e:
+                raise CommandError(f'No such profile: {e.filename}')
+        records = sorted(self.records(options), key=lambda record: record['duration_ms'], reverse=True)
+        return records[:options['limit']]
+
+    def list(self, options):
+        records = self.records(options)
+        if options['slowest']:
+            records.sort(key=lambda record: record['duration_ms'], reverse=True)
+        for record in records[:options['limit']]:
+            self.stdout.write(
+                f"{record['id']}  {record['timestamp'][:19]}  {record['duration_ms']:>9.1f} ms  "
+                f"{record['status']}  {record['method']:<6} {record['view']:<28} {record['trigger']:<9} "
+                f"{record['samples']:>5} samples{'  pstats' if record['pstats'] else ''}"
+            )
+        self.stdout.write(f'{len(records)} profiles in {self.store.path}')
+
+    def top(self, options):
+        """
+        Slow requests per view, then the functions most often on top of the stack in them
+        """
+        records = self.records(options)
+        by_view = defaultdict(list)
+        self_samples = Counter()
+        for record in records:
+            by_view[record['view']].append(record['duration_ms'])
+            for stack, count in record['stacks'].items():
+                self_samples[stack.rsplit(';', 1)[-1]] += count
+
+        self.stdout.write(f"{'view':<32} {'profiles':>8} {'mean ms':>10} {'max ms':>10}")
+        ranked = sorted(by_view.items(), key=lambda item: sum(item[1]), reverse=True)
+        for view, durations in ranked[:options['limit']]:
+            self.stdout.write(
+                f'{view:<32} {len(durations):>8} {sum(durations) / len(durations):>10.1f} {max(durations):>10.1f}'
+            )
+
+        total = sum(self_samples.values())
+        if total:
+            self.stdout.write(f'\nFunctions running when sampled ({total} samples)')
+            for label, count in self_samples.most_common(options['limit']):
+                self.stdout.write(f'{count / total:>7.1%}  {label}')
+
+    def render(self, options):
+        """
+        Merge the stacks of the selected traces in the collapsed format read by
+        flamegraph.pl, speedscope and inferno
+        """
+        stacks = Counter()
+        for record in self.selected(options):
+            stacks.update(record['stacks'])
+        lines = ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(lines)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(stacks)} stacks to {options['output']}"))
+        else:
+            self.stdout.write(lines, ending='')
+
+    def stats(self, options):
+        if len(options['ids']) != 1:
+            raise CommandError('stats takes one profile id')
+        path = self.store.stats_path(options['ids'][0])
+        if not path.exists():
+            raise CommandError('That profile has no cProfile stats (only ?profile=1 requests do)')
+        output = io.StringIO()
+        pstats.Stats(str(path), stream=output).sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(output.getvalue())
+
+    def clear(self, options):
+        count = len(self.store.ids())
+        self.store.clear()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} profiles'))
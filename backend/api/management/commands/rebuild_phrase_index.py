@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Document, PhraseIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the repeated-phrase indexes of documents and their authors from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, nargs='+', help='Only these documents (and their authors)')
+        parser.add_argument('--author', type=int, nargs='+', help='Only the documents of these authors')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.order_by('pk')
+        if options['document']:
+            documents = documents.filter(pk__in=options['document'])
+        if options['author']:
+            documents = documents.filter(author_id__in=options['author'])
+
+        authors = set(options['author'] or [])
+        indexed = 0
+        for document_id, author_id in documents.values_list('pk', 'author_id').iterator(chunk_size=500):
+            # The author's index is rebuilt below from all of their documents together
+            PhraseIndex.rebuild(document_id, count_for_author=False)
+            if author_id is not None:
+                authors.add(author_id)
+            indexed += 1
+
+        if not options['document'] and not options['author']:
+            # Empty the indexes of authors left without documents too
+            authors.update(PhraseIndex.objects.filter(author__isnull=False).values_list('author_id', flat=True))
+        for author_id in sorted(authors):
+            PhraseIndex.rebuild_author(author_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} documents and {len(authors)} authors'))
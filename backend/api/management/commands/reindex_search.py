@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import Document
+from api.utils.search import INDEX_FIELDS, get_search_backend, index_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--clear', action='store_true', help='Empty the index and index every document')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None:
+            raise CommandError(f'Search is not available on {connection.vendor}')
+
+        if options['clear']:
+            with connection.cursor() as cursor:
+                backend.clear(cursor)
+
+        batch_size = options['batch_size']
+        checked = indexed = 0
+        batch = []
+        queryset = Document.objects.only(*INDEX_FIELDS).order_by('pk')
+        for document in queryset.iterator(chunk_size=batch_size):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                indexed += self.index(batch, options['clear'])
+                checked += len(batch)
+                batch = []
+        if batch:
+            indexed += self.index(batch, options['clear'])
+            checked += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} documents, indexed {indexed}'))
+
+    def index(self, documents, force):
+        with transaction.atomic():
+            return index_documents(documents, force=force)
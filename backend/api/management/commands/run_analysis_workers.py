@@ -0,0 +1,30 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.utils.jobs import AnalysisWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of workers that process queued AI analysis jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.ANALYSIS_JOBS['WORKERS'])
+        parser.add_argument('--poll-interval', type=float, default=settings.ANALYSIS_JOBS['POLL_INTERVAL'],
+                            help='Seconds an idle worker waits before checking the queue again')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        pool = AnalysisWorkerPool(options['workers'], options['poll_interval'], burst=options['burst'])
+        # Let running jobs finish on shutdown; anything left running is requeued after ANALYSIS_JOBS['TIMEOUT']
+        signal.signal(signal.SIGTERM, lambda *args: pool.stop())
+        pool.start()
+        self.stdout.write(f"Started {options['workers']} analysis workers as {pool.name}")
+        try:
+            while pool.is_alive():
+                pool.join(timeout=1)
+        except KeyboardInterrupt:
+            pool.stop()
+            pool.join()
+        self.stdout.write(self.style.SUCCESS('Analysis workers stopped'))
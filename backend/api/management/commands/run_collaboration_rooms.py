@@ -0,0 +1,33 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.collaboration import serve_rooms
+
+
+class Command(BaseCommand):
+    help = "Host the collaborative editing rooms of COLLABORATION['ROOM_HOST'] = 'worker'"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+',
+                            help="Room shards to serve (default: all COLLABORATION['SHARDS']). "
+                                 'Each shard must be served by exactly one worker.')
+
+    def handle(self, *args, **options):
+        count = settings.COLLABORATION['SHARDS']
+        shards = options['shards'] or list(range(count))
+        if any(shard < 0 or shard >= count for shard in shards):
+            raise CommandError(f'Shards are numbered 0 to {count - 1}')
+        self.stdout.write(f"Serving collaboration room shards {', '.join(map(str, shards))}")
+        asyncio.run(self.serve(shards))
+        self.stdout.write(self.style.SUCCESS('Collaboration rooms saved and stopped'))
+
+    async def serve(self, shards):
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        # Save every open room before exiting
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopping.set)
+        await serve_rooms(shards, stopping)
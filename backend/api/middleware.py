@@ -0,0 +1,71 @@
+from urllib.parse import parse_qs
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from api.utils import metrics
+
+
+class MetricsMiddleware:
+    """
+    Record each request's wall time, database queries and time spent in spaCy
+    and the LLM, per view, and add a Server-Timing header when METRICS['SERVER_TIMING'] is set.
+
+    Works for both sync and async views. For streaming responses only the time
+    until the response starts is measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        response = self.get_response(request)
+        metrics.finish_request(request, response, timings, token)
+        return response
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        response = await self.get_response(request)
+        metrics.finish_request(request, response, timings, token)
+        return response
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticate websockets with the same JWT access tokens as the REST API.
+
+    Browsers cannot set an Authorization header on a websocket, so the token
+    comes in the ``token`` query parameter. Sockets sending an invalid or
+    expired token are anonymous; sockets sending none keep the session user.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            scope = dict(scope, user=await self.get_user(token[-1]))
+        return await super().__call__(scope, receive, send)
+
+    @database_sync_to_async
+    def get_user(self, raw_token):
+        authentication = JWTAuthentication()
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return AnonymousUser()
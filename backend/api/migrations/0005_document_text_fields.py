@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_alter_document_content"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="char_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="plain_text",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="word_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
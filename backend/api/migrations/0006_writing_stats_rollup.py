@@ -0,0 +1,55 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_rollups(apps, schema_editor):
+    Document = apps.get_model("api", "Document")
+    WritingStatsRollup = apps.get_model("api", "WritingStatsRollup")
+    totals = (
+        Document.objects.filter(author__isnull=False)
+        .annotate(month=TruncMonth("created_at"))
+        .values("author_id", "month")
+        .annotate(documents=Count("id"), words=Sum("word_count"))
+        .order_by()
+    )
+    WritingStatsRollup.objects.bulk_create(
+        [
+            WritingStatsRollup(
+                author_id=row["author_id"],
+                month=row["month"].date(),
+                document_count=row["documents"],
+                word_count=row["words"] or 0,
+            )
+            for row in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_document_text_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WritingStatsRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField()),
+                ("document_count", models.IntegerField(default=0)),
+                ("word_count", models.BigIntegerField(default=0)),
+                ("author", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="writing_stats_rollups", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("author", "month"), name="unique_writing_stats_month")],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_writing_stats_rollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(fields=["author", "-created_at", "-id"], name="document_author_created_idx"),
+        ),
+    ]
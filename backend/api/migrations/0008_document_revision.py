@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_document_author_created_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="revision",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
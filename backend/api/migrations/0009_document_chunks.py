@@ -0,0 +1,195 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:16
+
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+POSITION_STEP = 1 << 16
+EMBED_CHAR = "\ufffc"
+
+
+# The delta helpers as they were when this migration was written, so later changes to them do not change it
+
+def insert_text(op):
+    value = op["insert"]
+    return value if isinstance(value, str) else EMBED_CHAR
+
+
+def delta_to_text(ops):
+    return "".join(insert_text(op) for op in ops if "insert" in op)
+
+
+def push(ops, op):
+    if ops:
+        last = ops[-1]
+        if (
+            isinstance(last["insert"], str) and isinstance(op["insert"], str)
+            and last.get("attributes") == op.get("attributes")
+        ):
+            last["insert"] += op["insert"]
+            return
+    ops.append(op)
+
+
+def join_ops(op_lists):
+    ops = []
+    for run in op_lists:
+        for op in run:
+            piece = {"insert": op["insert"]}
+            if op.get("attributes"):
+                piece["attributes"] = dict(op["attributes"])
+            push(ops, piece)
+    return {"ops": ops}
+
+
+def split_lines(delta):
+    lines = []
+    current = []
+    for op in delta["ops"]:
+        attributes = op.get("attributes")
+        if not isinstance(op["insert"], str):
+            current.append({"insert": op["insert"], "attributes": attributes} if attributes else {"insert": op["insert"]})
+            continue
+
+        parts = op["insert"].split("\n")
+        for index, part in enumerate(parts):
+            pieces = [part] if index == len(parts) - 1 else [part, "\n"]
+            for piece in pieces:
+                if piece:
+                    push(current, {"insert": piece, "attributes": dict(attributes)} if attributes else {"insert": piece})
+            if index < len(parts) - 1:
+                lines.append(current)
+                current = []
+    if current:
+        lines.append(current)
+    return lines
+
+
+def text_fields(chunks):
+    """
+    The word/char counts and content hash of a document's chunks, in order
+    """
+    filled = [index for index, chunk in enumerate(chunks) if chunk.word_count]
+    char_count = 0
+    if filled:
+        first, last = chunks[filled[0]], chunks[filled[-1]]
+        char_count = sum(chunk.length for chunk in chunks[filled[0]:filled[-1] + 1])
+        char_count -= len(first.text) - len(first.text.lstrip())
+        char_count -= len(last.text) - len(last.text.rstrip())
+    return {
+        "word_count": sum(chunk.word_count for chunk in chunks),
+        "char_count": char_count,
+        "content_hash": hashlib.sha256("".join(chunk.hash for chunk in chunks).encode("utf-8")).hexdigest(),
+    }
+
+
+def parse_content(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return {"ops": [{"insert": value}]} if value else {"ops": []}
+    if isinstance(value, dict):
+        value = value.get("ops", [])
+    if not isinstance(value, list):
+        return {"ops": []}
+    return {"ops": [op for op in value if isinstance(op, dict) and "insert" in op]}
+
+
+def rebuild_rollups(apps):
+    Document = apps.get_model("api", "Document")
+    WritingStatsRollup = apps.get_model("api", "WritingStatsRollup")
+    totals = (
+        Document.objects.filter(author__isnull=False)
+        .annotate(month=TruncMonth("created_at"))
+        .values("author_id", "month")
+        .annotate(documents=Count("id"), words=Sum("word_count"))
+        .order_by()
+    )
+    WritingStatsRollup.objects.all().delete()
+    WritingStatsRollup.objects.bulk_create([
+        WritingStatsRollup(
+            author_id=row["author_id"],
+            month=row["month"].date() if hasattr(row["month"], "date") else row["month"],
+            document_count=row["documents"],
+            word_count=row["words"] or 0,
+        )
+        for row in totals
+    ], batch_size=1000)
+
+
+def split_content(apps, schema_editor):
+    Document = apps.get_model("api", "Document")
+    DocumentChunk = apps.get_model("api", "DocumentChunk")
+    recounted = False
+    for document in Document.objects.only("id", "content", "word_count").iterator(chunk_size=100):
+        chunks = []
+        for index, ops in enumerate(split_lines(parse_content(document.content))):
+            text = delta_to_text(ops)
+            encoded = json.dumps(ops, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+            chunks.append(DocumentChunk(
+                document_id=document.id,
+                position=(index + 1) * POSITION_STEP,
+                ops=ops,
+                text=text,
+                length=len(text),
+                word_count=len(text.split()),
+                hash=hashlib.sha256(encoded.encode("utf-8")).hexdigest(),
+            ))
+        DocumentChunk.objects.bulk_create(chunks, batch_size=500)
+        # Count as the chunks do, instead of the stored plain text that is going away
+        fields = text_fields(chunks)
+        Document.objects.filter(pk=document.id).update(**fields)
+        recounted = recounted or fields["word_count"] != document.word_count
+    if recounted:
+        rebuild_rollups(apps)
+
+
+def join_content(apps, schema_editor):
+    Document = apps.get_model("api", "Document")
+    DocumentChunk = apps.get_model("api", "DocumentChunk")
+    for document in Document.objects.only("id").iterator(chunk_size=100):
+        chunks = list(DocumentChunk.objects.filter(document_id=document.id).order_by("position").values_list("ops", "text"))
+        document.content = join_ops(ops for ops, _ in chunks)
+        document.plain_text = "".join(text for _, text in chunks).strip()
+        document.save(update_fields=["content", "plain_text"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_document_revision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentChunk",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("position", models.BigIntegerField()),
+                ("ops", models.JSONField(default=list)),
+                ("text", models.TextField(blank=True, default="")),
+                ("length", models.PositiveIntegerField(default=0)),
+                ("word_count", models.PositiveIntegerField(default=0)),
+                ("hash", models.CharField(max_length=64)),
+                ("document", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="chunks", to="api.document")),
+            ],
+            options={
+                "ordering": ["position"],
+                "constraints": [models.UniqueConstraint(fields=("document", "position"), name="unique_document_chunk_position")],
+            },
+        ),
+        migrations.RunPython(split_content, join_content),
+        migrations.RemoveField(
+            model_name="document",
+            name="content",
+        ),
+        migrations.RemoveField(
+            model_name="document",
+            name="plain_text",
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_document_chunks"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentRevision",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("revision", models.PositiveIntegerField()),
+                ("delta", models.BinaryField(null=True)),
+                ("snapshot", models.BinaryField(null=True)),
+                ("word_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("document", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="revisions", to="api.document")),
+            ],
+            options={
+                "ordering": ["-revision"],
+                "constraints": [models.UniqueConstraint(fields=("document", "revision"), name="unique_document_revision")],
+            },
+        ),
+    ]
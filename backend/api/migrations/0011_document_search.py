@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE api_document_search USING fts5("
+            "title, body, owner, content_hash UNINDEXED, tokenize = 'porter unicode61')"
+        )
+        # Rank title matches above body matches
+        schema_editor.execute("INSERT INTO api_document_search (api_document_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 0.0, 0.0)')")
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE api_document_search ("
+            "document_id bigint PRIMARY KEY REFERENCES api_document (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "title text NOT NULL, body text NOT NULL, content_hash varchar(64) NOT NULL, owner varchar(32) NOT NULL, "
+            "search_vector tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX api_document_search_vector_idx ON api_document_search USING GIN (search_vector)"
+        )
+        schema_editor.execute("CREATE INDEX api_document_search_owner_idx ON api_document_search (owner)")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS api_document_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_document_revisions"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
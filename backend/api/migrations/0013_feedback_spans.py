@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_analysis_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aifeedback",
+            name="confidence",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="aifeedback",
+            name="revision",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="aifeedback",
+            index=models.Index(fields=["document", "feedback_type", "start_index"], name="feedback_document_type_idx"),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_feedback_spans"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PhraseIndex",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("sketch", models.BinaryField()),
+                ("phrases", models.BinaryField()),
+                ("paragraphs", models.CharField(blank=True, default="", max_length=16)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("author", models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="phrase_index", to=settings.AUTH_USER_MODEL)),
+                ("counted_author", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to=settings.AUTH_USER_MODEL)),
+                ("document", models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="phrase_index", to="api.document")),
+            ],
+            options={
+                "constraints": [models.CheckConstraint(condition=models.Q(models.Q(("author__isnull", True), ("document__isnull", False)), models.Q(("author__isnull", False), ("document__isnull", True)), _connector="OR"), name="phrase_index_document_or_author")],
+            },
+        ),
+    ]
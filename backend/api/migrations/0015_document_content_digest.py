@@ -0,0 +1,53 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:50
+
+import hashlib
+
+from django.db import migrations
+
+DIGEST_MODULUS = 1 << 256
+
+
+def content_digest(chunks):
+    digest = 0
+    for position, value in chunks:
+        encoded = f"{position}:{value}".encode("utf-8")
+        digest += int.from_bytes(hashlib.blake2b(encoded, digest_size=32).digest(), "big")
+    return digest % DIGEST_MODULUS
+
+
+def sha256_hash(chunks):
+    return hashlib.sha256("".join(value for _, value in chunks).encode("utf-8")).hexdigest()
+
+
+def rehash(apps, make_hash):
+    Document = apps.get_model("api", "Document")
+    DocumentChunk = apps.get_model("api", "DocumentChunk")
+    batch = []
+    for document in Document.objects.only("id", "content_hash").iterator(chunk_size=500):
+        chunks = DocumentChunk.objects.filter(document_id=document.id).order_by("position").values_list("position", "hash")
+        document.content_hash = make_hash(list(chunks))
+        batch.append(document)
+        if len(batch) >= 500:
+            Document.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+    if batch:
+        Document.objects.bulk_update(batch, ["content_hash"])
+
+
+def to_digest(apps, schema_editor):
+    rehash(apps, lambda chunks: f"{content_digest(chunks):064x}")
+
+
+def to_sha256(apps, schema_editor):
+    rehash(apps, sha256_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_phrase_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(to_digest, to_sha256),
+    ]
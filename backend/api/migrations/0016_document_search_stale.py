@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_document_content_digest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="search_stale",
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(
+                condition=models.Q(("search_stale", True)), fields=["author"], name="document_search_stale_idx"
+            ),
+        ),
+    ]
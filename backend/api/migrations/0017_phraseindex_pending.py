@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0016_document_search_stale"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="phraseindex",
+            name="pending",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
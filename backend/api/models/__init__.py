@@ -1,4 +1,9 @@
 from .document import Document, AIFeedback
+from .chunk import DocumentChunk
+from .revision import DocumentRevision
+from .job import AnalysisJob
 from .user import User
+from .stats import WritingStatsRollup
+from .phrase import PhraseIndex
 
-__all__ = ['Document', 'AIFeedback', 'User']
\ No newline at end of file
+__all__ = ['Document', 'AIFeedback', 'DocumentChunk', 'DocumentRevision', 'AnalysisJob', 'User', 'WritingStatsRollup', 'PhraseIndex']
\ No newline at end of file
@@ -0,0 +1,88 @@
+from collections import namedtuple
+from django.db import models
+import hashlib
+import json
+from api.utils.delta import delta_to_text
+
+# Gap left between consecutive chunk positions, so new chunks fit in between
+POSITION_STEP = 1 << 16
+DIGEST_MODULUS = 1 << 256
+
+# The stored columns of a chunk needed to place it and total it up, without its ops or text
+ChunkSummary = namedtuple('ChunkSummary', ('position', 'hash', 'length', 'word_count'))
+
+
+def content_digest(chunks, digest=0, sign=1):
+    """
+    Add (or with sign=-1 take away) chunks, as (position, hash) pairs, to a
+    digest of a document's content.
+
+    The digest is the sum of a hash of each chunk's position and content,
+    modulo 2**256. The positions make it follow the order of the chunks, and a
+    save updates it from the chunks it removes and adds alone.
+    """
+    for position, value in chunks:
+        encoded = f'{position}:{value}'.encode('utf-8')
+        digest += sign * int.from_bytes(hashlib.blake2b(encoded, digest_size=32).digest(), 'big')
+    return digest % DIGEST_MODULUS
+
+
+class DocumentChunk(models.Model):
+    """
+    One line (paragraph) of a document's content, as Quill insert ops.
+
+    Documents keep their content as an ordered run of chunks so large
+    manuscripts can be read a range at a time and saved by rewriting only the
+    paragraphs that changed. Chunks are ordered by ``position``, which leaves
+    gaps so an edit can insert chunks without renumbering its neighbours.
+    """
+    document = models.ForeignKey('api.Document', on_delete=models.CASCADE, related_name='chunks')
+    position = models.BigIntegerField()
+    ops = models.JSONField(default=list)
+    # Text of the ops with embeds as one character, so lengths match Quill indexes
+    text = models.TextField(blank=True, default='')
+    length = models.PositiveIntegerField(default=0)
+    word_count = models.PositiveIntegerField(default=0)
+    hash = models.CharField(max_length=64)
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'position'], name='unique_document_chunk_position'),
+        ]
+
+    def __str__(self):
+        return f"Chunk {self.position} of document {self.document_id}"
+
+    @classmethod
+    def build(cls, ops, **kwargs):
+        """
+        Return an unsaved chunk for a line of ops, with its text and counts filled in
+        """
+        text = delta_to_text(ops)
+        encoded = json.dumps(ops, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return cls(
+            ops=ops,
+            text=text,
+            length=len(text),
+            word_count=len(text.split()),
+            hash=hashlib.sha256(encoded.encode('utf-8')).hexdigest(),
+            **kwargs
+        )
+
+    @staticmethod
+    def spread_positions(before, after, count):
+        """
+        Return count positions strictly between before and after (either may be
+        None for the ends of the document), or None if they do not fit
+        """
+        if before is None and after is None:
+            return [(index + 1) * POSITION_STEP for index in range(count)]
+        if after is None:
+            return [before + (index + 1) * POSITION_STEP for index in range(count)]
+        if before is None:
+            before = after - (count + 1) * POSITION_STEP
+        gap = after - before
+        if gap <= count:
+            return None
+        return [before + gap * (index + 1) // (count + 1) for index in range(count)]
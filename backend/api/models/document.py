@@ -1,11 +1,19 @@
-from django.db import models
+from collections import deque
+from django.db import models, transaction
+from django.db.models import F, Max, Min, Sum
 from django.conf import settings
 import json
+from api.utils.delta import (
+    DeltaError, StaleRevisionError, change_lengths, change_range, compose, delta_to_text, get_ops, join_ops,
+    split_lines
+)
 from .base import AuditModel
+from .chunk import POSITION_STEP, ChunkSummary, DocumentChunk, content_digest
+from .phrase import PhraseIndex
+from .revision import DocumentRevision
 
 class Document(AuditModel):
     title = models.CharField(max_length=255)
-    content = models.JSONField(default=dict, blank=True)
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -13,40 +21,447 @@ class Document(AuditModel):
         blank=True
     )
     is_public = models.BooleanField(default=False)
+    # Bumped on every content change, clients send it back with deltas
+    revision = models.PositiveIntegerField(default=0, editable=False)
+
+    # Derived from the chunks on save so reads never re-parse the content. The
+    # content hash is a digest of the chunks' positions and hashes (see
+    # content_digest), so equal content stored at other positions hashes differently.
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    char_count = models.PositiveIntegerField(default=0, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    # Set by saves that change what search indexes, cleared once the search index has caught up
+    search_stale = models.BooleanField(default=True, editable=False)
+
+    TEXT_FIELDS = ('word_count', 'char_count', 'content_hash')
+    SEARCH_FIELDS = ('title', 'author', 'content_hash')
+
+    class Meta(AuditModel.Meta):
+        indexes = [
+            # Serves the per-author, newest-first document list
+            models.Index(fields=['author', '-created_at', '-id'], name='document_author_created_idx'),
+            # Serves finding an author's documents to reindex before searching
+            models.Index(fields=['author'], condition=models.Q(search_stale=True), name='document_search_stale_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
-    def get_plain_text(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.stats_snapshot = instance.get_stats_snapshot()
+        return instance
+
+    def get_stats_snapshot(self):
+        """
+        Return (author_id, created_at, word_count) as far as they are loaded, for
+        working out how a save or delete changes the author's writing stats
+        """
+        loaded = self.__dict__
+        if not all(name in loaded for name in ('author_id', 'created_at', 'word_count')):
+            return None
+        return (loaded['author_id'], loaded['created_at'], loaded['word_count'])
+
+    def lock_row(self):
+        """
+        Read the stats snapshot and text fields from the row as stored, locking
+        it until the transaction ends. Saves move the writing stats and count
+        chunk changes from what is stored rather than what was loaded, so that
+        concurrent saves of a document loaded at the same time build on each other.
+        """
+        row = Document.objects.select_for_update().filter(pk=self.pk).values_list(
+            'author_id', 'created_at', *self.TEXT_FIELDS
+        ).first()
+        self.stats_snapshot = row[:3] if row else None
+        if row:
+            self.word_count, self.char_count, self.content_hash = row[2:]
+
+    @property
+    def content(self):
         """
-        Extract plain text from Quill content
+        The whole content as one Quill delta, assembled from the chunks on first access.
+        Use the chunks directly to read part of a large document.
         """
-        try:
-            # Handle case where content is a string
-            if isinstance(self.content, str):
-                try:
-                    content = json.loads(self.content)
-                except json.JSONDecodeError:
-                    return self.content  # Return as is if not valid JSON
+        content = self.__dict__.get('_content')
+        if content is None:
+            if self.pk is None:
+                content = {'ops': []}
             else:
-                content = self.content
-
-            # Handle null content
-            if not content:
-                return ""
-
-            # Handle case where content doesn't have ops
-            if not isinstance(content, dict) or 'ops' not in content:
-                return str(content)
-            
-            text = ""
-            for op in content['ops']:
-                if isinstance(op, dict) and 'insert' in op:
-                    text += str(op['insert'])
-            return text.strip()
-        except Exception as e:
-            print(f"Error extracting plain text: {e}")
-            return ""  # Return empty string on error
+                content = join_ops(self.chunks.values_list('ops', flat=True).iterator(chunk_size=200))
+            self._content = content
+        return content
+
+    @content.setter
+    def content(self, value):
+        self._content = self.parse_content(value)
+        self.__dict__.pop('_text', None)
+        self._content_changed = True
+
+    def load_content(self):
+        """
+        Read the content and its text from the chunks together, in one pass,
+        for when both are needed
+        """
+        if self.pk is None or self.__dict__.get('_content_changed'):
+            return
+        lines, texts = [], []
+        for ops, text in self.chunks.values_list('ops', 'text').iterator(chunk_size=200):
+            lines.append(ops)
+            texts.append(text)
+        self._content = join_ops(lines)
+        self._text = ''.join(texts)
+
+    @staticmethod
+    def parse_content(value):
+        """
+        Return value as a document delta, accepting JSON strings and bare op lists.
+        Text that is not JSON becomes a single insert.
+        """
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                return {'ops': [{'insert': value}]} if value else {'ops': []}
+        if isinstance(value, dict):
+            value = value.get('ops', [])
+        if not isinstance(value, list):
+            return {'ops': []}
+        return {'ops': [op for op in value if isinstance(op, dict) and 'insert' in op]}
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop('_content', None)
+        self.__dict__.pop('_text', None)
+        self._content_changed = False
+
+    def save(self, *args, locked=False, **kwargs):
+        """
+        Save the document, and its content as chunks when it was set. Pass
+        locked when lock_row already read the row in the current transaction.
+        """
+        update_fields = kwargs.get('update_fields')
+        chunks = None
+        if self.__dict__.get('_content_changed') and (update_fields is None or 'content' in update_fields):
+            chunks = [DocumentChunk.build(ops) for ops in split_lines(self._content)]
+
+        with transaction.atomic():
+            adding = self._state.adding
+            if not adding and not locked and (
+                chunks is not None or update_fields is None or {'author', 'word_count'} & set(update_fields)
+            ):
+                self.lock_row()
+
+            change = None
+            if chunks is not None and adding:
+                # The chunks can only be written once the row is; they go where replace_chunks will put them
+                for chunk, position in zip(chunks, DocumentChunk.spread_positions(None, None, len(chunks))):
+                    chunk.position = position
+                self.set_text_fields(chunks)
+            elif chunks is not None:
+                change = self.replace_chunks(self.chunk_summaries(), chunks)
+                if not change:
+                    # Same content as stored
+                    chunks = None
+                elif update_fields is None or 'revision' not in update_fields:
+                    self.revision += 1
+
+            if update_fields is not None:
+                update_fields = set(update_fields) - {'content'}
+                if chunks is not None:
+                    update_fields |= set(self.TEXT_FIELDS) | {'revision'}
+            if update_fields is None or set(self.SEARCH_FIELDS) & update_fields:
+                # Reindexed in a background batch once the save commits (see api.utils.search)
+                self.search_stale = True
+                if update_fields is not None:
+                    update_fields.add('search_stale')
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields
+            super().save(*args, **kwargs)
+
+            if chunks is not None and adding:
+                self.replace_chunks([], chunks, count=False)
+            if chunks is not None:
+                DocumentRevision.record(self, change)
+        self._content_changed = False
+
+    def chunk_summaries(self):
+        """
+        Return the stored chunks as ChunkSummary, in order
+        """
+        return [
+            ChunkSummary(*row)
+            for row in self.chunks.values_list(*ChunkSummary._fields).iterator(chunk_size=2000)
+        ]
+
+    def set_text_fields(self, chunks):
+        """
+        Set the counts and content hash from all of the document's chunks, in
+        order and with their positions. Returns True when any of them changed.
+        """
+        content_hash = f'{content_digest((chunk.position, chunk.hash) for chunk in chunks):064x}'
+        word_count = sum(chunk.word_count for chunk in chunks)
+
+        # The character count is of the stripped text, and a chunk without words is all whitespace
+        filled = [index for index, chunk in enumerate(chunks) if chunk.word_count]
+        if filled:
+            first, last = chunks[filled[0]], chunks[filled[-1]]
+            char_count = sum(chunk.length for chunk in chunks[filled[0]:filled[-1] + 1])
+            char_count -= len(first.text) - len(first.text.lstrip())
+            char_count -= len(last.text) - len(last.text.rstrip())
+        else:
+            char_count = 0
+
+        changed = (content_hash, word_count, char_count) != (self.content_hash, self.word_count, self.char_count)
+        self.content_hash = content_hash
+        self.word_count = word_count
+        self.char_count = char_count
+        return changed
+
+    def update_text_fields(self):
+        """
+        Recompute the counts and content hash from the stored chunks.
+        Returns True when any of them changed.
+        """
+        stored = (self.word_count, self.char_count, self.content_hash)
+        self.word_count = self.chunks.aggregate(total=Sum('word_count'))['total'] or 0
+        self.char_count = self.count_chars()
+        digest = content_digest(self.chunks.values_list('position', 'hash').iterator(chunk_size=2000))
+        self.content_hash = f'{digest:064x}'
+        return (self.word_count, self.char_count, self.content_hash) != stored
+
+    def count_chars(self):
+        """
+        Return the length of the stored text with surrounding whitespace
+        stripped, from the first and last chunks with words and the lengths
+        between them
+        """
+        filled = self.chunks.filter(word_count__gt=0)
+        first = filled.order_by('position').values_list('position', 'text').first()
+        if first is None:
+            return 0
+        last = filled.order_by('-position').values_list('position', 'text').first()
+        between = self.chunks.filter(position__gte=first[0], position__lte=last[0]).aggregate(total=Sum('length'))
+        return between['total'] - (len(first[1]) - len(first[1].lstrip())) - (len(last[1]) - len(last[1].rstrip()))
+
+    def count_change(self, removed, added, before, after, renumbered=False):
+        """
+        Update the counts and content hash for the chunks removed and added
+        between the positions before and after, or recompute the hash when the
+        chunks were renumbered
+        """
+        self.word_count += sum(chunk.word_count for chunk in added) - sum(chunk.word_count for chunk in removed)
+        if renumbered:
+            digest = content_digest(self.chunks.values_list('position', 'hash').iterator(chunk_size=2000))
+        else:
+            digest = content_digest(((chunk.position, chunk.hash) for chunk in removed), int(self.content_hash or '0', 16), -1)
+            digest = content_digest(((chunk.position, chunk.hash) for chunk in added), digest)
+        self.content_hash = f'{digest:064x}'
+
+        filled = self.chunks.filter(word_count__gt=0)
+        if (
+            not renumbered and before is not None and after is not None
+            and filled.filter(position__lte=before).exists() and filled.filter(position__gte=after).exists()
+        ):
+            # With words on either side, the whitespace stripped off the ends is untouched
+            self.char_count += sum(chunk.length for chunk in added) - sum(chunk.length for chunk in removed)
+        else:
+            self.char_count = self.count_chars()
+
+    def replace_chunks(self, old, new, before=None, after=None, count=True):
+        """
+        Replace old, a run of stored chunks lying between the positions before
+        and after (None for the ends of the document), with the unsaved chunks new.
+
+        Chunks at either end of the run that did not change stay as they are,
+        and only the others are counted in and out of the counts and content
+        hash (unless count is False) and the phrase index.
+        Returns the change as delta ops relative to the start of the run.
+        """
+        prefix = 0
+        while prefix < min(len(old), len(new)) and old[prefix].hash == new[prefix].hash:
+            prefix += 1
+        suffix = 0
+        while suffix < min(len(old), len(new)) - prefix and old[-1 - suffix].hash == new[-1 - suffix].hash:
+            suffix += 1
+        if prefix:
+            before = old[prefix - 1].position
+        if suffix:
+            after = old[-suffix].position
+
+        index_phrases = settings.PHRASE_INDEX['ENABLED']
+        removed = old[prefix:len(old) - suffix]
+        removed_texts = []
+        if removed:
+            rows = self.chunks.all()
+            if before is not None:
+                rows = rows.filter(position__gt=before)
+            if after is not None:
+                rows = rows.filter(position__lt=after)
+            if index_phrases:
+                removed_texts = list(rows.values_list('hash', 'text'))
+            rows.delete()
+
+        added = new[prefix:len(new) - suffix]
+        change = []
+        retained = sum(chunk.length for chunk in old[:prefix])
+        deleted = sum(chunk.length for chunk in removed)
+        if retained and (deleted or added):
+            change.append({'retain': retained})
+        if deleted:
+            change.append({'delete': deleted})
+        change.extend(op for chunk in added for op in chunk.ops)
+        renumbered = False
+        if added:
+            positions = DocumentChunk.spread_positions(before, after, len(added))
+            if positions is None:
+                positions = self.renumber_chunks(before, len(added))
+                renumbered = True
+            for chunk, position in zip(added, positions):
+                chunk.document = self
+                chunk.position = position
+            DocumentChunk.objects.bulk_create(added)
+        if count and (removed or added):
+            self.count_change(removed, added, before, after, renumbered)
+        if index_phrases and (removed_texts or added):
+            PhraseIndex.record_change(self, removed_texts, [(chunk.hash, chunk.text) for chunk in added])
+        return change
+
+    def renumber_chunks(self, before, count):
+        """
+        Spread the stored chunks out again, leaving room for count chunks right
+        after the position before (or at the start). Returns the free positions.
+        """
+        chunks = self.chunks.all()
+        stored = list(chunks.values_list('pk', 'position'))
+        gap = sum(1 for _, position in stored if before is not None and position <= before)
+
+        # Move everything above both the current and the new positions first, so no two collide on the way
+        bounds = chunks.aggregate(low=Min('position'), high=Max('position'))
+        top = (len(stored) + count + 1) * POSITION_STEP
+        chunks.update(position=F('position') + max(bounds['high'], top) - bounds['low'] + 1)
+
+        DocumentChunk.objects.bulk_update([
+            DocumentChunk(pk=pk, position=(index + 1 + (count if index >= gap else 0)) * POSITION_STEP)
+            for index, (pk, _) in enumerate(stored)
+        ], ['position'], batch_size=500)
+        return [(gap + 1 + index) * POSITION_STEP for index in range(count)]
+
+    def apply_delta(self, change, base_revision):
+        """
+        Compose a Quill change delta made against base_revision into the content.
+
+        Only the chunks the change falls in are read and rewritten, and the
+        counts and content hash are updated from them. Raises
+        StaleRevisionError if the document has moved past base_revision and
+        DeltaError if the change does not fit the content.
+        """
+        ops = get_ops(change)
+        with transaction.atomic():
+            # Claim the next revision first; of several writers sharing a base only one gets it
+            claimed = Document.objects.filter(pk=self.pk, revision=base_revision).update(revision=base_revision + 1)
+            if not claimed:
+                current = Document.objects.filter(pk=self.pk).values_list('revision', flat=True).first()
+                raise StaleRevisionError(f'Document is at revision {current}', revision=current)
+
+            # Under the claim the row and chunks are exactly the base revision
+            self.lock_row()
+            touched = change_range(ops)
+            if touched is not None:
+                self.apply_change(ops, touched)
+            self.__dict__.pop('_content', None)
+            self.__dict__.pop('_text', None)
+            self.revision = base_revision + 1
+            self.save(update_fields=['revision', 'updated_at', *self.TEXT_FIELDS], locked=True)
+            DocumentRevision.record(self, ops)
+
+    def locate_run(self, start, end):
+        """
+        Return the stored chunks a change between the offsets start and end
+        falls in: from the one holding start to the one holding end, which is
+        included even when the change stops right before it, so that deleting
+        a line break joins the two lines.
+
+        Returns the run as (ChunkSummary, ops) pairs, the offsets it starts and
+        ends at and the positions of the chunks either side (None at the ends).
+        Only the positions and lengths of the chunks up to the run are read.
+        """
+        positions = []
+        # The last two chunks before the run, as (position, length)
+        previous = deque(maxlen=2)
+        run_start = offset = 0
+        after = None
+        done = False
+        for position, length in self.chunks.values_list('position', 'length').iterator(chunk_size=500):
+            if done:
+                after = position
+                break
+            if positions or start < offset + length:
+                if not positions:
+                    run_start = offset
+                positions.append(position)
+                done = end < offset + length
+            else:
+                previous.append((position, length))
+            offset += length
+        if not positions and previous:
+            # The change starts at the end of the document: it goes into the last line
+            position, length = previous.pop()
+            positions.append(position)
+            run_start = offset - length
+        if not positions:
+            return [], 0, 0, None, None
+        before = previous[-1][0] if previous else None
+
+        rows = self.chunks.filter(position__gte=positions[0], position__lte=positions[-1])
+        run = [(ChunkSummary(*row[:4]), row[4]) for row in rows.values_list(*ChunkSummary._fields, 'ops')]
+        return run, run_start, run_start + sum(chunk.length for chunk, _ in run), before, after
+
+    def apply_change(self, ops, touched):
+        """
+        Rewrite the chunks a change touches
+        """
+        start, end, first, last = touched
+        run, run_start, run_end, before, after = self.locate_run(start, end)
+        needed = change_lengths(ops)[0]
+        if needed > run_end:
+            rest = self.chunks.filter(position__gte=after).aggregate(total=Sum('length'))['total'] if after else 0
+            if needed > run_end + (rest or 0):
+                raise DeltaError('Delta reaches past the end of the document')
+
+        local_change = [{'retain': start - run_start}] if start > run_start else []
+        local_change += ops[first:last + 1]
+        new = [
+            DocumentChunk.build(line)
+            for line in split_lines(compose(join_ops(ops for _, ops in run), local_change))
+        ]
+        self.replace_chunks([chunk for chunk, _ in run], new, before, after)
+
+    def iter_text(self, batch_size=200):
+        """
+        Yield the text of the content a chunk (line) at a time, embeds as EMBED_CHAR
+        """
+        if self.__dict__.get('_content_changed') or self.pk is None:
+            for line in split_lines(self.content):
+                yield delta_to_text(line)
+            return
+        yield from self.chunks.values_list('text', flat=True).iterator(chunk_size=batch_size)
+
+    def get_text(self):
+        """
+        Return the text of the content as is, so that offsets into it are the editor's indexes
+        """
+        text = self.__dict__.get('_text')
+        if text is None or self.__dict__.get('_content_changed'):
+            text = ''.join(self.iter_text())
+        return text
+
+    def get_plain_text(self):
+        """
+        Return the plain text of the content, read chunk by chunk from storage.
+        It is not stored whole, so that saves only write the chunks that change.
+        """
+        return self.get_text().strip()
 
 class AIFeedback(AuditModel):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ai_feedbacks')
@@ -54,6 +469,47 @@ class AIFeedback(AuditModel):
     start_index = models.IntegerField()
     end_index = models.IntegerField()
     suggestion = models.TextField()
+    confidence = models.FloatField(null=True, blank=True)
+    # The document revision whose text start_index and end_index point into
+    revision = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta(AuditModel.Meta):
+        indexes = [
+            # Serves the per-document, per-type lookups of feedback by position
+            models.Index(fields=['document', 'feedback_type', 'start_index'], name='feedback_document_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.feedback_type} feedback for {self.document.title}"
+
+    @classmethod
+    def replace_findings(cls, document, findings, feedback_types):
+        """
+        Replace the document's feedback of feedback_types with analyzer findings,
+        each a suggestion with 'start' and 'end' offsets into the document text
+        """
+        rows = [
+            cls(
+                document=document,
+                feedback_type=finding['type'],
+                start_index=finding['start'],
+                end_index=finding['end'],
+                suggestion=finding['suggestion'],
+                confidence=finding.get('confidence'),
+                revision=document.revision,
+            )
+            for finding in findings
+        ]
+        with transaction.atomic():
+            cls.objects.filter(document=document, feedback_type__in=feedback_types).delete()
+            return cls.objects.bulk_create(rows)
+
+    @classmethod
+    def overlapping(cls, document, start, end=None):
+        """
+        Return the document's feedback whose span overlaps [start, end), by position
+        """
+        feedback = cls.objects.filter(document=document, end_index__gt=start)
+        if end is not None:
+            feedback = feedback.filter(start_index__lt=end)
+        return feedback.order_by('start_index', 'id')
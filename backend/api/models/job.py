@@ -0,0 +1,130 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+class AnalysisJob(models.Model):
+    """
+    A queued AI analysis of a document's content.
+
+    Jobs live in the database so no broker is needed: workers claim the oldest
+    queued job with a conditional UPDATE, and a job for content that is already
+    queued, running or analyzed is reused instead of enqueued again.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    document = models.ForeignKey('api.Document', on_delete=models.CASCADE, related_name='analysis_jobs')
+    # The content the job analyzes, so unchanged content is never analyzed twice
+    content_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    feedback = models.ForeignKey('api.AIFeedback', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    # Queued jobs are not picked up before this, to back off between attempts
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Serves the workers' "oldest job that is due" lookup
+            models.Index(fields=['status', 'run_after'], name='analysis_job_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'content_hash'],
+                condition=~Q(status='failed'),
+                name='unique_active_analysis_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Analysis job {self.pk} ({self.status}) for document {self.document_id}"
+
+    @classmethod
+    def enqueue(cls, document):
+        """
+        Return (job, created): the job analyzing the document's current content,
+        queuing a new one unless one is already queued, running or done
+        """
+        job = cls.objects.filter(document=document, content_hash=document.content_hash).exclude(status=cls.FAILED).first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                return cls.objects.create(document=document, content_hash=document.content_hash), True
+        except IntegrityError:
+            # Someone else queued the same content first
+            return cls.objects.exclude(status=cls.FAILED).get(document=document, content_hash=document.content_hash), False
+
+    @classmethod
+    def claim(cls, worker):
+        """
+        Mark the oldest due job as running for worker and return it, or None if there is nothing to do
+        """
+        while True:
+            now = timezone.now()
+            job_id = (
+                cls.objects.filter(status=cls.QUEUED, run_after__lte=now)
+                .order_by('run_after', 'id').values_list('id', flat=True).first()
+            )
+            if job_id is None:
+                return None
+            # Only one worker's UPDATE finds the job still queued
+            claimed = cls.objects.filter(pk=job_id, status=cls.QUEUED).update(
+                status=cls.RUNNING, worker=worker, started_at=now, attempts=F('attempts') + 1
+            )
+            if claimed:
+                return cls.objects.select_related('document').get(pk=job_id)
+
+    @classmethod
+    def requeue_stale(cls):
+        """
+        Put jobs back in the queue whose worker has not finished them within
+        ANALYSIS_JOBS['TIMEOUT'], e.g. because it was killed, and fail those
+        that have used up ANALYSIS_JOBS['MAX_ATTEMPTS']. Returns how many were requeued.
+        """
+        config = settings.ANALYSIS_JOBS
+        now = timezone.now()
+        stale = cls.objects.filter(status=cls.RUNNING, started_at__lt=now - timedelta(seconds=config['TIMEOUT']))
+        stale.filter(attempts__gte=config['MAX_ATTEMPTS']).update(
+            status=cls.FAILED, worker='', error='Timed out', finished_at=now
+        )
+        return stale.filter(attempts__lt=config['MAX_ATTEMPTS']).update(status=cls.QUEUED, worker='', run_after=now)
+
+    def finish(self, feedback):
+        self.status = self.DONE
+        self.feedback = feedback
+        self.error = ''
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'feedback', 'error', 'finished_at'])
+
+    def fail(self, error, retry=True):
+        """
+        Record a failed attempt, queuing the job again with exponential backoff
+        until it has used up ANALYSIS_JOBS['MAX_ATTEMPTS']
+        """
+        config = settings.ANALYSIS_JOBS
+        self.error = str(error)
+        if retry and self.attempts < config['MAX_ATTEMPTS']:
+            self.status = self.QUEUED
+            self.run_after = timezone.now() + timedelta(seconds=config['RETRY_DELAY'] * 2 ** (self.attempts - 1))
+        else:
+            self.status = self.FAILED
+            self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'error', 'run_after', 'finished_at'])
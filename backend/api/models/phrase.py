@@ -0,0 +1,279 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from api.utils.phrases import (
+    add_counts, count_paragraphs, count_phrases, dump_table, load_sketch, load_table, new_sketch, paragraphs_digest,
+    update_table
+)
+
+
+class PhraseIndex(models.Model):
+    """
+    How often the phrases and content words of a document, or of all of an
+    author's documents, are used.
+
+    A document's index is kept up to date as its chunks change, from the text
+    of the chunks replaced and added only: saves queue the change in
+    ``pending``, and queued changes are applied in a batch to the index and
+    its author's index. Indexes take the same room whatever the length of the
+    text: see ``api.utils.phrases``.
+    """
+    document = models.OneToOneField(
+        'api.Document', on_delete=models.CASCADE, null=True, blank=True, related_name='phrase_index'
+    )
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='phrase_index'
+    )
+    # The author whose index includes a document's counts
+    counted_author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    # zlib-compressed count-min sketch counters, and JSON of the repeated phrases' counts
+    sketch = models.BinaryField()
+    phrases = models.BinaryField()
+    # zlib-compressed JSON of changes to a document's counts not yet applied to the sketch, table and author
+    pending = models.BinaryField(null=True, blank=True)
+    # Digest of the chunk hashes a document's index counted, to tell when it missed a change
+    paragraphs = models.CharField(max_length=16, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(document__isnull=False, author__isnull=True) | Q(document__isnull=True, author__isnull=False),
+                name='phrase_index_document_or_author',
+            ),
+        ]
+
+    def __str__(self):
+        if self.document_id:
+            return f"Phrase index of document {self.document_id}"
+        return f"Phrase index of author {self.author_id}"
+
+    def load(self):
+        """
+        Return the index's sketch and table of repeated phrases
+        """
+        return load_sketch(self.sketch), load_table(self.phrases)
+
+    def store(self, sketch, table):
+        self.sketch = sketch.to_bytes()
+        self.phrases = dump_table(table)
+
+    @classmethod
+    def author_index(cls, author_id, create=True):
+        """
+        Return the author's index locked for update, creating it empty if
+        needed unless create is False. None for documents without an author.
+        """
+        if author_id is None:
+            return None
+        index = cls.objects.select_for_update().filter(author_id=author_id).first()
+        if index is not None or not create:
+            # Nothing to take away from an index that does not exist, e.g. as the author is deleted
+            return index
+        try:
+            with transaction.atomic():
+                return cls.objects.create(author_id=author_id, sketch=new_sketch().to_bytes(), phrases=dump_table({}))
+        except IntegrityError:
+            # Another request created it first
+            return cls.objects.select_for_update().get(author_id=author_id)
+
+    @classmethod
+    def add_to_author(cls, author_id, sketch, table, sign=1):
+        """
+        Add (or with sign=-1 take away) a document's counts, as held in its
+        index, to its author's index
+        """
+        index = cls.author_index(author_id, create=sign > 0)
+        if index is None:
+            return
+        author_sketch, author_table = index.load()
+        author_sketch.merge(sketch, sign)
+        update_table(author_sketch, author_table, {phrase: sign * count for phrase, count in table.items()})
+        index.store(author_sketch, author_table)
+        index.save(update_fields=['sketch', 'phrases', 'updated_at'])
+
+    @classmethod
+    def count_for_author(cls, document_id, author_id, sign=1):
+        """
+        Add (or with sign=-1 take away) the counts of a document's text, streamed from its chunks, to an author's index
+        """
+        from api.models import DocumentChunk  # Import here to avoid circular import
+
+        index = cls.author_index(author_id, create=sign > 0)
+        if index is None:
+            return
+        sketch, table = index.load()
+        texts = DocumentChunk.objects.filter(document_id=document_id).values_list('text', flat=True)
+        count_paragraphs(texts.iterator(chunk_size=200), (sketch, table), sign=sign)
+        index.store(sketch, table)
+        index.save(update_fields=['sketch', 'phrases', 'updated_at'])
+
+    @classmethod
+    def record_change(cls, document, removed, added):
+        """
+        Count a change to a document's chunks: removed and added are lists of
+        (hash, text) of the chunks taken out and put in. Called in the
+        transaction that writes the chunks.
+
+        Only the document's own index row is locked and written: the change
+        is queued in pending, and applied once PENDING_PHRASES phrases are
+        queued, after the transaction commits, or before the index is read.
+        A document without an index is indexed from scratch once the transaction commits.
+        """
+        index = cls.objects.select_for_update().filter(document=document).only('id', 'paragraphs', 'pending').first()
+        if index is None:
+            document_id = document.pk
+            transaction.on_commit(lambda: cls.rebuild(document_id))
+            return
+
+        # Kept from the stored digest; an index that missed a change goes on not matching its chunks when read
+        digest = paragraphs_digest([value for value, _ in removed], int(index.paragraphs or '0', 16), -1)
+        index.paragraphs = f'{paragraphs_digest([value for value, _ in added], digest):016x}'
+        changes = Counter(load_table(index.pending))
+        changes.update(count_phrases(text for _, text in added))
+        changes.subtract(count_phrases(text for _, text in removed))
+        pending = {phrase: change for phrase, change in changes.items() if change}
+        index.pending = dump_table(pending) if pending else None
+        index.save(update_fields=['paragraphs', 'pending', 'updated_at'])
+
+        if len(pending) >= settings.PHRASE_INDEX['PENDING_PHRASES']:
+            index_id = index.pk
+            transaction.on_commit(lambda: cls.apply_pending(index_id))
+
+    @classmethod
+    def apply_pending(cls, index_id, count_for_author=True):
+        """
+        Apply the changes queued on a document's index to it and, unless
+        count_for_author is False, to its author's index. Returns the index,
+        or None if it is gone.
+        """
+        with transaction.atomic():
+            index = cls.objects.select_for_update().filter(pk=index_id).first()
+            if index is None or index.pending is None:
+                return index
+            changes = load_table(index.pending)
+            sketch, table = index.load()
+            add_counts(sketch, table, changes)
+            index.store(sketch, table)
+            index.pending = None
+            index.save(update_fields=['sketch', 'phrases', 'pending', 'updated_at'])
+
+            author = cls.author_index(index.counted_author_id) if count_for_author else None
+            if author is not None:
+                author_sketch, author_table = author.load()
+                add_counts(author_sketch, author_table, changes)
+                author.store(author_sketch, author_table)
+                author.save(update_fields=['sketch', 'phrases', 'updated_at'])
+            return index
+
+    @classmethod
+    def apply_author_pending(cls, author_id):
+        """
+        Apply the changes queued on the indexes of an author's documents
+        """
+        pending = cls.objects.filter(counted_author_id=author_id, pending__isnull=False)
+        for index_id in pending.values_list('pk', flat=True):
+            cls.apply_pending(index_id)
+
+    @classmethod
+    def rebuild(cls, document_id, count_for_author=True):
+        """
+        Index a document from scratch, streaming its chunks, and replace its
+        counts in its author's index. Returns the index, or None if the document is gone.
+        """
+        from api.models import Document  # Import here to avoid circular import
+
+        with transaction.atomic():
+            document = Document.objects.select_for_update().filter(pk=document_id).only('id', 'author_id').first()
+            if document is None:
+                return None
+            hashes = []
+
+            def texts():
+                for value, text in document.chunks.values_list('hash', 'text').iterator(chunk_size=200):
+                    hashes.append(value)
+                    yield text
+
+            old = cls.objects.select_for_update().filter(document=document).first()
+            if old is not None and old.counted_author_id is not None and count_for_author:
+                # What the old index counted is no longer there to count again. Its
+                # queued changes never reached the author, and are dropped with it.
+                cls.add_to_author(old.counted_author_id, *old.load(), sign=-1)
+
+            index = old or cls(document=document)
+            sketch, table = new_sketch(), {}
+            author = cls.author_index(document.author_id) if count_for_author else None
+            if author is not None:
+                author_sketch, author_table = author.load()
+                count_paragraphs(texts(), (sketch, table), (author_sketch, author_table))
+                author.store(author_sketch, author_table)
+                author.save(update_fields=['sketch', 'phrases', 'updated_at'])
+            else:
+                count_paragraphs(texts(), (sketch, table))
+            index.store(sketch, table)
+            index.pending = None
+            index.paragraphs = f'{paragraphs_digest(hashes):016x}'
+            if count_for_author:
+                index.counted_author_id = document.author_id
+            index.save()
+            return index
+
+    @classmethod
+    def rebuild_author(cls, author_id):
+        """
+        Index all of an author's documents together from scratch, streaming
+        their chunks, and count each document's index towards the author,
+        indexing documents that have none first
+        """
+        from api.models import Document, DocumentChunk  # Import here to avoid circular import
+
+        with transaction.atomic():
+            document_ids = list(Document.objects.filter(author_id=author_id).values_list('pk', flat=True))
+            for document_id in document_ids:
+                index = cls.objects.select_for_update().filter(document_id=document_id).first()
+                if index is None:
+                    cls.rebuild(document_id, count_for_author=False)
+                elif index.pending is not None:
+                    # The author is counted from the text as it is now, which already has the change
+                    cls.apply_pending(index.pk, count_for_author=False)
+            cls.objects.filter(document_id__in=document_ids).update(counted_author_id=author_id)
+
+            texts = DocumentChunk.objects.filter(document__author_id=author_id).order_by('document', 'position')
+            sketch, table = new_sketch(), {}
+            count_paragraphs(texts.values_list('text', flat=True).iterator(chunk_size=200), (sketch, table))
+            cls.objects.filter(author_id=author_id).delete()
+            index = cls(author_id=author_id)
+            index.store(sketch, table)
+            index.save()
+            return index
+
+    @classmethod
+    def move_document(cls, document):
+        """
+        Move a document's counts to the index of its current author, if they are counted for another
+        """
+        with transaction.atomic():
+            index = cls.objects.select_for_update().filter(document=document).first()
+            if index is None or index.counted_author_id == document.author_id:
+                return
+            # The counts moved are those of the text as it is now, queued changes included
+            cls.apply_pending(index.pk)
+            cls.count_for_author(document.pk, index.counted_author_id, sign=-1)
+            cls.count_for_author(document.pk, document.author_id)
+            index.counted_author_id = document.author_id
+            index.save(update_fields=['counted_author', 'updated_at'])
+
+    @classmethod
+    def remove_document(cls, document):
+        """
+        Take a document's counts out of its author's index before the document is deleted
+        """
+        with transaction.atomic():
+            index = cls.objects.select_for_update().filter(document=document).first()
+            if index is not None:
+                cls.apply_pending(index.pk)
+                cls.count_for_author(document.pk, index.counted_author_id, sign=-1)
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+import json
+import zlib
+from api.utils.delta import compose
+
+
+class DocumentRevision(models.Model):
+    """
+    One saved version of a document's content.
+
+    Each revision stores the change from the previous one as a compressed Quill
+    delta. Every ``REVISION_HISTORY['SNAPSHOT_INTERVAL']`` revisions (and
+    wherever the chain of changes is broken) the whole content is stored too,
+    so rebuilding any version applies a bounded number of changes to the
+    nearest snapshot.
+    """
+    document = models.ForeignKey('api.Document', on_delete=models.CASCADE, related_name='revisions')
+    revision = models.PositiveIntegerField()
+    # zlib-compressed JSON
+    delta = models.BinaryField(null=True)
+    snapshot = models.BinaryField(null=True)
+    word_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-revision']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'revision'], name='unique_document_revision'),
+        ]
+
+    def __str__(self):
+        return f"Revision {self.revision} of document {self.document_id}"
+
+    @staticmethod
+    def compress(value):
+        encoded = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        return zlib.compress(encoded, settings.REVISION_HISTORY['COMPRESSION_LEVEL'])
+
+    @staticmethod
+    def decompress(data):
+        return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+    @classmethod
+    def record(cls, document, change=None):
+        """
+        Add the document's current revision to its history, given the change
+        ops from the previous revision (None to store a snapshot only)
+        """
+        interval = settings.REVISION_HISTORY['SNAPSHOT_INTERVAL']
+        take_snapshot = (
+            change is None
+            or document.revision % interval == 0
+            or not cls.objects.filter(document=document, revision=document.revision - 1).exists()
+        )
+        revision = cls(
+            document=document,
+            revision=document.revision,
+            delta=cls.compress({'ops': change}) if change is not None else None,
+            snapshot=cls.compress(document.content) if take_snapshot else None,
+            word_count=document.word_count,
+        )
+        try:
+            with transaction.atomic():
+                revision.save()
+        except IntegrityError:
+            # Two unguarded full saves ended up with the same number, keep the content that won
+            revision.delta = None
+            revision.snapshot = cls.compress(document.content)
+            cls.objects.filter(document=document, revision=document.revision).update(
+                delta=None, snapshot=revision.snapshot, word_count=revision.word_count, created_at=revision.created_at
+            )
+        return revision
+
+    @classmethod
+    def content_at(cls, document_id, revision):
+        """
+        Rebuild the document's content as of revision.
+        Raises DocumentRevision.DoesNotExist when that version is not in the history.
+        """
+        rows = cls.objects.filter(document_id=document_id, revision__lte=revision)
+        base = rows.filter(snapshot__isnull=False).values_list('revision', 'snapshot').order_by('-revision').first()
+        if base is None:
+            raise cls.DoesNotExist(f'Revision {revision} is not in the history')
+
+        chain = list(rows.filter(revision__gt=base[0]).values_list('revision', 'delta').order_by('revision'))
+        if [number for number, _ in chain] != list(range(base[0] + 1, revision + 1)):
+            raise cls.DoesNotExist(f'Revision {revision} is not in the history')
+
+        content = cls.decompress(base[1])
+        for _, delta in chain:
+            content = compose(content, cls.decompress(delta))
+        return content
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def month_of(value):
+    """
+    Return the first day of the month value falls in, in the current time zone
+    """
+    return timezone.localtime(value).date().replace(day=1)
+
+
+class WritingStatsRollup(models.Model):
+    """
+    Per-author, per-month document and word totals, kept up to date as documents
+    are saved and deleted so writing stats never have to scan the documents.
+    """
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='writing_stats_rollups'
+    )
+    month = models.DateField()
+    document_count = models.IntegerField(default=0)
+    word_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'month'], name='unique_writing_stats_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.author_id} {self.month:%Y-%m}: {self.document_count} documents"
+
+    @classmethod
+    def apply_change(cls, author_id, month, documents, words):
+        """
+        Add documents/words to an author's month, creating the row if needed
+        """
+        if not author_id or (not documents and not words):
+            return
+        rows = cls.objects.filter(author_id=author_id, month=month)
+        if rows.update(document_count=F('document_count') + documents, word_count=F('word_count') + words):
+            return
+        if documents <= 0:
+            # The row is already gone, e.g. the author is being deleted
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(author_id=author_id, month=month, document_count=documents, word_count=words)
+        except IntegrityError:
+            # Another request created the row first
+            rows.update(document_count=F('document_count') + documents, word_count=F('word_count') + words)
+
+    @classmethod
+    def rebuild(cls, author_ids=None):
+        """
+        Recompute rollups from the documents table, for all authors or only the given ones
+        """
+        from api.models import Document  # Import here to avoid circular import
+
+        documents = Document.objects.filter(author__isnull=False)
+        rollups = cls.objects.all()
+        if author_ids is not None:
+            documents = documents.filter(author_id__in=author_ids)
+            rollups = rollups.filter(author_id__in=author_ids)
+
+        totals = (
+            documents
+            .annotate(month=TruncMonth('created_at'))
+            .values('author_id', 'month')
+            .annotate(documents=Count('id'), words=Sum('word_count'))
+            .order_by()
+        )
+        with transaction.atomic():
+            rollups.delete()
+            cls.objects.bulk_create([
+                cls(
+                    author_id=row['author_id'],
+                    month=row['month'].date() if hasattr(row['month'], 'date') else row['month'],
+                    document_count=row['documents'],
+                    word_count=row['words'] or 0,
+                )
+                for row in totals
+            ], batch_size=1000)
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
 from django.db import models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from .base import AuditModel
 
@@ -27,17 +30,34 @@ class User(AbstractUser, AuditModel):
         """
         Get user's writing statistics.
         Returns dict with stats like total_documents, total_words, etc.
+
+        Reads the per-month rollups (a handful of rows per author) when
+        WRITING_STATS_USE_ROLLUP is set, otherwise aggregates the documents
+        table. Either way it is a single query.
         """
-        from api.models import Document  # Import here to avoid circular import
-        
-        documents = Document.objects.filter(author=self)
-        total_words = sum(len(doc.content.split()) for doc in documents)
-        
+        from api.models import Document, WritingStatsRollup  # Import here to avoid circular import
+
+        this_month = timezone.localtime().date().replace(day=1)
+        if settings.WRITING_STATS_USE_ROLLUP:
+            stats = WritingStatsRollup.objects.filter(author=self).aggregate(
+                total_documents=Coalesce(Sum('document_count'), 0),
+                total_words=Coalesce(Sum('word_count'), 0),
+                documents_this_month=Coalesce(Sum('document_count', filter=Q(month=this_month)), 0),
+            )
+        else:
+            month_start = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            stats = Document.objects.filter(author=self).aggregate(
+                total_documents=Count('id'),
+                total_words=Coalesce(Sum('word_count'), 0),
+                documents_this_month=Count('id', filter=Q(created_at__gte=month_start)),
+            )
+
+        total_documents = stats['total_documents']
         return {
-            'total_documents': documents.count(),
-            'total_words': total_words,
-            'average_words_per_document': total_words / documents.count() if documents.count() > 0 else 0,
-            'documents_this_month': documents.filter(created_at__month=timezone.now().month).count()
+            'total_documents': total_documents,
+            'total_words': stats['total_words'],
+            'average_words_per_document': stats['total_words'] / total_documents if total_documents > 0 else 0,
+            'documents_this_month': stats['documents_this_month']
         }
 
     def has_permission(self, permission_type):
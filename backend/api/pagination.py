@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DocumentCursorPagination(CursorPagination):
+    """
+    Newest documents first. Cursor pagination keeps every page an index range
+    scan, no matter how deep into the library the client has scrolled.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class RevisionCursorPagination(CursorPagination):
+    """
+    Newest revisions first.
+    """
+    ordering = '-revision'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
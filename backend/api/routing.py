@@ -0,0 +1,8 @@
+from django.urls import path
+from api.consumers import AnalysisJobConsumer, DocumentEditConsumer, SuggestionsConsumer
+
+websocket_urlpatterns = [
+    path('ws/ai/suggestions/', SuggestionsConsumer.as_asgi()),
+    path('ws/ai/jobs/<int:job_id>/', AnalysisJobConsumer.as_asgi()),
+    path('ws/documents/<int:document_id>/edit/', DocumentEditConsumer.as_asgi()),
+]
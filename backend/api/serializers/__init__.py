@@ -1,9 +1,13 @@
-from .document import DocumentSerializer, AIFeedbackSerializer
+from .document import DocumentSerializer, DocumentListSerializer, DocumentChunkSerializer, DocumentRevisionSerializer, AIFeedbackSerializer, AnalysisJobSerializer
 from .user import UserSerializer, UserUpdateSerializer, UserStatsSerializer
 
 __all__ = [
     'DocumentSerializer',
+    'DocumentListSerializer',
+    'DocumentChunkSerializer',
+    'DocumentRevisionSerializer',
     'AIFeedbackSerializer',
+    'AnalysisJobSerializer',
     'UserSerializer',
     'UserUpdateSerializer',
     'UserStatsSerializer'
@@ -1,6 +1,6 @@
 from rest_framework import serializers
-from django.contrib.auth.models import User
-from api.models import Document, AIFeedback
+from api.models import Document, DocumentChunk, DocumentRevision, AIFeedback, AnalysisJob, User
+from api.serializers.mixins import SparseFieldsetMixin
 import json
 
 class UserSerializer(serializers.ModelSerializer):
@@ -13,21 +13,51 @@ class AIFeedbackSerializer(serializers.ModelSerializer):
         model = AIFeedback
         fields = '__all__'
 
-class DocumentSerializer(serializers.ModelSerializer):
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    feedback = AIFeedbackSerializer(read_only=True)
+
+    class Meta:
+        model = AnalysisJob
+        fields = ('id', 'document', 'status', 'attempts', 'error', 'feedback', 'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+class DocumentChunkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DocumentChunk
+        fields = ('position', 'ops', 'length')
+        read_only_fields = fields
+
+class DocumentRevisionSerializer(serializers.ModelSerializer):
+    has_snapshot = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = DocumentRevision
+        fields = ('revision', 'word_count', 'created_at', 'has_snapshot')
+        read_only_fields = fields
+
+class DocumentListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Summary representation for document lists, without the content or feedback
+    """
     author = UserSerializer(read_only=True)
-    ai_feedbacks = AIFeedbackSerializer(many=True, read_only=True)
-    plain_text = serializers.SerializerMethodField()
 
     class Meta:
         model = Document
-        fields = ('id', 'title', 'content', 'plain_text', 'author', 'created_at', 'updated_at', 'is_public', 'ai_feedbacks')
-        read_only_fields = ('author', 'created_at', 'updated_at')
+        fields = ('id', 'title', 'word_count', 'char_count', 'author', 'created_at', 'updated_at', 'is_public')
+        read_only_fields = fields
 
-    def get_plain_text(self, obj):
-        """
-        Get the plain text version of the document content
-        """
-        return obj.get_plain_text()
+class DocumentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    author = UserSerializer(read_only=True)
+    # Stored as chunks, read and written whole through the model's content property
+    content = serializers.JSONField(required=False)
+    # Joined from the chunk texts on read, in the same pass as the content when both are asked for
+    plain_text = serializers.CharField(source='get_plain_text', read_only=True)
+    ai_feedbacks = AIFeedbackSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Document
+        fields = ('id', 'title', 'content', 'revision', 'plain_text', 'word_count', 'char_count', 'author', 'created_at', 'updated_at', 'is_public', 'ai_feedbacks')
+        read_only_fields = ('author', 'created_at', 'updated_at', 'revision', 'word_count', 'char_count')
 
     def validate_content(self, value):
         """
@@ -69,6 +99,11 @@ class DocumentSerializer(serializers.ModelSerializer):
         except Exception as e:
             raise serializers.ValidationError(f"Invalid content format: {str(e)}")
 
+    def to_representation(self, instance):
+        if {'content', 'plain_text'} <= self.fields.keys():
+            instance.load_content()
+        return super().to_representation(instance)
+
     def to_internal_value(self, data):
         """
         Convert the incoming data to the correct format before validation
@@ -0,0 +1,19 @@
+class SparseFieldsetMixin:
+    """
+    Lets clients ask for a subset of a serializer's fields with ``?fields=id,title``.
+    Only applies to reads.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return
+
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+
+        allowed = {name.strip() for name in requested.split(',') if name.strip()}
+        for name in set(self.fields) - allowed:
+            self.fields.pop(name)
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.models import Document, PhraseIndex, WritingStatsRollup
+from api.models.stats import month_of
+from api.utils.metrics import install_query_wrapper
+from api.utils.search import schedule_index, schedule_remove
+
+
+@receiver(post_save, sender=Document)
+def update_writing_stats_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Move the document's contribution in the author's rollups from its previous
+    author/month/word count to the current ones
+    """
+    new = instance.get_stats_snapshot()
+    old = None if created else getattr(instance, 'stats_snapshot', None)
+
+    if not created and old is None:
+        # Nothing known about the previous state, recount the author from scratch
+        if instance.author_id:
+            WritingStatsRollup.rebuild(author_ids=[instance.author_id])
+    else:
+        if old is not None and update_fields is not None and 'word_count' not in update_fields:
+            # The stored word count did not change whatever the instance holds
+            new = (new[0], new[1], old[2])
+        if old is not None and old[0] == new[0] and month_of(old[1]) == month_of(new[1]):
+            WritingStatsRollup.apply_change(new[0], month_of(new[1]), 0, new[2] - old[2])
+        else:
+            if old is not None:
+                WritingStatsRollup.apply_change(old[0], month_of(old[1]), -1, -old[2])
+            WritingStatsRollup.apply_change(new[0], month_of(new[1]), 1, new[2])
+
+    instance.stats_snapshot = new
+
+
+@receiver(pre_delete, sender=Document)
+def lock_writing_stats_on_delete(sender, instance, **kwargs):
+    """
+    Take away what the row holds when it is deleted rather than what was loaded
+    """
+    if instance.pk is not None:
+        instance.lock_row()
+
+
+@receiver(post_delete, sender=Document)
+def update_writing_stats_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, 'stats_snapshot', None) or instance.get_stats_snapshot()
+    if old is not None:
+        WritingStatsRollup.apply_change(old[0], month_of(old[1]), -1, -old[2])
+
+
+@receiver(post_save, sender=Document)
+def update_search_index_on_save(sender, instance, update_fields=None, **kwargs):
+    """
+    Reindex the document in the background once a save that marked it stale has committed
+    """
+    if update_fields is None or 'search_stale' in update_fields:
+        schedule_index(instance.pk)
+
+
+@receiver(post_delete, sender=Document)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    schedule_remove(instance.pk)
+
+
+@receiver(post_save, sender=Document)
+def update_phrase_index_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Count the document's phrases for its new author when it changes hands
+    """
+    if settings.PHRASE_INDEX['ENABLED'] and not created and (update_fields is None or 'author' in update_fields):
+        PhraseIndex.move_document(instance)
+
+
+@receiver(pre_delete, sender=Document)
+def update_phrase_index_on_delete(sender, instance, **kwargs):
+    if settings.PHRASE_INDEX['ENABLED']:
+        PhraseIndex.remove_document(instance)
+
+
+@receiver(connection_created)
+def instrument_queries(sender, connection, **kwargs):
+    """
+    Count every connection's queries towards the request being handled
+    """
+    install_query_wrapper(connection)
@@ -0,0 +1,119 @@
+import pickle
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from api.tests.utils import blank_nlp
+from api.utils.cache import _MISSING, DjangoCacheTier, LocalLRUTier, ResultCache
+from api.utils.grammar import grammar_version
+
+
+def stored_size(value):
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+class LocalLRUTierTests(SimpleTestCase):
+    def test_hits_and_misses(self):
+        tier = LocalLRUTier(max_entries=2, ttl=None)
+        self.assertIs(tier.get('a'), _MISSING)
+        tier.set('a', [1])
+        tier.set('b', [2])
+        self.assertEqual(tier.get('a'), [1])
+        tier.set('c', [3])
+        # b was the least recently used
+        self.assertEqual([tier.get(key) for key in 'abc'], [[1], _MISSING, [3]])
+
+    def test_entries_expire(self):
+        tier = LocalLRUTier(max_entries=10, ttl=300)
+        with mock.patch('api.utils.cache.time.monotonic', return_value=1000.0):
+            tier.set('a', 'value')
+        with mock.patch('api.utils.cache.time.monotonic', return_value=1300.0):
+            self.assertEqual(tier.get('a'), 'value')
+        with mock.patch('api.utils.cache.time.monotonic', return_value=1300.5):
+            self.assertIs(tier.get('a'), _MISSING)
+        self.assertEqual((len(tier), tier.size), (0, 0))
+
+    def test_hits_are_copies(self):
+        tier = LocalLRUTier(max_entries=10, ttl=None)
+        suggestions = [{'type': 'grammar', 'suggestion': 'One'}]
+        tier.set('a', suggestions)
+        suggestions.append({'type': 'style'})
+        hit = tier.get('a')
+        hit.append({'type': 'content'})
+        hit[0]['suggestion'] = 'Changed'
+        self.assertEqual(tier.get('a'), [{'type': 'grammar', 'suggestion': 'One'}])
+
+    def test_bounded_by_total_size(self):
+        entry = stored_size(b'x' * 30)
+        tier = LocalLRUTier(max_entries=100, ttl=None, max_bytes=entry * 3)
+        for key in 'abcd':
+            tier.set(key, b'x' * 30)
+        self.assertEqual((len(tier), tier.size), (3, entry * 3))
+        self.assertIs(tier.get('a'), _MISSING)
+
+        # Recently read entries are kept over older ones
+        tier.get('b')
+        tier.set('e', b'x' * 30)
+        self.assertEqual([key for key in 'bcde' if tier.get(key) is not _MISSING], ['b', 'd', 'e'])
+
+        # Replacing an entry counts only its new size
+        tier.set('b', b'x')
+        self.assertEqual(tier.size, entry * 2 + stored_size(b'x'))
+
+    def test_values_over_the_budget_are_not_kept(self):
+        tier = LocalLRUTier(max_entries=100, ttl=None, max_bytes=100)
+        tier.set('small', b'x' * 10)
+        tier.set('large', b'x' * 100)
+        self.assertIs(tier.get('large'), _MISSING)
+        self.assertEqual(tier.get('small'), b'x' * 10)
+        self.assertEqual(tier.size, stored_size(b'x' * 10))
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.local = LocalLRUTier(max_entries=10, ttl=None)
+        self.cache = ResultCache('test', '1', [self.local, DjangoCacheTier('default', None)])
+
+    def test_get_or_compute(self):
+        compute = mock.Mock(return_value=['result'])
+        self.assertEqual(self.cache.get_or_compute('text', compute), ['result'])
+        self.assertEqual(self.cache.get_or_compute('text', compute), ['result'])
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(self.cache.stats()['tiers'], {
+            'local': {'hits': 1, 'misses': 1},
+            'django': {'hits': 0, 'misses': 1},
+        })
+
+    def test_shared_hits_fill_the_local_tier(self):
+        self.cache.set(self.cache.key('text'), ['result'])
+        self.local.clear()
+        self.assertEqual(self.cache.get(self.cache.key('text')), ['result'])
+        self.assertEqual(self.local.get(self.cache.key('text')), ['result'])
+        self.assertIsNone(self.cache.get(self.cache.key('other')))
+
+    def test_keys_depend_on_the_version(self):
+        other = ResultCache('test', '2', self.cache.tiers)
+        self.cache.set(self.cache.key('text'), ['old'])
+        self.assertIsNone(other.get(other.key('text')))
+
+    def test_large_results_are_not_cached(self):
+        cache = ResultCache('test', '1', [self.local], max_entry_bytes=50)
+        cache.set(cache.key('small'), b'x' * 50)
+        cache.set(cache.key('large'), b'x' * 51)
+        self.assertEqual(cache.get(cache.key('small')), b'x' * 50)
+        self.assertIsNone(cache.get(cache.key('large')))
+        self.assertEqual(len(self.local), 1)
+
+
+class GrammarVersionTests(SimpleTestCase):
+    def test_the_model_and_parsing_mode_are_part_of_the_version(self):
+        nlp = blank_nlp()
+        with override_settings(GRAMMAR_TIERED=False):
+            full = grammar_version(nlp)
+        with override_settings(GRAMMAR_TIERED=True):
+            tiered = grammar_version(nlp)
+        self.assertNotEqual(full, tiered)
+        with mock.patch.dict(nlp.meta, name='other_model'):
+            self.assertNotIn(grammar_version(nlp), (full, tiered))
@@ -0,0 +1,142 @@
+import os
+import random
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from api.tests.utils import blank_nlp
+from api.utils import chunking
+from api.utils.chunking import find_issues_in_chunks, get_parse_cache, group_chunks, is_cut_point
+
+WORDS = ['the', 'quick', 'fox', 'jumps', 'over', 'a', 'lazy', 'dog', 'and', 'js', 'runs']
+
+
+def random_paragraphs(rng, count):
+    paragraphs = []
+    for _ in range(count):
+        sentences = [' '.join(rng.choices(WORDS, k=rng.randint(2, 12))) for _ in range(rng.randint(1, 6))]
+        paragraphs.append('. '.join(sentence.capitalize() for sentence in sentences) + rng.choice(['.', '', '!']))
+    return paragraphs
+
+
+def edit(paragraph):
+    """
+    Change a paragraph without changing whether it is a cut point
+    """
+    for words in range(1, 100):
+        edited = paragraph + ' more' * words + '.'
+        if is_cut_point(edited, 1000) == is_cut_point(paragraph, 1000):
+            return edited
+    raise AssertionError('No edit keeps the cut point')
+
+
+ANALYSIS = dict(settings.DOCUMENT_ANALYSIS, CHUNK_CHARS=4000, CHUNK_TARGET_CHARS=1000, WORKERS=1)
+
+
+class GroupChunksTests(SimpleTestCase):
+    def test_chunks_end_at_cut_points_or_the_size_limit(self):
+        paragraphs = random_paragraphs(random.Random(5), 300)
+        chunks = list(group_chunks(paragraphs, 4000, 1000))
+        self.assertEqual([text for chunk in chunks for text in chunk], paragraphs)
+        self.assertGreater(len(chunks), 5)
+        for chunk, following in zip(chunks, chunks[1:]):
+            self.assertLessEqual(sum(len(text) for text in chunk), 4000)
+            self.assertTrue(is_cut_point(chunk[-1], 1000) or sum(len(text) for text in chunk + following[:1]) > 4000)
+            self.assertFalse(any(is_cut_point(text, 1000) for text in chunk[:-1]))
+
+    def test_an_edit_only_changes_its_own_chunk(self):
+        rng = random.Random(6)
+        paragraphs = random_paragraphs(rng, 300)
+        chunks = list(group_chunks(paragraphs, 4000, 1000))
+        for index in rng.sample(range(len(paragraphs)), 20):
+            edited = list(paragraphs)
+            edited[index] = edit(paragraphs[index])
+            changed = [chunk for chunk in group_chunks(edited, 4000, 1000) if chunk not in chunks]
+            self.assertEqual(len(changed), 1, index)
+            self.assertIn(edited[index], changed[0])
+
+    def test_a_long_text_is_a_chunk_of_its_own(self):
+        self.assertEqual(list(group_chunks(['a' * 10, 'b' * 50, 'c' * 10], 40, 1000)), [['a' * 10], ['b' * 50], ['c' * 10]])
+
+
+@override_settings(DOCUMENT_ANALYSIS=ANALYSIS)
+class FindIssuesInChunksTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.nlp = blank_nlp()
+        get_parse_cache(self.nlp).clear()
+        self.paragraphs = random_paragraphs(random.Random(7), 120)
+
+    def parsed_texts(self):
+        """
+        Patch the parser to record the chunks that are actually parsed
+        """
+        parsed = []
+        parse_texts = chunking.parse_texts
+
+        def record(nlp, texts):
+            parsed.append(list(texts))
+            return parse_texts(nlp, texts)
+
+        patcher = mock.patch.object(chunking, 'parse_texts', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return parsed
+
+    def test_an_edited_paragraph_only_reparses_its_chunk(self):
+        parsed = self.parsed_texts()
+        expected = list(find_issues_in_chunks(self.nlp, self.paragraphs))
+        self.assertEqual(parsed, list(group_chunks(self.paragraphs, 4000, 1000)))
+
+        parsed.clear()
+        self.assertEqual(list(find_issues_in_chunks(self.nlp, self.paragraphs)), expected)
+        self.assertEqual(parsed, [])
+
+        edited = list(self.paragraphs)
+        edited[50] = edit(edited[50])
+        issues = list(find_issues_in_chunks(self.nlp, edited))
+        self.assertEqual(len(parsed), 1)
+        self.assertIn(edited[50], parsed[0])
+        self.assertEqual(issues[:50] + issues[51:], expected[:50] + expected[51:])
+
+    def test_a_broken_pool_falls_back_to_parsing_in_process(self):
+        expected = list(find_issues_in_chunks(self.nlp, self.paragraphs))
+        get_parse_cache(self.nlp).clear()
+        caches['default'].clear()
+
+        def submit(*args):
+            future = Future()
+            future.set_exception(BrokenProcessPool('A worker died'))
+            return future
+
+        pool = mock.Mock(submit=mock.Mock(side_effect=submit))
+        with override_settings(DOCUMENT_ANALYSIS=dict(ANALYSIS, WORKERS=2, PARALLEL_MIN_CHARS=0)), \
+                mock.patch.object(chunking, 'get_pool', return_value=pool), \
+                mock.patch.object(chunking, 'reset_pool') as reset_pool, \
+                self.assertLogs('api.utils.chunking', 'ERROR'):
+            self.assertEqual(list(find_issues_in_chunks(self.nlp, self.paragraphs)), expected)
+        self.assertTrue(pool.submit.called)
+        self.assertEqual(reset_pool.call_count, pool.submit.call_count)
+
+    def test_parsing_in_the_pool(self):
+        expected = list(find_issues_in_chunks(self.nlp, self.paragraphs))
+        get_parse_cache(self.nlp).clear()
+        caches['default'].clear()
+
+        # Pool processes load the pipeline named by SPACY_MODEL when they start
+        with tempfile.TemporaryDirectory() as model:
+            self.nlp.nlp.to_disk(model)
+            config = dict(ANALYSIS, WORKERS=2, PARALLEL_MIN_CHARS=0, START_METHOD='spawn')
+            with override_settings(DOCUMENT_ANALYSIS=config), mock.patch.dict(os.environ, SPACY_MODEL=model):
+                chunking.reset_pool()
+                try:
+                    parsed = self.parsed_texts()
+                    self.assertEqual(list(find_issues_in_chunks(self.nlp, self.paragraphs)), expected)
+                    self.assertEqual(parsed, [])
+                finally:
+                    chunking.reset_pool()
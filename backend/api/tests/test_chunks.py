@@ -0,0 +1,71 @@
+import random
+
+from django.test import TestCase
+
+from api.models import Document, DocumentChunk
+from api.models.chunk import content_digest
+from api.tests.test_delta import random_change, random_document
+from api.utils.delta import DeltaError, StaleRevisionError, compose, delta_to_text, split_lines
+
+
+class ApplyDeltaTests(TestCase):
+    def assertChunksMatch(self, document, content):
+        """
+        The stored chunks must be the lines of content, with their counts and
+        the document's totals as a fresh save would have them
+        """
+        chunks = list(document.chunks.order_by('position'))
+        self.assertEqual([chunk.ops for chunk in chunks], split_lines(content))
+        for chunk in chunks:
+            built = DocumentChunk.build(chunk.ops)
+            self.assertEqual(
+                (chunk.text, chunk.length, chunk.word_count, chunk.hash),
+                (built.text, built.length, built.word_count, built.hash),
+            )
+        text = delta_to_text(content)
+        self.assertEqual((document.char_count, document.word_count), (len(text.strip()), len(text.split())))
+        self.assertEqual(document.content_hash, f'{content_digest((chunk.position, chunk.hash) for chunk in chunks):064x}')
+
+    def test_random_changes_rewrite_the_chunks(self):
+        rng = random.Random(2)
+        content = random_document(rng)
+        for _ in range(6):
+            content = compose(content, {'ops': [{'insert': delta_to_text(random_document(rng))}]})
+        document = Document.objects.create(title='Chunks', content=content)
+        for _ in range(200):
+            change = random_change(rng, len(delta_to_text(content)))
+            document = Document.objects.get(pk=document.pk)
+            document.apply_delta(change, document.revision)
+            content = compose(content, change)
+
+            document = Document.objects.get(pk=document.pk)
+            self.assertEqual(document.content, content, change)
+            self.assertChunksMatch(document, content)
+
+    def test_inserted_lines_fit_between_their_neighbours(self):
+        document = Document.objects.create(title='Lines', content={'ops': [{'insert': 'one\ntwo\n'}]})
+        lines = ''.join(f'line {index}\n' for index in range(50))
+        document.apply_delta({'ops': [{'retain': 4}, {'insert': lines}]}, document.revision)
+        document = Document.objects.get(pk=document.pk)
+        self.assertEqual(delta_to_text(document.content), 'one\n' + lines + 'two\n')
+        self.assertChunksMatch(document, document.content)
+
+    def test_joining_lines(self):
+        document = Document.objects.create(title='Join', content={'ops': [{'insert': 'one\ntwo\nthree\n'}]})
+        document.apply_delta({'ops': [{'retain': 3}, {'delete': 1}]}, document.revision)
+        document = Document.objects.get(pk=document.pk)
+        self.assertEqual(document.chunks.count(), 2)
+        self.assertChunksMatch(document, {'ops': [{'insert': 'onetwo\nthree\n'}]})
+
+    def test_stale_revision_and_bad_delta_leave_the_document_alone(self):
+        document = Document.objects.create(title='Stale', content={'ops': [{'insert': 'one\n'}]})
+        revision = document.revision
+        document.apply_delta({'ops': [{'insert': 'a'}]}, revision)
+        with self.assertRaises(StaleRevisionError):
+            document.apply_delta({'ops': [{'insert': 'b'}]}, revision)
+        with self.assertRaises(DeltaError):
+            document.apply_delta({'ops': [{'retain': 100}, {'insert': 'c'}]}, revision + 1)
+
+        document = Document.objects.get(pk=document.pk)
+        self.assertEqual(document.revision, revision + 1)
+        self.assertChunksMatch(document, {'ops': [{'insert': 'aone\n'}]})
@@ -0,0 +1,168 @@
+import asyncio
+import random
+
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from api.models import Document, DocumentRevision
+from api.tests.test_delta import random_change, random_document
+from api.utils.collaboration import EditRoom, RoomHost, edit_group
+from api.utils.delta import DeltaError, StaleRevisionError, compose, delta_to_text, transform
+
+
+class EditRoomTests(SimpleTestCase):
+    def test_edits_against_older_versions_converge(self):
+        rng = random.Random(4)
+        room = EditRoom(1, random_document(rng), 1)
+        contents = [room.content]
+        for _ in range(500):
+            # An editor who has seen up to version made a change to that content
+            version = rng.randint(max(0, room.version - 5), room.version)
+            content = contents[version]
+            change = random_change(rng, len(delta_to_text(content)))
+            missed = list(room.history)[version - (room.version - len(room.history)):]
+            applied = room.apply(change, version)
+            contents.append(room.content)
+
+            # The editor applied their change, then brings in the edits they missed as a client does
+            content = compose(content, change)
+            for edit in missed:
+                content, change = compose(content, transform(change, edit, False)), transform(edit, change, True)
+            self.assertEqual(change, applied)
+            self.assertEqual(content, room.content)
+
+    @override_settings(COLLABORATION=dict(settings.COLLABORATION, HISTORY=3))
+    def test_versions_older_than_the_history_are_stale(self):
+        room = EditRoom(1, {'ops': [{'insert': 'text\n'}]}, 1)
+        for _ in range(5):
+            room.apply({'ops': [{'insert': 'a'}]}, room.version)
+        room.apply({'ops': [{'insert': 'b'}]}, 2)
+        with self.assertRaises(StaleRevisionError):
+            room.apply({'ops': [{'insert': 'c'}]}, 1)
+        with self.assertRaises(StaleRevisionError):
+            room.apply({'ops': [{'insert': 'c'}]}, room.version + 1)
+
+    def test_changes_past_the_end_are_refused(self):
+        room = EditRoom(1, {'ops': [{'insert': 'text\n'}]}, 1)
+        with self.assertRaises(DeltaError):
+            room.apply({'ops': [{'retain': 10}, {'delete': 1}]}, 0)
+        self.assertEqual((room.version, room.content), (0, {'ops': [{'insert': 'text\n'}]}))
+
+    def test_reset_refuses_the_edits_made_before(self):
+        room = EditRoom(1, {'ops': [{'insert': 'text\n'}]}, 1)
+        room.apply({'ops': [{'insert': 'a'}]}, 0)
+        room.add_unsaved({'ops': [{'insert': 'a'}]})
+        room.reset({'ops': [{'insert': 'saved\n'}]}, 4)
+        self.assertEqual((room.version, room.saved_revision, room.unsaved), (2, 4, []))
+        with self.assertRaises(StaleRevisionError):
+            room.apply({'ops': [{'insert': 'b'}]}, 1)
+
+
+@override_settings(
+    COLLABORATION=dict(settings.COLLABORATION, SAVE_DELAY=60, MAX_SAVE_DELAY=60),
+    SEARCH=dict(settings.SEARCH, INDEX_DELAY=0),
+)
+class RoomHostTests(TransactionTestCase):
+    def setUp(self):
+        self.document = Document.objects.create(title='Story', content={'ops': [{'insert': 'Hello world\n'}]})
+        self.layer = InMemoryChannelLayer()
+        self.host = RoomHost(self.layer)
+
+    async def join(self, client):
+        channel = await self.layer.new_channel()
+        await self.layer.group_add(edit_group(self.document.pk), channel)
+        await self.host.handle({'type': 'collab.join', 'document': self.document.pk, 'client': client, 'channel': channel})
+        return channel, await self.layer.receive(channel)
+
+    async def edit(self, client, channel, delta, version):
+        await self.host.handle({
+            'type': 'collab.edit', 'document': self.document.pk, 'client': client, 'channel': channel,
+            'delta': {'ops': delta}, 'version': version,
+        })
+
+    async def messages(self, channel):
+        received = []
+        while True:
+            try:
+                received.append(await asyncio.wait_for(self.layer.receive(channel), 0.2))
+            except asyncio.TimeoutError:
+                return received
+
+    async def close(self):
+        for room in list(self.host.rooms.values()):
+            if room.save_task is not None:
+                room.save_task.cancel()
+        self.host.rooms.clear()
+
+    @database_sync_to_async
+    def saved(self, pk=None):
+        return Document.objects.get(pk=pk or self.document.pk).get_text()
+
+    async def test_concurrent_edits_are_sequenced_and_saved(self):
+        first, init = await self.join('first')
+        second, _ = await self.join('second')
+        self.assertEqual((init['type'], init['content']), ('collab.init', {'ops': [{'insert': 'Hello world\n'}]}))
+        await self.messages(first)
+
+        # Both edit the version they joined at
+        await self.edit('first', first, [{'retain': 5}, {'insert': ','}], init['version'])
+        await self.edit('second', second, [{'retain': 11}, {'insert': '!'}], init['version'])
+        deltas = [message for message in await self.messages(second) if message['type'] == 'collab.delta']
+        self.assertEqual([message['delta'] for message in deltas], [
+            {'ops': [{'retain': 5}, {'insert': ','}]},
+            {'ops': [{'retain': 12}, {'insert': '!'}]},
+        ])
+
+        room = self.host.rooms[self.document.pk]
+        await self.host.save(room)
+        self.assertEqual(await self.saved(), 'Hello, world!\n')
+        self.assertEqual(room.unsaved, [])
+        saved = [message for message in await self.messages(first) if message['type'] == 'collab.saved']
+        self.assertEqual(saved[-1]['revision'], room.saved_revision)
+        await self.close()
+
+    async def test_changes_saved_elsewhere_are_merged(self):
+        channel, init = await self.join('editor')
+        await self.edit('editor', channel, [{'insert': 'Oh. '}], init['version'])
+
+        @database_sync_to_async
+        def save_elsewhere():
+            document = Document.objects.get(pk=self.document.pk)
+            document.apply_delta({'ops': [{'retain': 11}, {'insert': ' again'}]}, document.revision)
+        await save_elsewhere()
+
+        room = self.host.rooms[self.document.pk]
+        await self.host.save(room)
+        self.assertEqual(await self.saved(), 'Oh. Hello world again\n')
+        self.assertEqual(delta_to_text(room.content), 'Oh. Hello world again\n')
+        await self.close()
+
+    async def test_changes_the_history_cannot_account_for_are_not_overwritten(self):
+        channel, init = await self.join('editor')
+        await self.edit('editor', channel, [{'insert': 'Unsaved. '}], init['version'])
+
+        @database_sync_to_async
+        def rewrite_elsewhere():
+            document = Document.objects.get(pk=self.document.pk)
+            document.content = {'ops': [{'insert': 'Rewritten\n'}]}
+            document.save()
+            DocumentRevision.objects.filter(document=document, revision=document.revision).update(delta=None)
+        await rewrite_elsewhere()
+        await self.messages(channel)
+
+        room = self.host.rooms[self.document.pk]
+        with self.assertLogs('api.utils.collaboration', 'WARNING'):
+            await self.host.save(room)
+        messages = await self.messages(channel)
+        resync = [message for message in messages if message['type'] == 'collab.resync']
+        self.assertEqual(len(resync), 1)
+        self.assertEqual(await self.saved(), 'Rewritten\n')
+        self.assertEqual(await self.saved(resync[0]['conflict']), 'Unsaved. Hello world\n')
+        self.assertEqual((room.content, room.unsaved), ({'ops': [{'insert': 'Rewritten\n'}]}, []))
+
+        # Edits made before the resync are refused
+        await self.edit('editor', channel, [{'insert': 'x'}], init['version'] + 1)
+        self.assertEqual([message['type'] for message in await self.messages(channel)], ['collab.resync'])
+        await self.close()
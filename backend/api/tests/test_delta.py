@@ -0,0 +1,107 @@
+import random
+
+from django.test import SimpleTestCase
+
+from api.utils.delta import compose, compose_changes, delta_to_text, transform
+
+WORDS = ['the', 'quick', 'fox', 'jumps', 'over', 'a', 'lazy', 'dog', '\n']
+FORMATS = [{'bold': True}, {'italic': True}, {'bold': None}, {'header': 2}]
+
+
+def random_document(rng):
+    ops = []
+    for _ in range(rng.randint(1, 8)):
+        op = {'insert': ' '.join(rng.choices(WORDS, k=rng.randint(1, 6)))}
+        if rng.random() < 0.3:
+            op['attributes'] = {'bold': True}
+        ops.append(op)
+    if rng.random() < 0.2:
+        ops.append({'insert': {'image': 'cover.png'}})
+    ops.append({'insert': '\n'})
+    return compose(None, {'ops': ops})
+
+
+def random_change(rng, length):
+    """
+    A random change to a document of length, with every kind of op
+    """
+    ops = []
+    position = 0
+    while position < length and rng.random() < 0.8:
+        kind = rng.choice(['retain', 'retain', 'insert', 'delete'])
+        if kind == 'insert':
+            op = {'insert': rng.choice(WORDS) + ' '}
+            if rng.random() < 0.3:
+                op['attributes'] = {'italic': True}
+            ops.append(op)
+            continue
+        size = rng.randint(1, min(5, length - position))
+        if kind == 'delete':
+            ops.append({'delete': size})
+        else:
+            op = {'retain': size}
+            if rng.random() < 0.3:
+                op['attributes'] = rng.choice(FORMATS)
+            ops.append(op)
+        position += size
+    if rng.random() < 0.3:
+        ops.append({'insert': 'end'})
+    return {'ops': ops}
+
+
+def length_of(document):
+    return len(delta_to_text(document))
+
+
+class TransformTests(SimpleTestCase):
+    def test_concurrent_changes_converge(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            document = random_document(rng)
+            first = random_change(rng, length_of(document))
+            second = random_change(rng, length_of(document))
+            self.assertEqual(
+                compose(compose(document, first), transform(first, second, True)),
+                compose(compose(document, second), transform(second, first, False)),
+                (document, first, second),
+            )
+
+    def test_priority_orders_inserts_at_the_same_position(self):
+        document = {'ops': [{'insert': 'ab\n'}]}
+        first = {'ops': [{'retain': 1}, {'insert': 'X'}]}
+        second = {'ops': [{'retain': 1}, {'insert': 'Y'}]}
+        self.assertEqual(delta_to_text(compose(compose(document, first), transform(first, second, True))), 'aXYb\n')
+        self.assertEqual(delta_to_text(compose(compose(document, second), transform(second, first, False))), 'aXYb\n')
+
+    def test_formats_of_the_first_change_win(self):
+        first = {'ops': [{'retain': 2, 'attributes': {'bold': True}}]}
+        second = {'ops': [{'retain': 2, 'attributes': {'bold': None, 'italic': True}}]}
+        self.assertEqual(transform(first, second, True), {'ops': [{'retain': 2, 'attributes': {'italic': True}}]})
+        self.assertEqual(transform(second, first, False), first)
+
+    def test_deleted_text_is_not_formatted(self):
+        first = {'ops': [{'delete': 3}]}
+        second = {'ops': [{'retain': 5, 'attributes': {'bold': True}}]}
+        self.assertEqual(transform(first, second, True), {'ops': [{'retain': 2, 'attributes': {'bold': True}}]})
+
+
+class ComposeTests(SimpleTestCase):
+    def test_composed_changes_apply_like_the_changes_in_turn(self):
+        rng = random.Random(1)
+        for _ in range(2000):
+            document = random_document(rng)
+            changes = []
+            expected = document
+            for _ in range(rng.randint(2, 4)):
+                change = random_change(rng, length_of(expected))
+                changes.append(change)
+                expected = compose(expected, change)
+            combined = {'ops': []}
+            for change in changes:
+                combined = compose_changes(combined, change)
+            self.assertEqual(compose(document, combined), expected, (document, changes))
+
+    def test_text_inserted_then_deleted_cancels_out(self):
+        first = {'ops': [{'retain': 2}, {'insert': 'abc'}]}
+        second = {'ops': [{'retain': 2}, {'delete': 3}]}
+        self.assertEqual(compose_changes(first, second), {'ops': []})
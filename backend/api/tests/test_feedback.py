@@ -0,0 +1,57 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.models import AIFeedback, Document
+
+
+def finding(start, end, type='grammar', suggestion='Fix this'):
+    return {'type': type, 'start': start, 'end': end, 'suggestion': suggestion, 'confidence': 0.9}
+
+
+class AIFeedbackTests(TestCase):
+    def setUp(self):
+        self.document = Document.objects.create(title='Story', content={'ops': [{'insert': 'Some text to check\n'}]})
+
+    def spans(self, feedback):
+        return [(row.start_index, row.end_index) for row in feedback]
+
+    def test_replace_findings_swaps_the_old_revisions_rows(self):
+        AIFeedback.replace_findings(self.document, [finding(0, 4), finding(5, 9, type='style')], ('grammar', 'style'))
+        general = AIFeedback.objects.create(
+            document=self.document, feedback_type='general', start_index=0, end_index=18, suggestion='Overall'
+        )
+        old_revision = self.document.revision
+        self.document.apply_delta({'ops': [{'insert': 'More. '}]}, self.document.revision)
+
+        findings = [finding(0, 5), finding(6, 10), finding(11, 15, type='style')]
+        with CaptureQueriesContext(connection) as queries:
+            AIFeedback.replace_findings(self.document, findings, ('grammar', 'style'))
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+
+        rows = AIFeedback.objects.filter(document=self.document).exclude(pk=general.pk).order_by('start_index')
+        self.assertEqual(self.spans(rows), [(0, 5), (6, 10), (11, 15)])
+        self.assertEqual({row.revision for row in rows}, {old_revision + 1})
+        self.assertEqual([row.feedback_type for row in rows], ['grammar', 'grammar', 'style'])
+        # Feedback of other types is left alone
+        self.assertTrue(AIFeedback.objects.filter(pk=general.pk).exists())
+
+        AIFeedback.replace_findings(self.document, [], ('grammar', 'style'))
+        self.assertEqual(list(AIFeedback.objects.filter(document=self.document)), [general])
+
+    def test_overlapping_includes_spans_cut_by_either_edge(self):
+        AIFeedback.replace_findings(self.document, [
+            finding(0, 5),    # ends where the range starts
+            finding(2, 7),    # overlaps the start
+            finding(8, 9),    # inside
+            finding(6, 20),   # covers the whole range
+            finding(9, 14),   # overlaps the end
+            finding(12, 16),  # starts where the range ends
+        ], ('grammar',))
+        self.assertEqual(self.spans(AIFeedback.overlapping(self.document, 5, 12)), [(2, 7), (6, 20), (8, 9), (9, 14)])
+        self.assertEqual(self.spans(AIFeedback.overlapping(self.document, 8, 9)), [(6, 20), (8, 9)])
+        self.assertEqual(self.spans(AIFeedback.overlapping(self.document, 13)), [(6, 20), (9, 14), (12, 16)])
+
+        other = Document.objects.create(title='Other', content={'ops': [{'insert': 'Text\n'}]})
+        self.assertEqual(list(AIFeedback.overlapping(other, 0)), [])
@@ -0,0 +1,174 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api.tests.utils import blank_nlp
+from api.utils import grammar
+from api.utils.grammar import RULES, Rule, RuleEngine, check_grammar, check_text, register_rule
+
+TEXTS = [
+    'The first sentence is fine. The second one is too!',
+    'the sentence starts in lower case.',
+    'This one trails off without an ending',
+    'Short. Is it? Very.',
+    'We wrote the whole thing in js, and the js build is slow.',
+    ' '.join(['word'] * 45) + '.',
+    'Mixed: js without capitals, punctuation or anything else ' + ' '.join(['and more'] * 20),
+    '',
+]
+
+
+def baseline_suggestions(doc):
+    """
+    The checks GrammarCheckView ran inline before the rule engine, kept as the reference
+    """
+    suggestions = []
+    for sent in doc.sents:
+        if len(sent) > 40:
+            suggestions.append({
+                'type': 'grammar',
+                'suggestion': f'Consider breaking this long sentence into smaller ones: "{sent}"',
+                'confidence': 0.7
+            })
+        sent_tokens = [token for token in sent]
+        if sent_tokens and not sent_tokens[0].text[0].isupper():
+            suggestions.append({
+                'type': 'grammar',
+                'suggestion': f'Sentence should start with a capital letter: "{sent}"',
+                'confidence': 0.9
+            })
+        if sent_tokens and sent_tokens[-1].text not in ['.', '!', '?']:
+            suggestions.append({
+                'type': 'grammar',
+                'suggestion': f'Sentence should end with proper punctuation: "{sent}"',
+                'confidence': 0.9
+            })
+        if any(token.dep_ == 'auxpass' for token in sent):
+            suggestions.append({
+                'type': 'grammar',
+                'suggestion': f'Consider using active voice instead of passive voice in: "{sent}"',
+                'confidence': 0.8
+            })
+        subjects = [token for token in sent if token.dep_ in ('nsubj', 'nsubjpass')]
+        verbs = [token for token in sent if token.pos_ == 'VERB']
+        for subject in subjects:
+            for verb in verbs:
+                if subject.text.lower() in ['it', 'he', 'she'] and verb.text in ['are', 'were']:
+                    suggestions.append({
+                        'type': 'grammar',
+                        'suggestion': f'Check subject-verb agreement in: "{sent}"',
+                        'confidence': 0.8
+                    })
+        if 'js' in [token.text.lower() for token in sent]:
+            suggestions.append({
+                'type': 'style',
+                'suggestion': f'Consider using "JavaScript" instead of "js" for better clarity: "{sent}"',
+                'confidence': 0.7
+            })
+        if len(sent_tokens) < 3:
+            suggestions.append({
+                'type': 'grammar',
+                'suggestion': f'This might be an incomplete sentence: "{sent}"',
+                'confidence': 0.7
+            })
+    if not suggestions:
+        suggestions.append({
+            'type': 'feedback',
+            'suggestion': 'The text appears to be grammatically correct, but you might want to expand it for better context.',
+            'confidence': 0.6
+        })
+    return suggestions
+
+
+def parsed_doc(vocab):
+    """
+    A hand-annotated parse, so the syntax rules have labels to read without a trained model
+    """
+    from spacy.tokens import Doc
+
+    return Doc(
+        vocab,
+        words='The book was written by him . it were here and she were there'.split(),
+        pos=['DET', 'NOUN', 'AUX', 'VERB', 'ADP', 'PRON', 'PUNCT', 'PRON', 'VERB', 'ADV', 'CCONJ', 'PRON', 'VERB', 'ADV'],
+        deps=['det', 'nsubjpass', 'auxpass', 'ROOT', 'agent', 'pobj', 'punct',
+              'nsubj', 'ROOT', 'advmod', 'cc', 'nsubj', 'conj', 'advmod'],
+        heads=[1, 3, 3, 3, 3, 4, 3, 8, 8, 8, 8, 12, 8, 12],
+    )
+
+
+class RuleEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.nlp = blank_nlp()
+
+    def test_findings_match_the_original_checks(self):
+        for tiered in (False, True):
+            with override_settings(GRAMMAR_TIERED=tiered):
+                for text in TEXTS:
+                    self.assertEqual(check_text(self.nlp, text), baseline_suggestions(self.nlp(text)), (tiered, text))
+
+    def test_syntax_findings_match_the_original_checks(self):
+        doc = parsed_doc(self.nlp.vocab)
+        suggestions = check_grammar(doc)
+        self.assertEqual(suggestions, baseline_suggestions(doc))
+        # One agreement finding per mismatched subject and verb, as before
+        agreement = [suggestion for suggestion in suggestions if 'subject-verb' in suggestion['suggestion']]
+        self.assertEqual(len(agreement), 4)
+        self.assertEqual(sum('passive voice' in suggestion['suggestion'] for suggestion in suggestions), 1)
+
+    def test_findings_follow_sentence_then_rule_order(self):
+        doc = self.nlp('it js. Fine sentence here')
+        self.assertEqual(
+            [suggestion['suggestion'].split(':')[0] for suggestion in check_grammar(doc)],
+            [
+                'Sentence should start with a capital letter',
+                'Consider using "JavaScript" instead of "js" for better clarity',
+                'Sentence should end with proper punctuation',
+            ]
+        )
+
+    def test_syntax_rules_only_run_where_they_could_fire(self):
+        engine = RuleEngine(RULES)
+        doc = self.nlp('The cat sat. The cats were fed. It is done.')
+        self.assertEqual([engine.needs_parse(sent) for sent in doc.sents], [False, True, True])
+        self.assertFalse(RuleEngine([rule for rule in RULES if not rule.attrs]).needs_parse(doc[:4]))
+
+
+class RegisterRuleTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(grammar, 'RULES', list(RULES))
+        self.rules = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rules_run_in_registration_order(self):
+        @register_rule
+        class ShoutRule(Rule):
+            name = 'shout'
+
+            def check(self, sent, collected):
+                return [self.suggestion('Shout', 0.5)]
+
+        self.assertEqual([rule.name for rule in self.rules][-2:], ['incomplete-sentence', 'shout'])
+        suggestions = RuleEngine(self.rules).check_sentence(blank_nlp()('hi')[:])
+        self.assertEqual(
+            [suggestion['suggestion'].split(':')[0] for suggestion in suggestions],
+            [
+                'Sentence should start with a capital letter',
+                'Sentence should end with proper punctuation',
+                'This might be an incomplete sentence',
+                'Shout',
+            ]
+        )
+
+    def test_registering_a_rule_again_replaces_it_in_place(self):
+        names = [rule.name for rule in self.rules]
+
+        @register_rule
+        class CapitalizationRule(Rule):
+            name = 'capitalization'
+
+            def check(self, sent, collected):
+                return []
+
+        self.assertEqual([rule.name for rule in self.rules], names)
+        self.assertIsInstance(self.rules[names.index('capitalization')], CapitalizationRule)
+        self.assertEqual(RuleEngine(self.rules).check_sentence(blank_nlp()('lower case text.')[:]), [])
@@ -0,0 +1,88 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.models import Document
+from api.tests.utils import blank_nlp
+from api.utils.grammar import check_text
+
+URL = '/api/ai/grammar/batch/'
+
+
+def content(text):
+    return {'ops': [{'insert': text + '\n'}]}
+
+
+class BatchGrammarCheckTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('api.views.ai_views.get_nlp', return_value=blank_nlp())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+
+    def post(self, data):
+        response = self.client.post(URL, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_lines_come_back_in_input_order(self):
+        texts = [
+            'the first text has no ending',
+            5,
+            'This one is fine.',
+            '',
+            'we use js here.',
+            '   ',
+            'the first text has no ending',
+        ]
+        # One of the texts is cached already, so its line is ready before the others are parsed
+        self.post({'texts': ['This one is fine.']})
+
+        lines = self.post({'texts': texts, 'batch_size': 2})
+        self.assertEqual([line['index'] for line in lines], list(range(len(texts))))
+        for text, line in zip(texts, lines):
+            if isinstance(text, str) and text.strip():
+                self.assertEqual(line, {'index': line['index'], 'suggestions': check_text(blank_nlp(), text)})
+            else:
+                self.assertEqual(line, {'index': line['index'], 'error': 'Text is required'})
+        self.assertTrue(lines[0]['suggestions'])
+        # Served from the cache the second time, the same
+        self.assertEqual(self.post({'texts': texts}), lines)
+
+    def test_documents_the_caller_cannot_read_are_not_found(self):
+        User = get_user_model()
+        owner = User.objects.create_user('owner', password='secret')
+        other = User.objects.create_user('other', password='secret')
+        mine = Document.objects.create(title='Mine', content=content('the draft'), author=owner)
+        empty = Document.objects.create(title='Empty', content={'ops': []}, author=owner)
+        theirs = Document.objects.create(title='Theirs', content=content('Not yours.'), author=other)
+
+        self.client.force_authenticate(owner)
+        lines = self.post({'document_ids': [theirs.pk, mine.pk, 0, empty.pk]})
+        self.assertEqual(lines, [
+            {'index': 0, 'error': 'Document not found'},
+            {'index': 1, 'suggestions': check_text(blank_nlp(), 'the draft')},
+            {'index': 2, 'error': 'Document not found'},
+            {'index': 3, 'error': 'Document is empty'},
+        ])
+
+    @override_settings(GRAMMAR_BATCH_MAX_ITEMS=3)
+    def test_bad_requests_are_rejected(self):
+        for data in [
+            {},
+            {'texts': []},
+            {'texts': 'one text'},
+            {'texts': ['a', 'b', 'c', 'd']},
+            {'texts': ['a'], 'batch_size': 'many'},
+            {'texts': ['a'], 'n_process': 0},
+            {'document_ids': ['one']},
+        ]:
+            response = self.client.post(URL, data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn('error', response.data)
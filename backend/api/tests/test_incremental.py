@@ -0,0 +1,97 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from api.tests.utils import blank_nlp
+from api.utils import incremental
+from api.utils.delta import StaleRevisionError
+from api.utils.grammar import check_text
+from api.utils.incremental import IncrementalGrammarAnalyzer, split_paragraphs
+
+TEXT = (
+    'The first paragraph is fine.\n'
+    'the second one has no capital.\n'
+    'The third uses js a lot.\n'
+    'Short.\n'
+)
+
+
+class IncrementalGrammarAnalyzerTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.nlp = blank_nlp()
+        self.analyzer = IncrementalGrammarAnalyzer()
+        self.analyzer.paragraph_cache(self.nlp).clear()
+
+    def analyzed_bodies(self):
+        """
+        Patch the chunked analysis to record the paragraphs that are actually analyzed
+        """
+        bodies = []
+        find_issues_in_chunks = incremental.find_issues_in_chunks
+
+        def record(nlp, texts):
+            bodies.extend(texts)
+            return find_issues_in_chunks(nlp, texts)
+
+        patcher = mock.patch.object(incremental, 'find_issues_in_chunks', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return bodies
+
+    def test_a_delta_reanalyzes_only_its_paragraph(self):
+        state, _ = self.analyzer.analyze(self.nlp, 1, TEXT)
+        bodies = self.analyzed_bodies()
+        offset = TEXT.index('second')
+        state, reanalyzed = self.analyzer.apply_delta(
+            self.nlp, 1, state.revision, {'ops': [{'retain': offset}, {'delete': 1}, {'insert': 'S'}]}
+        )
+        start = TEXT.index('the second')
+        self.assertEqual(reanalyzed, [(start, start + len('the Second one has no capital.\n'))])
+        self.assertEqual(bodies, ['the Second one has no capital.'])
+
+    def test_findings_match_a_full_check(self):
+        state, _ = self.analyzer.analyze(self.nlp, 1, TEXT)
+        deltas = [
+            {'ops': [{'insert': 'A new opening line.\n'}]},
+            {'ops': [{'retain': 20}, {'delete': 29}]},
+            {'ops': [{'retain': 30}, {'insert': ' without an ending\nthe js part'}]},
+        ]
+        for delta in deltas:
+            state, _ = self.analyzer.apply_delta(self.nlp, 1, state.revision, delta)
+            # Paragraphs are checked on their own, as check_text would check each one
+            expected = [
+                suggestion['suggestion']
+                for paragraph in split_paragraphs(state.text) if paragraph.strip()
+                for suggestion in check_text(self.nlp, paragraph.rstrip('\n'))
+                if suggestion['type'] != 'feedback'
+            ]
+            self.assertEqual(sorted(finding['suggestion'] for finding in state.findings()), sorted(expected))
+            for finding in state.findings():
+                self.assertIn(state.text[finding['start']:finding['end']].strip(), finding['suggestion'])
+
+    def test_stale_revisions_are_refused(self):
+        first, _ = self.analyzer.analyze(self.nlp, 1, TEXT)
+        second, _ = self.analyzer.apply_delta(self.nlp, 1, first.revision, {'ops': [{'insert': 'x'}]})
+        with self.assertRaises(StaleRevisionError):
+            self.analyzer.apply_delta(self.nlp, 1, first.revision, {'ops': [{'insert': 'y'}]})
+        self.assertEqual(self.analyzer.get_state(1).text, 'x' + TEXT)
+
+    def test_a_lost_state_is_not_mistaken_for_a_rebuilt_one(self):
+        old, _ = self.analyzer.analyze(self.nlp, 1, TEXT)
+        caches['default'].clear()
+        with self.assertRaises(StaleRevisionError):
+            self.analyzer.apply_delta(self.nlp, 1, old.revision, {'ops': [{'insert': 'x'}]})
+
+        # Analyzed again from other text, e.g. by another tab: the old revision must not apply to it
+        new, _ = self.analyzer.analyze(self.nlp, 1, 'Other text.\n')
+        self.assertNotEqual(new.revision, old.revision)
+        with self.assertRaises(StaleRevisionError):
+            self.analyzer.apply_delta(self.nlp, 1, old.revision, {'ops': [{'insert': 'x'}]})
+
+    def test_the_state_is_shared_between_processes(self):
+        state, _ = self.analyzer.analyze(self.nlp, 1, TEXT)
+        other = IncrementalGrammarAnalyzer()
+        state, _ = other.apply_delta(self.nlp, 1, state.revision, {'ops': [{'insert': 'x'}]})
+        self.assertEqual(self.analyzer.get_state(1).revision, state.revision)
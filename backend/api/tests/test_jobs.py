@@ -0,0 +1,109 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.models import AnalysisJob, Document
+
+
+@override_settings(ANALYSIS_JOBS=dict(settings.ANALYSIS_JOBS, MAX_ATTEMPTS=2, RETRY_DELAY=10, TIMEOUT=300))
+class AnalysisJobTests(TestCase):
+    def setUp(self):
+        self.document = Document.objects.create(title='Story', content={'ops': [{'insert': 'Once upon a time\n'}]})
+
+    def test_enqueueing_the_same_content_reuses_the_job(self):
+        job, created = AnalysisJob.enqueue(self.document)
+        self.assertTrue(created)
+        self.assertEqual(AnalysisJob.enqueue(self.document), (job, False))
+
+        # The partial unique constraint stops a second active job for the same content
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AnalysisJob.objects.create(document=self.document, content_hash=self.document.content_hash)
+
+        # Also when another request queues it between the lookup and the insert
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            self.assertEqual(AnalysisJob.enqueue(self.document), (job, False))
+
+        # Failed jobs do not count
+        job.status = AnalysisJob.FAILED
+        job.save()
+        retry, created = AnalysisJob.enqueue(self.document)
+        self.assertTrue(created)
+        self.assertNotEqual(retry.pk, job.pk)
+
+        # New content gets a job of its own
+        self.document.apply_delta({'ops': [{'insert': 'Twice '}]}, self.document.revision)
+        self.assertTrue(AnalysisJob.enqueue(Document.objects.get(pk=self.document.pk))[1])
+
+    def test_a_job_is_claimed_once(self):
+        job, _ = AnalysisJob.enqueue(self.document)
+        claimed = AnalysisJob.claim('first')
+        self.assertEqual((claimed.pk, claimed.status, claimed.worker, claimed.attempts), (job.pk, 'running', 'first', 1))
+        self.assertIsNone(AnalysisJob.claim('second'))
+
+    def test_a_worker_losing_the_race_moves_on(self):
+        first, _ = AnalysisJob.enqueue(self.document)
+        other = Document.objects.create(title='Other', content={'ops': [{'insert': 'Text\n'}]})
+        second, _ = AnalysisJob.enqueue(other)
+        AnalysisJob.objects.filter(pk=first.pk).update(run_after=first.run_after - timedelta(seconds=1))
+
+        # Another worker claims the first job between this worker's lookup and its update
+        lookup = QuerySet.first
+
+        def first_then_claimed(queryset):
+            job_id = lookup(queryset)
+            if job_id == first.pk:
+                AnalysisJob.objects.filter(pk=job_id).update(status=AnalysisJob.RUNNING, worker='other')
+            return job_id
+
+        with mock.patch.object(QuerySet, 'first', first_then_claimed):
+            claimed = AnalysisJob.claim('late')
+        self.assertEqual((claimed.pk, claimed.worker), (second.pk, 'late'))
+        first.refresh_from_db()
+        self.assertEqual((first.worker, first.attempts), ('other', 0))
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job, _ = AnalysisJob.enqueue(self.document)
+        AnalysisJob.claim('lost')
+        self.assertEqual(AnalysisJob.requeue_stale(), 0)
+
+        # The worker died: the job is queued again once it has run for longer than the timeout
+        AnalysisJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=301))
+        self.assertEqual(AnalysisJob.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), ('queued', '', 1))
+
+        # Its last attempt is lost too
+        self.assertEqual(AnalysisJob.claim('lost again').pk, job.pk)
+        AnalysisJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=301))
+        self.assertEqual(AnalysisJob.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.attempts), ('failed', 'Timed out', 2))
+        self.assertIsNone(AnalysisJob.claim('idle'))
+
+    def test_failures_back_off_then_give_up(self):
+        job, _ = AnalysisJob.enqueue(self.document)
+        job = AnalysisJob.claim('worker')
+        job.fail('Rate limited')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('queued', 'Rate limited'))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=9))
+        self.assertIsNone(AnalysisJob.claim('worker'))
+
+        AnalysisJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = AnalysisJob.claim('worker')
+        job.fail('Rate limited')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+        # Errors that will not go away are not retried
+        other = Document.objects.create(title='Other', content={'ops': [{'insert': 'Text\n'}]})
+        AnalysisJob.enqueue(other)
+        job = AnalysisJob.claim('worker')
+        job.fail('Document is empty', retry=False)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
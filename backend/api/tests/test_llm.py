@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.utils import llm
+from api.utils.llm import LLMError, LLMGateway
+
+
+def response(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeClient:
+    """
+    Stands in for the OpenAI client: answers after delay seconds, counting calls and concurrency
+    """
+
+    def __init__(self, delay=0.2, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def start(self):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def stop(self, params):
+        with self._lock:
+            self.running -= 1
+        if self.error is not None:
+            raise self.error
+        return response(f"Answer to {params['messages'][-1]['content']}")
+
+    def create(self, **params):
+        self.start()
+        time.sleep(self.delay)
+        return self.stop(params)
+
+
+class AsyncFakeClient(FakeClient):
+    async def create(self, **params):
+        self.start()
+        await asyncio.sleep(self.delay)
+        return self.stop(params)
+
+
+def messages(prompt):
+    return [{'role': 'user', 'content': prompt}]
+
+
+def timeout_error():
+    import httpx
+    from openai import APITimeoutError
+
+    return APITimeoutError(httpx.Request('POST', 'https://example.com'))
+
+
+class LLMGatewaySyncTests(SimpleTestCase):
+    def gateway(self, client, **kwargs):
+        gateway = LLMGateway('key', **kwargs)
+        gateway._client = client
+        return gateway
+
+    def run_threads(self, target, prompts):
+        results = [None] * len(prompts)
+
+        def run(index, prompt):
+            try:
+                results[index] = target(messages(prompt))
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=run, args=item) for item in enumerate(prompts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_prompts_share_one_request(self):
+        client = FakeClient()
+        gateway = self.gateway(client)
+        results = self.run_threads(gateway.complete_sync, ['same'] * 6)
+        self.assertEqual(results, ['Answer to same'] * 6)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(gateway._inflight, {})
+
+    def test_requests_in_flight_are_capped(self):
+        client = FakeClient(delay=0.1)
+        gateway = self.gateway(client, max_concurrency=2)
+        results = self.run_threads(gateway.complete_sync, [f'prompt {index}' for index in range(6)])
+        self.assertEqual(results, [f'Answer to prompt {index}' for index in range(6)])
+        self.assertEqual((client.calls, client.max_running), (6, 2))
+
+    def test_waiters_wait_as_long_as_the_request(self):
+        # The shared request outlasts the per-attempt timeout, as it can with retries
+        client = FakeClient(delay=0.3)
+        gateway = self.gateway(client, timeout=0.1, max_retries=2)
+        self.assertEqual(self.run_threads(gateway.complete_sync, ['slow'] * 3), ['Answer to slow'] * 3)
+        self.assertEqual(client.calls, 1)
+
+    def test_timeouts_are_llm_errors(self):
+        client = FakeClient(error=timeout_error())
+        gateway = self.gateway(client)
+        results = self.run_threads(gateway.complete_sync, ['lost'] * 3)
+        self.assertTrue(all(isinstance(result, LLMError) for result in results), results)
+        self.assertEqual(client.calls, 1)
+
+        with mock.patch.object(gateway, 'request_budget', return_value=0.05):
+            gateway._client = FakeClient(delay=0.3)
+            results = self.run_threads(gateway.complete_sync, ['slow'] * 2)
+        # The owner gets its answer, the waiter gives up after the budget
+        self.assertIn('Answer to slow', results)
+        self.assertTrue(any(isinstance(result, LLMError) for result in results), results)
+
+    def test_other_errors_reach_every_caller(self):
+        gateway = self.gateway(FakeClient(error=ValueError('Bad request')))
+        results = self.run_threads(gateway.complete_sync, ['bad'] * 3)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results), results)
+
+
+class LLMGatewayAsyncTests(SimpleTestCase):
+    def gateway(self, client, **kwargs):
+        gateway = LLMGateway('key', **kwargs)
+
+        class LoopState:
+            def __init__(self, gateway):
+                self.client = client
+                self.semaphore = asyncio.Semaphore(gateway.max_concurrency)
+                self.inflight = {}
+
+        patcher = mock.patch.object(llm, '_LoopState', LoopState)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return gateway
+
+    def test_identical_prompts_share_one_request(self):
+        client = AsyncFakeClient(delay=0.1)
+        gateway = self.gateway(client)
+
+        async def run():
+            return await asyncio.gather(*(gateway.complete(messages('same')) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), ['Answer to same'] * 5)
+        self.assertEqual(client.calls, 1)
+
+    def test_requests_in_flight_are_capped(self):
+        client = AsyncFakeClient(delay=0.05)
+        gateway = self.gateway(client, max_concurrency=3)
+
+        async def run():
+            return await asyncio.gather(*(gateway.complete(messages(f'prompt {index}')) for index in range(9)))
+
+        self.assertEqual(asyncio.run(run()), [f'Answer to prompt {index}' for index in range(9)])
+        self.assertEqual((client.calls, client.max_running), (9, 3))
+
+    def test_timeouts_are_llm_errors(self):
+        gateway = self.gateway(AsyncFakeClient(delay=1), timeout=0.05)
+        with self.assertRaises(LLMError):
+            asyncio.run(gateway.complete(messages('slow')))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+URL = '/api/metrics/'
+
+
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.writer = User.objects.create_user('writer', password='secret')
+        self.staff = User.objects.create_user('admin', password='secret', is_staff=True)
+
+    def assertAllowed(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'smartwriter_request_duration_seconds', response.content)
+
+    @override_settings(METRICS=dict(settings.METRICS, TOKEN=''))
+    def test_without_a_token_only_staff_can_read_them(self):
+        self.assertEqual(self.client.get(URL).status_code, 401)
+        # Any bearer token is refused when none is configured
+        self.assertEqual(self.client.get(URL, HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+        self.client.force_login(self.writer)
+        self.assertEqual(self.client.get(URL).status_code, 401)
+        self.client.force_login(self.staff)
+        self.assertAllowed(self.client.get(URL))
+
+    @override_settings(METRICS=dict(settings.METRICS, TOKEN='scrape-me'))
+    def test_with_a_token_scrapers_must_send_it(self):
+        self.assertAllowed(self.client.get(URL, HTTP_AUTHORIZATION='Bearer scrape-me'))
+        self.assertEqual(self.client.get(URL, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get(URL, HTTP_AUTHORIZATION='scrape-me').status_code, 401)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(URL).status_code, 401)
+
+    @override_settings(METRICS=dict(settings.METRICS, ENABLED=False, TOKEN='scrape-me'))
+    def test_disabled(self):
+        self.assertEqual(self.client.get(URL, HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 404)
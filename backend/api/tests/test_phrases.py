@@ -0,0 +1,99 @@
+import random
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api.models import Document
+from api.utils.phrases import (
+    CountMinSketch, count_paragraphs, count_phrases, document_phrases, new_sketch, phrase_hashes
+)
+
+WORDS = [
+    'river', 'stone', 'quiet', 'harbor', 'lantern', 'morning', 'the', 'old', 'boat', 'drifted', 'past', 'a',
+    'market', 'where', 'children', 'sang', 'under', 'grey', 'clouds', 'again',
+]
+
+
+def paragraphs(seed, count):
+    rng = random.Random(seed)
+    return [
+        ' '.join(
+            ' '.join(rng.choices(WORDS, k=rng.randint(3, 12))).capitalize() + rng.choice(['.', ',', '!', ';'])
+            for _ in range(rng.randint(1, 4))
+        )
+        for _ in range(count)
+    ]
+
+
+class CountMinSketchTests(SimpleTestCase):
+    def test_estimates_never_undercount(self):
+        # Far more keys than counters, with Zipf-like counts, so most counters are shared
+        rng = random.Random(3)
+        keys = [f'phrase {index}' for index in range(2000)]
+        counts = Counter({key: max(1, 1000 // (index + 1)) for index, key in enumerate(keys)})
+        sketch = CountMinSketch(3, 256)
+        for start in range(0, len(keys), 300):
+            batch = keys[start:start + 300]
+            rng.shuffle(batch)
+            sketch.add(phrase_hashes(batch), np.array([counts[key] for key in batch], dtype=np.int32))
+        estimates = sketch.estimate(phrase_hashes(keys)).tolist()
+        self.assertTrue(all(estimate >= counts[key] for key, estimate in zip(keys, estimates)))
+        # Small enough that some are over, or this tests nothing
+        self.assertTrue(any(estimate > counts[key] for key, estimate in zip(keys, estimates)))
+
+        # Including once counts are taken away again
+        removed = keys[::2]
+        sketch.add(phrase_hashes(removed), -np.array([counts[key] for key in removed], dtype=np.int32))
+        counts.subtract({key: counts[key] for key in removed})
+        estimates = sketch.estimate(phrase_hashes(keys)).tolist()
+        self.assertTrue(all(estimate >= counts[key] for key, estimate in zip(keys, estimates)))
+
+        copy = CountMinSketch.from_bytes(3, 256, sketch.to_bytes())
+        self.assertTrue(np.array_equal(copy.counters, sketch.counters))
+
+    def test_adding_then_taking_away_a_paragraph_restores_the_index(self):
+        sketch, table = new_sketch(), {}
+        count_paragraphs(paragraphs(5, 40), (sketch, table))
+        counters, phrases = sketch.counters.copy(), dict(table)
+        self.assertTrue(phrases)
+
+        paragraph = paragraphs(6, 1)
+        count_paragraphs(paragraph, (sketch, table))
+        self.assertFalse(np.array_equal(sketch.counters, counters))
+        count_paragraphs(paragraph, (sketch, table), sign=-1)
+        self.assertTrue(np.array_equal(sketch.counters, counters))
+        self.assertEqual(table, phrases)
+
+        # Indexes fed the same paragraphs in batches of any size agree
+        batched, batched_table = new_sketch(), {}
+        count_paragraphs(paragraphs(5, 40), (batched, batched_table), batch_chars=100)
+        self.assertTrue(np.array_equal(batched.counters, counters))
+        self.assertEqual(batched_table, phrases)
+
+
+# A sketch this small overcounts most phrases, so the table's counts are not exact
+@override_settings(PHRASE_INDEX=dict(settings.PHRASE_INDEX, SKETCH_DEPTH=2, SKETCH_WIDTH=64, MAX_LOCATIONS=3))
+class DocumentPhrasesTests(TestCase):
+    def test_counts_are_exact_after_the_candidate_pass(self):
+        texts = paragraphs(7, 30)
+        document = Document.objects.create(title='Story', content={'ops': [{'insert': '\n'.join(texts) + '\n'}]})
+        exact = count_phrases(document.chunks.values_list('text', flat=True))
+
+        result = document_phrases(document, 10)
+        self.assertTrue(result['phrases'])
+        self.assertTrue(result['words'])
+        index = document.phrase_index
+        _, table = index.load()
+        self.assertTrue(any(table[phrase] > exact[phrase] for phrase in table))
+
+        text = document.get_text()
+        for row in result['phrases'] + result['words']:
+            self.assertEqual(row['count'], exact[row['phrase']], row['phrase'])
+            self.assertEqual(len(row['locations']), min(row['count'], 3))
+            for location in row['locations']:
+                self.assertEqual(text[location['start']:location['end']].lower(), row['phrase'])
+        # The most used words, by their exact counts
+        words = sorted((count, word) for word, count in exact.items() if ' ' not in word)
+        self.assertEqual(result['words'][0]['count'], words[-1][0])
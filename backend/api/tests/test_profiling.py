@@ -0,0 +1,36 @@
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from api.utils.profiling import ProfileStore
+
+
+class FakeProfiler:
+    def dump_stats(self, path):
+        Path(path).write_bytes(b'stats')
+
+
+class ProfileStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ProfileStore(Path(directory.name) / 'profiles', max_profiles=3)
+
+    def test_only_the_newest_traces_are_kept(self):
+        self.assertEqual(self.store.ids(), [])
+        saved = [
+            self.store.save({'path': f'/request/{index}'}, FakeProfiler() if index % 2 else None) for index in range(7)
+        ]
+        self.assertEqual(self.store.ids(), saved[-3:])
+        self.assertEqual([self.store.load(profile_id)['path'] for profile_id in self.store.ids()],
+                         ['/request/4', '/request/5', '/request/6'])
+
+        # Dropped traces take their cProfile stats with them
+        files = sorted(path.name for path in self.store.path.iterdir())
+        self.assertEqual(files, sorted([f'{profile_id}.json' for profile_id in saved[-3:]] + [f'{saved[5]}.prof']))
+        self.assertTrue(self.store.load(saved[5])['pstats'])
+        self.assertFalse(self.store.load(saved[6])['pstats'])
+
+        self.store.clear()
+        self.assertEqual(list(self.store.path.iterdir()), [])
@@ -0,0 +1,54 @@
+import random
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from api.models import Document, DocumentRevision
+from api.tests.test_delta import random_change, random_document
+from api.utils.delta import compose, delta_to_text
+
+
+@override_settings(REVISION_HISTORY=dict(settings.REVISION_HISTORY, SNAPSHOT_INTERVAL=10))
+class ContentAtTests(TestCase):
+    def test_every_revision_rebuilds(self):
+        rng = random.Random(3)
+        document = Document.objects.create(title='History', content=random_document(rng))
+        expected = {document.revision: document.content}
+        for step in range(120):
+            document = Document.objects.get(pk=document.pk)
+            if step == 55:
+                # A full save in between breaks the chain of changes
+                document.content = random_document(rng)
+                document.save()
+            else:
+                change = random_change(rng, len(delta_to_text(document.content)))
+                document.apply_delta(change, document.revision)
+            document = Document.objects.get(pk=document.pk)
+            expected[document.revision] = document.content
+
+        self.assertEqual(sorted(expected), list(range(min(expected), document.revision + 1)))
+        for revision, content in expected.items():
+            self.assertEqual(DocumentRevision.content_at(document.pk, revision), content, revision)
+
+        # Bounded rebuilds: every snapshot interval keeps a full copy
+        snapshots = DocumentRevision.objects.filter(document=document, snapshot__isnull=False)
+        self.assertTrue(set(range(10, document.revision + 1, 10)) <= set(snapshots.values_list('revision', flat=True)))
+
+    def test_composing_the_stored_changes(self):
+        document = Document.objects.create(title='Chain', content={'ops': [{'insert': 'one\n'}]})
+        first = document.revision
+        document.apply_delta({'ops': [{'retain': 3}, {'insert': ' two'}]}, first)
+        document.apply_delta({'ops': [{'delete': 4}]}, first + 1)
+        self.assertEqual(DocumentRevision.content_at(document.pk, first + 1), compose(
+            {'ops': [{'insert': 'one\n'}]}, {'ops': [{'retain': 3}, {'insert': ' two'}]}
+        ))
+        self.assertEqual(DocumentRevision.content_at(document.pk, first + 2), {'ops': [{'insert': 'two\n'}]})
+
+    def test_missing_revisions(self):
+        document = Document.objects.create(title='Gone', content={'ops': [{'insert': 'one\n'}]})
+        document.apply_delta({'ops': [{'insert': 'a'}]}, document.revision)
+        with self.assertRaises(DocumentRevision.DoesNotExist):
+            DocumentRevision.content_at(document.pk, document.revision + 1)
+        DocumentRevision.objects.filter(document=document).delete()
+        with self.assertRaises(DocumentRevision.DoesNotExist):
+            DocumentRevision.content_at(document.pk, document.revision)
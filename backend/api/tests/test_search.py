@@ -0,0 +1,126 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.models import Document
+from api.utils import search
+from api.utils.search import SearchIndexer, search_documents
+
+
+def content(text):
+    return {'ops': [{'insert': text + '\n'}]}
+
+
+@override_settings(SEARCH=dict(settings.SEARCH, INDEX_DELAY=0))
+class SearchTests(TestCase):
+    def create(self, title, text, author=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Document.objects.create(title=title, content=content(text), author=author)
+
+    def test_saves_are_indexed_once_committed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            document = Document.objects.create(title='Winter', content=content('A cold night'))
+        self.assertTrue(Document.objects.get(pk=document.pk).search_stale)
+        with mock.patch.object(search, 'index_stale_documents'):
+            self.assertEqual(search_documents('cold', None, 10), [])
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(Document.objects.get(pk=document.pk).search_stale)
+        with mock.patch.object(search, 'index_stale_documents'):
+            self.assertEqual([match[0] for match in search_documents('cold', None, 10)], [document.pk])
+
+        # Saving a field that is not indexed leaves the index alone
+        with self.captureOnCommitCallbacks() as callbacks:
+            document.save(update_fields=['updated_at'])
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Document.objects.get(pk=document.pk).search_stale)
+
+    @override_settings(SEARCH=dict(settings.SEARCH, INDEX_DELAY=0, STALE_BATCH=2))
+    def test_searches_catch_up_on_a_bounded_number_of_stale_documents(self):
+        # Saved without their commit callbacks running, as if the process stopped
+        documents = [Document.objects.create(title=f'Draft {index}', content=content('dragons')) for index in range(5)]
+        self.assertTrue(all(document.search_stale for document in documents))
+
+        # The least recently saved go first
+        matches = search_documents('dragons', None, 10)
+        self.assertEqual(sorted(match[0] for match in matches), [document.pk for document in documents[:2]])
+        stale = Document.objects.filter(search_stale=True).values_list('pk', flat=True)
+        self.assertEqual(sorted(stale), [document.pk for document in documents[2:]])
+        self.assertEqual(len(search_documents('dragons', None, 10)), 4)
+        self.assertEqual(len(search_documents('dragons', None, 10)), 5)
+
+    def test_ranking(self):
+        mention = self.create('Notes', 'The dragon slept. The knight rode on through the long rain.')
+        repeated = self.create('Notes', 'The dragon slept. The dragon woke. The dragon flew away.')
+        titled = self.create('Dragon', 'The knight rode on through the long rain and the wind.')
+        self.create('Other', 'Nothing here.')
+        matches = search_documents('dragon', None, 10)
+        self.assertEqual([match[0] for match in matches], [titled.pk, repeated.pk, mention.pk])
+        ranks = [match[1] for match in matches]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+        # Every word must match, the last as a prefix
+        matches = search_documents('knight ra', None, 10)
+        self.assertEqual(sorted(match[0] for match in matches), [mention.pk, titled.pk])
+
+    def test_snippets_are_escaped_and_marked(self):
+        self.create('Tags', 'Use <b>bold</b> & the dragon markup.')
+        [(_, _, snippet)] = search_documents('dragon', None, 10)
+        self.assertIn('<mark>dragon</mark>', snippet)
+        self.assertIn('&lt;b&gt;bold&lt;/b&gt; &amp;', snippet)
+        self.assertNotIn('<b>', snippet)
+
+    def test_searches_only_see_the_callers_documents(self):
+        users = [get_user_model().objects.create_user(f'writer{index}', password='secret') for index in range(2)]
+        owned = [self.create('Dragon', 'A dragon story', author=user) for user in users]
+        anonymous = self.create('Dragon', 'An anonymous dragon story')
+
+        client = APIClient()
+        response = client.get('/api/documents/search/', {'q': 'dragon'})
+        self.assertEqual([result['id'] for result in response.data['results']], [anonymous.pk])
+        for user, document in zip(users, owned):
+            client.force_authenticate(user)
+            response = client.get('/api/documents/search/', {'q': 'dragon'})
+            self.assertEqual([result['id'] for result in response.data['results']], [document.pk])
+            self.assertIn('<mark>', response.data['results'][0]['snippet'])
+
+    def test_deleted_documents_leave_the_index(self):
+        document = self.create('Gone', 'A dragon story')
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+        self.assertEqual(search_documents('dragon', None, 10), [])
+
+
+@override_settings(SEARCH=dict(settings.SEARCH, INDEX_DELAY=60))
+class SearchIndexerTests(SimpleTestCase):
+    def test_saves_within_the_delay_are_indexed_together(self):
+        indexer = SearchIndexer()
+        with mock.patch.object(search, 'index_document_ids') as index, \
+                mock.patch.object(search, 'close_old_connections'), mock.patch.object(search, 'connection'):
+            for document_id in (1, 2, 1):
+                indexer.schedule(document_id)
+            timer = indexer.timer
+            timer.cancel()
+            self.assertEqual(index.call_count, 0)
+            indexer.run()
+            index.assert_called_once_with({1, 2})
+
+            # The next save starts a new batch
+            indexer.schedule(3)
+            self.assertIsNot(indexer.timer, timer)
+            indexer.timer.cancel()
+            self.assertEqual(indexer.pending, {3})
+
+    def test_a_failed_batch_is_logged(self):
+        indexer = SearchIndexer()
+        with mock.patch.object(search, 'index_document_ids', side_effect=RuntimeError), \
+                mock.patch.object(search, 'close_old_connections'), mock.patch.object(search, 'connection'):
+            indexer.schedule(1)
+            indexer.timer.cancel()
+            with self.assertLogs('api.utils.search', 'ERROR'):
+                indexer.run()
+        self.assertEqual(indexer.pending, set())
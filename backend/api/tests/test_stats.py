@@ -0,0 +1,96 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.models import Document, WritingStatsRollup
+
+
+def content(text):
+    return {'ops': [{'insert': text + '\n'}]}
+
+
+class WritingStatsRollupTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create_user(f'writer{index}', password='secret') for index in range(2)]
+
+    def assertRollupMatches(self):
+        """
+        The rollups give every author the same stats as aggregating their documents
+        """
+        for user in self.users:
+            with override_settings(WRITING_STATS_USE_ROLLUP=True):
+                rollup = user.get_writing_stats()
+            with override_settings(WRITING_STATS_USE_ROLLUP=False):
+                direct = user.get_writing_stats()
+            self.assertEqual(rollup, direct, user.username)
+
+    def months_ago(self, months):
+        today = timezone.localtime()
+        return today.replace(day=15) - datetime.timedelta(days=31 * months)
+
+    def test_rollups_follow_every_change(self):
+        first, second = self.users
+        documents = [
+            Document.objects.create(title=f'Story {index}', content=content('one two three ' * index), author=first)
+            for index in range(1, 5)
+        ]
+        anonymous = Document.objects.create(title='Anonymous', content=content('not counted'))
+        self.assertRollupMatches()
+
+        # Edits: a full save, a delta and a save of fields other than the text
+        documents[0].content = content('a much longer text than it was before')
+        documents[0].save()
+        self.assertRollupMatches()
+        document = Document.objects.get(pk=documents[1].pk)
+        document.apply_delta({'ops': [{'insert': 'more words here '}]}, document.revision)
+        self.assertRollupMatches()
+        documents[2].title = 'Renamed'
+        documents[2].save(update_fields=['title'])
+        self.assertRollupMatches()
+
+        # Moves across months, including back to this one, and to another author
+        for months in (1, 3, 0):
+            document = Document.objects.get(pk=documents[3].pk)
+            document.created_at = self.months_ago(months)
+            document.save()
+            self.assertRollupMatches()
+        document = Document.objects.get(pk=documents[2].pk)
+        document.created_at = self.months_ago(2)
+        document.author = second
+        document.content = content('handed over')
+        document.save()
+        self.assertRollupMatches()
+        anonymous.author = second
+        anonymous.save()
+        self.assertRollupMatches()
+
+        # Deletes, one by one and in bulk
+        documents[0].delete()
+        self.assertRollupMatches()
+        Document.objects.filter(author=second).delete()
+        self.assertRollupMatches()
+        Document.objects.all().delete()
+        self.assertRollupMatches()
+        self.assertFalse(WritingStatsRollup.objects.exclude(document_count=0).exists())
+
+    def test_saves_of_stale_instances_count_what_is_stored(self):
+        document = Document.objects.create(title='Story', content=content('one two'), author=self.users[0])
+        stale = Document.objects.get(pk=document.pk)
+        document.content = content('one two three four')
+        document.save()
+        stale.created_at = self.months_ago(1)
+        stale.save(update_fields=['created_at'])
+        self.assertRollupMatches()
+
+    def test_rebuild(self):
+        for index in range(3):
+            Document.objects.create(title=f'Story {index}', content=content('word ' * index), author=self.users[index % 2])
+        WritingStatsRollup.objects.update(document_count=0, word_count=0)
+        WritingStatsRollup.rebuild(author_ids=[self.users[0].pk])
+        with override_settings(WRITING_STATS_USE_ROLLUP=True):
+            self.assertEqual(self.users[1].get_writing_stats()['total_documents'], 0)
+        WritingStatsRollup.rebuild()
+        self.assertRollupMatches()
@@ -0,0 +1,67 @@
+import random
+
+from django.test import SimpleTestCase
+
+from api.utils.style import count_syllables, score_text
+
+# Counted by hand: 14 words in 3 sentences and 2 paragraphs, 18 syllables, one
+# word of three or more ("yesterday"), one passive ("was painted"), one adverb ("quickly")
+TEXT = 'The cat sat on the mat. It was painted yesterday.\nWe quickly ran home.'
+
+
+class StyleMetricsTests(SimpleTestCase):
+    def test_syllables(self):
+        self.assertEqual(
+            [count_syllables(word) for word in ['the', 'painted', 'yesterday', 'home', 'quickly', 'table', 'jumped']],
+            [1, 2, 3, 1, 2, 2, 1]
+        )
+
+    def test_readability_matches_the_formulas(self):
+        scores = score_text(TEXT)
+        document = scores['document']
+        self.assertEqual(
+            (document['words'], document['sentences'], document['paragraphs'], document['syllables']), (14, 3, 2, 18)
+        )
+        # 206.835 - 1.015 * 14/3 - 84.6 * 18/14
+        self.assertEqual(document['flesch_reading_ease'], 93.33)
+        # 0.39 * 14/3 + 11.8 * 18/14 - 15.59
+        self.assertEqual(document['flesch_kincaid_grade'], 1.4)
+        # 0.4 * (14/3 + 100 * 1/14)
+        self.assertEqual(document['gunning_fog'], 4.72)
+        self.assertEqual(document['passive_density'], 0.33)
+        self.assertEqual(document['adverb_density'], 0.07)
+
+        first, second = scores['paragraphs']
+        self.assertEqual((first['start'], first['end'], first['words'], first['sentences']), (0, 49, 10, 2))
+        # 10 words, 2 sentences, 13 syllables, 1 complex word
+        self.assertEqual(
+            (first['flesch_reading_ease'], first['flesch_kincaid_grade'], first['gunning_fog']), (91.78, 1.7, 6.0)
+        )
+        self.assertEqual(first['passive_density'], 0.5)
+        self.assertEqual((second['start'], second['words'], second['sentences'], second['longest_sentence']), (50, 4, 1, 4))
+        # 4 words, 1 sentence, 5 syllables
+        self.assertAlmostEqual(second['flesch_reading_ease'], 206.835 - 1.015 * 4 - 84.6 * 5 / 4, delta=0.01)
+
+    def test_paragraphs_score_as_they_would_alone(self):
+        rng = random.Random(8)
+        words = ['the', 'cat', 'was', 'painted', 'quickly', 'beautiful', 'yesterday', 'ran', 'home', 'it']
+        paragraphs = [
+            ' '.join(
+                ' '.join(rng.choices(words, k=rng.randint(1, 12))) + rng.choice(['.', '!', '?'])
+                for _ in range(rng.randint(1, 5))
+            )
+            for _ in range(20)
+        ]
+        scores = score_text('\n'.join(paragraphs))
+        self.assertEqual(len(scores['paragraphs']), 20)
+        for paragraph, row in zip(paragraphs, scores['paragraphs']):
+            alone = score_text(paragraph)['document']
+            self.assertEqual(
+                (row['words'], row['sentences'], row['flesch_reading_ease'], row['gunning_fog'], row['passive_density']),
+                (alone['words'], alone['sentences'], alone['flesch_reading_ease'], alone['gunning_fog'],
+                 alone['passive_density']),
+            )
+
+    def test_empty_text(self):
+        document = score_text('')['document']
+        self.assertEqual((document['words'], document['sentences'], document['flesch_reading_ease']), (0, 0, None))
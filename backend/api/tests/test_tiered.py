@@ -0,0 +1,107 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from spacy.language import Language
+
+from api.tests.utils import blank_nlp
+from api.utils.grammar import PASSIVE_AUXILIARIES, check_text, get_rule_engine
+from api.utils.nlp import TimedPipeline
+from api.utils.streaming import stream_suggestions
+from api.views.ai_views import AISuggestionsStreamView, AISuggestionsView
+
+TEXTS = [
+    'The report was written by the team. It were late. Everyone read it.',
+    'she were there and he are here. the cat sat on the mat',
+    'The cake was baked. It is tasty! Nothing else happened here.',
+    'We use js. it were fine, the build got started',
+    'Plain sentences only. No labels are needed in these. Or are they?',
+]
+
+parsed_sentences = []
+
+
+@Language.component('test_syntax')
+def label_syntax(doc):
+    """
+    Stands in for the tagger and parser with labels decided by each word and the next
+    """
+    parsed_sentences.append(doc.text)
+    for token in doc:
+        following = doc[token.i + 1] if token.i + 1 < len(doc) and not doc[token.i + 1].is_sent_start else None
+        if token.lower_ in ('it', 'he', 'she'):
+            token.dep_ = 'nsubj'
+        elif token.lower_ in PASSIVE_AUXILIARIES and following is not None and following.text.endswith('ed'):
+            token.dep_ = 'auxpass'
+        else:
+            token.dep_ = 'dep'
+        token.pos_ = 'VERB' if token.lower_ in ('are', 'were') or token.text.endswith('ed') else 'NOUN'
+    return doc
+
+
+class TieredParseTests(SimpleTestCase):
+    def setUp(self):
+        import spacy
+
+        nlp = spacy.blank('en')
+        nlp.add_pipe('sentencizer')
+        nlp.add_pipe('test_syntax')
+        self.nlp = TimedPipeline(nlp, 'grammar')
+        parsed_sentences.clear()
+
+    def test_tiered_findings_match_the_full_parse(self):
+        with override_settings(GRAMMAR_TIERED=False):
+            full = [check_text(self.nlp, text) for text in TEXTS]
+        parsed_sentences.clear()
+        with override_settings(GRAMMAR_TIERED=True):
+            tiered = [check_text(self.nlp, text) for text in TEXTS]
+        self.assertEqual(tiered, full)
+        self.assertTrue(any('passive' in suggestion['suggestion'] for suggestions in full for suggestion in suggestions))
+        self.assertTrue(any('agreement' in suggestion['suggestion'] for suggestions in full for suggestion in suggestions))
+
+        # Only the sentences the prefilter keeps were parsed
+        engine = get_rule_engine()
+        kept = [
+            sent.text for text in TEXTS for sent in blank_nlp()(text).sents if engine.needs_parse(sent)
+        ]
+        self.assertEqual([text.strip() for text in parsed_sentences], kept)
+        self.assertLess(len(kept), sum(len(list(blank_nlp()(text).sents)) for text in TEXTS))
+
+
+@override_settings(OPENAI_API_KEY='')
+class MockSuggestionsTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('api.views.ai_views.get_nlp', return_value=blank_nlp())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record_threads(self):
+        threads = []
+        get_mock_suggestions = AISuggestionsView.get_mock_suggestions
+
+        def record(view, text):
+            threads.append(threading.get_ident())
+            return get_mock_suggestions(view, text)
+
+        patcher = mock.patch.object(AISuggestionsView, 'get_mock_suggestions', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return threads
+
+    async def test_checks_run_off_the_event_loop(self):
+        threads = self.record_threads()
+        suggestions = await AISuggestionsView().mock_suggestions('the grammar here')
+        self.assertIn('Sentence should start with a capital letter: "the grammar here"',
+                      [suggestion['suggestion'] for suggestion in suggestions])
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    async def test_streamed_checks_run_off_the_event_loop(self):
+        threads = self.record_threads()
+        view = AISuggestionsStreamView()
+        with mock.patch('api.utils.streaming.get_nlp', return_value=blank_nlp()):
+            events = [event async for event, _ in stream_suggestions('one two', view.get_messages('one two'), view.mock_suggestions)]
+        self.assertIn('suggestion', events)
+        self.assertEqual(events[-1], 'done')
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
@@ -0,0 +1,101 @@
+import os
+import random
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from api.utils.wordnet import WordNetIndex, build_index, write_index
+
+
+def has_wordnet():
+    try:
+        import nltk
+
+        nltk.data.find('corpora/wordnet')
+    except (ImportError, LookupError):
+        return False
+    return True
+
+
+class FakeSynset:
+    def __init__(self, name, definition, examples=()):
+        self._name, self._definition, self._examples = name, definition, list(examples)
+
+    def name(self):
+        return self._name
+
+    def definition(self):
+        return self._definition
+
+    def examples(self):
+        return self._examples
+
+
+class FakeReader:
+    """
+    The parts of NLTK's WordNet reader build_index reads
+    """
+    synsets = {
+        ('n', 1): FakeSynset('goose.n.01', 'web-footed bird', ['a goose honked']),
+        ('n', 2): FakeSynset('goose.n.02', 'a silly person'),
+        ('v', 3): FakeSynset('goose.v.01', 'prod', ['she goosed him', 'goosed again', 'and again', 'once more']),
+        ('n', 4): FakeSynset('church.n.01', 'a place for worship'),
+        ('v', 5): FakeSynset('run.v.01', 'move fast'),
+        ('n', 6): FakeSynset('run.n.01', 'a score in baseball'),
+    }
+    _lemma_pos_offset_map = {
+        'goose': {'n': [1, 2], 'v': [3]},
+        'church': {'n': [4]},
+        'run': {'v': [5], 'n': [6]},
+    }
+    _exception_map = {'n': {'geese': ['goose']}, 'v': {'ran': ['run']}, 'a': {}, 'r': {}}
+
+    def synset_from_pos_and_offset(self, pos, offset):
+        return self.synsets[(pos, offset)]
+
+
+class WordNetIndexTests(SimpleTestCase):
+    def test_lookups_follow_wordnet_order_and_morphology(self):
+        index = WordNetIndex(build_index(FakeReader()))
+
+        def names(word):
+            return [name for name, _, _ in index.lookup(word)]
+
+        # Nouns before verbs, at most three senses, through the exception lists and suffix rules
+        self.assertEqual(names('goose'), ['goose.n.01', 'goose.n.02', 'goose.v.01'])
+        self.assertEqual(names('Geese'), ['goose.n.01', 'goose.n.02'])
+        self.assertEqual(names('churches'), ['church.n.01'])
+        self.assertEqual(names('runs'), ['run.n.01', 'run.v.01'])
+        self.assertEqual(names('ran'), ['run.v.01'])
+        self.assertEqual(index.lookup('unknown'), [])
+        self.assertEqual(index.lookup('goose', limit=1), [['goose.n.01', 'web-footed bird', ['a goose honked']]])
+        self.assertEqual(index.synset(index.senses('goose')['v'][0])[2], ['she goosed him', 'goosed again', 'and again'])
+
+    def test_an_index_file_reads_the_same_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'wordnet.idx')
+            write_index(path, FakeReader())
+            mapped = WordNetIndex.open(path)
+            read = WordNetIndex.open(path, use_mmap=False)
+            for word in ('goose', 'geese', 'churches', 'running', 'ran', 'nothing'):
+                self.assertEqual(mapped.analyze(word), read.analyze(word))
+            mapped.buffer.close()
+
+
+@unittest.skipUnless(has_wordnet(), 'NLTK WordNet data is not installed')
+class WordNetCorpusTests(SimpleTestCase):
+    def test_lookups_match_nltk(self):
+        from nltk.corpus import wordnet
+
+        index = WordNetIndex(build_index())
+        words = [
+            'dog', 'dogs', 'ran', 'running', 'better', 'happiest', 'geese', 'women', 'churches', 'analyses',
+            'quickly', 'Set', 'new_york', 'xyzzy',
+        ]
+        words += random.Random(17).sample(sorted(wordnet.all_lemma_names()), 500)
+        for word in words:
+            expected = [
+                [synset.name(), synset.definition(), synset.examples()[:3]] for synset in wordnet.synsets(word)[:3]
+            ]
+            self.assertEqual(index.lookup(word), expected, word)
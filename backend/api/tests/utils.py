@@ -0,0 +1,18 @@
+from api.utils.nlp import TimedPipeline
+
+_pipeline = None
+
+
+def blank_nlp():
+    """
+    An English pipeline that only tokenizes and splits sentences, standing in
+    for the trained model, which the tests do not need
+    """
+    global _pipeline
+    if _pipeline is None:
+        import spacy
+
+        nlp = spacy.blank('en')
+        nlp.add_pipe('sentencizer')
+        _pipeline = nlp
+    return TimedPipeline(_pipeline, 'grammar')
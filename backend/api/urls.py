@@ -4,9 +4,14 @@ from api.views import (
     DocumentViewSet,
     UserViewSet,
     AISuggestionsView,
+    AISuggestionsStreamView,
     WordAnalysisView,
+    WordAnalysisBatchView,
     GrammarCheckView,
-    TestView
+    BatchGrammarCheckView,
+    IncrementalGrammarCheckView,
+    TestView,
+    MetricsView
 )
 
 router = DefaultRouter()
@@ -16,7 +21,12 @@ router.register(r'users', UserViewSet, basename='user')
 urlpatterns = [
     path('', include(router.urls)),
     path('test/', TestView.as_view(), name='test'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('ai/suggestions/', AISuggestionsView.as_view(), name='ai-suggestions'),
+    path('ai/suggestions/stream/', AISuggestionsStreamView.as_view(), name='ai-suggestions-stream'),
+    path('ai/word-analysis/batch/', WordAnalysisBatchView.as_view(), name='word-analysis-batch'),
     path('ai/word-analysis/<str:word>/', WordAnalysisView.as_view(), name='word-analysis'),
     path('ai/grammar/', GrammarCheckView.as_view(), name='grammar-check'),
+    path('ai/grammar/batch/', BatchGrammarCheckView.as_view(), name='grammar-check-batch'),
+    path('ai/grammar/incremental/', IncrementalGrammarCheckView.as_view(), name='grammar-check-incremental'),
 ]
@@ -0,0 +1,233 @@
+import hashlib
+import pickle
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from api.utils import metrics
+
+_MISSING = object()
+_SPACES = re.compile(r'[ \t\f\v]+')
+
+
+def normalize_text(text):
+    """
+    Normalize text before hashing so trivially different submissions share a key
+    """
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return _SPACES.sub(' ', text).strip()
+
+
+def make_key(namespace, version, text):
+    """
+    Build a content-addressed key from the analyzer name, its version and the text
+    """
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return f'analysis:{namespace}:{version}:{digest}'
+
+
+def value_size(value):
+    """
+    Approximate the memory a cached value takes: exact for bytes and strings, shallow otherwise
+    """
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class LocalLRUTier:
+    """
+    In-process LRU tier with a maximum size and a per-entry TTL.
+
+    Values are kept pickled, like a shared backend keeps them, so every hit is
+    a fresh copy that callers can change without changing the cached result.
+    With ``max_bytes`` set the tier is also bounded by the total size of its
+    entries, for analyzers whose results vary a lot in size (serialized
+    parses). A value larger than the whole budget is not kept.
+    """
+    name = 'local'
+
+    def __init__(self, max_entries=1024, ttl=300, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, data = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                self.size -= len(data)
+                return _MISSING
+            self._entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            if self.max_bytes and len(data) > self.max_bytes:
+                return
+            self._entries[key] = (expires_at, data)
+            self.size += len(data)
+            while len(self._entries) > self.max_entries or (self.max_bytes and self.size > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheTier:
+    """
+    Shared tier backed by one of the configured Django cache backends.
+    """
+    name = 'django'
+
+    def __init__(self, alias='default', ttl=3600):
+        self.alias = alias
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key, _MISSING)
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.ttl or None)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ResultCache:
+    """
+    Tiered cache for analyzer results.
+
+    Lookups go through the tiers in order; a hit in a slower tier is copied
+    into the faster ones in front of it. Hits and misses are counted per tier.
+    Results over ``max_entry_bytes`` are not cached at all.
+    """
+
+    def __init__(self, namespace, version, tiers, max_entry_bytes=None):
+        self.namespace = namespace
+        self.version = version
+        self.tiers = tiers
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def key(self, text):
+        return make_key(self.namespace, self.version, text)
+
+    def get(self, key, default=None):
+        for position, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is _MISSING:
+                self._count(tier.name, 'misses')
+                continue
+            self._count(tier.name, 'hits')
+            for faster in self.tiers[:position]:
+                faster.set(key, value)
+            metrics.record('cache_hit')
+            return value
+        metrics.record('cache_miss')
+        return default
+
+    def set(self, key, value):
+        if self.max_entry_bytes and value_size(value) > self.max_entry_bytes:
+            return
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def get_or_compute(self, text, compute):
+        """
+        Return the cached result for text, computing and storing it on a miss
+        """
+        key = self.key(text)
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def _count(self, tier_name, outcome):
+        metrics.CACHE_REQUESTS.inc(namespace=self.namespace, tier=tier_name, outcome=outcome)
+        with self._lock:
+            self._stats[tier_name][outcome] += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {tier.name: {'hits': 0, 'misses': 0} for tier in self.tiers}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'namespace': self.namespace,
+                'version': self.version,
+                'tiers': {name: dict(counts) for name, counts in self._stats.items()},
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def build_tiers(max_bytes=None):
+    """
+    Build the cache tiers described by the ANALYSIS_CACHE setting, the local
+    tier bounded to max_bytes as well if given
+    """
+    config = settings.ANALYSIS_CACHE
+    tiers = []
+    if config.get('LOCAL_MAX_ENTRIES'):
+        tiers.append(LocalLRUTier(config['LOCAL_MAX_ENTRIES'], config.get('LOCAL_TTL'), max_bytes))
+    if config.get('BACKEND'):
+        tiers.append(DjangoCacheTier(config['BACKEND'], config.get('BACKEND_TTL')))
+    return tiers
+
+
+def get_result_cache(namespace, version, max_bytes=None, max_entry_bytes=None):
+    """
+    Return the process-wide result cache for an analyzer.
+
+    The size limits apply to the cache created by the first call for a namespace and version.
+    """
+    with _caches_lock:
+        cache = _caches.get((namespace, version))
+        if cache is None:
+            cache = ResultCache(namespace, version, build_tiers(max_bytes), max_entry_bytes)
+            _caches[(namespace, version)] = cache
+        return cache
+
+
+def all_cache_stats():
+    with _caches_lock:
+        return [cache.stats() for cache in _caches.values()]
@@ -0,0 +1,228 @@
+"""
+Grammar analysis of whole documents in chunks.
+
+A document is analyzed paragraph by paragraph, and paragraphs longer than
+``DOCUMENT_ANALYSIS['CHUNK_CHARS']`` are cut at sentence ends, so no doc comes
+near spaCy's ``max_length`` however long the manuscript. Consecutive
+paragraphs are grouped into chunks of up to ``CHUNK_CHARS`` characters, cut
+after paragraphs picked by their own text (about once every
+``CHUNK_TARGET_CHARS`` characters) rather than by where they fall, so editing
+one paragraph leaves the other chunks as they were. The parse of each chunk
+(sentence starts, tags and dependency labels) is kept as a ``DocBin`` in the
+analysis cache, keyed by the chunk's text and the pipeline, so changing the
+rules re-runs them without parsing again. The in-process tier holds at most
+``PARSE_CACHE_MAX_BYTES`` of parses, and parses over
+``PARSE_CACHE_MAX_ENTRY_BYTES`` are not cached.
+
+Uncached chunks of documents over ``PARALLEL_MIN_CHARS`` are parsed in a pool of
+``WORKERS`` processes with only a couple of chunks per worker in flight, so
+memory is bounded by the chunks being parsed rather than by the document.
+"""
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from api.utils.cache import get_result_cache
+from api.utils.grammar import check_sentence, locate, parse_texts
+from api.utils.nlp import get_nlp
+
+logger = logging.getLogger(__name__)
+
+# What the grammar rules read besides the token text
+PARSE_ATTRS = ['SENT_START', 'POS', 'DEP']
+
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s+')
+
+
+def split_chunk(text, max_chars):
+    """
+    Cut text into (offset, piece) pieces of at most max_chars characters,
+    after the last sentence end that fits, else the last space, else anywhere
+    """
+    pieces = []
+    offset = 0
+    while len(text) - offset > max_chars:
+        window = text[offset:offset + max_chars]
+        ends = [match.end() for match in _SENTENCE_END.finditer(window)]
+        cut = ends[-1] if ends else window.rfind(' ') + 1 or max_chars
+        pieces.append((offset, window[:cut]))
+        offset += cut
+    pieces.append((offset, text[offset:]))
+    return pieces
+
+
+def parse_version(nlp):
+    """
+    Identify the pipeline a cached parse came from
+    """
+    import spacy
+
+    mode = 'tiered' if settings.GRAMMAR_TIERED else 'full'
+    return f"{nlp.meta.get('name')}-{nlp.meta.get('version')}:{spacy.__version__}:{mode}"
+
+
+def get_parse_cache(nlp):
+    """
+    Return the cache of serialized parses, bounded by their total size
+    """
+    config = settings.DOCUMENT_ANALYSIS
+    return get_result_cache(
+        'grammar-parse', parse_version(nlp),
+        max_bytes=config['PARSE_CACHE_MAX_BYTES'], max_entry_bytes=config['PARSE_CACHE_MAX_ENTRY_BYTES']
+    )
+
+
+def serialize(docs):
+    from spacy.tokens import DocBin
+
+    return DocBin(attrs=PARSE_ATTRS, docs=docs).to_bytes()
+
+
+def deserialize(vocab, data):
+    from spacy.tokens import DocBin
+
+    return list(DocBin().from_bytes(data).get_docs(vocab))
+
+
+def parse_in_worker(analyzer, texts):
+    """
+    Parse a chunk's texts in a pool process and return them serialized
+    """
+    return serialize(list(parse_texts(get_nlp(analyzer), texts)))
+
+
+def init_worker():
+    import django
+
+    django.setup()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = settings.DOCUMENT_ANALYSIS
+            _pool = ProcessPoolExecutor(
+                config['WORKERS'],
+                mp_context=multiprocessing.get_context(config['START_METHOD']),
+                initializer=init_worker,
+            )
+        return _pool
+
+
+def reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def is_cut_point(text, target_chars):
+    """
+    Whether a chunk ends after text. Decided by the text alone, with a chance
+    in proportion to its length, so chunks average target_chars characters.
+    """
+    digest = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+    return digest < len(text) / target_chars * (1 << 64)
+
+
+def group_chunks(texts, max_chars, target_chars):
+    """
+    Group consecutive texts into lists of up to max_chars characters, ending
+    them at cut points, so that changing a text only changes its own chunk
+    (and the next, if it was or becomes a cut point)
+    """
+    chunk, size = [], 0
+    for text in texts:
+        if chunk and size + len(text) > max_chars:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(text)
+        size += len(text)
+        if is_cut_point(text, target_chars):
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+def parse_chunks(nlp, chunks, parallel=False):
+    """
+    Yield a parsed doc per text of each chunk, in order, from the parse cache
+    or by parsing the chunk, in the process pool if parallel is set
+    """
+    workers = settings.DOCUMENT_ANALYSIS['WORKERS']
+    cache = get_parse_cache(nlp)
+
+    def start(texts):
+        """
+        Look the chunk up in the cache, or start parsing it in the pool
+        """
+        key = cache.key('\n'.join(texts))
+        data = cache.get(key)
+        future = None
+        if data is None and parallel:
+            future = get_pool().submit(parse_in_worker, nlp.analyzer, texts)
+        return texts, key, data, future
+
+    def finish(texts, key, data, future):
+        if data is not None:
+            return deserialize(nlp.vocab, data)
+        if future is not None:
+            try:
+                data = future.result()
+            except BrokenProcessPool:
+                logger.exception('The document analysis pool broke, parsing in process')
+                reset_pool()
+            else:
+                cache.set(key, data)
+                return deserialize(nlp.vocab, data)
+        docs = list(parse_texts(nlp, texts))
+        cache.set(key, serialize(docs))
+        return docs
+
+    pending = deque()
+    in_flight = workers * 2 if parallel else 1
+    for texts in chunks:
+        pending.append(start(texts))
+        if len(pending) >= in_flight:
+            yield from finish(*pending.popleft())
+    while pending:
+        yield from finish(*pending.popleft())
+
+
+def find_issues_in_chunks(nlp, texts):
+    """
+    Yield the located grammar issues of each text, like find_issues_in_texts,
+    parsing them in cached chunks of at most CHUNK_CHARS characters
+    """
+    config = settings.DOCUMENT_ANALYSIS
+    max_chars = min(config['CHUNK_CHARS'], nlp.max_length)
+    pieces = [split_chunk(text, max_chars) for text in texts]
+    chunks = group_chunks(
+        (piece for text_pieces in pieces for _, piece in text_pieces), max_chars, min(config['CHUNK_TARGET_CHARS'], max_chars)
+    )
+    # Small texts are not worth the trip to the pool
+    parallel = config['WORKERS'] > 1 and sum(len(text) for text in texts) >= config['PARALLEL_MIN_CHARS']
+    docs = parse_chunks(nlp, chunks, parallel)
+    for text_pieces in pieces:
+        issues = []
+        for (offset, _), doc in zip(text_pieces, itertools.islice(docs, len(text_pieces))):
+            for issue in locate((sent, check_sentence(sent)) for sent in doc.sents):
+                issue['start'] += offset
+                issue['end'] += offset
+                issues.append(issue)
+        yield issues
@@ -0,0 +1,464 @@
+"""
+Real-time collaborative editing of documents.
+
+Every document being edited has one ``EditRoom`` that puts the editors'
+Quill deltas in a single order. An edit made against an older version is
+transformed past the edits sequenced since, applied to the room's copy of the
+content and broadcast to the ``document-edit-<id>`` group, where it reaches
+the other editors as a ``delta`` event and its author as an ``ack``.
+
+Edits are not saved one by one: the room composes them and writes the result
+with ``Document.apply_delta`` once editing pauses for ``SAVE_DELAY`` seconds
+(at least every ``MAX_SAVE_DELAY`` seconds, or once ``MAX_UNSAVED_OPS`` edits
+pile up) and when the last editor leaves. Changes saved some other way in the
+meantime, e.g. through the REST API, are read back from the revision history
+and transformed into the room like any other edit. When the history cannot
+account for them the room starts over from the saved content, keeping its
+unsaved edits as a copy of the document.
+
+Rooms live in a ``RoomHost``. With ``ROOM_HOST = 'local'`` each process hosts
+the rooms of the sockets it serves, which is right for a single process (or
+when the load balancer sends all sockets of a document to the same one). With
+``ROOM_HOST = 'worker'`` the rooms live in ``manage.py run_collaboration_rooms``
+processes, each serving some of the ``collab-rooms-<shard>`` channels, and the
+socket consumers reach them over the channel layer, which then has to be one
+shared by all processes such as Redis.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from api.utils.delta import (
+    DeltaError, StaleRevisionError, change_lengths, compose, compose_changes, get_ops, op_length, transform
+)
+
+logger = logging.getLogger(__name__)
+
+
+def edit_group(document_id):
+    return f'document-edit-{document_id}'
+
+
+def room_channel(document_id):
+    """
+    The channel of the room worker shard serving a document
+    """
+    return f"collab-rooms-{document_id % settings.COLLABORATION['SHARDS']}"
+
+
+class DocumentGone(Exception):
+    """
+    Raised when the document of a room no longer exists.
+    """
+
+
+@database_sync_to_async
+def load_document(document_id):
+    """
+    Return (content, revision) of a document
+    """
+    from api.models import Document
+
+    while True:
+        document = Document.objects.filter(pk=document_id).only('id', 'revision').first()
+        if document is None:
+            raise DocumentGone(document_id)
+        content = document.content
+        # Read again in case a save landed between reading the revision and the chunks
+        if Document.objects.filter(pk=document_id, revision=document.revision).exists():
+            return content, document.revision
+
+
+@database_sync_to_async
+def save_change(document_id, change, revision):
+    """
+    Save a change made against revision and return the document's new revision
+    """
+    from api.models import Document
+
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None:
+        raise DocumentGone(document_id)
+    document.apply_delta(change, revision)
+    return document.revision
+
+
+@database_sync_to_async
+def load_changes_since(document_id, revision):
+    """
+    Return (change, current revision) for the changes saved after revision, or
+    (None, current revision) when the history cannot account for all of them
+    """
+    from api.models import Document, DocumentRevision
+
+    current = Document.objects.filter(pk=document_id).values_list('revision', flat=True).first()
+    if current is None:
+        raise DocumentGone(document_id)
+    if current == revision:
+        return {'ops': []}, current
+    rows = list(
+        DocumentRevision.objects.filter(document_id=document_id, revision__gt=revision, revision__lte=current)
+        .order_by('revision').values_list('revision', 'delta')
+    )
+    if [number for number, _ in rows] != list(range(revision + 1, current + 1)) or any(delta is None for _, delta in rows):
+        return None, current
+    change = {'ops': []}
+    for _, delta in rows:
+        change = compose_changes(change, DocumentRevision.decompress(delta))
+    return change, current
+
+
+@database_sync_to_async
+def save_conflict(document_id, content):
+    """
+    Save content as a new document next to the document, for edits that could
+    not be merged into it, and return the new document's id
+    """
+    from api.models import Document
+
+    document = Document.objects.filter(pk=document_id).only('id', 'title', 'author_id').first()
+    if document is None:
+        raise DocumentGone(document_id)
+    title = document.title[:255 - len(' (conflicting edits)')]
+    copy = Document.objects.create(title=f'{title} (conflicting edits)', author_id=document.author_id, content=content)
+    return copy.pk
+
+
+class EditRoom:
+    """
+    The sequenced state of one document being edited.
+
+    ``version`` counts the edits the room has applied; ``history`` keeps the
+    last ``HISTORY`` of them to transform edits made against older versions.
+    ``unsaved`` are the edits applied since the content at ``saved_revision``.
+    """
+
+    def __init__(self, document_id, content, revision):
+        self.document_id = document_id
+        self.content = content
+        self.length = sum(op_length(op) for op in content['ops'])
+        self.version = 0
+        self.history = deque(maxlen=settings.COLLABORATION['HISTORY'])
+        self.saved_revision = revision
+        self.unsaved = []
+        self.first_unsaved = self.last_unsaved = None
+        # client id -> (reply channel, last seen)
+        self.clients = {}
+        self.lock = asyncio.Lock()
+        self.save_lock = asyncio.Lock()
+        self.save_task = None
+
+    def apply(self, change, version):
+        """
+        Transform a change made against version past the edits sequenced since,
+        apply it and return it as applied. Raises DeltaError if it does not fit.
+        """
+        oldest = self.version - len(self.history)
+        if version < oldest or version > self.version:
+            raise StaleRevisionError(f'Version {version} is no longer available', revision=self.version)
+        change = {'ops': get_ops(change)}
+        for applied in list(self.history)[version - oldest:]:
+            change = transform(applied, change, True)
+        base, added = change_lengths(change)
+        if base > self.length:
+            raise DeltaError('Delta reaches past the end of the document')
+        self.content = compose(self.content, change)
+        self.length += added
+        self.version += 1
+        self.history.append(change)
+        return change
+
+    def reset(self, content, revision):
+        """
+        Start over from content saved as revision, dropping the unsaved edits.
+        The version moves on with no history, so edits made before are refused as stale.
+        """
+        self.content = content
+        self.length = sum(op_length(op) for op in content['ops'])
+        self.version += 1
+        self.history.clear()
+        self.saved_revision = revision
+        self.unsaved = []
+        self.first_unsaved = self.last_unsaved = None
+
+    def add_unsaved(self, change):
+        now = time.monotonic()
+        if not self.unsaved:
+            self.first_unsaved = now
+        self.last_unsaved = now
+        self.unsaved.append(change)
+
+    def save_due(self):
+        """
+        Seconds until the unsaved edits should be written
+        """
+        config = settings.COLLABORATION
+        if len(self.unsaved) >= config['MAX_UNSAVED_OPS']:
+            return 0
+        due = min(self.last_unsaved + config['SAVE_DELAY'], self.first_unsaved + config['MAX_SAVE_DELAY'])
+        return max(0, due - time.monotonic())
+
+
+class RoomHost:
+    """
+    Holds the edit rooms of one process and handles the messages of editors' sockets.
+
+    Messages are dicts with a ``type`` of ``collab.join``, ``collab.edit``,
+    ``collab.ping`` or ``collab.leave``, the ``document`` id, the editor's
+    ``client`` id and reply ``channel``. Replies and broadcasts go out over the
+    channel layer.
+    """
+
+    def __init__(self, channel_layer=None):
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.rooms = {}
+        self.loading = {}
+
+    async def handle(self, message):
+        handler = {
+            'collab.join': self.join,
+            'collab.edit': self.edit,
+            'collab.ping': self.ping,
+            'collab.leave': self.leave,
+        }.get(message.get('type'))
+        if handler is None:
+            logger.warning('Unknown collaboration message %r', message.get('type'))
+            return
+        try:
+            await handler(message)
+        except DocumentGone:
+            await self.close_room(message['document'])
+        except Exception:
+            logger.exception('Could not handle %s for document %s', message['type'], message.get('document'))
+
+    async def reply(self, message, reply):
+        await self.channel_layer.send(message['channel'], reply)
+
+    async def get_room(self, document_id):
+        room = self.rooms.get(document_id)
+        if room is not None:
+            return room
+        task = self.loading.get(document_id)
+        if task is None:
+            task = self.loading[document_id] = asyncio.ensure_future(load_document(document_id))
+        try:
+            content, revision = await task
+        finally:
+            self.loading.pop(document_id, None)
+        room = self.rooms.get(document_id)
+        if room is None:
+            room = self.rooms[document_id] = EditRoom(document_id, content, revision)
+            asyncio.ensure_future(self.expire_clients(room))
+        return room
+
+    async def join(self, message):
+        room = await self.get_room(message['document'])
+        # Not while a save is in flight, or catching up would take the room's own save for someone else's
+        async with room.save_lock, room.lock:
+            await self.catch_up(room)
+            room.clients[message['client']] = (message['channel'], time.monotonic())
+            await self.reply(message, {
+                'type': 'collab.init',
+                'version': room.version,
+                'content': room.content,
+                'revision': room.saved_revision,
+                'editors': len(room.clients),
+            })
+
+    async def edit(self, message):
+        room = self.rooms.get(message['document'])
+        if room is None or message['client'] not in room.clients:
+            # The room was dropped (e.g. this worker restarted), the editor has to start over
+            await self.reply(message, {'type': 'collab.resync'})
+            return
+        async with room.lock:
+            room.clients[message['client']] = (message['channel'], time.monotonic())
+            try:
+                change = room.apply(message['delta'], message['version'])
+            except StaleRevisionError:
+                await self.reply(message, {'type': 'collab.resync'})
+                return
+            except DeltaError as e:
+                await self.reply(message, {'type': 'collab.error', 'error': str(e), 'request_id': message.get('request_id')})
+                return
+            room.add_unsaved(change)
+            await self.broadcast(room, change, message['client'], message.get('request_id'))
+        self.schedule_save(room)
+
+    async def ping(self, message):
+        room = self.rooms.get(message['document'])
+        if room is None or message['client'] not in room.clients:
+            await self.reply(message, {'type': 'collab.resync'})
+            return
+        room.clients[message['client']] = (message['channel'], time.monotonic())
+
+    async def leave(self, message):
+        room = self.rooms.get(message['document'])
+        if room is None:
+            return
+        room.clients.pop(message['client'], None)
+        if not room.clients:
+            await self.save(room)
+            if not room.clients and not room.unsaved and self.rooms.get(room.document_id) is room:
+                del self.rooms[room.document_id]
+
+    async def broadcast(self, room, change, client=None, request_id=None):
+        await self.channel_layer.group_send(edit_group(room.document_id), {
+            'type': 'collab.delta',
+            'version': room.version,
+            'delta': change,
+            'client': client,
+            'request_id': request_id,
+        })
+
+    async def catch_up(self, room):
+        """
+        Bring in changes saved to the document outside the room. Call with room.save_lock and room.lock held.
+        """
+        external, current = await load_changes_since(room.document_id, room.saved_revision)
+        if current == room.saved_revision:
+            return
+        if external is None:
+            # Not in the history any more, so the room's edits cannot be merged: never write over the saved
+            # change, keep them as a copy and have every editor start over from what is saved
+            content, revision = await load_document(room.document_id)
+            conflict = None
+            if room.unsaved:
+                conflict = await save_conflict(room.document_id, room.content)
+                logger.warning(
+                    'Document %s changed outside its edit room, unsaved edits kept as document %s',
+                    room.document_id, conflict
+                )
+            room.reset(content, revision)
+            await self.channel_layer.group_send(edit_group(room.document_id), {
+                'type': 'collab.resync', 'conflict': conflict,
+            })
+            return
+        unsaved = {'ops': []}
+        for change in room.unsaved:
+            unsaved = compose_changes(unsaved, change)
+        # Saved changes come first, the room's unsaved edits go on top of them
+        room.unsaved = [transform(external, unsaved, True)] if unsaved['ops'] else []
+        change = room.apply(transform(unsaved, external, False), room.version)
+        room.saved_revision = current
+        await self.broadcast(room, change)
+
+    def schedule_save(self, room):
+        if room.save_task is None or room.save_task.done():
+            room.save_task = asyncio.ensure_future(self.save_later(room))
+
+    async def save_later(self, room):
+        while room.unsaved:
+            delay = room.save_due()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await self.save(room)
+            except DocumentGone:
+                await self.close_room(room.document_id)
+                return
+            except Exception:
+                logger.exception('Could not save the edits to document %s', room.document_id)
+                await asyncio.sleep(settings.COLLABORATION['SAVE_DELAY'])
+
+    async def save(self, room):
+        """
+        Write the room's unsaved edits to the document as one change
+        """
+        async with room.save_lock:
+            while True:
+                async with room.lock:
+                    edits, room.unsaved = room.unsaved, []
+                if not edits:
+                    return
+                change = {'ops': []}
+                for edit in edits:
+                    change = compose_changes(change, edit)
+                try:
+                    revision = await save_change(room.document_id, change, room.saved_revision)
+                    break
+                except StaleRevisionError:
+                    # Saved by someone else in the meantime: bring their change in and try again
+                    async with room.lock:
+                        room.unsaved = edits + room.unsaved
+                        await self.catch_up(room)
+                except Exception:
+                    async with room.lock:
+                        room.unsaved = edits + room.unsaved
+                    raise
+            room.saved_revision = revision
+            await self.channel_layer.group_send(edit_group(room.document_id), {
+                'type': 'collab.saved', 'version': room.version, 'revision': revision,
+            })
+
+    async def expire_clients(self, room):
+        """
+        Forget editors that have not been heard from in CLIENT_TIMEOUT, e.g. because their process died
+        """
+        timeout = settings.COLLABORATION['CLIENT_TIMEOUT']
+        while self.rooms.get(room.document_id) is room:
+            await asyncio.sleep(timeout / 2)
+            cutoff = time.monotonic() - timeout
+            for client, (channel, seen) in list(room.clients.items()):
+                if seen < cutoff:
+                    await self.leave({'document': room.document_id, 'client': client, 'channel': channel})
+
+    async def close_room(self, document_id):
+        room = self.rooms.pop(document_id, None)
+        if room is not None and room.save_task is not None:
+            room.save_task.cancel()
+        await self.channel_layer.group_send(edit_group(document_id), {'type': 'collab.closed'})
+
+    async def save_all(self):
+        for room in list(self.rooms.values()):
+            try:
+                await self.save(room)
+            except Exception:
+                logger.exception('Could not save the edits to document %s', room.document_id)
+
+
+_host = None
+
+
+def get_room_host():
+    """
+    Return the room host of this process, for ROOM_HOST = 'local'
+    """
+    global _host
+    if _host is None:
+        _host = RoomHost()
+    return _host
+
+
+async def send_to_room(channel_layer, message):
+    """
+    Deliver an editor's message to the room host of its document
+    """
+    if settings.COLLABORATION['ROOM_HOST'] == 'worker':
+        await channel_layer.send(room_channel(message['document']), message)
+    else:
+        await get_room_host().handle(message)
+
+
+async def serve_rooms(shards, stopping):
+    """
+    Serve the room channels of shards until stopping is set, then save every room
+    """
+    host = RoomHost()
+
+    async def serve(channel):
+        while True:
+            message = await host.channel_layer.receive(channel)
+            await host.handle(message)
+
+    tasks = [asyncio.ensure_future(serve(f'collab-rooms-{shard}')) for shard in shards]
+    await stopping.wait()
+    for task in tasks:
+        task.cancel()
+    await host.save_all()
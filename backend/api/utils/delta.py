@@ -0,0 +1,443 @@
+"""
+Helpers for working with Quill deltas on the server.
+"""
+
+# Quill counts every embed (image, video, formula) as a single character
+EMBED_CHAR = '\ufffc'
+
+
+class DeltaError(ValueError):
+    """
+    Raised when a delta is malformed or does not fit the text it is applied to.
+    """
+
+
+class StaleRevisionError(Exception):
+    """
+    Raised when a delta is sent against a revision that is no longer the current one.
+    """
+
+    def __init__(self, message, revision=None):
+        super().__init__(message)
+        self.revision = revision
+
+
+def op_length(op):
+    """
+    Return the length of a single delta operation in Quill index units
+    """
+    if 'insert' in op:
+        return len(op['insert']) if isinstance(op['insert'], str) else 1
+    if 'delete' in op:
+        return op['delete']
+    if 'retain' in op:
+        return op['retain'] if isinstance(op['retain'], int) else 1
+    raise DeltaError('Each operation must have an insert, retain or delete key')
+
+
+def insert_text(op):
+    """
+    Return the text an insert operation contributes, with embeds as EMBED_CHAR
+    """
+    value = op['insert']
+    return value if isinstance(value, str) else EMBED_CHAR
+
+
+def get_ops(delta):
+    """
+    Return the ops list of a delta, accepting either {'ops': [...]} or a bare list
+    """
+    ops = delta.get('ops') if isinstance(delta, dict) else delta
+    if not isinstance(ops, list):
+        raise DeltaError("Delta must be a list of operations or an object with an 'ops' list")
+    for op in ops:
+        if not isinstance(op, dict):
+            raise DeltaError('Each operation must be an object')
+        length = op_length(op)
+        if not isinstance(length, int) or length < 0:
+            raise DeltaError('Operation lengths must be non-negative integers')
+        if 'insert' in op and not isinstance(op['insert'], (str, dict)):
+            raise DeltaError('Inserts must be text or an embed object')
+        if 'attributes' in op and not isinstance(op['attributes'], dict):
+            raise DeltaError('Operation attributes must be an object')
+    return ops
+
+
+def delta_to_text(delta):
+    """
+    Return the text of a document delta, keeping Quill's index positions
+    """
+    return ''.join(insert_text(op) for op in get_ops(delta) if 'insert' in op)
+
+
+def apply_to_text(text, delta):
+    """
+    Apply a change delta to text.
+
+    Returns the new text and the (start, end) range of the old text the change
+    touched, or None when only formatting changed. Everything before start and
+    after end is carried over unchanged.
+    """
+    parts = []
+    position = 0
+    changed_start = changed_end = None
+
+    for op in get_ops(delta):
+        if 'retain' in op:
+            length = op_length(op)
+            if position + length > len(text):
+                raise DeltaError('Delta retains past the end of the text')
+            parts.append(text[position:position + length])
+            position += length
+            continue
+
+        if changed_start is None:
+            changed_start = position
+        if 'insert' in op:
+            parts.append(insert_text(op))
+        else:
+            length = op_length(op)
+            if position + length > len(text):
+                raise DeltaError('Delta deletes past the end of the text')
+            position += length
+        changed_end = position
+
+    # Quill leaves the trailing retain implicit
+    parts.append(text[position:])
+
+    if changed_start is None:
+        return text, None
+    return ''.join(parts), (changed_start, changed_end)
+
+
+def _take(ops, index, offset, length):
+    """
+    Take up to length units of document ops starting at ops[index][offset].
+
+    Returns the pieces taken (as insert ops) and the new (index, offset).
+    """
+    pieces = []
+    while length and index < len(ops):
+        op = ops[index]
+        size = op_length(op)
+        count = min(length, size - offset)
+        if isinstance(op['insert'], str):
+            piece = {'insert': op['insert'][offset:offset + count]}
+        else:
+            piece = {'insert': op['insert']}
+        if op.get('attributes'):
+            piece['attributes'] = dict(op['attributes'])
+        pieces.append(piece)
+
+        length -= count
+        offset += count
+        if offset == size:
+            index, offset = index + 1, 0
+    if length:
+        raise DeltaError('Delta reaches past the end of the document')
+    return pieces, index, offset
+
+
+def _push(ops, op):
+    """
+    Append an insert op, merging it into the previous one when they can be joined
+    """
+    if ops:
+        last = ops[-1]
+        if (
+            isinstance(last['insert'], str) and isinstance(op['insert'], str)
+            and last.get('attributes') == op.get('attributes')
+        ):
+            last['insert'] += op['insert']
+            return
+    ops.append(op)
+
+
+def compose(document, change):
+    """
+    Apply a change delta to a document delta and return the new document delta.
+
+    Only the change is validated; the document is trusted to be well formed.
+    Retains with attributes format the text they cover, an attribute set to
+    None removes it.
+    """
+    change_ops = get_ops(change)
+    document_ops = [op for op in (get_ops(document) if document else []) if 'insert' in op]
+
+    ops = []
+    index = offset = 0
+    for op in change_ops:
+        if 'insert' in op:
+            piece = {'insert': op['insert']}
+            attributes = {key: value for key, value in (op.get('attributes') or {}).items() if value is not None}
+            if attributes:
+                piece['attributes'] = attributes
+            _push(ops, piece)
+        elif 'delete' in op:
+            _, index, offset = _take(document_ops, index, offset, op['delete'])
+        else:
+            pieces, index, offset = _take(document_ops, index, offset, op_length(op))
+            for piece in pieces:
+                if op.get('attributes'):
+                    attributes = dict(piece.get('attributes') or {})
+                    for key, value in op['attributes'].items():
+                        if value is None:
+                            attributes.pop(key, None)
+                        else:
+                            attributes[key] = value
+                    piece.pop('attributes', None)
+                    if attributes:
+                        piece['attributes'] = attributes
+                _push(ops, piece)
+
+    # Quill leaves the trailing retain implicit
+    pieces, _, _ = _take(document_ops, index, offset, sum(op_length(op) for op in document_ops[index:]) - offset)
+    for piece in pieces:
+        _push(ops, piece)
+
+    return {'ops': ops}
+
+
+def join_ops(op_lists):
+    """
+    Concatenate runs of insert ops into one document delta, merging text that shares attributes
+    """
+    ops = []
+    for run in op_lists:
+        for op in run:
+            piece = {'insert': op['insert']}
+            if op.get('attributes'):
+                piece['attributes'] = dict(op['attributes'])
+            _push(ops, piece)
+    return {'ops': ops}
+
+
+def split_lines(delta):
+    """
+    Split a document delta into lines.
+
+    Each line is a list of insert ops ending with the newline that carries the
+    line's formatting. The last line has no newline when the document does not
+    end with one.
+    """
+    lines = []
+    current = []
+    for op in get_ops(delta):
+        if 'insert' not in op:
+            continue
+        attributes = op.get('attributes')
+        if not isinstance(op['insert'], str):
+            current.append({'insert': op['insert'], 'attributes': attributes} if attributes else {'insert': op['insert']})
+            continue
+
+        parts = op['insert'].split('\n')
+        for index, part in enumerate(parts):
+            pieces = [part] if index == len(parts) - 1 else [part, '\n']
+            for piece in pieces:
+                if piece:
+                    _push(current, {'insert': piece, 'attributes': dict(attributes)} if attributes else {'insert': piece})
+            if index < len(parts) - 1:
+                lines.append(current)
+                current = []
+    if current:
+        lines.append(current)
+    return lines
+
+
+def change_range(delta):
+    """
+    Return the (start, end) range of the document a change delta touches, or
+    None when it changes nothing. Formatting retains count as changes.
+
+    Also returns the index of the first and last op inside that range.
+    """
+    position = 0
+    start = end = first = last = None
+    for index, op in enumerate(get_ops(delta)):
+        if 'retain' in op and not op.get('attributes'):
+            position += op_length(op)
+            continue
+        if start is None:
+            start, first = position, index
+        if 'insert' not in op:
+            position += op_length(op)
+        end, last = position, index
+    if start is None:
+        return None
+    return start, end, first, last
+
+
+class _OpIterator:
+    """
+    Walks the ops of a change delta, handing out pieces of any length.
+    Past the end it yields an unbounded retain, as Quill does.
+    """
+
+    def __init__(self, ops):
+        self.ops = ops
+        self.index = 0
+        self.offset = 0
+
+    def has_next(self):
+        return self.index < len(self.ops)
+
+    def peek_type(self):
+        if self.index < len(self.ops):
+            op = self.ops[self.index]
+            return 'insert' if 'insert' in op else 'delete' if 'delete' in op else 'retain'
+        return 'retain'
+
+    def peek_length(self):
+        if self.index < len(self.ops):
+            return op_length(self.ops[self.index]) - self.offset
+        return float('inf')
+
+    def next(self, length=float('inf')):
+        if self.index >= len(self.ops):
+            return {'retain': length}
+        op = self.ops[self.index]
+        offset = self.offset
+        size = op_length(op)
+        if length >= size - offset:
+            length = size - offset
+            self.index += 1
+            self.offset = 0
+        else:
+            self.offset += length
+
+        if 'delete' in op:
+            return {'delete': length}
+        if 'retain' in op:
+            piece = {'retain': length if isinstance(op['retain'], int) else op['retain']}
+        elif isinstance(op['insert'], str):
+            piece = {'insert': op['insert'][offset:offset + length]}
+        else:
+            piece = {'insert': op['insert']}
+        if op.get('attributes'):
+            piece['attributes'] = dict(op['attributes'])
+        return piece
+
+
+def _append(ops, op):
+    """
+    Append an op to a change delta, merging it with the previous op where Quill would
+    """
+    if not op_length(op):
+        return
+    index = len(ops)
+    last = ops[-1] if ops else None
+    if last is not None:
+        if 'delete' in op and 'delete' in last:
+            last['delete'] += op['delete']
+            return
+        if 'insert' in op and 'delete' in last:
+            # Inserts go before deletes at the same position
+            index -= 1
+            last = ops[index - 1] if index else None
+        if last is not None and last.get('attributes') == op.get('attributes'):
+            if 'insert' in op and 'insert' in last and isinstance(op['insert'], str) and isinstance(last['insert'], str):
+                last['insert'] += op['insert']
+                return
+            if 'retain' in op and 'retain' in last and isinstance(op['retain'], int) and isinstance(last['retain'], int):
+                last['retain'] += op['retain']
+                return
+    ops.insert(index, op)
+
+
+def _chop(ops):
+    """
+    Drop a trailing plain retain, which Quill leaves implicit
+    """
+    if ops and 'retain' in ops[-1] and not ops[-1].get('attributes'):
+        ops.pop()
+    return ops
+
+
+def compose_changes(first, second):
+    """
+    Return one change delta with the effect of applying first and then second
+    """
+    first_ops = _OpIterator(get_ops(first))
+    second_ops = _OpIterator(get_ops(second))
+    ops = []
+    while first_ops.has_next() or second_ops.has_next():
+        if second_ops.peek_type() == 'insert':
+            _append(ops, second_ops.next())
+        elif first_ops.peek_type() == 'delete':
+            _append(ops, first_ops.next())
+        else:
+            length = min(first_ops.peek_length(), second_ops.peek_length())
+            first_op = first_ops.next(length)
+            second_op = second_ops.next(length)
+            if 'retain' in second_op:
+                if 'retain' in first_op:
+                    piece = {'retain': first_op['retain']}
+                else:
+                    piece = {'insert': first_op['insert']}
+                attributes = dict(first_op.get('attributes') or {})
+                attributes.update(second_op.get('attributes') or {})
+                if 'insert' in piece:
+                    # A removed format on newly inserted text is simply absent
+                    attributes = {key: value for key, value in attributes.items() if value is not None}
+                if attributes:
+                    piece['attributes'] = attributes
+                _append(ops, piece)
+            elif 'retain' in first_op:
+                _append(ops, second_op)
+            # Text the first change inserted and the second deleted cancels out
+    return {'ops': _chop(ops)}
+
+
+def transform(first, second, priority):
+    """
+    Return second rewritten to apply after first, for two changes made to the same document.
+
+    With priority, first is taken to have happened first: where both insert at
+    the same position its insert comes first, and its formats win where both
+    format the same text. Applying first then ``transform(first, second, True)``
+    gives the same document as applying second then ``transform(second, first, False)``.
+    """
+    first_ops = _OpIterator(get_ops(first))
+    second_ops = _OpIterator(get_ops(second))
+    ops = []
+    while first_ops.has_next() or second_ops.has_next():
+        if first_ops.peek_type() == 'insert' and (priority or second_ops.peek_type() != 'insert'):
+            _append(ops, {'retain': op_length(first_ops.next())})
+        elif second_ops.peek_type() == 'insert':
+            _append(ops, second_ops.next())
+        else:
+            length = min(first_ops.peek_length(), second_ops.peek_length())
+            first_op = first_ops.next(length)
+            second_op = second_ops.next(length)
+            if 'delete' in first_op:
+                # Already gone: drop whatever second did to it
+                continue
+            if 'delete' in second_op:
+                _append(ops, second_op)
+                continue
+            piece = {'retain': length}
+            attributes = second_op.get('attributes')
+            if attributes and priority:
+                attributes = {key: value for key, value in attributes.items() if key not in (first_op.get('attributes') or {})}
+            if attributes:
+                piece['attributes'] = attributes
+            _append(ops, piece)
+    return {'ops': _chop(ops)}
+
+
+def change_lengths(delta):
+    """
+    Return (base, added): the length of document a change delta needs at least,
+    and how much longer it makes the document
+    """
+    base = added = 0
+    for op in get_ops(delta):
+        length = op_length(op)
+        if 'insert' in op:
+            added += length
+        elif 'delete' in op:
+            base += length
+            added -= length
+        else:
+            base += length
+    return base, added
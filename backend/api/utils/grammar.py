@@ -0,0 +1,451 @@
+import itertools
+import threading
+import time
+
+from django.conf import settings
+
+from api.utils import metrics
+
+# Bump whenever the rules change so cached results are not reused
+GRAMMAR_RULES_VERSION = '1'
+
+# Feedback types the rules emit, stored findings of these types are replaced together
+GRAMMAR_FEEDBACK_TYPES = ('grammar', 'style')
+
+# Token attributes rules can ask for, mapped to the spaCy Token attribute
+TOKEN_ATTRS = {
+    'text': 'text',
+    'lower': 'lower_',
+    'pos': 'pos_',
+    'dep': 'dep_',
+}
+
+# Attributes only the tagger and parser fill in; rules reading them are syntax rules
+SYNTAX_ATTRS = ('pos', 'dep')
+
+TERMINAL_PUNCTUATION = ('.', '!', '?')
+
+# Forms of the passive auxiliaries ("was written", "got written")
+PASSIVE_AUXILIARIES = frozenset([
+    'be', 'am', 'is', 'are', 'was', 'were', 'been', 'being', "'s", "'re", "'m", '\u2019s', '\u2019re', '\u2019m',
+    'get', 'gets', 'got', 'gotten', 'getting',
+])
+
+
+class Rule:
+    """
+    A grammar rule evaluated by the RuleEngine.
+
+    Rules that look at individual tokens list the token attributes they read in
+    ``attrs`` and implement ``collect``, which the engine calls for every token
+    during its single pass over the sentence. Whatever ``collect`` returns
+    (other than None) is handed to ``check`` once the sentence has been
+    scanned. Sentence-level rules leave ``attrs`` empty and only implement
+    ``check``.
+
+    Rules reading ``pos`` or ``dep`` need the parser. With ``GRAMMAR_TIERED``
+    they only see sentences containing one of their ``triggers`` (lowercased
+    words they cannot fire without); None means every sentence is parsed.
+    """
+    name = None
+    attrs = ()
+    triggers = None
+
+    def collect(self, token):
+        return None
+
+    def check(self, sent, collected):
+        raise NotImplementedError
+
+    def suggestion(self, message, confidence, type='grammar'):
+        return {
+            'type': type,
+            'suggestion': message,
+            'confidence': confidence
+        }
+
+
+def grammar_version(nlp):
+    """
+    Identify the rules, the pipeline and the parsing mode grammar results come
+    from, so cached results are not reused across any of them
+    """
+    mode = 'tiered' if settings.GRAMMAR_TIERED else 'full'
+    return f"{GRAMMAR_RULES_VERSION}:{nlp.meta.get('name')}-{nlp.meta.get('version')}:{mode}"
+
+
+RULES = []
+
+
+def register_rule(rule_class):
+    """
+    Class decorator adding a rule to the default rule set, in declaration order.
+    A rule registered again under the same name replaces the earlier one in its place.
+    """
+    rule = rule_class()
+    for index, registered in enumerate(RULES):
+        if registered.name == rule.name:
+            RULES[index] = rule
+            break
+    else:
+        RULES.append(rule)
+    return rule_class
+
+
+@register_rule
+class LongSentenceRule(Rule):
+    name = 'long-sentence'
+
+    def check(self, sent, collected):
+        if len(sent) > 40:
+            return [self.suggestion(f'Consider breaking this long sentence into smaller ones: "{sent}"', 0.7)]
+        return []
+
+
+@register_rule
+class CapitalizationRule(Rule):
+    name = 'capitalization'
+
+    def check(self, sent, collected):
+        if len(sent) and not sent[0].text[0].isupper():
+            return [self.suggestion(f'Sentence should start with a capital letter: "{sent}"', 0.9)]
+        return []
+
+
+@register_rule
+class EndPunctuationRule(Rule):
+    name = 'end-punctuation'
+
+    def check(self, sent, collected):
+        if len(sent) and sent[-1].text not in TERMINAL_PUNCTUATION:
+            return [self.suggestion(f'Sentence should end with proper punctuation: "{sent}"', 0.9)]
+        return []
+
+
+@register_rule
+class PassiveVoiceRule(Rule):
+    name = 'passive-voice'
+    attrs = ('dep',)
+    triggers = PASSIVE_AUXILIARIES
+
+    def collect(self, token):
+        return True if token['dep'] == 'auxpass' else None
+
+    def check(self, sent, collected):
+        if collected:
+            return [self.suggestion(f'Consider using active voice instead of passive voice in: "{sent}"', 0.8)]
+        return []
+
+
+@register_rule
+class SubjectVerbAgreementRule(Rule):
+    name = 'subject-verb-agreement'
+    attrs = ('text', 'lower', 'pos', 'dep')
+    triggers = frozenset(['are', 'were'])
+
+    def collect(self, token):
+        is_subject = token['dep'] in ('nsubj', 'nsubjpass') and token['lower'] in ['it', 'he', 'she']
+        is_verb = token['pos'] == 'VERB' and token['text'] in ['are', 'were']
+        if is_subject or is_verb:
+            return (is_subject, is_verb)
+        return None
+
+    def check(self, sent, collected):
+        # One suggestion per mismatched subject/verb pair
+        subjects = sum(1 for is_subject, _ in collected if is_subject)
+        verbs = sum(1 for _, is_verb in collected if is_verb)
+        return [
+            self.suggestion(f'Check subject-verb agreement in: "{sent}"', 0.8)
+            for _ in range(subjects * verbs)
+        ]
+
+
+@register_rule
+class TechTermRule(Rule):
+    name = 'tech-terms'
+    attrs = ('lower',)
+
+    def collect(self, token):
+        return True if token['lower'] == 'js' else None
+
+    def check(self, sent, collected):
+        if collected:
+            return [self.suggestion(
+                f'Consider using "JavaScript" instead of "js" for better clarity: "{sent}"', 0.7, type='style'
+            )]
+        return []
+
+
+@register_rule
+class IncompleteSentenceRule(Rule):
+    name = 'incomplete-sentence'
+
+    def check(self, sent, collected):
+        if len(sent) < 3:
+            return [self.suggestion(f'This might be an incomplete sentence: "{sent}"', 0.7)]
+        return []
+
+
+class RuleEngine:
+    """
+    Evaluates a set of rules over a sentence in a single pass over its tokens.
+
+    Only the token attributes some rule asked for are read, once per token.
+    When ``timed`` is set, the time spent in each rule (and in reading token
+    attributes) is accumulated and available from ``timings()``.
+    """
+
+    def __init__(self, rules, timed=False):
+        self.rules = list(rules)
+        self.token_rules = [rule for rule in self.rules if rule.attrs]
+        self.attrs = [
+            (attr, TOKEN_ATTRS[attr])
+            for attr in TOKEN_ATTRS
+            if any(attr in rule.attrs for rule in self.token_rules)
+        ]
+        self.syntax_rules = [rule for rule in self.token_rules if set(rule.attrs) & set(SYNTAX_ATTRS)]
+        # Words a sentence needs before any syntax rule can fire, None if some rule can fire on any sentence
+        if any(rule.triggers is None for rule in self.syntax_rules):
+            self.triggers = None
+        else:
+            self.triggers = frozenset().union(*(rule.triggers for rule in self.syntax_rules))
+        self.timed = timed
+        self._lock = threading.Lock()
+        self.reset_timings()
+
+    def needs_parse(self, sent):
+        """
+        Whether the syntax rules could fire on a sentence that has only been tokenized
+        """
+        if not self.syntax_rules:
+            return False
+        if self.triggers is None:
+            return True
+        return any(token.lower_ in self.triggers for token in sent)
+
+    def check_sentence(self, sent):
+        if self.timed:
+            return self._check_sentence_timed(sent)
+
+        collected = {rule: [] for rule in self.token_rules}
+        if self.token_rules:
+            for token in sent:
+                values = {attr: getattr(token, name) for attr, name in self.attrs}
+                for rule in self.token_rules:
+                    value = rule.collect(values)
+                    if value is not None:
+                        collected[rule].append(value)
+
+        suggestions = []
+        for rule in self.rules:
+            suggestions.extend(rule.check(sent, collected.get(rule)))
+        return suggestions
+
+    def _check_sentence_timed(self, sent):
+        clock = time.perf_counter
+        elapsed = dict.fromkeys(self.rules, 0.0)
+        extract = 0.0
+
+        collected = {rule: [] for rule in self.token_rules}
+        if self.token_rules:
+            for token in sent:
+                start = clock()
+                values = {attr: getattr(token, name) for attr, name in self.attrs}
+                extract += clock() - start
+                for rule in self.token_rules:
+                    start = clock()
+                    value = rule.collect(values)
+                    if value is not None:
+                        collected[rule].append(value)
+                    elapsed[rule] += clock() - start
+
+        suggestions = []
+        for rule in self.rules:
+            start = clock()
+            suggestions.extend(rule.check(sent, collected.get(rule)))
+            elapsed[rule] += clock() - start
+
+        with self._lock:
+            self._timings['token-attributes']['calls'] += 1
+            self._timings['token-attributes']['seconds'] += extract
+            for rule, seconds in elapsed.items():
+                self._timings[rule.name]['calls'] += 1
+                self._timings[rule.name]['seconds'] += seconds
+        return suggestions
+
+    def reset_timings(self):
+        with self._lock:
+            self._timings = {
+                name: {'calls': 0, 'seconds': 0.0}
+                for name in ['token-attributes'] + [rule.name for rule in self.rules]
+            }
+
+    def timings(self):
+        """
+        Return the accumulated time per rule, most expensive first
+        """
+        with self._lock:
+            return dict(sorted(
+                ((name, dict(values)) for name, values in self._timings.items()),
+                key=lambda item: item[1]['seconds'],
+                reverse=True
+            ))
+
+
+_engine = None
+
+
+def get_rule_engine():
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine(RULES, timed=settings.GRAMMAR_RULE_TIMING)
+    return _engine
+
+
+def check_sentence(sent):
+    """
+    Run the grammar rules over a single sentence span
+    """
+    return get_rule_engine().check_sentence(sent)
+
+
+_sentencizer = None
+
+
+def get_sentencizer():
+    global _sentencizer
+    if _sentencizer is None:
+        from spacy.pipeline import Sentencizer
+
+        _sentencizer = Sentencizer()
+    return _sentencizer
+
+
+def parse_texts(nlp, texts, batch_size=64, n_process=1):
+    """
+    Yield a doc per text, in order, with the sentence boundaries and token attributes the rules read.
+
+    With ``GRAMMAR_TIERED`` off every text goes through the full pipeline.
+    With it on, texts are only tokenized and split into sentences at
+    punctuation, which is all the surface rules need; just the sentences that
+    could trip a syntax rule are parsed, and their tags and dependency labels
+    copied onto the doc. The syntax rules find nothing in the others.
+    """
+    engine = get_rule_engine()
+    if not settings.GRAMMAR_TIERED:
+        for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+            metrics.GRAMMAR_SENTENCES.inc(sum(1 for _ in doc.sents), stage='parser')
+            yield doc
+        return
+
+    from spacy.tokens import Doc
+
+    texts = iter(texts)
+    while True:
+        batch = list(itertools.islice(texts, batch_size))
+        if not batch:
+            return
+        docs = surface_docs(nlp, batch)
+        sentences = 0
+        pending = []
+        for index, doc in enumerate(docs):
+            for sent in doc.sents:
+                sentences += 1
+                if engine.needs_parse(sent):
+                    # Parse the sentence's own tokens so the labels line up with them
+                    words = [token.text for token in sent]
+                    spaces = [bool(token.whitespace_) for token in sent]
+                    pending.append((Doc(doc.vocab, words=words, spaces=spaces), (index, sent.start)))
+        if pending:
+            for parsed, (index, start) in nlp.pipe(pending, as_tuples=True, batch_size=batch_size, n_process=n_process):
+                for token, parsed_token in zip(docs[index][start:start + len(parsed)], parsed):
+                    token.pos_ = parsed_token.pos_
+                    token.dep_ = parsed_token.dep_
+        metrics.GRAMMAR_SENTENCES.inc(len(pending), stage='parser')
+        metrics.GRAMMAR_SENTENCES.inc(sentences - len(pending), stage='surface')
+        yield from docs
+
+
+def surface_docs(nlp, texts):
+    """
+    Return a doc per text, only tokenized and split into sentences at punctuation
+    """
+    sentencizer = get_sentencizer()
+    return [sentencizer(doc) for doc in nlp.tokenize(texts)]
+
+
+def check_surface(nlp, text):
+    """
+    Return the suggestions of the rules that need no parse for text, the first stage of tiered checking.
+    The syntax rules find nothing in sentences that were not parsed.
+    """
+    return [suggestion for sent in surface_docs(nlp, [text])[0].sents for suggestion in check_sentence(sent)]
+
+
+def checked_sentences(nlp, texts, batch_size=64, n_process=1):
+    """
+    Yield the sentences of each text, in order, paired with their suggestions
+    """
+    for doc in parse_texts(nlp, texts, batch_size, n_process):
+        yield [(sent, check_sentence(sent)) for sent in doc.sents]
+
+
+def with_feedback(suggestions):
+    # If no issues found, provide a positive feedback
+    if not suggestions:
+        suggestions.append({
+            'type': 'feedback',
+            'suggestion': 'The text appears to be grammatically correct, but you might want to expand it for better context.',
+            'confidence': 0.6
+        })
+    return suggestions
+
+
+def locate(sentences):
+    """
+    Tag each suggestion with the character span of its sentence
+    """
+    issues = []
+    for sent, suggestions in sentences:
+        for suggestion in suggestions:
+            suggestion['start'] = sent.start_char
+            suggestion['end'] = sent.end_char
+            issues.append(suggestion)
+    return issues
+
+
+def check_grammar(doc):
+    """
+    Run the grammar rules over a parsed spaCy doc and return the suggestions
+    """
+    suggestions = []
+    for sent in doc.sents:
+        suggestions.extend(check_sentence(sent))
+    return with_feedback(suggestions)
+
+
+def find_issues(doc):
+    """
+    Run the grammar rules and tag each suggestion with the character span of its sentence
+    """
+    return locate((sent, check_sentence(sent)) for sent in doc.sents)
+
+
+def check_texts(nlp, texts, batch_size=64, n_process=1):
+    """
+    Yield the grammar suggestions for each text, like check_grammar on its parse
+    """
+    for sentences in checked_sentences(nlp, texts, batch_size, n_process):
+        yield with_feedback([suggestion for _, suggestions in sentences for suggestion in suggestions])
+
+
+def check_text(nlp, text):
+    return next(check_texts(nlp, [text]))
+
+
+def find_issues_in_texts(nlp, texts, batch_size=64, n_process=1):
+    """
+    Yield the located grammar issues of each text, like find_issues on its parse
+    """
+    for sentences in checked_sentences(nlp, texts, batch_size, n_process):
+        yield locate(sentences)
@@ -0,0 +1,198 @@
+import threading
+import uuid
+
+from django.conf import settings
+
+from api.utils.cache import DjangoCacheTier, get_result_cache
+from api.utils.delta import EMBED_CHAR, StaleRevisionError, apply_to_text
+from api.utils.chunking import find_issues_in_chunks
+from api.utils.grammar import grammar_version
+
+
+def split_paragraphs(text):
+    """
+    Split text into Quill paragraphs, each keeping its trailing newline
+    """
+    lines = text.split('\n')
+    paragraphs = [line + '\n' for line in lines[:-1]]
+    if lines[-1]:
+        paragraphs.append(lines[-1])
+    return paragraphs
+
+
+class Paragraph:
+    __slots__ = ('text', 'findings')
+
+    def __init__(self, text, findings):
+        self.text = text
+        self.findings = findings
+
+
+class AnalysisState:
+    """
+    The last analyzed version of a document: its text split into paragraphs,
+    each with findings relative to the start of the paragraph. ``revision`` is
+    a token unique to this version.
+    """
+    __slots__ = ('revision', 'text', 'paragraphs')
+
+    def __init__(self, revision, text, paragraphs):
+        self.revision = revision
+        self.text = text
+        self.paragraphs = paragraphs
+
+    def findings(self):
+        """
+        Return every finding with offsets into the full text
+        """
+        results = []
+        offset = 0
+        for paragraph in self.paragraphs:
+            for finding in paragraph.findings:
+                results.append(dict(finding, start=finding['start'] + offset, end=finding['end'] + offset))
+            offset += len(paragraph.text)
+        return results
+
+
+def find_text_issues(nlp, text):
+    """
+    Run the grammar rules over text paragraph by paragraph, reusing cached
+    paragraphs, and return the findings with offsets into text
+    """
+    paragraphs = get_incremental_analyzer().analyze_paragraphs(nlp, split_paragraphs(text))
+    return AnalysisState(None, text, paragraphs).findings()
+
+
+def new_revision():
+    return uuid.uuid4().hex
+
+
+class IncrementalGrammarAnalyzer:
+    """
+    Keeps the last analyzed version of each document in the shared cache and
+    re-runs the grammar rules only on the paragraphs a Quill delta touches.
+
+    Every version gets a new random revision token, and a delta is applied only
+    to the version whose token it was sent with. A version that expired, was
+    evicted or was replaced from another process is refused, never patched
+    with a delta meant for other text.
+    """
+
+    def __init__(self, alias='default', ttl=1800):
+        self.states = DjangoCacheTier(alias, ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def paragraph_cache(nlp):
+        return get_result_cache('grammar-paragraph', grammar_version(nlp))
+
+    def analyze_paragraphs(self, nlp, texts):
+        """
+        Return Paragraph objects for texts, parsing only those not already cached
+        (see api.utils.chunking for how long documents are parsed)
+        """
+        cache = self.paragraph_cache(nlp)
+        paragraphs = [None] * len(texts)
+        misses = []
+        for index, text in enumerate(texts):
+            body = text.rstrip('\n')
+            if not body.strip(' \t' + EMBED_CHAR):
+                paragraphs[index] = Paragraph(text, [])
+                continue
+            findings = cache.get(cache.key(body))
+            if findings is None:
+                misses.append((body, index))
+            else:
+                paragraphs[index] = Paragraph(text, findings)
+
+        bodies = [body for body, _ in misses]
+        for (body, index), findings in zip(misses, find_issues_in_chunks(nlp, bodies)):
+            cache.set(cache.key(body), findings)
+            paragraphs[index] = Paragraph(texts[index], findings)
+        return paragraphs
+
+    @staticmethod
+    def state_key(key):
+        return f'analysis:incremental:{key}'
+
+    def get_state(self, key):
+        state = self.states.get(self.state_key(key))
+        return state if isinstance(state, AnalysisState) else None
+
+    def save_state(self, key, state, expected_revision=None):
+        """
+        Store state as the document's last analyzed version, if the stored one
+        is still expected_revision (None to replace whatever is stored)
+        """
+        with self._lock:
+            if expected_revision is not None:
+                current = self.get_state(key)
+                if current is None or current.revision != expected_revision:
+                    raise StaleRevisionError('The analysis has moved on from that revision')
+            self.states.set(self.state_key(key), state)
+
+    def analyze(self, nlp, key, text):
+        """
+        Analyze the full text and make it the base for later deltas
+        """
+        paragraphs = self.analyze_paragraphs(nlp, split_paragraphs(text))
+        state = AnalysisState(new_revision(), text, paragraphs)
+        self.save_state(key, state)
+        return state, [(0, len(text))]
+
+    def apply_delta(self, nlp, key, revision, delta):
+        """
+        Apply a Quill delta to the last analyzed version and re-analyze the paragraphs it touched.
+
+        Returns the new state and the (start, end) ranges of the new text that were re-analyzed.
+        """
+        current = self.get_state(key)
+        if current is None or current.revision != revision:
+            raise StaleRevisionError('Delta does not apply to the last analyzed version')
+
+        text, changed = apply_to_text(current.text, delta)
+        if changed is None:
+            state = AnalysisState(new_revision(), text, current.paragraphs)
+            self.save_state(key, state, revision)
+            return state, []
+
+        # Widen the changed range to whole paragraphs. A change that starts right
+        # after a newline can still merge into the paragraph that follows it, so
+        # a paragraph is re-analyzed when the change reaches its first character
+        changed_start, changed_end = changed
+        first, region_start = len(current.paragraphs), len(current.text)
+        last, region_end = len(current.paragraphs) - 1, len(current.text)
+        found_first = False
+        offset = 0
+        for index, paragraph in enumerate(current.paragraphs):
+            end = offset + len(paragraph.text)
+            open_ended = not paragraph.text.endswith('\n')
+            if not found_first and (end > changed_start or open_ended):
+                first, region_start = index, offset
+                found_first = True
+            if end > changed_end or open_ended:
+                last, region_end = index, end
+                break
+            offset = end
+
+        new_region_end = region_end + len(text) - len(current.text)
+        region = split_paragraphs(text[region_start:new_region_end])
+        paragraphs = (
+            current.paragraphs[:first]
+            + self.analyze_paragraphs(nlp, region)
+            + current.paragraphs[last + 1:]
+        )
+        state = AnalysisState(new_revision(), text, paragraphs)
+        self.save_state(key, state, revision)
+        return state, [(region_start, new_region_end)]
+
+
+_analyzer = None
+
+
+def get_incremental_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        config = settings.INCREMENTAL_ANALYSIS
+        _analyzer = IncrementalGrammarAnalyzer(config['BACKEND'], config['TTL'])
+    return _analyzer
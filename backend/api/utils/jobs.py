@@ -0,0 +1,160 @@
+"""
+Background AI analysis of documents.
+
+``enqueue_analysis`` queues an ``AnalysisJob`` for a document's current
+content, a pool of worker threads (``python manage.py run_analysis_workers``)
+claims jobs from the database, stores the result as ``AIFeedback`` and pushes
+the job's new state to the ``analysis-job-<id>`` channel group.
+"""
+import logging
+import os
+import socket
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import close_old_connections, connection
+
+from api.utils.llm import get_llm_gateway
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_MESSAGES = [
+    {
+        "role": "system",
+        "content": "You are a helpful writing assistant. Analyze the text and provide grammar and style suggestions."
+    },
+]
+
+
+def get_analysis_messages(text):
+    return ANALYSIS_MESSAGES + [
+        {"role": "user", "content": f"Please analyze this text and provide suggestions: {text}"}
+    ]
+
+
+def analyze_document(document):
+    """
+    Ask the LLM for suggestions on the whole document and store them as AIFeedback
+    """
+    from api.models import AIFeedback
+
+    text = document.get_text()
+    suggestion = get_llm_gateway().complete_sync(get_analysis_messages(text.strip()))
+    # The completion is about the whole text, so it spans all of it
+    return AIFeedback.objects.create(
+        document=document,
+        feedback_type='general',
+        start_index=0,
+        end_index=len(text),
+        suggestion=suggestion,
+        revision=document.revision
+    )
+
+
+def job_group(job_id):
+    return f'analysis-job-{job_id}'
+
+
+def serialize_job(job):
+    from api.serializers import AnalysisJobSerializer
+
+    return AnalysisJobSerializer(job).data
+
+
+def notify_job(job):
+    """
+    Push the job's current state to whoever is watching it
+    """
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(job_group(job.pk), {'type': 'analysis.job', 'job': serialize_job(job)})
+    except Exception:
+        # Clients still see the result when they poll
+        logger.exception('Could not push the state of analysis job %s', job.pk)
+
+
+def enqueue_analysis(document):
+    """
+    Return (job, created) for analyzing the document's current content
+    """
+    from api.models import AnalysisJob
+
+    return AnalysisJob.enqueue(document)
+
+
+def run_job(job):
+    """
+    Analyze a claimed job's document and record the outcome on the job
+    """
+    notify_job(job)
+    document = job.document
+    if document.content_hash != job.content_hash:
+        # A job for the new content is queued when the client asks again
+        job.fail('The document changed before it was analyzed', retry=False)
+    else:
+        try:
+            job.finish(analyze_document(document))
+        except Exception as e:
+            logger.warning('Analysis job %s failed (attempt %s): %s', job.pk, job.attempts, e)
+            job.fail(e)
+    notify_job(job)
+
+
+class AnalysisWorkerPool:
+    """
+    Worker threads that claim and run analysis jobs until stopped.
+
+    The work is almost all waiting on the LLM, so threads are enough to keep
+    several completions in flight; the gateway still caps how many at once.
+    With ``burst`` set, each worker exits as soon as it finds the queue empty.
+    """
+
+    def __init__(self, workers, poll_interval, burst=False, name=None):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.work, args=(index,), name=f'analysis-worker-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopping.set()
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def work(self, index):
+        from api.models import AnalysisJob
+
+        worker = f'{self.name}-{index}'
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    job = AnalysisJob.claim(worker)
+                    if job is not None:
+                        run_job(job)
+                        continue
+                    if index == 0:
+                        AnalysisJob.requeue_stale()
+                except Exception:
+                    logger.exception('Analysis worker %s failed', worker)
+                if self.burst:
+                    break
+                self.stopping.wait(self.poll_interval)
+        finally:
+            connection.close()
+
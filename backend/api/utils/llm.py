@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from api.utils import metrics
+
+
+# The longest the OpenAI client waits between two attempts at a request
+MAX_RETRY_DELAY = 8
+
+
+class LLMError(Exception):
+    """
+    Raised when the LLM gateway cannot serve a completion.
+    """
+
+
+def as_llm_error(error):
+    """
+    Return a timeout from the client (or from waiting on it) as an LLMError, other errors as they are
+    """
+    from openai import APITimeoutError
+
+    if isinstance(error, (APITimeoutError, TimeoutError)):
+        wrapped = LLMError('Timed out waiting for the LLM')
+        wrapped.__cause__ = error
+        return wrapped
+    return error
+
+
+@contextmanager
+def upstream_timer(method):
+    """
+    Observe the latency of one request to the LLM provider, by outcome
+    """
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        metrics.LLM_DURATION.observe(time.perf_counter() - start, method=method, outcome=outcome)
+
+
+class _LoopState:
+    """
+    Async client, semaphore and in-flight requests bound to one event loop.
+    """
+
+    def __init__(self, gateway):
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI(**gateway.client_kwargs())
+        self.semaphore = asyncio.Semaphore(gateway.max_concurrency)
+        self.inflight = {}
+
+
+class LLMGateway:
+    """
+    Process-wide access point for chat completions.
+
+    The gateway owns one pooled OpenAI client (one per event loop for the async
+    path), caps the number of completions in flight, applies a timeout, and
+    coalesces identical prompts so that concurrent callers asking the same
+    thing share a single upstream request.
+    """
+
+    def __init__(self, api_key, base_url=None, model='gpt-3.5-turbo', max_concurrency=8, timeout=30, max_retries=2):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self._client = None
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._inflight = {}
+        self._loops = weakref.WeakKeyDictionary()
+
+    def client_kwargs(self):
+        kwargs = {'api_key': self.api_key, 'timeout': self.timeout, 'max_retries': self.max_retries}
+        if self.base_url:
+            kwargs['base_url'] = self.base_url
+        return kwargs
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+
+                    self._client = OpenAI(**self.client_kwargs())
+        return self._client
+
+    def request_params(self, messages, params):
+        params = dict(params)
+        params.setdefault('model', self.model)
+        params['messages'] = messages
+        return params
+
+    def request_key(self, params):
+        """
+        Identify a request by everything that can change its completion
+        """
+        encoded = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def request_budget(self):
+        """
+        The longest a completion can take: waiting for a slot, then every attempt timing out
+        """
+        return self.timeout * (self.max_retries + 2) + MAX_RETRY_DELAY * self.max_retries
+
+    def complete_sync(self, messages, **params):
+        """
+        Return the completion text for messages, blocking the calling thread
+        """
+        params = self.request_params(messages, params)
+        key = self.request_key(params)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            metrics.LLM_COALESCED.inc(method='sync')
+            with metrics.timed('llm'):
+                # The owner can take as long as its own slot wait and retries
+                try:
+                    return future.result(timeout=self.request_budget())
+                except TimeoutError as e:
+                    raise as_llm_error(e) from e
+
+        start = time.perf_counter()
+        try:
+            if not self._semaphore.acquire(timeout=self.timeout):
+                raise LLMError('Timed out waiting for a free LLM slot')
+            try:
+                with upstream_timer('sync'):
+                    response = self.client.chat.completions.create(**params)
+            finally:
+                self._semaphore.release()
+            result = self.get_content(response)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            error = as_llm_error(e)
+            future.set_exception(error)
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            if not future.done():
+                future.set_exception(LLMError('The shared LLM request was abandoned'))
+            metrics.record('llm', time.perf_counter() - start)
+
+    async def complete(self, messages, **params):
+        """
+        Return the completion text for messages without blocking the event loop
+        """
+        params = self.request_params(messages, params)
+        key = self.request_key(params)
+        state = self.get_loop_state()
+
+        task = state.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._complete(state, params))
+            state.inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(state, key, done))
+        else:
+            metrics.LLM_COALESCED.inc(method='async')
+        with metrics.timed('llm'):
+            # Shield the shared request so one caller going away does not cancel it for the others
+            return await asyncio.shield(task)
+
+    async def _complete(self, state, params):
+        try:
+            await asyncio.wait_for(state.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise LLMError('Timed out waiting for a free LLM slot')
+        try:
+            with upstream_timer('async'):
+                response = await asyncio.wait_for(state.client.chat.completions.create(**params), self.timeout)
+        except Exception as e:
+            error = as_llm_error(e)
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            state.semaphore.release()
+        return self.get_content(response)
+
+    async def stream(self, messages, **params):
+        """
+        Yield the completion text for messages chunk by chunk as the model produces it.
+
+        Streams are not coalesced, but they count against the concurrency limit.
+        """
+        params = self.request_params(messages, params)
+        params['stream'] = True
+        state = self.get_loop_state()
+
+        try:
+            await asyncio.wait_for(state.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise LLMError('Timed out waiting for a free LLM slot')
+        try:
+            with upstream_timer('stream'):
+                response = await asyncio.wait_for(state.client.chat.completions.create(**params), self.timeout)
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        finally:
+            state.semaphore.release()
+
+    def _forget(self, state, key, task):
+        state.inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved when every caller went away
+            task.exception()
+
+    def get_loop_state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = _LoopState(self)
+            self._loops[loop] = state
+        return state
+
+    def get_content(self, response):
+        if not response.choices:
+            return None
+        return response.choices[0].message.content
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway():
+    """
+    Return the process-wide LLM gateway configured from settings
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                config = settings.LLM_GATEWAY
+                _gateway = LLMGateway(
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=settings.OPENAI_BASE_URL,
+                    model=config['MODEL'],
+                    max_concurrency=config['MAX_CONCURRENCY'],
+                    timeout=config['TIMEOUT'],
+                    max_retries=config['MAX_RETRIES'],
+                )
+    return _gateway
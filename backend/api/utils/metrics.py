@@ -0,0 +1,282 @@
+"""
+Request instrumentation and Prometheus metrics.
+
+Metrics are kept in process and rendered in the Prometheus text format by the
+metrics endpoint. While a request is being handled, ``MetricsMiddleware`` also
+collects how long it spent in the database, spaCy and the LLM (and how the
+analysis caches answered) so the totals can be recorded per view and,
+optionally, returned in a ``Server-Timing`` header.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    """
+    A metric family with a fixed set of label names
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def label_values(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self.render_samples(items))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self.label_values(labels), 0)
+
+    def render_samples(self, items):
+        for key, value in items:
+            yield f'{self.name}_total{format_labels(self.labelnames, key)} {format_value(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        # Observations land in the first bucket they fit, made cumulative when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Bucket counts (the last one is +Inf), sum, count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._values.get(self.label_values(labels))
+        return series[2] if series else 0
+
+    def render_samples(self, items):
+        names = self.labelnames + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{format_labels(names, key + (format_value(float(bound)),))} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labelnames, key)} {count}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'smartwriter_request_duration_seconds', 'Time spent producing a response, by view',
+    ('view', 'method', 'status'),
+))
+REQUEST_DB_QUERIES = REGISTRY.register(Histogram(
+    'smartwriter_request_db_queries', 'Database queries run while handling a request, by view',
+    ('view',), buckets=QUERY_COUNT_BUCKETS,
+))
+REQUEST_DB_DURATION = REGISTRY.register(Histogram(
+    'smartwriter_request_db_duration_seconds', 'Time spent in database queries while handling a request, by view',
+    ('view',),
+))
+SPACY_DURATION = REGISTRY.register(Histogram(
+    'smartwriter_spacy_parse_duration_seconds', 'Time spent parsing text with spaCy',
+    ('analyzer', 'method'),
+))
+LLM_DURATION = REGISTRY.register(Histogram(
+    'smartwriter_llm_request_duration_seconds', 'Latency of completions requested from the LLM',
+    ('method', 'outcome'),
+))
+LLM_COALESCED = REGISTRY.register(Counter(
+    'smartwriter_llm_coalesced_requests', 'Completions served by an identical request already in flight',
+    ('method',),
+))
+GRAMMAR_SENTENCES = REGISTRY.register(Counter(
+    'smartwriter_grammar_sentences', 'Sentences grammar checked, by whether they were parsed or only tokenized',
+    ('stage',),
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'smartwriter_analysis_cache_requests', 'Analysis result cache lookups, by cache tier and outcome',
+    ('namespace', 'tier', 'outcome'),
+))
+
+
+class RequestTimings:
+    """
+    Time and call counts per component accumulated while handling one request
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, component, seconds=0.0, count=1):
+        with self._lock:
+            self.durations[component] = self.durations.get(component, 0.0) + seconds
+            self.counts[component] = self.counts.get(component, 0) + count
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total):
+        """
+        Return the Server-Timing header value for these timings
+        """
+        entries = [f'total;dur={total * 1000:.1f}']
+        for component in ('db', 'spacy', 'llm'):
+            if component in self.counts:
+                entries.append(
+                    f'{component};dur={self.durations[component] * 1000:.1f};desc="{self.counts[component]} calls"'
+                )
+        hits, misses = self.counts.get('cache_hit', 0), self.counts.get('cache_miss', 0)
+        if hits or misses:
+            entries.append(f'cache;desc="{hits} hits, {misses} misses"')
+        return ', '.join(entries)
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def current_timings():
+    return _current.get()
+
+
+def record(component, seconds=0.0, count=1):
+    """
+    Add to the current request's totals for component, if a request is being instrumented
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(component, seconds, count)
+
+
+@contextmanager
+def timed(component, histogram=None, **labels):
+    """
+    Time the block for the current request's component total and, if given, a histogram
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        record(component, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed, **labels)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding every query's time to the current request
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - start)
+
+
+def install_query_wrapper(connection):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def start_request():
+    """
+    Start collecting timings for a request, returning (timings, token to pass to finish_request)
+    """
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(request, response, timings, token):
+    """
+    Record a handled request's timings and stop collecting them
+    """
+    _current.reset(token)
+    total = timings.elapsed()
+    match = getattr(request, 'resolver_match', None)
+    # Route names, not paths, so the number of series stays bounded
+    view = (match.view_name or match._func_path) if match else 'unmatched'
+    REQUEST_DURATION.observe(total, view=view, method=request.method, status=response.status_code)
+    REQUEST_DB_QUERIES.observe(timings.counts.get('db', 0), view=view)
+    REQUEST_DB_DURATION.observe(timings.durations.get('db', 0.0), view=view)
+    if settings.METRICS['SERVER_TIMING']:
+        response['Server-Timing'] = timings.server_timing(total)
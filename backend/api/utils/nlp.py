@@ -0,0 +1,105 @@
+import gc
+import threading
+import time
+
+from django.conf import settings
+
+from api.utils import metrics
+
+_models = {}
+_lock = threading.Lock()
+
+
+class TimedPipeline:
+    """
+    A spaCy pipeline that records the time spent parsing in the metrics.
+
+    Everything other than calling it, ``pipe`` and ``tokenize`` is passed through to the pipeline.
+    """
+
+    def __init__(self, nlp, analyzer):
+        self.nlp = nlp
+        self.analyzer = analyzer
+
+    def __call__(self, text, **kwargs):
+        with metrics.timed('spacy', metrics.SPACY_DURATION, analyzer=self.analyzer, method='call'):
+            return self.nlp(text, **kwargs)
+
+    def tokenize(self, texts):
+        """
+        Run only the tokenizer over texts, returning the docs
+        """
+        with metrics.timed('spacy', metrics.SPACY_DURATION, analyzer=self.analyzer, method='tokenize'):
+            return list(self.nlp.tokenizer.pipe(texts))
+
+    def pipe(self, texts, **kwargs):
+        """
+        Like Language.pipe, timing only the parsing and not the caller's work between results
+        """
+        docs = self.nlp.pipe(texts, **kwargs)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    doc = next(docs)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield doc
+        finally:
+            metrics.record('spacy', elapsed)
+            metrics.SPACY_DURATION.observe(elapsed, analyzer=self.analyzer, method='pipe')
+
+    def __getattr__(self, name):
+        return getattr(self.nlp, name)
+
+
+def get_pipeline_config(analyzer):
+    """
+    Return the model name and excluded components configured for an analyzer
+    """
+    config = settings.SPACY_PIPELINES.get(analyzer, {})
+    return config.get('model', settings.SPACY_MODEL), tuple(sorted(config.get('exclude', ())))
+
+
+def get_nlp(analyzer='default'):
+    """
+    Return the spaCy pipeline for an analyzer, loading it on first use.
+
+    Analyzers that ask for the same model and components share one pipeline.
+    Parse times are recorded per analyzer.
+    """
+    key = get_pipeline_config(analyzer)
+    nlp = _models.get(key)
+    if nlp is None:
+        with _lock:
+            nlp = _models.get(key)
+            if nlp is None:
+                import spacy
+
+                model, exclude = key
+                nlp = spacy.load(model, exclude=list(exclude))
+                _models[key] = nlp
+    return TimedPipeline(nlp, analyzer)
+
+
+def loaded_pipelines():
+    return {f'{model}:{",".join(exclude) or "-"}': nlp.pipe_names for (model, exclude), nlp in _models.items()}
+
+
+def preload_models():
+    """
+    Load every configured pipeline up front.
+
+    Called from the WSGI/ASGI entry points when SPACY_PRELOAD is set, so that
+    under ``gunicorn --preload`` the master loads the models once and forked
+    workers share the pages copy-on-write. The loaded objects are moved out of
+    the garbage collector's generations so collections in the workers do not
+    touch (and copy) those pages.
+    """
+    for analyzer in settings.SPACY_PIPELINES:
+        get_nlp(analyzer)
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,360 @@
+"""
+Repeated phrases and overused words.
+
+A phrase is a run of ``MIN_WORDS`` to ``MAX_WORDS`` words within a clause
+that has a content word in it and does not end on an article, preposition or
+conjunction; a word is a single content word. Every occurrence is counted in
+a count-min sketch of fixed size, which never undercounts, and only the
+phrases and words the sketch shows used at least ``MIN_REPEATS`` times are
+kept by name in a table, pruned to the ``MAX_PHRASES`` and ``MAX_SINGLE_WORDS``
+most used. So an index takes the same room however long the manuscript, and
+counts can be added and taken away paragraph by paragraph as it changes.
+
+The sketch overcounts by about ``e * total / SKETCH_WIDTH`` at worst, so it
+only picks the candidates; a document's candidates are then counted exactly,
+and located, in one pass over its chunks.
+"""
+import hashlib
+import heapq
+import itertools
+import json
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
+
+from api.utils.cache import get_result_cache
+from api.utils.style import STOPWORDS
+
+PHRASES_VERSION = '1'
+
+_CLAUSE = re.compile(r'[^.!?;:,()\[\]"“”—–…]+')
+_WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+# A phrase ending on one of these goes on in a longer one
+_DANGLING = frozenset((
+    'a', 'an', 'the', 'and', 'but', 'or', 'nor', 'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with', 'from',
+    'into', 'as', 'than', 'that', 'my', 'your', 'his', 'her', 'its', 'our', 'their',
+))
+_CONJUNCTIONS = frozenset(('and', 'but', 'or', 'nor'))
+
+
+def clause_phrases(words, min_words, max_words, first_words=None):
+    """
+    Yield (phrase, first, last) for each phrase and content word of a
+    clause's lowercase words, by the indexes of their first and last word.
+    With first_words, only those starting with one of them.
+    """
+    content = [word not in STOPWORDS and len(word) > 2 for word in words]
+    # Content words up to each position, to tell whether a run has any
+    seen = list(itertools.accumulate(content, initial=0))
+    for index, word in enumerate(words):
+        if first_words is not None and word not in first_words:
+            continue
+        if content[index]:
+            yield word, index, index
+        if word in _CONJUNCTIONS:
+            continue
+        for last in range(index + min_words - 1, min(index + max_words, len(words))):
+            if words[last] in _DANGLING or seen[last + 1] == seen[index]:
+                continue
+            yield ' '.join(words[index:last + 1]), index, last
+
+
+def count_phrases(texts):
+    """
+    Count the phrases and content words of paragraphs
+    """
+    config = settings.PHRASE_INDEX
+    counts = Counter()
+    for text in texts:
+        for clause in _CLAUSE.findall(text):
+            words = [word.lower() for word in _WORD.findall(clause)]
+            counts.update(phrase for phrase, _, _ in clause_phrases(words, config['MIN_WORDS'], config['MAX_WORDS']))
+    return counts
+
+
+def phrase_hashes(phrases):
+    """
+    Stable 64-bit hashes of phrases, the same in every process
+    """
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(phrase.encode('utf-8'), digest_size=8).digest(), 'little') for phrase in phrases],
+        dtype=np.uint64,
+    )
+
+
+class CountMinSketch:
+    """
+    Counts of any number of keys in depth x width counters.
+
+    Each key adds to one counter per row and its estimate is the smallest of
+    them: never below the true count, and above it by at most e/width of the
+    total with probability 1 - e^-depth. Counts can be taken away again, and
+    sketches of the same size added together.
+    """
+
+    def __init__(self, depth, width, counters=None):
+        self.depth = depth
+        self.width = width
+        self.counters = np.zeros((depth, width), dtype=np.int32) if counters is None else counters
+
+    def columns(self, hashes):
+        # Double hashing: row i uses h1 + i * h2
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((low[None, :] + rows * high[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, hashes, counts):
+        for row, columns in enumerate(self.columns(hashes)):
+            np.add.at(self.counters[row], columns, counts)
+
+    def estimate(self, hashes):
+        columns = self.columns(hashes)
+        return self.counters[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def merge(self, other, sign=1):
+        self.counters += sign * other.counters
+
+    def to_bytes(self):
+        return zlib.compress(self.counters.tobytes(), 1)
+
+    @classmethod
+    def from_bytes(cls, depth, width, data):
+        counters = np.frombuffer(zlib.decompress(data), dtype=np.int32).reshape(depth, width).copy()
+        return cls(depth, width, counters)
+
+
+def paragraphs_digest(hashes, digest=0, sign=1):
+    """
+    Add (or with sign=-1 take away) chunk hashes to an order-independent digest of a document's chunks
+    """
+    for value in hashes:
+        digest = (digest + sign * int(value[:16], 16)) % (1 << 64)
+    return digest
+
+
+def new_sketch():
+    config = settings.PHRASE_INDEX
+    return CountMinSketch(config['SKETCH_DEPTH'], config['SKETCH_WIDTH'])
+
+
+def load_sketch(data):
+    config = settings.PHRASE_INDEX
+    if not data:
+        return new_sketch()
+    return CountMinSketch.from_bytes(config['SKETCH_DEPTH'], config['SKETCH_WIDTH'], bytes(data))
+
+
+def dump_table(table):
+    return zlib.compress(json.dumps(table, separators=(',', ':'), ensure_ascii=False).encode('utf-8'), 1)
+
+
+def load_table(data):
+    return json.loads(zlib.decompress(bytes(data))) if data else {}
+
+
+def update_table(sketch, table, changes):
+    """
+    Apply changes, {phrase: change in count}, to the table of repeated
+    phrases once the sketch includes them. Phrases the sketch now shows
+    repeated join the table at their estimate.
+    """
+    minimum = settings.PHRASE_INDEX['MIN_REPEATS']
+    candidates = []
+    for phrase, change in changes.items():
+        if phrase in table:
+            table[phrase] += change
+            if table[phrase] < minimum:
+                del table[phrase]
+        elif change > 0:
+            candidates.append(phrase)
+    if candidates:
+        for phrase, estimate in zip(candidates, sketch.estimate(phrase_hashes(candidates)).tolist()):
+            if estimate >= minimum:
+                table[phrase] = estimate
+    prune_table(table)
+
+
+def prune_table(table):
+    """
+    Keep the MAX_PHRASES most used phrases and the MAX_SINGLE_WORDS most used words
+    """
+    config = settings.PHRASE_INDEX
+    phrases = [phrase for phrase in table if ' ' in phrase]
+    words = [phrase for phrase in table if ' ' not in phrase]
+    for group, limit in ((phrases, config['MAX_PHRASES']), (words, config['MAX_SINGLE_WORDS'])):
+        if len(group) > limit:
+            kept = set(heapq.nlargest(limit, group, key=table.__getitem__))
+            for phrase in group:
+                if phrase not in kept:
+                    del table[phrase]
+
+
+def add_counts(sketch, table, changes):
+    """
+    Add changes, {phrase: change in count} with negative changes for text
+    taken away, to a sketch and its table
+    """
+    changes = {phrase: change for phrase, change in changes.items() if change}
+    if not changes:
+        return
+    sketch.add(phrase_hashes(list(changes)), np.array(list(changes.values()), dtype=np.int32))
+    update_table(sketch, table, changes)
+
+
+def count_paragraphs(texts, *indexes, sign=1, batch_chars=200000):
+    """
+    Add (or with sign=-1 take away) the counts of paragraphs streamed in
+    order to each (sketch, table) of indexes, a batch at a time
+    """
+    batch, size = [], 0
+    for text in itertools.chain(texts, [None]):
+        if text is not None:
+            batch.append(text)
+            size += len(text)
+        if batch and (text is None or size >= batch_chars):
+            changes = count_phrases(batch)
+            if sign < 0:
+                changes = {phrase: -count for phrase, count in changes.items()}
+            for sketch, table in indexes:
+                add_counts(sketch, table, changes)
+            batch, size = [], 0
+
+
+def locate_phrases(texts, phrases, max_locations):
+    """
+    Count and locate phrases in paragraphs streamed in order. Returns
+    {phrase: [count, [(start, end), ...]]} with offsets into their joined text.
+    """
+    config = settings.PHRASE_INDEX
+    first_words = {phrase.split(' ', 1)[0] for phrase in phrases}
+    found = {}
+    offset = 0
+    for text in texts:
+        for clause in _CLAUSE.finditer(text):
+            matches = list(_WORD.finditer(text, clause.start(), clause.end()))
+            words = [match.group().lower() for match in matches]
+            for phrase, first, last in clause_phrases(words, config['MIN_WORDS'], config['MAX_WORDS'], first_words):
+                if phrase in phrases:
+                    entry = found.setdefault(phrase, [0, []])
+                    entry[0] += 1
+                    if len(entry[1]) < max_locations:
+                        entry[1].append((offset + matches[first].start(), offset + matches[last].end()))
+        offset += len(text)
+    return found
+
+
+def top_entries(counts, limit, nested=False):
+    """
+    Return the most used phrases and words of {phrase: count} as two lists of
+    (phrase, count), dropping phrases used no more often than a longer one
+    holding them unless nested is set
+    """
+    phrases = sorted(
+        ((phrase, count) for phrase, count in counts.items() if ' ' in phrase),
+        key=lambda entry: (-entry[1], -len(entry[0]), entry[0]),
+    )
+    kept = []
+    for phrase, count in phrases:
+        padded = f' {phrase} '
+        if not nested and any(longer_count >= count and padded in f' {longer} ' for longer, longer_count in kept):
+            continue
+        kept.append((phrase, count))
+        if len(kept) == limit:
+            break
+    words = sorted(
+        ((word, count) for word, count in counts.items() if ' ' not in word),
+        key=lambda entry: (-entry[1], entry[0]),
+    )
+    return kept, words[:limit]
+
+
+def describe(entries, word_count, locations=None):
+    rows = []
+    for phrase, count in entries:
+        row = {
+            'phrase': phrase,
+            'words': phrase.count(' ') + 1,
+            'count': count,
+            'per_thousand': round(count * 1000 / word_count, 2) if word_count else None,
+        }
+        if locations is not None:
+            row['locations'] = [{'start': start, 'end': end} for start, end in locations[phrase]]
+        rows.append(row)
+    return rows
+
+
+def document_phrases(document, limit):
+    """
+    Return the document's most repeated phrases and most used words, counted
+    exactly and located in one pass over its chunks. Cached by content hash.
+    """
+    from api.models import PhraseIndex  # Import here to avoid circular import
+
+    config = settings.PHRASE_INDEX
+
+    def compute():
+        index = PhraseIndex.objects.filter(document=document).first()
+        current = paragraphs_digest(document.chunks.values_list('hash', flat=True).iterator(chunk_size=2000))
+        if index is None or index.paragraphs != f'{current:016x}':
+            # Never indexed, or changed while the index was turned off
+            index = PhraseIndex.rebuild(document.pk)
+        elif index.pending is not None:
+            index = PhraseIndex.apply_pending(index.pk) or PhraseIndex.rebuild(document.pk)
+        _, table = index.load()
+        candidates = [
+            phrase for group in top_entries(table, config['CANDIDATES'], nested=True) for phrase, _ in group
+        ]
+        found = locate_phrases(document.iter_text(), set(candidates), config['MAX_LOCATIONS'])
+        phrases, words = top_entries(
+            {phrase: count for phrase, (count, _) in found.items() if count >= config['MIN_REPEATS']}, limit
+        )
+        locations = {phrase: places for phrase, (_, places) in found.items()}
+        return {
+            'phrases': describe(phrases, document.word_count, locations),
+            'words': describe(words, document.word_count, locations),
+        }
+
+    if not document.content_hash:
+        return compute()
+    cache = get_result_cache('phrases', PHRASES_VERSION)
+    return cache.get_or_compute(f'{document.content_hash}:{limit}', compute)
+
+
+def author_phrases(author_id, limit):
+    """
+    Return the author's most repeated phrases and most used words across
+    their documents, with the documents using each most. Counts come from the
+    author's index and may be over by the sketch's error.
+    """
+    from api.models import Document, PhraseIndex  # Import here to avoid circular import
+
+    PhraseIndex.apply_author_pending(author_id)
+    index = PhraseIndex.objects.filter(author_id=author_id).first() or PhraseIndex.rebuild_author(author_id)
+    _, table = index.load()
+    phrases, words = top_entries(table, limit)
+    word_count = Document.objects.filter(author_id=author_id).aggregate(total=Sum('word_count'))['total']
+
+    # Where each is used, from the documents' own indexes
+    wanted = {phrase for phrase, _ in phrases + words}
+    documents = {phrase: [] for phrase in wanted}
+    document_indexes = PhraseIndex.objects.filter(counted_author_id=author_id, document__isnull=False).select_related(
+        'document'
+    ).only('phrases', 'document__id', 'document__title')
+    for document_index in document_indexes.iterator(chunk_size=50):
+        document_table = load_table(document_index.phrases)
+        for phrase in wanted & document_table.keys():
+            documents[phrase].append({
+                'id': document_index.document.pk,
+                'title': document_index.document.title,
+                'count': document_table[phrase],
+            })
+
+    result = {'phrases': describe(phrases, word_count), 'words': describe(words, word_count)}
+    for row in result['phrases'] + result['words']:
+        row['documents'] = sorted(documents[row['phrase']], key=lambda entry: -entry['count'])[:10]
+    return result
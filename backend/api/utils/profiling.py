@@ -0,0 +1,281 @@
+"""
+Opt-in profiling of slow requests.
+
+While ``PROFILING['ENABLED']`` is set, views using ``ProfilingMixin`` register
+their thread with a process-wide stack sampler for the duration of the
+request. Requests that take longer than ``PROFILING['SLOW_THRESHOLD']`` keep
+their samples as collapsed stacks (the input format of flamegraph.pl and
+speedscope); faster ones are dropped. Staff can also ask for a trace of one
+request with ``?profile=1``, which additionally runs cProfile.
+
+Traces are JSON files (plus a ``.prof`` file for cProfile stats) in
+``PROFILING['DIR']``, which keeps at most ``PROFILING['MAX_PROFILES']`` of
+them, dropping the oldest. ``python manage.py profiles`` lists and renders them.
+"""
+import asyncio
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=8192)
+def frame_label(code):
+    """
+    Name a code object as ``function (path:line)``, with paths relative to the project or site-packages
+    """
+    filename = code.co_filename
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        filename = filename[len(base):]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+def collapse(frame):
+    """
+    Return the stack ending at frame as a semicolon separated line, outermost frame first
+    """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Background thread sampling the stacks of registered threads every interval.
+
+    Each registered request gets a Counter of collapsed stacks. Requests of
+    async views share the event loop thread, so their samples include
+    whatever else the loop was running at the time. The thread sleeps while
+    nothing is registered.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def register(self, thread_id):
+        samples = Counter()
+        with self.lock:
+            self.active.setdefault(thread_id, []).append(samples)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+                self.thread.start()
+            self.wake.set()
+        return samples
+
+    def unregister(self, thread_id, samples):
+        with self.lock:
+            collectors = self.active.get(thread_id, [])
+            if samples in collectors:
+                collectors.remove(samples)
+            if not collectors:
+                self.active.pop(thread_id, None)
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        with self.lock:
+            if not self.active:
+                self.wake.clear()
+                return
+            active = {thread_id: list(collectors) for thread_id, collectors in self.active.items()}
+        frames = sys._current_frames()
+        for thread_id, collectors in active.items():
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = collapse(frame)
+            for samples in collectors:
+                samples[stack] += 1
+
+
+class ProfileStore:
+    """
+    Ring buffer of saved traces in a directory, oldest dropped first
+    """
+
+    def __init__(self, path, max_profiles):
+        self.path = Path(path)
+        self.max_profiles = max_profiles
+
+    def ids(self):
+        """
+        Saved trace ids, oldest first
+        """
+        if not self.path.is_dir():
+            return []
+        return sorted(entry.stem for entry in self.path.glob('*.json'))
+
+    def load(self, profile_id):
+        with open(self.path / f'{profile_id}.json') as f:
+            return json.load(f)
+
+    def stats_path(self, profile_id):
+        return self.path / f'{profile_id}.prof'
+
+    def save(self, record, profiler=None):
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Nanosecond timestamps sort in the order traces were taken
+        profile_id = f'{time.time_ns()}-{os.getpid()}-{threading.get_ident()}'
+        record = {'id': profile_id, **record, 'pstats': profiler is not None}
+        if profiler is not None:
+            profiler.dump_stats(self.stats_path(profile_id))
+        temporary = self.path / f'{profile_id}.json.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(record, f)
+        os.replace(temporary, self.path / f'{profile_id}.json')
+        self.prune()
+        return profile_id
+
+    def remove(self, profile_id):
+        for path in (self.path / f'{profile_id}.json', self.stats_path(profile_id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def prune(self):
+        ids = self.ids()
+        for profile_id in ids[:max(0, len(ids) - self.max_profiles)]:
+            self.remove(profile_id)
+
+    def clear(self):
+        for profile_id in self.ids():
+            self.remove(profile_id)
+
+
+class ProfilingSession:
+    """
+    Profiling of one request, from the start of dispatch to the response
+    """
+    # cProfile replaces any profiler already running on the thread, so only one request at a time gets it
+    cprofile_lock = threading.Lock()
+
+    def __init__(self, request):
+        self.request = request
+        self.thread_id = threading.get_ident()
+        try:
+            # Async views run on the event loop, and only authenticate in a worker thread
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+        self.samples = get_sampler().register(self.thread_id)
+        self.profiler = None
+        self.stopped = False
+        self.start = time.perf_counter()
+
+    def start_cprofile(self):
+        """
+        Run cProfile on the request's thread as well, once the request is known to come from staff
+        """
+        if threading.get_ident() != self.thread_id:
+            if self.loop is not None:
+                # Runs before the loop gets back to the view, which waits on the calling thread
+                self.loop.call_soon_threadsafe(self.start_cprofile)
+            return
+        if self.stopped or self.profiler is not None or not self.cprofile_lock.acquire(blocking=False):
+            return
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self):
+        duration = time.perf_counter() - self.start
+        self.stopped = True
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.cprofile_lock.release()
+        get_sampler().unregister(self.thread_id, self.samples)
+        return duration
+
+    def finish(self, view, response):
+        """
+        Stop profiling and save the trace if the request was slow or staff asked for it
+        """
+        duration = self.stop()
+        config = settings.PROFILING
+        # The user DRF authenticated, without authenticating again if it never got that far
+        user = getattr(getattr(view, 'request', None), '_user', None)
+        explicit = wants_profile(self.request) and bool(user and user.is_staff)
+        slow = bool(config['SLOW_THRESHOLD']) and duration >= config['SLOW_THRESHOLD']
+        if not (explicit or slow):
+            return response
+
+        match = self.request.resolver_match
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'view': match.view_name if match else type(view).__name__,
+            'method': self.request.method,
+            'path': self.request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'trigger': 'request' if explicit else 'threshold',
+            'user': user.pk if user and user.is_authenticated else None,
+            'interval_ms': config['SAMPLE_INTERVAL'] * 1000,
+            'samples': sum(self.samples.values()),
+            'stacks': dict(self.samples),
+        }
+        try:
+            profile_id = get_store().save(record, self.profiler if explicit else None)
+        except OSError:
+            logger.exception('Could not save the profile of %s %s', self.request.method, self.request.path)
+            return response
+        if explicit:
+            response['X-Profile-Id'] = profile_id
+        return response
+
+
+def wants_profile(request):
+    return request.GET.get('profile') == '1'
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = StackSampler(settings.PROFILING['SAMPLE_INTERVAL'])
+    return _sampler
+
+
+def get_store():
+    config = settings.PROFILING
+    return ProfileStore(config['DIR'], config['MAX_PROFILES'])
+
+
+def start_profiling(request):
+    """
+    Return a ProfilingSession for the request, or None when profiling is off
+    """
+    config = settings.PROFILING
+    if not config['ENABLED']:
+        return None
+    if not wants_profile(request) and not config['SLOW_THRESHOLD']:
+        return None
+    return ProfilingSession(request)
@@ -0,0 +1,321 @@
+"""
+Full-text search over documents.
+
+Documents are indexed from their title and plain text into
+``api_document_search``: an FTS5 virtual table on SQLite, or a table with a
+weighted ``tsvector`` column and a GIN index on Postgres. The table is created
+by migration 0011; other databases have no search backend.
+
+Saves that change what is indexed mark the document ``search_stale`` and,
+once they commit, hand it to the process's ``SearchIndexer``, which reindexes
+the documents saved in the last ``SEARCH_INDEX_DELAY`` seconds in one batch in
+a background thread. Documents it missed (e.g. because the process stopped)
+stay marked, and each search reindexes up to ``SEARCH_STALE_BATCH`` of the
+caller's before running.
+"""
+import html
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'api_document_search'
+
+# The document fields index_documents needs loaded
+INDEX_FIELDS = ('id', 'title', 'content_hash', 'author_id', 'search_stale')
+
+# Highlight markers that cannot occur in document text, swapped for <mark> after escaping
+START_MARK = '\x02'
+STOP_MARK = '\x03'
+
+
+def render_snippet(snippet):
+    """
+    Return a snippet as HTML, escaped, with the matches wrapped in <mark>
+    """
+    escaped = html.escape(snippet or '')
+    return escaped.replace(START_MARK, '<mark>').replace(STOP_MARK, '</mark>')
+
+
+def visibility_clause(author_id):
+    if author_id is None:
+        return 'd.author_id IS NULL', []
+    return 'd.author_id = %s', [author_id]
+
+
+def owner_token(author_id):
+    """
+    Return the token a document's owner is indexed as, so matching can be narrowed to one library
+    """
+    return 'anonymous' if author_id is None else f'author{author_id}'
+
+
+class SearchBackend:
+    vendor = None
+
+    def indexed(self, cursor, document_id):
+        """
+        Return the (title, content_hash, owner) a document was indexed with, or None
+        """
+        cursor.execute(f'SELECT title, content_hash, owner FROM {SEARCH_TABLE} WHERE {self.key} = %s', [document_id])
+        return cursor.fetchone()
+
+    def index(self, cursor, rows):
+        """
+        Add or replace index rows of (document_id, title, body, content_hash, owner)
+        """
+        raise NotImplementedError
+
+    def remove(self, cursor, document_ids):
+        for document_id in document_ids:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {self.key} = %s', [document_id])
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def search(self, cursor, query, author_id, limit):
+        """
+        Return (document_id, rank, snippet) for the best matches, best first
+        """
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+    vendor = 'sqlite'
+    key = 'rowid'
+
+    def index(self, cursor, rows):
+        rows = list(rows)
+        self.remove(cursor, [row[0] for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, body, content_hash, owner) VALUES (%s, %s, %s, %s, %s)', rows
+        )
+
+    def match_expression(self, query, author_id):
+        """
+        Turn free text into an FTS5 query: every word must match the title or
+        text, the last one as a prefix, in documents of the given owner
+        """
+        words = re.findall(r'\w+', query)
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += '*'
+        # Narrowing by owner inside the index keeps ranking to the caller's own library
+        return f'owner : "{owner_token(author_id)}" AND {{title body}} : ({" ".join(terms)})'
+
+    def search(self, cursor, query, author_id, limit):
+        expression = self.match_expression(query, author_id)
+        if expression is None:
+            return []
+        visible, params = visibility_clause(author_id)
+        cursor.execute(
+            f"""
+            SELECT {SEARCH_TABLE}.rowid, -{SEARCH_TABLE}.rank,
+                   snippet({SEARCH_TABLE}, 1, %s, %s, '…', %s)
+            FROM {SEARCH_TABLE}
+            JOIN api_document d ON d.id = {SEARCH_TABLE}.rowid
+            WHERE {SEARCH_TABLE} MATCH %s AND {visible}
+            ORDER BY {SEARCH_TABLE}.rank
+            LIMIT %s
+            """,
+            [START_MARK, STOP_MARK, settings.SEARCH['SNIPPET_WORDS'], expression, *params, limit]
+        )
+        return cursor.fetchall()
+
+
+class PostgresSearchBackend(SearchBackend):
+    vendor = 'postgresql'
+    key = 'document_id'
+
+    def index(self, cursor, rows):
+        config = settings.SEARCH['POSTGRES_CONFIG']
+        cursor.executemany(
+            f"""
+            INSERT INTO {SEARCH_TABLE} (document_id, title, body, content_hash, owner, search_vector)
+            VALUES (%s, %s, %s, %s, %s,
+                    setweight(to_tsvector(%s::regconfig, %s), 'A') || setweight(to_tsvector(%s::regconfig, %s), 'B'))
+            ON CONFLICT (document_id) DO UPDATE SET
+                title = EXCLUDED.title, body = EXCLUDED.body, content_hash = EXCLUDED.content_hash,
+                owner = EXCLUDED.owner, search_vector = EXCLUDED.search_vector
+            """,
+            [(document_id, title, body, content_hash, owner, config, title, config, body)
+             for document_id, title, body, content_hash, owner in rows]
+        )
+
+    def search(self, cursor, query, author_id, limit):
+        config = settings.SEARCH['POSTGRES_CONFIG']
+        visible, params = visibility_clause(author_id)
+        options = (
+            f"StartSel={START_MARK}, StopSel={STOP_MARK}, "
+            f"MaxWords={settings.SEARCH['SNIPPET_WORDS'] * 2}, MinWords={settings.SEARCH['SNIPPET_WORDS']}"
+        )
+        # Rank through the GIN index first, then build headlines for the page only
+        cursor.execute(
+            f"""
+            SELECT ranked.document_id, ranked.rank, ts_headline(%s::regconfig, s.body, ranked.query, %s)
+            FROM (
+                SELECT s.document_id, ts_rank_cd(s.search_vector, q.query) AS rank, q.query
+                FROM {SEARCH_TABLE} s
+                JOIN api_document d ON d.id = s.document_id
+                CROSS JOIN websearch_to_tsquery(%s::regconfig, %s) AS q(query)
+                WHERE s.search_vector @@ q.query AND s.owner = %s AND {visible}
+                ORDER BY rank DESC
+                LIMIT %s
+            ) ranked
+            JOIN {SEARCH_TABLE} s ON s.document_id = ranked.document_id
+            ORDER BY ranked.rank DESC
+            """,
+            [config, options, config, query, owner_token(author_id), *params, limit]
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {backend.vendor: backend for backend in (SQLiteSearchBackend(), PostgresSearchBackend())}
+
+
+def get_search_backend():
+    """
+    Return the search backend for the default database, or None if it has none
+    """
+    return BACKENDS.get(connection.vendor)
+
+
+def index_documents(documents, force=False):
+    """
+    Bring the index rows of documents up to date with their title and plain text,
+    and clear their search_stale mark. Documents must have INDEX_FIELDS loaded.
+    Unless force is set, documents indexed with the same title and content hash are skipped.
+    Returns the number of documents (re)indexed.
+    """
+    from api.models import Document
+
+    backend = get_search_backend()
+    if backend is None:
+        return 0
+
+    rows, stale = [], []
+    with connection.cursor() as cursor:
+        for document in documents:
+            if document.search_stale:
+                stale.append(document)
+            owner = owner_token(document.author_id)
+            if not force and backend.indexed(cursor, document.pk) == (document.title, document.content_hash, owner):
+                continue
+            rows.append((document.pk, document.title, document.get_plain_text(), document.content_hash, owner))
+        if rows:
+            backend.index(cursor, rows)
+    for document in stale:
+        # A save since the document was read has marked it again and keeps its mark
+        Document.objects.filter(
+            pk=document.pk, title=document.title, author_id=document.author_id, content_hash=document.content_hash
+        ).update(search_stale=False)
+    return len(rows)
+
+
+def index_document_ids(document_ids):
+    """
+    Reindex those of the documents that are marked search_stale
+    """
+    from api.models import Document
+
+    with transaction.atomic():
+        return index_documents(Document.objects.filter(pk__in=document_ids, search_stale=True).only(*INDEX_FIELDS))
+
+
+def index_stale_documents(author_id, limit):
+    """
+    Reindex up to limit of the documents of author_id (None for anonymous
+    documents) saved since they were last indexed, least recently saved first
+    """
+    from api.models import Document
+
+    with transaction.atomic():
+        stale = Document.objects.filter(author_id=author_id, search_stale=True).order_by('updated_at')
+        return index_documents(stale.only(*INDEX_FIELDS)[:limit])
+
+
+class SearchIndexer:
+    """
+    Reindexes the documents saved in this process in a background thread.
+
+    Documents saved within SEARCH_INDEX_DELAY seconds of the first are indexed
+    together, so a run of autosaves reads a document's text once rather than
+    per save. With no delay they are indexed right away, in the caller's thread.
+    """
+
+    def __init__(self):
+        self.pending = set()
+        self.timer = None
+        self._lock = threading.Lock()
+
+    def schedule(self, document_id):
+        delay = settings.SEARCH['INDEX_DELAY']
+        if not delay:
+            index_document_ids([document_id])
+            return
+        with self._lock:
+            self.pending.add(document_id)
+            if self.timer is None:
+                self.timer = threading.Timer(delay, self.run)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def run(self):
+        with self._lock:
+            document_ids, self.pending, self.timer = self.pending, set(), None
+        try:
+            close_old_connections()
+            index_document_ids(document_ids)
+        except Exception:
+            # Still marked stale, so searches and reindex_search pick them up
+            logger.exception('Could not reindex %s documents', len(document_ids))
+        finally:
+            connection.close()
+
+
+_indexer = None
+_indexer_lock = threading.Lock()
+
+
+def get_search_indexer():
+    global _indexer
+    with _indexer_lock:
+        if _indexer is None:
+            _indexer = SearchIndexer()
+        return _indexer
+
+
+def schedule_index(document_id):
+    """
+    Reindex the document once the current transaction commits
+    """
+    transaction.on_commit(lambda: get_search_indexer().schedule(document_id))
+
+
+def remove_documents(document_ids):
+    backend = get_search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, document_ids)
+
+
+def schedule_remove(document_id):
+    transaction.on_commit(lambda: remove_documents([document_id]))
+
+
+def search_documents(query, author_id, limit):
+    """
+    Return (document_id, rank, snippet_html) for the documents of author_id
+    (None for anonymous documents) best matching query
+    """
+    backend = get_search_backend()
+    index_stale_documents(author_id, settings.SEARCH['STALE_BATCH'])
+    with connection.cursor() as cursor:
+        matches = backend.search(cursor, query, author_id, limit)
+    return [(document_id, rank, render_snippet(snippet)) for document_id, rank, snippet in matches]
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from api.utils.cache import get_result_cache
+from api.utils.grammar import find_issues_in_texts, grammar_version
+from api.utils.incremental import split_paragraphs
+from api.utils.llm import get_llm_gateway
+from api.utils.nlp import get_nlp
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def analyze_paragraph(body):
+    nlp = get_nlp('grammar')
+    cache = get_result_cache('grammar-paragraph', grammar_version(nlp))
+    return cache.get_or_compute(body, lambda: next(find_issues_in_texts(nlp, [body])))
+
+
+async def _stream_grammar(text, queue):
+    offset = 0
+    for paragraph in split_paragraphs(text):
+        body = paragraph.rstrip('\n')
+        if body.strip():
+            # Parsing is CPU bound, keep it off the event loop
+            findings = await sync_to_async(analyze_paragraph, thread_sensitive=False)(body)
+            for finding in findings:
+                await queue.put(('grammar', dict(finding, start=finding['start'] + offset, end=finding['end'] + offset)))
+        offset += len(paragraph)
+
+
+async def _stream_llm(text, queue, messages, mock_suggestions):
+    if not settings.OPENAI_API_KEY:
+        for suggestion in await mock_suggestions(text):
+            await queue.put(('suggestion', suggestion))
+        return
+
+    parts = []
+    async for chunk in get_llm_gateway().stream(messages, temperature=0.7, max_tokens=150):
+        parts.append(chunk)
+        await queue.put(('token', {'content': chunk}))
+    await queue.put(('suggestion', {
+        'type': 'content',
+        'suggestion': ''.join(parts),
+        'confidence': 0.9
+    }))
+
+
+async def _run(producer, queue, source):
+    try:
+        await producer
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning('Streaming %s failed: %s', source, e)
+        await queue.put(('error', {'source': source, 'error': str(e)}))
+    finally:
+        await queue.put((_DONE, None))
+
+
+async def stream_suggestions(text, messages, mock_suggestions):
+    """
+    Yield (event, data) pairs for text as they are produced.
+
+    Grammar findings (``grammar``) are emitted paragraph by paragraph while the
+    LLM completion streams in as ``token`` chunks, followed by the assembled
+    ``suggestion``. Without an API key the suggestions the mock_suggestions
+    coroutine function returns are sent instead.
+    The stream always ends with a ``done`` event.
+    """
+    queue = asyncio.Queue()
+    tasks = [
+        asyncio.ensure_future(_run(_stream_grammar(text, queue), queue, 'grammar')),
+        asyncio.ensure_future(_run(_stream_llm(text, queue, messages, mock_suggestions), queue, 'llm')),
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event, data = await queue.get()
+            if event is _DONE:
+                remaining -= 1
+                continue
+            yield event, data
+        yield 'done', {}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def format_sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
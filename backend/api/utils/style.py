@@ -0,0 +1,309 @@
+"""
+Readability and style metrics of plain text.
+
+The text is tokenized once with regular expressions into NumPy arrays of
+per-word features (vocabulary id, syllables, sentence, paragraph and
+a few word classes); every metric is then a vectorized reduction over them, per
+document and per paragraph at once. Nothing goes through spaCy, so a whole
+book is scored in a fraction of a second.
+
+Adverbs and passives are heuristics over the word list: words ending in -ly
+and a few common adverbs, and a form of "be" followed, at most one adverb
+later, by a word ending in -ed or an irregular past participle.
+"""
+import re
+
+import numpy as np
+
+from api.utils.cache import get_result_cache
+
+STYLE_METRICS_VERSION = '1'
+
+# Words per window for the moving-average type-token ratio
+MATTR_WINDOW = 50
+# A content word used again within this many words counts as a close repetition
+REPEAT_WINDOW = 50
+# How many of the most used content words to report
+TOP_WORDS = 10
+# Lower bounds of the sentence-length buckets, in words
+SENTENCE_LENGTH_BINS = (1, 11, 21, 31, 41)
+
+_WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+# Sentence ends, and line breaks, which end the paragraph and its sentence
+_BREAK = re.compile(r'([.!?]+(?=[\s"\'”’)\]]|$)|\n)')
+_NEWLINE = re.compile(r'\n')
+_VOWEL_GROUPS = re.compile(r'[aeiouy]+')
+
+_BE_FORMS = frozenset((
+    'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    "isn't", "aren't", "wasn't", "weren't", 'isn’t', 'aren’t', 'wasn’t', 'weren’t',
+))
+_IRREGULAR_PARTICIPLES = frozenset((
+    'arisen', 'awoken', 'beaten', 'become', 'begun', 'bent', 'bitten', 'blown', 'bought', 'bound', 'broken',
+    'brought', 'built', 'burnt', 'caught', 'chosen', 'come', 'cut', 'dealt', 'done', 'drawn', 'driven',
+    'dug', 'eaten', 'fallen', 'fed', 'felt', 'fought', 'found', 'flown', 'forbidden', 'forgiven',
+    'forgotten', 'frozen', 'given', 'gone', 'grown', 'heard', 'held', 'hidden', 'hit', 'hung', 'hurt',
+    'kept', 'known', 'laid', 'led', 'left', 'lent', 'lost', 'made', 'meant', 'met', 'paid', 'put',
+    'read', 'ridden', 'risen', 'run', 'said', 'seen', 'sent', 'set', 'shaken', 'shot', 'shown', 'shut',
+    'sold', 'sought', 'spent', 'split', 'spoken', 'spread', 'stolen', 'struck', 'stuck', 'sung', 'sunk',
+    'swept', 'sworn', 'taken', 'taught', 'thought', 'thrown', 'told', 'torn', 'understood', 'upset',
+    'woken', 'won', 'worn', 'written', 'wound',
+))
+_ADVERBS = frozenset((
+    'almost', 'already', 'also', 'always', 'never', 'not', 'often', 'perhaps', 'quite', 'rather',
+    'seldom', 'sometimes', 'soon', 'still', 'too', 'very',
+))
+# Words ending in -ly that are not adverbs
+_NOT_ADVERBS = frozenset((
+    'ally', 'anomaly', 'apply', 'assembly', 'belly', 'bully', 'butterfly', 'comply', 'costly', 'curly',
+    'daily', 'deadly', 'early', 'elderly', 'family', 'fly', 'friendly', 'holy', 'homely', 'italy',
+    'jelly', 'july', 'likely', 'lily', 'lively', 'lonely', 'lovely', 'melancholy', 'monopoly', 'only',
+    'rally', 'reply', 'silly', 'sly', 'supply', 'ugly', 'weekly', 'monthly', 'yearly', 'ply',
+))
+# Function words, left out of repetition
+STOPWORDS = frozenset((
+    'a', 'about', 'after', 'all', 'an', 'and', 'any', 'as', 'at', 'because', 'before', 'but', 'by',
+    'can', 'could', 'did', 'do', 'does', 'for', 'from', 'had', 'has', 'have', 'he', 'her', 'here',
+    'him', 'his', 'how', 'i', 'if', 'in', 'into', 'it', 'its', 'just', 'me', 'more', 'my', 'no', 'nor',
+    'of', 'on', 'one', 'or', 'our', 'out', 'over', 'said', 'she', 'so', 'some', 'than', 'that', 'the',
+    'their', 'them', 'then', 'there', 'these', 'they', 'this', 'those', 'to', 'up', 'us', 'we', 'what',
+    'when', 'where', 'which', 'while', 'who', 'will', 'with', 'would', 'you', 'your',
+)) | _BE_FORMS | _ADVERBS
+
+
+def count_syllables(word):
+    """
+    Estimate the syllables of a lowercase word from its vowel groups
+    """
+    count = len(_VOWEL_GROUPS.findall(word))
+    if count > 1:
+        if word.endswith('e') and not word.endswith(('le', 'ee', 'ye')):
+            count -= 1
+        elif word.endswith('ed') and not word.endswith(('ted', 'ded')):
+            count -= 1
+        elif word.endswith('es') and not word.endswith(('ses', 'zes', 'ces', 'ges', 'xes', 'ches', 'shes')):
+            count -= 1
+    return max(count, 1)
+
+
+def is_adverb(word):
+    return word in _ADVERBS or (len(word) > 3 and word.endswith('ly') and word not in _NOT_ADVERBS)
+
+
+def is_participle(word):
+    return (len(word) > 3 and word.endswith('ed')) or word in _IRREGULAR_PARTICIPLES
+
+
+class Features:
+    """
+    Per-word features of a text, as parallel arrays in text order
+    """
+
+    def __init__(self, text):
+        # Split at sentence ends and line breaks, keeping the break after each piece
+        pieces = _BREAK.split(text.lower())
+        words, counts, paragraphs = [], [], []
+        paragraph = 0
+        for index in range(0, len(pieces), 2):
+            found = _WORD.findall(pieces[index])
+            words.extend(found)
+            counts.append(len(found))
+            paragraphs.append(paragraph)
+            if index + 1 < len(pieces) and pieces[index + 1] == '\n':
+                paragraph += 1
+
+        vocabulary, self.ids = np.unique(np.array(words, dtype=str), return_inverse=True)
+        self.vocabulary = vocabulary.tolist()
+        # Pieces with no words make no sentence, so number the sentences from 0
+        counts = np.array(counts, dtype=np.int64)
+        self.sentences = np.repeat(np.arange(np.count_nonzero(counts)), counts[counts > 0])
+        self.paragraphs = np.repeat(np.array(paragraphs, dtype=np.int64), counts)
+        newlines = np.array([match.start() for match in _NEWLINE.finditer(text)], dtype=np.int64)
+        self.paragraph_bounds = np.concatenate(([-1], newlines, [len(text)]))
+
+        # Word classes are worked out once per distinct word
+        self.syllables = np.array([count_syllables(word) for word in self.vocabulary], dtype=np.int64)[self.ids]
+        self.adverb = np.array([is_adverb(word) for word in self.vocabulary], dtype=bool)[self.ids]
+        self.be = np.array([word in _BE_FORMS for word in self.vocabulary], dtype=bool)[self.ids]
+        self.participle = np.array([is_participle(word) for word in self.vocabulary], dtype=bool)[self.ids]
+        self.content = np.array(
+            [len(word) > 2 and word not in STOPWORDS for word in self.vocabulary], dtype=bool
+        )[self.ids]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def previous_use(self):
+        """
+        Index of the previous use of each word, or -1
+        """
+        order = np.lexsort((np.arange(len(self)), self.ids))
+        previous = np.full(len(self), -1, dtype=np.int64)
+        repeated = self.ids[order[1:]] == self.ids[order[:-1]]
+        previous[order[1:][repeated]] = order[:-1][repeated]
+        return previous
+
+    def passive_sentences(self):
+        """
+        Flag each sentence containing a passive construction
+        """
+        same = self.sentences[1:] == self.sentences[:-1]
+        passive = np.zeros(len(self), dtype=bool)
+        passive[:-1] = self.be[:-1] & self.participle[1:] & same
+        passive[:-2] |= self.be[:-2] & self.adverb[1:-1] & self.participle[2:] & same[:-1] & same[1:]
+        flags = np.zeros(self.sentences[-1] + 1 if len(self) else 0, dtype=bool)
+        flags[self.sentences[passive]] = True
+        return flags
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+def _readability(words, sentences, syllables, complex_words):
+    """
+    Flesch reading ease, Flesch-Kincaid grade and Gunning fog index, elementwise
+    """
+    words_per_sentence = _ratio(words, sentences)
+    syllables_per_word = _ratio(syllables, words)
+    return {
+        'flesch_reading_ease': 206.835 - 1.015 * words_per_sentence - 84.6 * syllables_per_word,
+        'flesch_kincaid_grade': 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59,
+        'gunning_fog': 0.4 * (words_per_sentence + 100 * _ratio(complex_words, words)),
+    }
+
+
+def _value(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 2)
+
+
+def _values(values):
+    return [None if np.isnan(value) else value for value in np.round(values, 2).tolist()]
+
+
+def moving_type_token_ratio(features, previous, window=MATTR_WINDOW):
+    """
+    Mean type-token ratio over every window of the given number of words.
+
+    A word is new to each window that starts after its previous use and
+    includes it, so the distinct words of all windows add up without
+    sliding over them.
+    """
+    count = len(features)
+    if count <= window:
+        return _ratio(len(set(features.ids.tolist())), count)
+    positions = np.arange(count)
+    first_window = np.maximum(previous + 1, positions - window + 1)
+    last_window = np.minimum(positions, count - window)
+    distinct = np.clip(last_window - first_window + 1, 0, None).sum()
+    return distinct / ((count - window + 1) * window)
+
+
+def score_text(text):
+    """
+    Compute the style metrics of text, for the whole and per paragraph
+    """
+    features = Features(text)
+    previous = features.previous_use()
+    count = len(features)
+    paragraph_count = len(features.paragraph_bounds) - 1
+
+    sentence_lengths = np.bincount(features.sentences) if count else np.zeros(0, dtype=np.int64)
+    first_words = np.flatnonzero(np.diff(features.sentences, prepend=-1)) if count else np.zeros(0, dtype=np.int64)
+    sentence_paragraphs = features.paragraphs[first_words]
+    passive = features.passive_sentences()
+    complex_words = features.syllables >= 3
+    close_repetitions = features.content & (previous >= 0) & (np.arange(count) - previous <= REPEAT_WINDOW)
+
+    def per_paragraph(values, index=features.paragraphs):
+        return np.bincount(index, weights=values, minlength=paragraph_count)
+
+    # Distinct words per paragraph, from the distinct (paragraph, word) pairs
+    pairs = np.unique(features.paragraphs * max(len(features.vocabulary), 1) + features.ids)
+    paragraph_types = np.bincount(pairs // max(len(features.vocabulary), 1), minlength=paragraph_count)
+    longest = np.zeros(paragraph_count, dtype=np.int64)
+    np.maximum.at(longest, sentence_paragraphs, sentence_lengths)
+
+    paragraph_words = per_paragraph(np.ones(count))
+    paragraph_sentences = np.bincount(sentence_paragraphs, minlength=paragraph_count)
+    paragraph_scores = {
+        **_readability(
+            paragraph_words, paragraph_sentences, per_paragraph(features.syllables), per_paragraph(complex_words)
+        ),
+        'average_sentence_length': _ratio(paragraph_words, paragraph_sentences),
+        'type_token_ratio': _ratio(paragraph_types, paragraph_words),
+        'adverb_density': _ratio(per_paragraph(features.adverb), paragraph_words),
+        'passive_density': _ratio(per_paragraph(passive, sentence_paragraphs), paragraph_sentences),
+    }
+    paragraph_repetitions = per_paragraph(close_repetitions)
+
+    # Built column by column, as converting each value on its own costs more than computing them
+    filled = np.flatnonzero(paragraph_words)
+    columns = {
+        'index': filled,
+        'start': features.paragraph_bounds[filled] + 1,
+        'end': features.paragraph_bounds[filled + 1],
+        'words': paragraph_words[filled].astype(np.int64),
+        'sentences': paragraph_sentences[filled],
+        'longest_sentence': longest[filled],
+        **{name: _values(values[filled]) for name, values in paragraph_scores.items()},
+        'close_repetitions': paragraph_repetitions[filled].astype(np.int64),
+    }
+    columns = {name: values if isinstance(values, list) else values.tolist() for name, values in columns.items()}
+    paragraphs = [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    sentence_count = len(sentence_lengths)
+    scores = _readability(count, sentence_count, features.syllables.sum(), complex_words.sum())
+    buckets = np.bincount(
+        np.searchsorted(SENTENCE_LENGTH_BINS, sentence_lengths, side='right') - 1, minlength=len(SENTENCE_LENGTH_BINS)
+    )
+    labels = [
+        f'{low}-{high - 1}' for low, high in zip(SENTENCE_LENGTH_BINS, SENTENCE_LENGTH_BINS[1:])
+    ] + [f'{SENTENCE_LENGTH_BINS[-1]}+']
+    uses = np.bincount(features.ids[features.content], minlength=len(features.vocabulary))
+    top = np.argsort(-uses, kind='stable')[:TOP_WORDS]
+
+    document = {
+        'words': count,
+        'sentences': sentence_count,
+        'paragraphs': len(paragraphs),
+        'syllables': int(features.syllables.sum()),
+        **{name: _value(value) for name, value in scores.items()},
+        'sentence_length': {
+            'mean': _value(sentence_lengths.mean()) if sentence_count else None,
+            'median': _value(np.median(sentence_lengths)) if sentence_count else None,
+            'std': _value(sentence_lengths.std()) if sentence_count else None,
+            'p90': _value(np.percentile(sentence_lengths, 90)) if sentence_count else None,
+            'max': int(sentence_lengths.max()) if sentence_count else 0,
+            'distribution': dict(zip(labels, buckets.tolist())),
+        },
+        'lexical_diversity': {
+            'type_token_ratio': _value(_ratio(len(features.vocabulary), count)),
+            'moving_type_token_ratio': _value(moving_type_token_ratio(features, previous)),
+        },
+        'adverb_density': _value(_ratio(features.adverb.sum(), count)),
+        'passive_density': _value(_ratio(passive.sum(), sentence_count)),
+        'repetition': {
+            'close_repetitions': int(close_repetitions.sum()),
+            'top_words': [
+                {
+                    'word': features.vocabulary[word],
+                    'count': int(uses[word]),
+                    'per_thousand': _value(uses[word] * 1000 / count),
+                }
+                for word in top if uses[word] > 1
+            ],
+        },
+    }
+    return {'document': document, 'paragraphs': paragraphs}
+
+
+def get_document_style(document):
+    """
+    Return the style metrics of a document, cached by its content hash, so
+    unchanged documents are not even read
+    """
+    cache = get_result_cache('style', STYLE_METRICS_VERSION)
+    return cache.get_or_compute(document.content_hash or document.get_text(), lambda: score_text(document.get_text()))
@@ -0,0 +1,239 @@
+"""
+Compact WordNet lookup for word analysis.
+
+Word analysis only ever shows the first three senses of a word, so instead of
+keeping NLTK's WordNet reader (and its lazily loaded corpus) around, the index
+stores for every lemma form the first three synsets per part of speech, the
+text of those synsets, and WordNet's exception lists. Lookups reproduce
+``wordnet.synsets(word)[:3]``, including its morphological rules.
+
+The index is a single binary blob: a JSON header followed by two sections of
+records (forms sorted by their UTF-8 bytes, then synsets), each with a table
+of uint32 record offsets, so it can be searched in place. ``download_nltk.py``
+writes it to ``WORDNET_INDEX['PATH']``, where it is memory-mapped; without the
+file it is built from the NLTK corpus in memory on first use.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WNIDX1\n'
+# Parts of speech in the order wordnet.synsets() goes through them
+POS_LIST = ('n', 'v', 'a', 'r')
+# Copied from WordNetCorpusReader.MORPHOLOGICAL_SUBSTITUTIONS
+MORPHOLOGICAL_SUBSTITUTIONS = {
+    'n': [('s', ''), ('ses', 's'), ('ves', 'f'), ('xes', 'x'), ('zes', 'z'), ('ches', 'ch'), ('shes', 'sh'),
+          ('men', 'man'), ('ies', 'y')],
+    'v': [('s', ''), ('ies', 'y'), ('es', 'e'), ('es', ''), ('ed', 'e'), ('ed', ''), ('ing', 'e'), ('ing', '')],
+    'a': [('er', ''), ('est', ''), ('er', 'e'), ('est', 'e')],
+    'r': [],
+}
+SENSES = 3
+EXAMPLES = 3
+
+_offset = struct.Struct('<I')
+
+
+def pack_section(records):
+    """
+    Return (table, data) bytes for a list of encoded records
+    """
+    table = bytearray()
+    data = bytearray()
+    for record in records:
+        table += _offset.pack(len(data))
+        data += record
+    table += _offset.pack(len(data))
+    return bytes(table), bytes(data)
+
+
+def build_index(reader=None):
+    """
+    Build the index blob from an NLTK WordNet corpus reader (by default nltk.corpus.wordnet)
+    """
+    if reader is None:
+        from nltk.corpus import wordnet as reader
+
+    synset_ids = {}
+    synsets = []
+
+    def synset_id(pos, offset):
+        synset = reader.synset_from_pos_and_offset(pos, offset)
+        name = synset.name()
+        if name not in synset_ids:
+            synset_ids[name] = len(synsets)
+            synsets.append(json.dumps(
+                [name, synset.definition(), synset.examples()[:EXAMPLES]], ensure_ascii=False
+            ).encode('utf-8'))
+        return synset_ids[name]
+
+    forms = []
+    for form, offsets_by_pos in reader._lemma_pos_offset_map.items():
+        senses = []
+        for pos in POS_LIST:
+            offsets = offsets_by_pos.get(pos)
+            if offsets:
+                ids = ','.join(str(synset_id(pos, offset)) for offset in offsets[:SENSES])
+                senses.append(f'{pos}{ids}')
+        if senses:
+            forms.append(f'{form}\t{";".join(senses)}'.encode('utf-8'))
+    forms.sort(key=lambda record: record.split(b'\t', 1)[0])
+
+    exceptions = {pos: reader._exception_map[pos] for pos in POS_LIST}
+    form_table, form_data = pack_section(forms)
+    synset_table, synset_data = pack_section(synsets)
+
+    sections = [form_table, form_data, synset_table, synset_data]
+    # Section offsets count from the end of the header
+    starts = []
+    position = 0
+    for section in sections:
+        starts.append(position)
+        position += len(section)
+    header = {'exceptions': exceptions, 'forms': len(forms), 'synsets': len(synsets), 'sections': starts}
+    encoded = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return b''.join([MAGIC, _offset.pack(len(encoded)), encoded, *sections])
+
+
+def write_index(path, reader=None):
+    data = build_index(reader)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+    return len(data)
+
+
+class WordNetIndex:
+    """
+    Read-only lookups over an index blob (bytes or a memory map)
+    """
+
+    def __init__(self, buffer):
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a WordNet index')
+        self.buffer = buffer
+        length, = _offset.unpack_from(buffer, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(buffer[start:start + length]).decode('utf-8'))
+        self.exceptions = header['exceptions']
+        self.form_count = header['forms']
+        self.synset_count = header['synsets']
+        base = start + length
+        self.form_table, self.form_data, self.synset_table, self.synset_data = (
+            base + offset for offset in header['sections']
+        )
+
+    @classmethod
+    def open(cls, path, use_mmap=True):
+        with open(path, 'rb') as f:
+            if use_mmap:
+                return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            return cls(f.read())
+
+    def record(self, table, data, index):
+        start, end = struct.unpack_from('<II', self.buffer, table + 4 * index)
+        return self.buffer[data + start:data + end]
+
+    def senses(self, form):
+        """
+        Return {pos: [synset ids]} stored for a lemma form, or None if WordNet does not have it
+        """
+        key = form.encode('utf-8')
+        low, high = 0, self.form_count
+        while low < high:
+            middle = (low + high) // 2
+            record = self.record(self.form_table, self.form_data, middle)
+            name, _, senses = bytes(record).partition(b'\t')
+            if name == key:
+                return {
+                    item[:1]: [int(value) for value in item[1:].split(',')]
+                    for item in senses.decode('ascii').split(';')
+                }
+            if name < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def synset(self, synset_id):
+        """
+        Return (name, definition, examples) of a synset
+        """
+        return json.loads(bytes(self.record(self.synset_table, self.synset_data, synset_id)).decode('utf-8'))
+
+    def morphy(self, form, pos, senses):
+        """
+        Return the forms of form with pos in WordNet, like WordNetCorpusReader._morphy
+        """
+        exceptions = self.exceptions[pos]
+        if form in exceptions:
+            candidates = exceptions[form]
+        else:
+            candidates = [
+                form[:-len(old)] + new for old, new in MORPHOLOGICAL_SUBSTITUTIONS[pos] if form.endswith(old)
+            ]
+        result = []
+        for candidate in [form] + candidates:
+            if candidate not in senses:
+                senses[candidate] = self.senses(candidate)
+            if senses[candidate] and pos in senses[candidate] and candidate not in result:
+                result.append(candidate)
+        return result
+
+    def lookup(self, word, limit=SENSES):
+        """
+        Return (name, definition, examples) of the first senses of word, as wordnet.synsets(word)[:limit] would
+        """
+        word = word.lower()
+        senses = {}
+        ids = []
+        for pos in POS_LIST:
+            for form in self.morphy(word, pos, senses):
+                ids.extend(senses[form][pos])
+                if len(ids) >= limit:
+                    return [self.synset(synset_id) for synset_id in ids[:limit]]
+        return [self.synset(synset_id) for synset_id in ids]
+
+    def analyze(self, word):
+        """
+        Return the word analysis suggestions for word
+        """
+        return [
+            {
+                'type': 'word-analysis',
+                'suggestion': definition,
+                'context': name,
+                'examples': examples,
+                'confidence': 0.8
+            }
+            for name, definition, examples in self.lookup(word)
+        ]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_wordnet_index():
+    """
+    Return the process-wide WordNet index, opening (or building) it on first use
+    """
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                config = settings.WORDNET_INDEX
+                if config['PATH'] and os.path.exists(config['PATH']):
+                    _index = WordNetIndex.open(config['PATH'], use_mmap=config['MMAP'])
+                else:
+                    logger.info('No WordNet index at %s, building it from the NLTK corpus', config['PATH'])
+                    _index = WordNetIndex(build_index())
+    return _index
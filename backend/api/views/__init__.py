@@ -1,12 +1,18 @@
 from .document import DocumentViewSet
 from .user import UserViewSet
-from .ai_views import AISuggestionsView, WordAnalysisView, GrammarCheckView, TestView
+from .metrics import MetricsView
+from .ai_views import AISuggestionsView, AISuggestionsStreamView, WordAnalysisView, WordAnalysisBatchView, GrammarCheckView, BatchGrammarCheckView, IncrementalGrammarCheckView, TestView
 
 __all__ = [
     'DocumentViewSet',
     'UserViewSet',
     'AISuggestionsView',
+    'AISuggestionsStreamView',
     'WordAnalysisView',
+    'WordAnalysisBatchView',
     'GrammarCheckView',
-    'TestView'
+    'BatchGrammarCheckView',
+    'IncrementalGrammarCheckView',
+    'TestView',
+    'MetricsView'
 ]
\ No newline at end of file
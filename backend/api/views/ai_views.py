@@ -2,14 +2,36 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-import spacy
-from nltk.corpus import wordnet
-from openai import OpenAI
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.http import StreamingHttpResponse
+from api.models import AIFeedback, Document
+from api.utils.cache import get_result_cache, normalize_text
+from api.utils.delta import DeltaError
+from api.utils.grammar import (
+    GRAMMAR_FEEDBACK_TYPES, check_surface, check_text, check_texts, grammar_version, with_feedback
+)
+from api.utils.incremental import StaleRevisionError, find_text_issues, get_incremental_analyzer
+from api.utils.llm import get_llm_gateway
+from api.utils.nlp import get_nlp
+from api.utils.streaming import format_sse, stream_suggestions
+from api.utils.wordnet import get_wordnet_index
+from api.views.mixins import ProfilingMixin
 import json
+import logging
+import random
+import re
 
-# Initialize spaCy
-nlp = spacy.load("en_core_web_sm")
+logger = logging.getLogger(__name__)
+
+def get_visible_documents(request):
+    """
+    Return the documents the caller may read, mirroring DocumentViewSet.get_queryset
+    """
+    if request.user.is_authenticated:
+        return Document.objects.filter(author=request.user)
+    return Document.objects.filter(author__isnull=True)
 
 class TestView(APIView):
     permission_classes = [AllowAny]
@@ -17,21 +39,20 @@ class TestView(APIView):
     def get(self, request):
         return Response({"message": "API is working!"})
 
-class AISuggestionsView(APIView):
+class AISuggestionsView(ProfilingMixin, AsyncAPIView):
+    """
+    Content suggestions from the LLM. Async so that under ASGI a pending
+    completion does not hold a worker thread.
+    """
     permission_classes = [AllowAny]
+    analyzer_version = '1'
+    system_prompt = "You are a helpful writing assistant. Analyze the text and provide suggestions for improvement in terms of style, clarity, and engagement."
     
     def get_mock_suggestions(self, text):
         """Generate mock suggestions for development/testing"""
-        suggestions = []
-        
-        # Grammar checks
-        if not text.strip().endswith(('.', '!', '?')):
-            suggestions.append({
-                'type': 'grammar',
-                'suggestion': 'Add proper punctuation at the end of your sentence.',
-                'confidence': 0.9
-            })
-        
+        # Grammar checks: the grammar rules that need no parse (punctuation, capitals, length, terms)
+        suggestions = check_surface(get_nlp('grammar'), text)
+
         if text.lower().startswith('grammer'):
             suggestions.append({
                 'type': 'grammar',
@@ -63,7 +84,13 @@ class AISuggestionsView(APIView):
 
         return suggestions
 
-    def post(self, request):
+    async def mock_suggestions(self, text):
+        """
+        get_mock_suggestions in a worker thread, so tokenizing the text does not block the event loop
+        """
+        return await sync_to_async(self.get_mock_suggestions, thread_sensitive=False)(text)
+
+    async def post(self, request):
         text = request.data.get('text')
         if not text:
             return Response(
@@ -75,16 +102,23 @@ class AISuggestionsView(APIView):
             # Check if we're in development mode or OpenAI API is not configured
             if not hasattr(settings, 'OPENAI_API_KEY') or not settings.OPENAI_API_KEY:
                 # Return mock suggestions
-                suggestions = self.get_mock_suggestions(text)
+                suggestions = await self.mock_suggestions(text)
+                return Response(suggestions)
+
+            # Identical paragraphs are answered from the cache instead of a new completion
+            gateway = get_llm_gateway()
+            text = normalize_text(text)
+            cache = get_result_cache('suggestions', f'{gateway.model}:{self.analyzer_version}')
+            cache_key = cache.key(text)
+            suggestions = cache.get(cache_key)
+            if suggestions is not None:
                 return Response(suggestions)
 
             # If OpenAI API is configured, try using it
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
             try:
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful writing assistant. Analyze the text and provide suggestions for improvement in terms of style, clarity, and engagement."},
+                content = await gateway.complete(
+                    [
+                        {"role": "system", "content": self.system_prompt},
                         {"role": "user", "content": text}
                     ],
                     temperature=0.7,
@@ -92,152 +126,355 @@ class AISuggestionsView(APIView):
                 )
                 
                 suggestions = []
-                if response.choices:
+                if content is not None:
                     suggestions.append({
                         'type': 'content',
-                        'suggestion': response.choices[0].message.content,
+                        'suggestion': content,
                         'confidence': 0.9
                     })
+                cache.set(cache_key, suggestions)
                 return Response(suggestions)
                 
             except Exception as api_error:
-                print(f"OpenAI API Error: {str(api_error)}")
+                logger.warning('OpenAI API error, falling back to mock suggestions: %s', api_error)
                 # Fallback to mock suggestions if API fails
-                suggestions = self.get_mock_suggestions(text)
+                suggestions = await self.mock_suggestions(text)
                 return Response(suggestions)
             
-        except Exception as e:
-            print(f"General Error: {str(e)}")
+        except Exception:
+            logger.exception('Could not produce suggestions')
             return Response(
                 {'error': 'Error processing your request. Please try again later.'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class WordAnalysisView(APIView):
+class AISuggestionsStreamView(AISuggestionsView):
+    """
+    Stream suggestions as server-sent events: grammar findings as each
+    paragraph is checked, LLM output token by token, then a ``done`` event.
+    """
+
+    def get_messages(self, text):
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": text}
+        ]
+
+    async def post(self, request):
+        text = request.data.get('text')
+        if not text:
+            return Response(
+                {'error': 'Text is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        async def events():
+            async for event, data in stream_suggestions(text, self.get_messages(text), self.mock_suggestions):
+                yield format_sse(event, data)
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class WordAnalysisView(ProfilingMixin, APIView):
+    """
+    WordNet senses of a word (the first three), from the preloaded index
+    """
     permission_classes = [AllowAny]
-    
+
     def get(self, request, word):
         try:
-            # Get WordNet analysis
-            synsets = wordnet.synsets(word)
-            
-            if not synsets:
-                return Response([])
-            
-            analysis = []
-            for synset in synsets[:3]:  # Limit to top 3 meanings
-                examples = synset.examples()[:3] if synset.examples() else []
-                
-                analysis.append({
-                    'type': 'word-analysis',
-                    'suggestion': synset.definition(),
-                    'context': synset.name(),
-                    'examples': examples,
-                    'confidence': 0.8
-                })
-            
-            return Response(analysis)
+            word = normalize_text(word).lower()
+            return Response(get_wordnet_index().analyze(word))
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class GrammarCheckView(APIView):
+class WordAnalysisBatchView(ProfilingMixin, APIView):
+    """
+    WordNet senses of every distinct word of a passage (``text``) or of a list
+    of ``words``, so hover definitions for a whole page take one request.
+
+    Returns ``{"words": {word: analysis}}`` keyed by the lowercased word.
+    """
     permission_classes = [AllowAny]
-    
+    word_pattern = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*")
+
     def post(self, request):
         text = request.data.get('text')
-        if not text:
+        words = request.data.get('words')
+        if text is not None:
+            if not isinstance(text, str):
+                return Response({'error': 'text must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+            words = self.word_pattern.findall(normalize_text(text))
+        elif not isinstance(words, list) or not all(isinstance(word, str) for word in words):
             return Response(
-                {'error': 'Text is required'}, 
+                {'error': 'Either text or a list of words is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        distinct = list(dict.fromkeys(normalize_text(word).lower() for word in words if word.strip()))
+        if len(distinct) > settings.WORD_ANALYSIS_BATCH_MAX_WORDS:
+            return Response(
+                {'error': f'At most {settings.WORD_ANALYSIS_BATCH_MAX_WORDS} distinct words can be analyzed per request'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         try:
-            doc = nlp(text)
-            suggestions = []
-            
-            sentences = list(doc.sents)
-            for sent in sentences:
-                # Check sentence length
-                if len(sent) > 40:
-                    suggestions.append({
-                        'type': 'grammar',
-                        'suggestion': f'Consider breaking this long sentence into smaller ones: "{sent}"',
-                        'confidence': 0.7
-                    })
-                
-                # Get tokens list for the sentence
-                sent_tokens = [token for token in sent]
-                
-                # Check for capitalization at the start of sentence
-                if sent_tokens and not sent_tokens[0].text[0].isupper():
-                    suggestions.append({
-                        'type': 'grammar',
-                        'suggestion': f'Sentence should start with a capital letter: "{sent}"',
-                        'confidence': 0.9
-                    })
+            index = get_wordnet_index()
+            return Response({'words': {word: index.analyze(word) for word in distinct}})
+        except Exception as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
-                # Check for ending punctuation
-                if sent_tokens and sent_tokens[-1].text not in ['.', '!', '?']:
-                    suggestions.append({
-                        'type': 'grammar',
-                        'suggestion': f'Sentence should end with proper punctuation: "{sent}"',
-                        'confidence': 0.9
-                    })
-                
-                # Check for passive voice
-                has_passive = any(token.dep_ == "auxpass" for token in sent)
-                if has_passive:
-                    suggestions.append({
-                        'type': 'grammar',
-                        'suggestion': f'Consider using active voice instead of passive voice in: "{sent}"',
-                        'confidence': 0.8
-                    })
+class GrammarCheckView(ProfilingMixin, APIView):
+    """
+    Grammar check a text, or a stored document given ``document_id``.
 
-                # Check for subject-verb agreement
-                subjects = [token for token in sent if token.dep_ in ('nsubj', 'nsubjpass')]
-                verbs = [token for token in sent if token.pos_ == 'VERB']
-                
-                for subject in subjects:
-                    for verb in verbs:
-                        # Basic subject-verb agreement check
-                        if subject.text.lower() in ['it', 'he', 'she'] and verb.text in ['are', 'were']:
-                            suggestions.append({
-                                'type': 'grammar',
-                                'suggestion': f'Check subject-verb agreement in: "{sent}"',
-                                'confidence': 0.8
-                            })
-
-                # Check for common tech writing style
-                tech_terms = [token.text.lower() for token in sent]
-                if 'js' in tech_terms:
-                    suggestions.append({
-                        'type': 'style',
-                        'suggestion': f'Consider using "JavaScript" instead of "js" for better clarity: "{sent}"',
-                        'confidence': 0.7
-                    })
+    A document's findings come back with ``start``/``end`` offsets into its
+    text and replace the grammar feedback stored for it.
+    """
+    permission_classes = [AllowAny]
 
-                # Check for incomplete sentences
-                if len(sent_tokens) < 3:
-                    suggestions.append({
-                        'type': 'grammar',
-                        'suggestion': f'This might be an incomplete sentence: "{sent}"',
-                        'confidence': 0.7
-                    })
+    def check_document(self, request, document_id):
+        try:
+            document = get_visible_documents(request).filter(pk=document_id).first()
+        except (TypeError, ValueError):
+            document = None
+        if document is None:
+            return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
 
-            # If no issues found, provide a positive feedback
-            if not suggestions:
-                suggestions.append({
-                    'type': 'feedback',
-                    'suggestion': 'The text appears to be grammatically correct, but you might want to expand it for better context.',
-                    'confidence': 0.6
-                })
-            
+        try:
+            findings = find_text_issues(get_nlp('grammar'), document.get_text())
+            AIFeedback.replace_findings(document, findings, GRAMMAR_FEEDBACK_TYPES)
+            return Response(findings)
+        except Exception as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    def post(self, request):
+        document_id = request.data.get('document_id')
+        if document_id is not None:
+            return self.check_document(request, document_id)
+
+        text = request.data.get('text')
+        if not text:
+            return Response(
+                {'error': 'Text is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            text = normalize_text(text)
+            cache = get_result_cache('grammar', grammar_version(get_nlp('grammar')))
+            if len(text) > settings.DOCUMENT_ANALYSIS['CHUNK_CHARS']:
+                # Too long to parse as one doc: analyze it paragraph by paragraph like a document
+                suggestions = cache.get_or_compute(
+                    text, lambda: with_feedback(find_text_issues(get_nlp('grammar'), text))
+                )
+            else:
+                suggestions = cache.get_or_compute(text, lambda: check_text(get_nlp('grammar'), text))
             return Response(suggestions)
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+class BatchGrammarCheckView(ProfilingMixin, APIView):
+    """
+    Grammar check many texts (or documents) in one request.
+
+    Texts are parsed with ``nlp.pipe`` and the results are streamed back as
+    newline-delimited JSON, one line per input, in input order.
+    """
+    permission_classes = [AllowAny]
+
+    def get_documents(self, request, document_ids):
+        """
+        Return the requested documents the caller is allowed to read, keyed by id
+        """
+        queryset = get_visible_documents(request).filter(pk__in=document_ids)
+        return {document.pk: document for document in queryset}
+
+    def get_int_param(self, request, name, default, maximum):
+        value = request.data.get(name, default)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} must be an integer')
+        if value < 1:
+            raise ValueError(f'{name} must be at least 1')
+        return min(value, maximum)
+
+    def render_line(self, index, suggestions=None, error=None):
+        line = {'index': index}
+        if error is not None:
+            line['error'] = error
+        else:
+            line['suggestions'] = suggestions
+        return json.dumps(line) + '\n'
+
+    def post(self, request):
+        texts = request.data.get('texts')
+        document_ids = request.data.get('document_ids')
+
+        if texts is None and document_ids is None:
+            return Response(
+                {'error': 'Either texts or document_ids is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        items = texts if texts is not None else document_ids
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'texts and document_ids must be non-empty lists'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(items) > settings.GRAMMAR_BATCH_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {settings.GRAMMAR_BATCH_MAX_ITEMS} items can be checked per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            batch_size = self.get_int_param(
+                request, 'batch_size', settings.GRAMMAR_BATCH_SIZE, settings.GRAMMAR_BATCH_MAX_SIZE
+            )
+            n_process = self.get_int_param(
+                request, 'n_process', 1, settings.GRAMMAR_BATCH_MAX_PROCESSES
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Resolve every item to a text to parse, a cached result or an error, keeping its position
+        cache = get_result_cache('grammar', grammar_version(get_nlp('grammar')))
+        ready = {}
+        inputs = []
+
+        def add_text(index, text):
+            text = normalize_text(text)
+            suggestions = cache.get(cache.key(text))
+            if suggestions is not None:
+                ready[index] = self.render_line(index, suggestions=suggestions)
+            else:
+                inputs.append((text, index))
+
+        if texts is not None:
+            for index, text in enumerate(texts):
+                if not isinstance(text, str) or not text.strip():
+                    ready[index] = self.render_line(index, error='Text is required')
+                else:
+                    add_text(index, text)
+        else:
+            try:
+                documents = self.get_documents(request, document_ids)
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'document_ids must be a list of integers'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            for index, document_id in enumerate(document_ids):
+                document = documents.get(document_id)
+                if document is None:
+                    ready[index] = self.render_line(index, error='Document not found')
+                    continue
+                text = document.get_plain_text()
+                if not text:
+                    ready[index] = self.render_line(index, error='Document is empty')
+                else:
+                    add_text(index, text)
+
+        def stream():
+            # Results come in input order, so interleave the ready lines as we go
+            next_index = 0
+            checked = check_texts(
+                get_nlp('grammar'), [text for text, _ in inputs], batch_size=batch_size, n_process=n_process
+            ) if inputs else []
+            for (text, index), suggestions in zip(inputs, checked):
+                while next_index < index:
+                    yield ready[next_index]
+                    next_index += 1
+                try:
+                    cache.set(cache.key(text), suggestions)
+                    yield self.render_line(index, suggestions=suggestions)
+                except Exception as e:
+                    yield self.render_line(index, error=str(e))
+                next_index = index + 1
+            while next_index < len(items):
+                yield ready[next_index]
+                next_index += 1
+
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+class IncrementalGrammarCheckView(ProfilingMixin, APIView):
+    """
+    Grammar check a document incrementally from Quill deltas.
+
+    Send ``text`` (or nothing, to use the stored document) to analyze the whole
+    document, then send each edit as ``delta`` with the ``revision`` token
+    returned by the previous call. Only the paragraphs the delta touches are
+    re-analyzed.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        document_id = request.data.get('document_id')
+        if document_id is None:
+            return Response(
+                {'error': 'document_id is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            document = get_visible_documents(request).filter(pk=document_id).first()
+        except (TypeError, ValueError):
+            document = None
+        if document is None:
+            return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        analyzer = get_incremental_analyzer()
+        delta = request.data.get('delta')
+        try:
+            if delta is None:
+                text = request.data.get('text')
+                if text is None:
+                    # Unstripped, so offsets line up with the editor's
+                    text = document.get_text()
+                if not isinstance(text, str):
+                    return Response({'error': 'text must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+                state, reanalyzed = analyzer.analyze(get_nlp('grammar'), document.pk, text)
+            else:
+                revision = request.data.get('revision')
+                if not isinstance(revision, str) or not revision:
+                    return Response(
+                        {'error': 'revision is required when sending a delta'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                state, reanalyzed = analyzer.apply_delta(get_nlp('grammar'), document.pk, revision, delta)
+        except DeltaError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except StaleRevisionError as e:
+            return Response(
+                {'error': f'{e}. Resend the full text to resynchronize.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response({
+            'revision': state.revision,
+            'reanalyzed': reanalyzed,
+            'findings': state.findings(),
+        })
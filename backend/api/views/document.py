@@ -2,27 +2,49 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.db.models import BooleanField, ExpressionWrapper, Q, Sum
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from api.models import Document, AIFeedback
-from api.serializers import DocumentSerializer, AIFeedbackSerializer
-import openai
+from api.models import Document, DocumentRevision, AIFeedback
+from api.pagination import DocumentCursorPagination, RevisionCursorPagination
+from api.serializers import DocumentSerializer, DocumentListSerializer, DocumentChunkSerializer, DocumentRevisionSerializer, AIFeedbackSerializer, AnalysisJobSerializer
+from api.utils.delta import DeltaError, StaleRevisionError
+from api.utils.jobs import analyze_document, enqueue_analysis
+from api.utils.search import get_search_backend, search_documents
+from api.utils.phrases import document_phrases
+from api.utils.style import get_document_style
+from api.views.mixins import ProfilingMixin
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(ProfilingMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing documents and AI suggestions.
     """
     serializer_class = DocumentSerializer
     permission_classes = [AllowAny]
+    pagination_class = DocumentCursorPagination
+
+    def get_serializer_class(self):
+        """
+        Lists use the lightweight summary serializer
+        """
+        if self.action == 'list':
+            return DocumentListSerializer
+        return DocumentSerializer
 
     def get_queryset(self):
         """
         Return documents owned by the current user or temporary documents for anonymous users.
         """
         if self.request.user.is_authenticated:
-            return Document.objects.filter(author=self.request.user)
+            queryset = Document.objects.filter(author=self.request.user)
         else:
             # For anonymous users, return documents with null author
-            return Document.objects.filter(author__isnull=True)
+            queryset = Document.objects.filter(author__isnull=True)
+
+        queryset = queryset.select_related('author')
+        if self.action in ('list', 'search', 'apply_delta', 'chunks', 'revisions', 'revision', 'analysis', 'analysis_job', 'feedback', 'style', 'phrases'):
+            return queryset
+        return queryset.prefetch_related('ai_feedbacks')
 
     def perform_create(self, serializer):
         """
@@ -34,43 +56,258 @@ class DocumentViewSet(viewsets.ModelViewSet):
         else:
             serializer.save(author=None)
 
-    @action(detail=True, methods=['post'])
-    def get_ai_suggestions(self, request, pk=None):
+    @action(detail=True, methods=['patch'], url_path='delta')
+    def apply_delta(self, request, pk=None):
         """
-        Get AI-powered suggestions for document content.
+        Apply a Quill change delta made against ``revision`` to the document content.
+
+        Only the change travels and is validated. If the document has moved on
+        since ``revision`` the change is rejected with 409 and the current
+        revision, and the client rebases the change onto the content saved since.
         """
+        change = request.data.get('delta')
+        revision = request.data.get('revision')
+        if change is None or not isinstance(revision, int) or isinstance(revision, bool):
+            return Response(
+                {'error': 'delta and an integer revision are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         document = self.get_object()
-        content = document.content
+        try:
+            document.apply_delta(change, revision)
+        except StaleRevisionError as e:
+            return Response(
+                {'error': str(e), 'revision': e.revision},
+                status=status.HTTP_409_CONFLICT
+            )
+        except DeltaError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'id': document.pk,
+            'revision': document.revision,
+            'word_count': document.word_count,
+            'char_count': document.char_count,
+            'updated_at': document.updated_at,
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over the caller's documents.
 
+        Returns the best matches for ``q`` first, each with its ``rank`` and an
+        HTML ``snippet`` with the matching words in <mark>.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if get_search_backend() is None:
+            return Response(
+                {'error': 'Search is not available on this database'},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
         try:
-            # Initialize OpenAI client
-            client = openai.OpenAI()
-            
-            # Get AI suggestions
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a helpful writing assistant. Analyze the text and provide grammar and style suggestions."
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"Please analyze this text and provide suggestions: {content}"
-                    }
-                ]
+            limit = max(1, min(int(request.query_params.get('limit', 20)), settings.SEARCH['MAX_RESULTS']))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        author_id = request.user.pk if request.user.is_authenticated else None
+        matches = search_documents(query, author_id, limit)
+        documents = self.get_queryset().in_bulk([document_id for document_id, _, _ in matches])
+
+        results = []
+        for document_id, rank, snippet in matches:
+            document = documents.get(document_id)
+            if document is None:
+                continue
+            data = DocumentListSerializer(document, context=self.get_serializer_context()).data
+            data['rank'] = rank
+            data['snippet'] = snippet
+            results.append(data)
+        return Response({'query': query, 'results': results})
+
+    @action(detail=True, methods=['get'])
+    def chunks(self, request, pk=None):
+        """
+        Return a range of the document's chunks (lines), for reading large documents lazily.
+
+        Pass the ``position`` of the last chunk already read as ``after`` to get
+        the next ``limit`` chunks. Each chunk comes with ``index``, its offset in
+        the document in Quill index units.
+        """
+        document = self.get_object()
+        try:
+            after = request.query_params.get('after')
+            after = int(after) if after is not None else None
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            return Response(
+                {'error': 'after and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        limit = max(1, min(limit, 500))
+
+        chunks = document.chunks.all()
+        index = 0
+        if after is not None:
+            chunks = chunks.filter(position__gt=after)
+            index = document.chunks.filter(position__lte=after).aggregate(total=Sum('length'))['total'] or 0
+        page = list(chunks[:limit + 1])
+
+        results = []
+        for chunk in page[:limit]:
+            data = DocumentChunkSerializer(chunk).data
+            data['index'] = index
+            index += chunk.length
+            results.append(data)
+
+        return Response({
+            'revision': document.revision,
+            'chunks': results,
+            'next': page[limit - 1].position if len(page) > limit else None,
+        })
+
+    @action(detail=True, methods=['get'])
+    def revisions(self, request, pk=None):
+        """
+        List the document's saved revisions, newest first
+        """
+        document = self.get_object()
+        revisions = document.revisions.only('id', 'document', 'revision', 'word_count', 'created_at').annotate(
+            has_snapshot=ExpressionWrapper(Q(snapshot__isnull=False), output_field=BooleanField())
+        )
+        paginator = RevisionCursorPagination()
+        page = paginator.paginate_queryset(revisions, request, view=self)
+        return paginator.get_paginated_response(DocumentRevisionSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<number>[0-9]+)')
+    def revision(self, request, pk=None, number=None):
+        """
+        Return the document's content as of a revision
+        """
+        document = self.get_object()
+        number = int(number)
+        try:
+            content = DocumentRevision.content_at(document.pk, number)
+        except DocumentRevision.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
 
-            # Create AI feedback
-            suggestion = response.choices[0].message.content
-            feedback = AIFeedback.objects.create(
-                document=document,
-                feedback_type='general',
-                start_index=0,
-                end_index=len(content),
-                suggestion=suggestion
+        details = document.revisions.filter(revision=number).values('word_count', 'created_at').first()
+        return Response({'revision': number, 'content': content, **details})
+
+    @action(detail=True, methods=['get'])
+    def feedback(self, request, pk=None):
+        """
+        Return the document's feedback overlapping the text range [start, end), by position.
+        Without ``end`` the range runs to the end of the document.
+
+        Lets the editor fetch annotations only for what is on screen. Narrow it
+        down with one or more ``type`` parameters; at most
+        ``FEEDBACK_MAX_RESULTS`` rows come back, with ``truncated`` set if
+        there were more. Each row carries the ``revision`` its offsets refer to.
+        """
+        document = self.get_object()
+        try:
+            start = int(request.query_params.get('start', 0))
+            end = request.query_params.get('end')
+            end = int(end) if end is not None else None
+        except ValueError:
+            return Response(
+                {'error': 'start and end must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if start < 0 or (end is not None and end < start):
+            return Response(
+                {'error': 'start and end must satisfy 0 <= start <= end'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
+        feedback = AIFeedback.overlapping(document, start, end)
+        types = request.query_params.getlist('type')
+        if types:
+            feedback = feedback.filter(feedback_type__in=types)
+        limit = settings.FEEDBACK_MAX_RESULTS
+        rows = list(feedback[:limit + 1])
+        return Response({
+            'revision': document.revision,
+            'start': start,
+            'end': end,
+            'feedback': AIFeedbackSerializer(rows[:limit], many=True).data,
+            'truncated': len(rows) > limit,
+        })
+
+    @action(detail=True, methods=['get'])
+    def style(self, request, pk=None):
+        """
+        Return the document's readability and style metrics, for the whole
+        document and for each paragraph with words in it.
+
+        Paragraphs are located by their ``start`` and ``end`` offsets in the
+        document text. Metrics are cached by content hash, so asking again for
+        an unchanged document does not read its text.
+        """
+        document = self.get_object()
+        metrics = get_document_style(document)
+        return Response({'revision': document.revision, **metrics})
+
+    @action(detail=True, methods=['get'])
+    def phrases(self, request, pk=None):
+        """
+        Return the document's most repeated phrases and most used words.
+
+        Each comes with its exact ``count`` and the ``start`` and ``end``
+        offsets of its first ``PHRASE_INDEX_MAX_LOCATIONS`` uses. Phrases used
+        no more often than a longer phrase holding them are left out.
+        """
+        document = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, 100))
+        return Response({'revision': document.revision, **document_phrases(document, limit)})
+
+    @action(detail=True, methods=['post'])
+    def analysis(self, request, pk=None):
+        """
+        Queue an AI analysis of the document's current content and return the job.
+
+        Answers 202 with a new job, or 200 with the job already queued, running
+        or done for the same content. Follow the job by polling
+        ``analysis/<job_id>/`` or on the ``ws/ai/jobs/<job_id>/`` websocket.
+        """
+        document = self.get_object()
+        job, created = enqueue_analysis(document)
+        return Response(
+            AnalysisJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['get'], url_path=r'analysis/(?P<job_id>[0-9]+)')
+    def analysis_job(self, request, pk=None, job_id=None):
+        """
+        Return the state of an analysis job, with its feedback once done
+        """
+        document = self.get_object()
+        job = get_object_or_404(document.analysis_jobs.select_related('feedback'), pk=job_id)
+        return Response(AnalysisJobSerializer(job).data)
+
+    @action(detail=True, methods=['post'])
+    def get_ai_suggestions(self, request, pk=None):
+        """
+        Get AI-powered suggestions for document content.
+        Waits for the completion; ``analysis`` queues the same work in the background instead.
+        """
+        document = self.get_object()
+
+        try:
+            # Get AI suggestions through the shared, pooled gateway and store them as feedback
+            feedback = analyze_document(document)
             return Response(AIFeedbackSerializer(feedback).data)
             
         except Exception as e:
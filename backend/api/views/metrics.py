@@ -0,0 +1,30 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views import View
+
+from api.utils.metrics import REGISTRY
+
+
+class MetricsView(View):
+    """
+    This process's metrics in the Prometheus text format.
+
+    Scrapers must send METRICS['TOKEN'] as a bearer token. Without a token
+    configured, only staff signed in to the admin site can read them.
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def get(self, request):
+        config = settings.METRICS
+        if not config['ENABLED']:
+            raise Http404
+        if config['TOKEN']:
+            expected = f"Bearer {config['TOKEN']}"
+            allowed = hmac.compare_digest(request.headers.get('Authorization', ''), expected)
+        else:
+            allowed = request.user.is_staff
+        if not allowed:
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        return HttpResponse(REGISTRY.render(), content_type=self.content_type)
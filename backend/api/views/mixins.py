@@ -0,0 +1,42 @@
+import asyncio
+
+from api.utils.profiling import start_profiling, wants_profile
+
+
+class ProfilingMixin:
+    """
+    Profiles requests to the view when PROFILING is enabled: slow requests are
+    kept from the stack sampler, and staff can ask for a cProfile trace with
+    ``?profile=1`` (its id comes back in ``X-Profile-Id``).
+
+    Only dispatch is covered, so streamed response bodies are not.
+    """
+    profiling_session = None
+
+    def dispatch(self, request, *args, **kwargs):
+        session = self.profiling_session = start_profiling(request)
+        if session is None:
+            return super().dispatch(request, *args, **kwargs)
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            session.stop()
+            raise
+        if asyncio.iscoroutine(response):
+            # Async views: keep profiling on the event loop thread until the handler is done
+            return self.finish_profiling(session, response)
+        return session.finish(self, response)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Only once DRF has authenticated the request, so no one else can hold the profiler
+        if self.profiling_session is not None and wants_profile(request) and request.user.is_staff:
+            self.profiling_session.start_cprofile()
+
+    async def finish_profiling(self, session, coroutine):
+        try:
+            response = await coroutine
+        except BaseException:
+            session.stop()
+            raise
+        return session.finish(self, response)
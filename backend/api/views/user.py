@@ -4,8 +4,10 @@ from rest_framework.response import Response
 from django.utils import timezone
 from api.models import User
 from api.serializers import UserSerializer, UserUpdateSerializer, UserStatsSerializer
+from api.utils.phrases import author_phrases
+from api.views.mixins import ProfilingMixin
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ProfilingMixin, viewsets.ModelViewSet):
     """
     ViewSet for user registration and management.
     """
@@ -51,6 +53,21 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = UserStatsSerializer(user)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def phrases(self, request):
+        """
+        Get the phrases and words the current user repeats most across their documents
+        """
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, 100))
+        return Response(author_phrases(request.user.pk, limit))
+
     def perform_update(self, serializer):
         """
         Update user and record last active time
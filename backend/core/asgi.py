@@ -13,4 +13,32 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
-application = get_asgi_application()
+# Initialize Django before importing anything that touches models
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from api.middleware import JWTAuthMiddleware  # noqa: E402
+from api.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        # The API authenticates with JWT, sessions only serve the admin site
+        AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)))
+    ),
+})
+
+from django.conf import settings  # noqa: E402
+
+if settings.WORDNET_INDEX['PRELOAD']:
+    from api.utils.wordnet import get_wordnet_index  # noqa: E402
+
+    get_wordnet_index()
+
+if settings.SPACY_PRELOAD:
+    from api.utils.nlp import preload_models  # noqa: E402
+
+    preload_models()
@@ -25,6 +25,174 @@ load_dotenv()
 
 # OpenAI API Key
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Point at a compatible server, e.g. `python manage.py fake_llm_server` for load tests
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# Shared LLM client: model, in-flight request cap and per-request timeout (seconds)
+LLM_GATEWAY = {
+    'MODEL': os.getenv('LLM_MODEL', 'gpt-3.5-turbo'),
+    'MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', '8')),
+    'TIMEOUT': float(os.getenv('LLM_TIMEOUT', '30')),
+    'MAX_RETRIES': int(os.getenv('LLM_MAX_RETRIES', '2')),
+}
+
+# spaCy pipelines are loaded lazily on first use, with the components each analyzer
+# does not need excluded. Set SPACY_PRELOAD to load them when the WSGI/ASGI app is
+# imported instead (e.g. in the gunicorn master with --preload).
+SPACY_MODEL = os.getenv('SPACY_MODEL', 'en_core_web_sm')
+SPACY_PRELOAD = os.getenv('SPACY_PRELOAD', 'False') == 'True'
+SPACY_PIPELINES = {
+    # The grammar rules only use POS tags, dependencies and sentence boundaries
+    'grammar': {'exclude': ['ner', 'lemmatizer']},
+}
+
+# Only tokenize text for the surface grammar rules (capitals, punctuation, length, terms) and parse
+# just the sentences containing words the passive voice and agreement rules look for. Off until
+# benchmark_grammar reports no mismatches with the production model, as sentence boundaries can differ
+GRAMMAR_TIERED = os.getenv('GRAMMAR_TIERED', 'False') == 'True'
+
+# Grammar analysis of whole documents: paragraphs are parsed in chunks of at most CHUNK_CHARS characters,
+# those of documents over PARALLEL_MIN_CHARS in a pool of WORKERS processes (1 to parse in process)
+DOCUMENT_ANALYSIS = {
+    'CHUNK_CHARS': int(os.getenv('DOCUMENT_ANALYSIS_CHUNK_CHARS', '20000')),
+    # Chunks end at paragraphs picked by their content, about once every CHUNK_TARGET_CHARS characters
+    'CHUNK_TARGET_CHARS': int(os.getenv('DOCUMENT_ANALYSIS_CHUNK_TARGET_CHARS', '5000')),
+    'WORKERS': int(os.getenv('DOCUMENT_ANALYSIS_WORKERS', '2')),
+    'PARALLEL_MIN_CHARS': int(os.getenv('DOCUMENT_ANALYSIS_PARALLEL_MIN_CHARS', '200000')),
+    # How pool processes start; 'spawn' loads the model in each, 'fork' shares the parent's
+    'START_METHOD': os.getenv('DOCUMENT_ANALYSIS_START_METHOD', 'spawn'),
+    # Total size of the serialized parses kept in process, and the largest parse worth caching at all
+    'PARSE_CACHE_MAX_BYTES': int(os.getenv('DOCUMENT_ANALYSIS_PARSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    'PARSE_CACHE_MAX_ENTRY_BYTES': int(os.getenv('DOCUMENT_ANALYSIS_PARSE_CACHE_MAX_ENTRY_BYTES', str(2 * 1024 * 1024))),
+}
+
+# Accumulate per-rule timings in the grammar rule engine
+GRAMMAR_RULE_TIMING = os.getenv('GRAMMAR_RULE_TIMING', 'False') == 'True'
+
+# Batch grammar check limits
+GRAMMAR_BATCH_SIZE = int(os.getenv('GRAMMAR_BATCH_SIZE', '64'))
+GRAMMAR_BATCH_MAX_SIZE = int(os.getenv('GRAMMAR_BATCH_MAX_SIZE', '1000'))
+GRAMMAR_BATCH_MAX_PROCESSES = int(os.getenv('GRAMMAR_BATCH_MAX_PROCESSES', '4'))
+GRAMMAR_BATCH_MAX_ITEMS = int(os.getenv('GRAMMAR_BATCH_MAX_ITEMS', '5000'))
+
+# Analyzer result cache: an in-process LRU tier in front of a Django cache backend
+ANALYSIS_CACHE = {
+    'LOCAL_MAX_ENTRIES': int(os.getenv('ANALYSIS_CACHE_LOCAL_MAX_ENTRIES', '2048')),
+    'LOCAL_TTL': int(os.getenv('ANALYSIS_CACHE_LOCAL_TTL', '300')),
+    'BACKEND': os.getenv('ANALYSIS_CACHE_BACKEND', 'default'),
+    'BACKEND_TTL': int(os.getenv('ANALYSIS_CACHE_BACKEND_TTL', '86400')),
+}
+
+# Incremental grammar analysis keeps the last analyzed version of each document in this Django
+# cache, which has to be shared (e.g. Redis) when several processes serve the API
+INCREMENTAL_ANALYSIS = {
+    'BACKEND': os.getenv('INCREMENTAL_ANALYSIS_BACKEND', 'default'),
+    'TTL': int(os.getenv('INCREMENTAL_ANALYSIS_TTL', '1800')),
+}
+
+# Document history keeps compressed deltas, with a full snapshot every SNAPSHOT_INTERVAL revisions
+REVISION_HISTORY = {
+    'SNAPSHOT_INTERVAL': int(os.getenv('REVISION_SNAPSHOT_INTERVAL', '50')),
+    'COMPRESSION_LEVEL': int(os.getenv('REVISION_COMPRESSION_LEVEL', '6')),
+}
+
+# Full-text search over document titles and text (SQLite FTS5 or Postgres tsvector)
+SEARCH = {
+    'POSTGRES_CONFIG': os.getenv('SEARCH_POSTGRES_CONFIG', 'english'),
+    'MAX_RESULTS': int(os.getenv('SEARCH_MAX_RESULTS', '50')),
+    'SNIPPET_WORDS': int(os.getenv('SEARCH_SNIPPET_WORDS', '16')),
+    # Saved documents are reindexed in a background batch this many seconds after the first save (0 inline)
+    'INDEX_DELAY': float(os.getenv('SEARCH_INDEX_DELAY', '2')),
+    # Documents still waiting to be reindexed that a search catches up on first, at most
+    'STALE_BATCH': int(os.getenv('SEARCH_STALE_BATCH', '20')),
+}
+
+# Background AI analysis jobs, queued in the database and run by `manage.py run_analysis_workers`
+ANALYSIS_JOBS = {
+    'WORKERS': int(os.getenv('ANALYSIS_JOBS_WORKERS', '4')),
+    'POLL_INTERVAL': float(os.getenv('ANALYSIS_JOBS_POLL_INTERVAL', '1')),
+    'MAX_ATTEMPTS': int(os.getenv('ANALYSIS_JOBS_MAX_ATTEMPTS', '3')),
+    # Seconds before the first retry, doubled on every further attempt
+    'RETRY_DELAY': float(os.getenv('ANALYSIS_JOBS_RETRY_DELAY', '10')),
+    # Running jobs older than this are assumed lost with their worker and queued again
+    'TIMEOUT': int(os.getenv('ANALYSIS_JOBS_TIMEOUT', '300')),
+    # How often a websocket watching a job re-reads it, in case a push was missed
+    'WATCH_INTERVAL': float(os.getenv('ANALYSIS_JOBS_WATCH_INTERVAL', '5')),
+}
+
+# Compact WordNet index for word analysis, written by download_nltk.py (built in memory when missing)
+WORDNET_INDEX = {
+    'PATH': os.getenv('WORDNET_INDEX_PATH', str(Path(__file__).resolve().parent.parent / 'wordnet.idx')),
+    'MMAP': os.getenv('WORDNET_INDEX_MMAP', 'True') == 'True',
+    # Open (or build) the index when the WSGI/ASGI app loads instead of on the first lookup
+    'PRELOAD': os.getenv('WORDNET_INDEX_PRELOAD', 'False') == 'True',
+}
+WORD_ANALYSIS_BATCH_MAX_WORDS = int(os.getenv('WORD_ANALYSIS_BATCH_MAX_WORDS', '2000'))
+
+# Most feedback rows the viewport lookup returns at once
+FEEDBACK_MAX_RESULTS = int(os.getenv('FEEDBACK_MAX_RESULTS', '500'))
+
+# Serve writing stats from the per-month rollup table instead of aggregating documents
+WRITING_STATS_USE_ROLLUP = os.getenv('WRITING_STATS_USE_ROLLUP', 'True') == 'True'
+
+# Per-view timings (database, spaCy, LLM, cache) exported in the Prometheus format at /api/metrics/
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'True') == 'True',
+    # Also report each request's breakdown in a Server-Timing response header
+    'SERVER_TIMING': os.getenv('METRICS_SERVER_TIMING', 'False') == 'True',
+    # Bearer token the metrics endpoint requires; without one only signed-in staff can read it
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+}
+
+# Opt-in profiling of the AI, document and user views, read with `manage.py profiles`
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', 'False') == 'True',
+    # Keep a sampled trace of requests slower than this many seconds (0 to only profile on ?profile=1)
+    'SLOW_THRESHOLD': float(os.getenv('PROFILING_SLOW_THRESHOLD', '1')),
+    'SAMPLE_INTERVAL': float(os.getenv('PROFILING_SAMPLE_INTERVAL', '0.005')),
+    'DIR': os.getenv('PROFILING_DIR', str(Path(__file__).resolve().parent.parent / 'profiles')),
+    'MAX_PROFILES': int(os.getenv('PROFILING_MAX_PROFILES', '100')),
+}
+
+# Real-time editing over ws/documents/<id>/edit/
+COLLABORATION = {
+    # 'local' keeps each document's room in the ASGI process its editors connected to, which only
+    # works with a single ASGI process; 'worker' sends them to `manage.py run_collaboration_rooms`
+    'ROOM_HOST': os.getenv('COLLABORATION_ROOM_HOST', 'local'),
+    # Rooms are spread over this many channels, each served by one room worker
+    'SHARDS': int(os.getenv('COLLABORATION_SHARDS', '1')),
+    # Save a room this many seconds after its last edit, but at least every MAX_SAVE_DELAY seconds
+    # or MAX_UNSAVED_OPS edits
+    'SAVE_DELAY': float(os.getenv('COLLABORATION_SAVE_DELAY', '2')),
+    'MAX_SAVE_DELAY': float(os.getenv('COLLABORATION_MAX_SAVE_DELAY', '10')),
+    'MAX_UNSAVED_OPS': int(os.getenv('COLLABORATION_MAX_UNSAVED_OPS', '500')),
+    # Edits kept to transform changes made against older versions; older ones get a resync
+    'HISTORY': int(os.getenv('COLLABORATION_HISTORY', '1000')),
+    # Drop editors that have not been heard from in this many seconds
+    'CLIENT_TIMEOUT': float(os.getenv('COLLABORATION_CLIENT_TIMEOUT', '60')),
+}
+
+# Repeated phrases and overused words, counted per document and per author
+PHRASE_INDEX = {
+    'ENABLED': os.getenv('PHRASE_INDEX_ENABLED', 'True') == 'True',
+    # Phrases are runs of MIN_WORDS to MAX_WORDS words; single content words are counted too
+    'MIN_WORDS': int(os.getenv('PHRASE_INDEX_MIN_WORDS', '2')),
+    'MAX_WORDS': int(os.getenv('PHRASE_INDEX_MAX_WORDS', '5')),
+    # Every phrase is counted in a count-min sketch of DEPTH x WIDTH counters (4 bytes each), which
+    # overcounts by at most e/WIDTH of all phrases counted; changing its size needs rebuild_phrase_index
+    'SKETCH_DEPTH': int(os.getenv('PHRASE_INDEX_SKETCH_DEPTH', '4')),
+    'SKETCH_WIDTH': int(os.getenv('PHRASE_INDEX_SKETCH_WIDTH', '32768')),
+    # Phrases used at least MIN_REPEATS times are kept by name, at most MAX_PHRASES and MAX_SINGLE_WORDS
+    'MIN_REPEATS': int(os.getenv('PHRASE_INDEX_MIN_REPEATS', '2')),
+    'MAX_PHRASES': int(os.getenv('PHRASE_INDEX_MAX_PHRASES', '2000')),
+    'MAX_SINGLE_WORDS': int(os.getenv('PHRASE_INDEX_MAX_SINGLE_WORDS', '500')),
+    # Saves queue their changes to the counts on the document's index; once this many phrases are queued
+    # they are applied to it and its author's index after the save commits (and always before a read)
+    'PENDING_PHRASES': int(os.getenv('PHRASE_INDEX_PENDING_PHRASES', '2000')),
+    # Most used phrases of a document counted exactly and located per request, and locations returned per phrase
+    'CANDIDATES': int(os.getenv('PHRASE_INDEX_CANDIDATES', '300')),
+    'MAX_LOCATIONS': int(os.getenv('PHRASE_INDEX_MAX_LOCATIONS', '20')),
+}
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -60,6 +228,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -158,9 +327,37 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-# Channels settings
-CHANNEL_LAYERS = {
+# Cache
+CACHES = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'smart-writer',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Channels settings; set CHANNEL_LAYER_URL (redis://...) to share groups between processes,
+# which needs `pip install channels-redis`
+CHANNEL_LAYER_URL = os.getenv('CHANNEL_LAYER_URL', '')
+CHANNEL_LAYER_CAPACITY = int(os.getenv('CHANNEL_LAYER_CAPACITY', '1000'))
+if CHANNEL_LAYER_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_LAYER_URL],
+                'capacity': CHANNEL_LAYER_CAPACITY,
+            },
+        }
     }
-}
\ No newline at end of file
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {
+                'capacity': CHANNEL_LAYER_CAPACITY,
+            },
+        }
+    }
\ No newline at end of file
@@ -14,3 +14,15 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WORDNET_INDEX['PRELOAD']:
+    from api.utils.wordnet import get_wordnet_index  # noqa: E402
+
+    get_wordnet_index()
+
+if settings.SPACY_PRELOAD:
+    from api.utils.nlp import preload_models  # noqa: E402
+
+    preload_models()
@@ -1,4 +1,22 @@
+import os
+import sys
+
 import nltk
 
 nltk.download('wordnet')
 nltk.download('punkt')
+
+# Build the compact WordNet index that word analysis memory-maps
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+from api.utils.wordnet import write_index  # noqa: E402
+
+size = write_index(settings.WORDNET_INDEX['PATH'])
+print(f"Wrote the WordNet index to {settings.WORDNET_INDEX['PATH']} ({size / 1e6:.1f} MB)")
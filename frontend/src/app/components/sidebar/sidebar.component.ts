@@ -84,6 +84,24 @@ export class SidebarComponent implements OnInit, OnDestroy {
     });
   }
 
+  hasMoreDocuments(): boolean {
+    return this.writerService.hasMoreDocuments();
+  }
+
+  loadMoreDocuments() {
+    this.writerService.loadMoreDocuments().subscribe({
+      next: (docs) => {
+        this.documents = docs;
+        this.cdr.detectChanges();
+      },
+      error: (error) => {
+        console.error('Error loading documents:', error);
+        this.error = 'Failed to load documents. Please try again.';
+        this.cdr.detectChanges();
+      }
+    });
+  }
+
   async createNewDocument() {
     try {
       const content = { ops: [{ insert: '\n' }] };
@@ -11,11 +11,15 @@ import { MatTooltipModule } from '@angular/material/tooltip';
 import { MatChipsModule } from '@angular/material/chips';
 import { MatSnackBar, MatSnackBarModule } from '@angular/material/snack-bar';
 import type Quill from 'quill';
+import type { Delta } from 'quill';
 import { quillConfig } from './quill.config';
 import { AIService, AISuggestion } from '../../services/ai.service';
 import { WriterService } from '../../services/writer.service';
 import { debounceTime, distinctUntilChanged, Subject, Subscription } from 'rxjs';
 
+// Times a save is rebased onto other writers' changes before giving up until the next autosave
+const MAX_REBASES = 3;
+
 @Component({
   selector: 'app-writer',
   standalone: true,
@@ -38,9 +42,15 @@ import { debounceTime, distinctUntilChanged, Subject, Subscription } from 'rxjs'
 export class WriterComponent implements OnInit, OnDestroy {
   @ViewChild('editor') private editorElement!: ElementRef;
   private editor!: Quill;
+  private DeltaClass!: typeof Delta;
   private textChangeSubject = new Subject<string>();
   private saveSubject = new Subject<void>();
   private subscriptions: Subscription[] = [];
+  private suggestionStream?: Subscription;
+  // Edits not saved yet, and the server revision they apply to
+  private pendingDelta: Delta | null = null;
+  private revision: number | null = null;
+  private titleChanged = false;
   
   isLoading = false;
   isSaving = false;
@@ -49,6 +59,8 @@ export class WriterComponent implements OnInit, OnDestroy {
   suggestions: AISuggestion[] = [];
   selectedWord: string = '';
   wordAnalysis: AISuggestion[] = [];
+  // Word analysis fetched ahead for the words of the document, by lowercased word
+  private wordAnalysisCache = new Map<string, AISuggestion[]>();
   cursorPosition = { top: 0, left: 0 };
 
   constructor(
@@ -70,6 +82,7 @@ export class WriterComponent implements OnInit, OnDestroy {
         if (text.length > 10) {
           this.checkGrammar(text);
         }
+        this.prefetchWordAnalysis(text);
       })
     );
 
@@ -98,20 +111,24 @@ export class WriterComponent implements OnInit, OnDestroy {
 
   ngOnDestroy(): void {
     this.subscriptions.forEach(sub => sub.unsubscribe());
+    this.suggestionStream?.unsubscribe();
     this.textChangeSubject.complete();
     this.saveSubject.complete();
   }
 
   onTitleChange(): void {
+    this.titleChanged = true;
     this.saveSubject.next();
   }
 
   private async initializeQuill(): Promise<void> {
     try {
-      const Quill = (await import('quill')).default;
+      const { default: Quill, Delta } = await import('quill');
+      this.DeltaClass = Delta;
       this.editor = new Quill(this.editorElement.nativeElement, quillConfig);
       
-      this.editor.on('text-change', () => {
+      this.editor.on('text-change', (delta: Delta) => {
+        this.pendingDelta = this.pendingDelta ? this.pendingDelta.compose(delta) : delta;
         const text = this.editor.getText();
         this.textChangeSubject.next(text);
         this.updateCursorPosition();
@@ -144,6 +161,9 @@ export class WriterComponent implements OnInit, OnDestroy {
         if (document.content && this.editor) {
           this.editor.setContents(document.content);
         }
+        // What was just loaded is what the server has
+        this.revision = document.revision ?? null;
+        this.pendingDelta = null;
       }
     } catch (error) {
       console.error('Error loading document:', error);
@@ -156,27 +176,84 @@ export class WriterComponent implements OnInit, OnDestroy {
 
     this.isSaving = true;
     try {
-      const content = this.editor.getContents();
-      const data = {
-        title: this.documentTitle,
-        content: content
-      };
-
       if (this.documentId === 'new') {
+        const content = this.editor.getContents();
+        this.pendingDelta = null;
         const newDoc = await this.writerService.createDocument(this.documentTitle, JSON.stringify(content) as any);
         this.documentId = (newDoc as any).id;
+        this.revision = (newDoc as any).revision ?? null;
         await this.router.navigate(['/document', this.documentId], { replaceUrl: true });
       } else {
-        await this.writerService.updateDocument(this.documentId, data).toPromise();
+        if (this.titleChanged) {
+          this.titleChanged = false;
+          await this.writerService.updateDocument(this.documentId, { title: this.documentTitle }).toPromise();
+        }
+        await this.saveContent();
       }
     } catch (error) {
       console.error('Error saving document:', error);
       this.showError('Error saving document');
     } finally {
       this.isSaving = false;
+      if (this.pendingDelta) {
+        // Edits made while saving
+        this.saveSubject.next();
+      }
     }
   }
 
+  // Send only the edits made since the last save. When another writer saved
+  // first, the edits are rebased onto their changes and sent again; the
+  // server copy is never overwritten with the editor's whole content.
+  private async saveContent(): Promise<void> {
+    const pending = this.pendingDelta;
+    if (!pending) return;
+    this.pendingDelta = null;
+    let delta: Delta = pending;
+
+    try {
+      for (let attempt = 0; ; attempt++) {
+        if (this.revision === null) {
+          throw new Error('The revision the document was loaded at is unknown');
+        }
+        try {
+          const result = await this.writerService.applyDelta(this.documentId, delta, this.revision).toPromise();
+          this.revision = result?.revision ?? null;
+          return;
+        } catch (error: any) {
+          if (error?.status !== 409 || attempt >= MAX_REBASES) {
+            throw error;
+          }
+        }
+        delta = await this.rebase(delta);
+      }
+    } catch (error) {
+      // Keep the edits for the next attempt
+      this.pendingDelta = this.pendingDelta ? delta.compose(this.pendingDelta) : delta;
+      throw error;
+    }
+  }
+
+  // Bring the editor up to the server's current revision under the unsaved
+  // edits (delta, and any made since), and return those edits rewritten to
+  // apply after the server's changes
+  private async rebase(delta: Delta): Promise<Delta> {
+    const base = await this.writerService.getRevision(this.documentId, this.revision!).toPromise();
+    const current = await this.writerService.getDocument(this.documentId).toPromise();
+    if (!base || !current) {
+      throw new Error('Could not load the revisions to rebase onto');
+    }
+    // What the other writers changed since our base
+    const theirs = new this.DeltaClass(base.content.ops).diff(new this.DeltaClass(current.content.ops));
+
+    // No awaits from here on, so no edit can slip in between
+    const ours = this.pendingDelta ? delta.compose(this.pendingDelta) : delta;
+    this.pendingDelta = null;
+    this.editor.updateContents(ours.transform(theirs, false), 'silent');
+    this.revision = current.revision ?? null;
+    return theirs.transform(ours, true);
+  }
+
   private updateCursorPosition(): void {
     const selection = this.editor.getSelection();
     if (selection) {
@@ -207,17 +284,51 @@ export class WriterComponent implements OnInit, OnDestroy {
     if (!this.editor) return;
 
     this.isLoading = true;
+    this.suggestions = [];
     const content = this.editor.getText();
-    
-    this.aiService.getContentSuggestions(content).subscribe({
-      next: (suggestions) => {
-        this.suggestions = suggestions;
-        this.isLoading = false;
+    // The LLM suggestion grows as tokens arrive, grammar findings show up as each paragraph is checked
+    let streamed: AISuggestion | null = null;
+
+    this.suggestionStream?.unsubscribe();
+    this.suggestionStream = this.aiService.streamSuggestions(content).subscribe({
+      next: ({ event, data }) => {
+        switch (event) {
+          case 'grammar':
+            this.suggestions = [...this.suggestions, data];
+            break;
+
+          case 'token':
+            if (!streamed) {
+              streamed = { type: 'content', suggestion: '', confidence: 0.9 };
+              this.suggestions = [...this.suggestions, streamed];
+            }
+            streamed.suggestion += data.content;
+            break;
+
+          case 'suggestion':
+            if (streamed) {
+              streamed.suggestion = data.suggestion;
+            } else {
+              this.suggestions = [...this.suggestions, data];
+            }
+            break;
+
+          case 'error':
+            console.error('Suggestion stream error:', data);
+            break;
+
+          case 'done':
+            this.isLoading = false;
+            break;
+        }
       },
       error: (error) => {
         console.error('Error getting suggestions:', error);
         this.isLoading = false;
         this.showError('Error getting AI suggestions');
+      },
+      complete: () => {
+        this.isLoading = false;
       }
     });
   }
@@ -238,9 +349,30 @@ export class WriterComponent implements OnInit, OnDestroy {
     });
   }
 
+  // Fetch the analysis of every word not seen yet in one request, so selecting a word needs none
+  private prefetchWordAnalysis(text: string): void {
+    const words = Array.from(new Set(
+      (text.match(/[\p{L}]+(?:['’-][\p{L}]+)*/gu) || []).map(word => word.toLowerCase())
+    )).filter(word => !this.wordAnalysisCache.has(word)).slice(0, 2000);
+    if (!words.length) return;
+
+    this.aiService.getWordAnalysisBatch(words).subscribe({
+      next: (analysis) => {
+        Object.entries(analysis).forEach(([word, result]) => this.wordAnalysisCache.set(word, result));
+      },
+      error: (error) => console.error('Error prefetching word analysis:', error)
+    });
+  }
+
   private getWordAnalysis(word: string): void {
+    const cached = this.wordAnalysisCache.get(word.toLowerCase());
+    if (cached) {
+      this.wordAnalysis = cached;
+      return;
+    }
     this.aiService.getWordAnalysis(word).subscribe({
       next: (analysis) => {
+        this.wordAnalysisCache.set(word.toLowerCase(), analysis);
         this.wordAnalysis = analysis;
       },
       error: (error) => {
@@ -1,6 +1,6 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable, catchError, tap } from 'rxjs';
+import { Observable, catchError, map, tap } from 'rxjs';
 import { environment } from '../../environments/environment';
 
 export interface AISuggestion {
@@ -9,6 +9,13 @@ export interface AISuggestion {
   context?: string;
   examples?: string[];
   confidence: number;
+  start?: number;
+  end?: number;
+}
+
+export interface AIStreamEvent {
+  event: 'grammar' | 'token' | 'suggestion' | 'error' | 'done';
+  data: any;
 }
 
 @Injectable({
@@ -33,6 +40,77 @@ export class AIService {
     );
   }
 
+  streamSuggestions(text: string): Observable<AIStreamEvent> {
+    const url = `${this.apiUrl}/ai/suggestions/stream/`;
+    console.log('Opening suggestion stream to:', url);
+    return new Observable<AIStreamEvent>(subscriber => {
+      const controller = new AbortController();
+
+      fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify({ text }),
+        signal: controller.signal
+      })
+        .then(async response => {
+          if (!response.ok || !response.body) {
+            throw new Error(`Suggestion stream failed with status ${response.status}`);
+          }
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+              const event = this.parseServerSentEvent(buffer.slice(0, boundary));
+              buffer = buffer.slice(boundary + 2);
+              if (event) subscriber.next(event);
+              boundary = buffer.indexOf('\n\n');
+            }
+          }
+          subscriber.complete();
+        })
+        .catch(error => {
+          if (error.name === 'AbortError') return;
+          console.error('Error streaming suggestions:', error);
+          subscriber.error(error);
+        });
+
+      return () => controller.abort();
+    });
+  }
+
+  private parseServerSentEvent(raw: string): AIStreamEvent | null {
+    let event = 'message';
+    const data: string[] = [];
+    for (const line of raw.split('\n')) {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        data.push(line.slice(5).trim());
+      }
+    }
+    if (!data.length) return null;
+    return { event: event as AIStreamEvent['event'], data: JSON.parse(data.join('\n')) };
+  }
+
+  // Analysis of many words in one request, keyed by the lowercased word
+  getWordAnalysisBatch(words: string[]): Observable<Record<string, AISuggestion[]>> {
+    const url = `${this.apiUrl}/ai/word-analysis/batch/`;
+    return this.http.post<{ words: Record<string, AISuggestion[]> }>(url, { words }).pipe(
+      map(response => response.words),
+      catchError(error => {
+        console.error('Error getting word analysis batch:', error);
+        throw error;
+      })
+    );
+  }
+
   getWordAnalysis(word: string): Observable<AISuggestion[]> {
     const url = `${this.apiUrl}/ai/word-analysis/${word}/`;
     console.log('Making GET request to:', url);
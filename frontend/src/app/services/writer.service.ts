@@ -2,22 +2,62 @@ import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { environment } from '../../environments/environment';
 import { Observable, from, Subject } from 'rxjs';
-import { tap } from 'rxjs/operators';
+import { map, tap } from 'rxjs/operators';
 import { Delta } from 'quill';
 
 export interface Document {
   id: string;
   title: string;
   content: Delta;
+  revision?: number;
   updatedAt: Date;
 }
 
+export interface DeltaSaveResult {
+  id: string;
+  revision: number;
+  word_count: number;
+  char_count: number;
+  updated_at: string;
+}
+
+export interface DocumentRevisionContent {
+  revision: number;
+  content: Delta;
+  word_count: number;
+  created_at: string;
+}
+
+export interface DocumentPage {
+  next: string | null;
+  previous: string | null;
+  results: Document[];
+}
+
 export interface AISuggestion {
   suggestion: string;
   type?: string;
   confidence?: number;
 }
 
+export interface DocumentFeedback {
+  id: number;
+  feedback_type: string;
+  start_index: number;
+  end_index: number;
+  suggestion: string;
+  confidence: number | null;
+  revision: number | null;
+}
+
+export interface FeedbackRange {
+  revision: number;
+  start: number;
+  end: number | null;
+  feedback: DocumentFeedback[];
+  truncated: boolean;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -27,18 +67,43 @@ export class WriterService {
 
   documentUpdates$ = this.documentUpdates.asObservable();
   private documents: Document[] = [];
+  private nextPageUrl: string | null = null;
 
   constructor(private http: HttpClient) {}
 
   // Document CRUD Operations
   getDocuments(): Observable<Document[]> {
-    return this.http.get<Document[]>(`${this.apiUrl}`).pipe(
+    return this.http.get<DocumentPage>(`${this.apiUrl}`).pipe(
+      tap(page => {
+        this.nextPageUrl = page.next;
+      }),
+      map(page => page.results),
       tap(docs => {
         this.documents = docs;
       })
     );
   }
 
+  hasMoreDocuments(): boolean {
+    return this.nextPageUrl !== null;
+  }
+
+  // Fetch the next page of the list and append it to the documents already loaded
+  loadMoreDocuments(): Observable<Document[]> {
+    if (!this.nextPageUrl) {
+      return from(Promise.resolve(this.documents));
+    }
+    return this.http.get<DocumentPage>(this.nextPageUrl).pipe(
+      tap(page => {
+        this.nextPageUrl = page.next;
+      }),
+      map(page => {
+        this.documents = [...this.documents, ...page.results];
+        return this.documents;
+      })
+    );
+  }
+
   getDocument(id: string): Observable<Document> {
     return this.http.get<Document>(`${this.apiUrl}${id}/`);
   }
@@ -83,6 +148,16 @@ export class WriterService {
       );
   }
 
+  // Send only the change made since `revision`; fails with 409 if the document moved on
+  applyDelta(id: string, delta: Delta, revision: number): Observable<DeltaSaveResult> {
+    return this.http.patch<DeltaSaveResult>(`${this.apiUrl}${id}/delta/`, { delta, revision });
+  }
+
+  // The document's content as it was at a revision
+  getRevision(id: string, revision: number): Observable<DocumentRevisionContent> {
+    return this.http.get<DocumentRevisionContent>(`${this.apiUrl}${id}/revisions/${revision}/`);
+  }
+
   deleteDocument(id: string): Observable<void> {
     return this.http.delete<void>(`${this.apiUrl}${id}/`)
       .pipe(
@@ -100,6 +175,22 @@ export class WriterService {
       .toPromise() as Promise<{ suggestion: string }>;
   }
 
+  // Stored feedback overlapping [start, end) of the document text, for what is on screen
+  getFeedback(id: string, start: number, end: number, types: string[] = []): Observable<FeedbackRange> {
+    const params: Record<string, string | string[]> = { start: String(start), end: String(end) };
+    if (types.length) {
+      params['type'] = types;
+    }
+    return this.http.get<FeedbackRange>(`${this.apiUrl}${id}/feedback/`, { params });
+  }
+
+  // Check the stored document and replace its grammar feedback; findings carry start/end offsets
+  checkDocumentGrammar(id: string): Observable<(AISuggestion & { start: number; end: number })[]> {
+    return this.http.post<(AISuggestion & { start: number; end: number })[]>(
+      `${environment.apiUrl}/api/ai/grammar/`, { document_id: id }
+    );
+  }
+
   // Optional: Add methods for specific suggestion types if needed
   getGrammarCheck(text: string): Observable<AISuggestion[]> {
     return this.http.post<AISuggestion[]>(`${environment.apiUrl}/api/ai/grammar/`, { text });